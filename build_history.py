@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译历史数据库
+每次编译运行（BuildRun）记录到状态目录下的SQLite数据库：目标、输入哈希、各阶段耗时、缓存命中、诊断数量、
+产物哈希和大小以及Flash/RAM等指标。写入由后台线程批量完成，不占用编译流程的时间；
+命令行可查询耗时趋势、相对历史中位数的退化和最慢的阶段。
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import statistics
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import build_metrics
+from build_run import TARGET_NAMES, BuildRun
+from path_utils import get_state_path
+
+DB_NAME = "build_history.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    target TEXT NOT NULL,
+    source TEXT,
+    started REAL NOT NULL,
+    finished REAL,
+    duration REAL,
+    status TEXT NOT NULL,
+    inputs_hash TEXT,
+    toolchain_fingerprint TEXT,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    cache_misses INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    warnings INTEGER NOT NULL DEFAULT 0,
+    revision TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_target_started ON runs (target, started);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+# 退化检查的默认参数：与之前多少次成功编译的中位数比较，超过多少比例算退化
+DEFAULT_BASELINE_RUNS = 10
+DEFAULT_THRESHOLD = 0.10
+
+
+def get_history_path() -> str:
+    return get_state_path(DB_NAME)
+
+
+def _normalize_target(target: Optional[str]) -> Optional[str]:
+    if target is None:
+        return None
+    return TARGET_NAMES.get(target.lower(), target.upper())
+
+
+class HistoryDB:
+    """编译历史数据库的读写"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_history_path()
+        # 写入线程和查询可能不在创建连接的线程中
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(_SCHEMA)
+        # 较早版本创建的数据库没有 revision 列（ALTER添加在末尾，与建表时的列顺序相同）
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(runs)")}
+        if "revision" not in columns:
+            self.conn.execute("ALTER TABLE runs ADD COLUMN revision TEXT")
+
+    def close(self):
+        self.conn.close()
+
+    def record_runs(self, runs: Iterable[BuildRun]):
+        """在一个事务中写入多次运行，同一run_id重复写入时覆盖"""
+        run_rows, phase_rows, artifact_rows, metric_rows = [], [], [], []
+        for run in runs:
+            run_rows.append((run.run_id, run.target, run.source, run.started, run.finished, run.duration,
+                             run.status, run.inputs_hash, run.toolchain_fingerprint, run.cache_hits,
+                             run.cache_misses, run.errors, run.warnings, run.revision))
+            phase_rows.extend((run.run_id, name, seconds) for name, seconds in run.phases.items())
+            artifact_rows.extend((run.run_id, name, info["sha256"], info["size"])
+                                 for name, info in run.artifacts.items())
+            metric_rows.extend((run.run_id, name, value) for name, value in run.metrics.items())
+        if not run_rows:
+            return
+        with self.conn:
+            # REPLACE 会删除旧行，级联删除该运行原有的阶段、产物和指标
+            self.conn.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  run_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO phases VALUES (?, ?, ?)", phase_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)", artifact_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?)", metric_rows)
+
+    # ---- 查询 ----
+
+    def _metrics_for(self, run_ids: List[str]) -> Dict[str, Dict[str, float]]:
+        result: Dict[str, Dict[str, float]] = {run_id: {} for run_id in run_ids}
+        if not run_ids:
+            return result
+        placeholders = ",".join("?" * len(run_ids))
+        for row in self.conn.execute(f"SELECT run_id, name, value FROM metrics WHERE run_id IN ({placeholders})",
+                                     run_ids):
+            result[row["run_id"]][row["name"]] = row["value"]
+        for row in self.conn.execute("SELECT run_id, SUM(size) AS total FROM artifacts "
+                                     f"WHERE run_id IN ({placeholders}) GROUP BY run_id", run_ids):
+            result[row["run_id"]]["artifact_bytes"] = row["total"]
+        return result
+
+    def trend(self, target: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """最近的运行（按时间先后），包含耗时、缓存命中率、诊断数量和指标"""
+        target = _normalize_target(target)
+        where, params = ("WHERE target = ?", [target]) if target else ("", [])
+        rows = self.conn.execute(f"SELECT * FROM runs {where} ORDER BY started DESC LIMIT ?",
+                                 params + [limit]).fetchall()
+        rows.reverse()
+        metrics = self._metrics_for([row["run_id"] for row in rows])
+        result = []
+        for row in rows:
+            entry = dict(row)
+            total = row["cache_hits"] + row["cache_misses"]
+            entry["cache_hit_rate"] = row["cache_hits"] / total if total else None
+            entry["metrics"] = metrics[row["run_id"]]
+            result.append(entry)
+        return result
+
+    def regressions(self, target: Optional[str] = None, baseline_runs: int = DEFAULT_BASELINE_RUNS,
+                    threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+        """比较各目标最近一次成功编译与之前若干次成功编译的中位数，返回超过阈值的耗时、阶段和指标"""
+        targets = [_normalize_target(target)] if target else [
+            row["target"] for row in self.conn.execute("SELECT DISTINCT target FROM runs ORDER BY target")]
+        findings = []
+        for name in targets:
+            rows = self.conn.execute(
+                "SELECT run_id, duration FROM runs WHERE target = ? AND status = 'success' "
+                "ORDER BY started DESC LIMIT ?", (name, baseline_runs + 1)).fetchall()
+            if len(rows) < 2:
+                continue
+            latest, baseline = rows[0], rows[1:]
+            run_ids = [row["run_id"] for row in rows]
+            values: Dict[str, Dict[str, float]] = self._metrics_for(run_ids)
+            for row in rows:
+                if row["duration"] is not None:
+                    values[row["run_id"]]["duration"] = row["duration"]
+            placeholders = ",".join("?" * len(run_ids))
+            for row in self.conn.execute(f"SELECT run_id, name, seconds FROM phases WHERE run_id IN ({placeholders})",
+                                         run_ids):
+                values[row["run_id"]][f"phase:{row['name']}"] = row["seconds"]
+
+            for key, current in sorted(values[latest["run_id"]].items()):
+                history = [values[row["run_id"]][key] for row in baseline if key in values[row["run_id"]]]
+                if not history:
+                    continue
+                median = statistics.median(history)
+                if median > 0 and (current - median) / median > threshold:
+                    findings.append({"target": name, "run_id": latest["run_id"], "metric": key,
+                                     "value": current, "median": median, "samples": len(history),
+                                     "change": (current - median) / median})
+        return findings
+
+    def slowest_phases(self, target: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """最近若干次运行中各阶段的平均和最大耗时，按平均耗时降序"""
+        target = _normalize_target(target)
+        where, params = ("WHERE target = ?", [target]) if target else ("", [])
+        return [dict(row) for row in self.conn.execute(
+            "SELECT p.name AS name, COUNT(*) AS runs, AVG(p.seconds) AS average, MAX(p.seconds) AS maximum, "
+            "SUM(p.seconds) AS total FROM phases p JOIN "
+            f"(SELECT run_id FROM runs {where} ORDER BY started DESC LIMIT ?) r ON p.run_id = r.run_id "
+            "GROUP BY p.name ORDER BY average DESC", params + [limit])]
+
+    def get_run(self, run_id: str) -> Optional[dict]:
+        """查询一次运行的完整记录，run_id 可以只写开头部分"""
+        row = self.conn.execute("SELECT * FROM runs WHERE run_id LIKE ? ORDER BY started DESC LIMIT 1",
+                                (run_id.replace("%", "") + "%",)).fetchone()
+        if row is None:
+            return None
+        run = dict(row)
+        params = (row["run_id"],)
+        run["phases"] = {r["name"]: r["seconds"] for r in
+                         self.conn.execute("SELECT name, seconds FROM phases WHERE run_id = ?", params)}
+        run["artifacts"] = {r["name"]: {"sha256": r["sha256"], "size": r["size"]} for r in
+                            self.conn.execute("SELECT name, sha256, size FROM artifacts WHERE run_id = ?", params)}
+        run["metrics"] = {r["name"]: r["value"] for r in
+                          self.conn.execute("SELECT name, value FROM metrics WHERE run_id = ?", params)}
+        return run
+
+
+class HistoryWriter:
+    """后台批量写入编译历史
+
+    submit() 只把记录放入队列；后台线程收集一批（或等待 flush_interval 秒）后在一个事务中写入。
+    close() 写入剩余记录并结束线程，进程退出时也会自动调用。
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 50, flush_interval: float = 0.5):
+        self.path = path or get_history_path()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[BuildRun]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="build-history-writer", daemon=True)
+        self._thread.start()
+        build_metrics.QUEUE_DEPTH.set_function(self._queue.qsize, queue="build_history")
+        atexit.register(self.close)
+
+    def submit(self, run: BuildRun):
+        self._queue.put(run)
+
+    def close(self, timeout: float = 10.0):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            db = HistoryDB(self.path)
+        except sqlite3.Error as e:
+            print(f"警告: 无法打开编译历史数据库: {e}")
+            return
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                try:
+                    db.record_runs(batch)
+                except sqlite3.Error as e:
+                    print(f"警告: 写入编译历史失败: {e}")
+        finally:
+            db.close()
+
+
+_writer: Optional[HistoryWriter] = None
+_writer_lock = threading.Lock()
+
+
+def record_run(run: BuildRun):
+    """把完成的运行交给进程内共享的后台写入线程"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter()
+    _writer.submit(run)
+
+
+def _read_new_lines(log, partial: str, final: bool = False):
+    """读取日志新增的内容，返回 (完整的行, 不完整的最后一行)"""
+    lines = (partial + log.read()).split("\n")
+    partial = lines.pop()
+    if final and partial:
+        lines.append(partial)
+        partial = ""
+    return [line.rstrip("\r") for line in lines], partial
+
+
+def wait_for_run(run_id: str, timeout: Optional[float] = None, log_path: Optional[str] = None,
+                 on_output: Optional[Callable[[str], None]] = None, poll_interval: float = 0.5,
+                 path: Optional[str] = None, process: Optional[subprocess.Popen] = None) -> Optional[dict]:
+    """等待另一个进程（MSYS中的编译后处理）把运行写入编译历史，返回 get_run() 的结果，超时返回None
+
+    Args:
+        log_path: 编译日志，等待期间把新增的行逐行交给 on_output（日志在编译开始时才会创建）
+        process: 运行编译的MSYS进程，它退出后仍没有结果时不再等待，返回None
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    db = HistoryDB(path)
+    log = None
+    partial = ""
+    exited = False
+    try:
+        while True:
+            if log is None and log_path and on_output and os.path.exists(log_path):
+                try:
+                    log = open(log_path, "r", encoding="utf-8", errors="replace")
+                except OSError:
+                    pass
+            if log is not None:
+                lines, partial = _read_new_lines(log, partial)
+                for line in lines:
+                    on_output(line)
+            run = db.get_run(run_id)
+            if run is not None:
+                if log is not None:
+                    for line in _read_new_lines(log, partial, final=True)[0]:
+                        on_output(line)
+                return run
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            if exited:
+                return None
+            # 进程退出前可能刚写入结果，退出后再检查一次
+            exited = process is not None and process.poll() is not None
+            if not exited:
+                time.sleep(poll_interval)
+    finally:
+        if log is not None:
+            log.close()
+        db.close()
+
+
+# ---- 命令行 ----
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.1f}s" if value < 120 else f"{value / 60:.1f}min"
+
+
+def _format_trend(runs: List[dict]) -> List[str]:
+    lines = [f"{'运行':<24} {'目标':<5} {'状态':<8} {'耗时':>8} {'缓存命中':>8} {'错误':>4} {'警告':>5}"
+             f" {'Flash':>10} {'RAM':>9}"]
+    for run in runs:
+        rate = run["cache_hit_rate"]
+        metrics = run["metrics"]
+        flash, ram = metrics.get("flash"), metrics.get("ram")
+        lines.append(f"{run['run_id']:<24} {run['target']:<5} {run['status']:<8} "
+                     f"{_format_seconds(run['duration']):>8} {'-' if rate is None else f'{rate:.0%}':>8} "
+                     f"{run['errors']:>4} {run['warnings']:>5} "
+                     f"{'-' if flash is None else f'{flash:.0f}':>10} {'-' if ram is None else f'{ram:.0f}':>9}")
+    durations = [run["duration"] for run in runs if run["duration"] is not None and run["status"] == "success"]
+    if len(durations) >= 2:
+        lines.append(f"成功编译耗时: 中位数 {_format_seconds(statistics.median(durations))}，"
+                     f"最短 {_format_seconds(min(durations))}，最长 {_format_seconds(max(durations))}")
+    return lines
+
+
+def main(argv=None):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="编译历史查询")
+    parser.add_argument("--db", help=f"数据库路径（默认: 状态目录下的 {DB_NAME}）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    trend_parser = subparsers.add_parser("trend", help="最近编译的耗时、诊断和占用趋势")
+    trend_parser.add_argument("--target", help="只看 MVCU(m) 或 SVCU(s)")
+    trend_parser.add_argument("-n", "--limit", type=int, default=20, help="显示的运行次数（默认20）")
+
+    regress_parser = subparsers.add_parser("regressions", help="最近一次成功编译相对历史中位数的退化")
+    regress_parser.add_argument("--target", help="只看 MVCU(m) 或 SVCU(s)")
+    regress_parser.add_argument("--baseline", type=int, default=DEFAULT_BASELINE_RUNS,
+                                help=f"参与比较的之前成功编译次数（默认{DEFAULT_BASELINE_RUNS}）")
+    regress_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD * 100,
+                                help=f"超过中位数多少百分比算退化（默认{DEFAULT_THRESHOLD * 100:.0f}）")
+
+    phases_parser = subparsers.add_parser("phases", help="最慢的阶段")
+    phases_parser.add_argument("--target", help="只看 MVCU(m) 或 SVCU(s)")
+    phases_parser.add_argument("-n", "--limit", type=int, default=50, help="统计的运行次数（默认50）")
+
+    show_parser = subparsers.add_parser("show", help="显示一次运行的详细记录")
+    show_parser.add_argument("run_id", help="运行ID（可以只写开头部分）")
+
+    args = parser.parse_args(argv)
+    db_path = args.db or get_history_path()
+    if not os.path.isfile(db_path):
+        print(f"还没有编译历史: {db_path}")
+        return 1
+    db = HistoryDB(db_path)
+    try:
+        if args.command == "trend":
+            runs = db.trend(args.target, args.limit)
+            if not runs:
+                print("没有符合条件的编译记录")
+                return 0
+            for line in _format_trend(runs):
+                print(line)
+        elif args.command == "regressions":
+            findings = db.regressions(args.target, args.baseline, args.threshold / 100)
+            if not findings:
+                print("未发现退化")
+                return 0
+            for item in findings:
+                print(f"✗ {item['target']} {item['metric']}: {item['value']:.2f}，"
+                      f"之前 {item['samples']} 次中位数 {item['median']:.2f}（{item['change']:+.1%}）"
+                      f" [{item['run_id']}]")
+            return 1
+        elif args.command == "phases":
+            rows = db.slowest_phases(args.target, args.limit)
+            if not rows:
+                print("没有阶段耗时记录")
+                return 0
+            print(f"{'阶段':<16} {'次数':>5} {'平均':>9} {'最长':>9} {'累计':>9}")
+            for row in rows:
+                print(f"{row['name']:<16} {row['runs']:>5} {_format_seconds(row['average']):>9} "
+                      f"{_format_seconds(row['maximum']):>9} {_format_seconds(row['total']):>9}")
+        elif args.command == "show":
+            run = db.get_run(args.run_id)
+            if run is None:
+                print(f"找不到运行: {args.run_id}")
+                return 1
+            print(json.dumps(run, ensure_ascii=False, indent=1))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译指标导出（Prometheus文本格式）
+编译流程中的计数器和直方图只在内存中累加（一次加锁的字典更新），不做任何I/O；
+进程退出或导出线程定期把增量合并到状态目录中的累计文件，因此界面、命令行和MSYS回调的编译后处理
+这几个进程的指标会汇总在一起。可通过本地HTTP端点或定期写入的文本文件（node_exporter textfile）导出。
+"""
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from path_utils import get_state_path
+
+STATE_NAME = "metrics_state.json"
+DEFAULT_PORT = 9464
+DEFAULT_TEXTFILE_INTERVAL = 15.0
+
+# 耗时直方图的桶（秒），覆盖从文件暂存到完整编译
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# 合并累计文件时的锁
+_LOCK_TIMEOUT = 2.0
+_LOCK_STALE = 30.0
+
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器，增量会累计到状态文件"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._deltas: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._deltas[key] = self._deltas.get(key, 0) + amount
+
+    def _take(self) -> Dict[Tuple[str, ...], float]:
+        deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def _merge(self, store: dict, deltas: Dict[Tuple[str, ...], float]):
+        values = store.setdefault(self.name, {})
+        for key, amount in deltas.items():
+            encoded = json.dumps(list(key))
+            values[encoded] = values.get(encoded, 0) + amount
+
+    def _render(self, stored: dict) -> List[str]:
+        totals = {tuple(json.loads(key)): value for key, value in stored.get(self.name, {}).items()}
+        for key, amount in self._deltas.items():
+            totals[key] = totals.get(key, 0) + amount
+        lines = self._header()
+        for key in sorted(totals):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(totals[key])}")
+        return lines
+
+
+class Histogram(Counter):
+    """累计直方图：各桶计数、总和与次数，同样累计到状态文件"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DURATION_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def _empty(self) -> List[float]:
+        # 各桶计数（非累计）+ 总和 + 次数
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with _lock:
+            state = self._deltas.get(key)
+            if state is None:
+                state = self._deltas[key] = self._empty()
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _merge(self, store: dict, deltas: Dict[Tuple[str, ...], List[float]]):
+        values = store.setdefault(self.name, {})
+        for key, state in deltas.items():
+            encoded = json.dumps(list(key))
+            current = values.get(encoded)
+            if current is None or len(current) != len(state):
+                current = self._empty()
+            values[encoded] = [a + b for a, b in zip(current, state)]
+
+    def _render(self, stored: dict) -> List[str]:
+        totals = {tuple(json.loads(key)): list(state) for key, state in stored.get(self.name, {}).items()
+                  if len(state) == len(self.buckets) + 2}
+        for key, state in self._deltas.items():
+            current = totals.setdefault(key, self._empty())
+            totals[key] = [a + b for a, b in zip(current, state)]
+        lines = self._header()
+        for key in sorted(totals):
+            state = totals[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(state[-2], 6))}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    """当前值，只属于本进程，不写入状态文件；可以用回调函数在导出时取值"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        with _lock:
+            self._functions[self._key(labels)] = function
+
+    def _render(self, stored: dict) -> List[str]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        lines = self._header()
+        for key in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(values[key])}")
+        return lines
+
+
+BUILDS_STARTED = Counter("loc_compile_builds_started_total", "开始的编译次数", ("target",))
+BUILDS_FINISHED = Counter("loc_compile_builds_finished_total", "结束的编译次数", ("target", "status"))
+BUILD_DURATION = Histogram("loc_compile_build_duration_seconds", "从开始暂存到编译后处理结束的总耗时", ("target",))
+PHASE_DURATION = Histogram("loc_compile_phase_duration_seconds", "各阶段耗时", ("target", "phase"))
+BYTES_COPIED = Counter("loc_compile_bytes_copied_total", "暂存到编译目录中的新文件和修改过的文件的字节数", ("target",))
+CACHE_HITS = Counter("loc_compile_cache_hits_total", "输入哈希缓存命中的文件数", ("target",))
+CACHE_MISSES = Counter("loc_compile_cache_misses_total", "输入哈希缓存未命中的文件数", ("target",))
+QUEUE_DEPTH = Gauge("loc_compile_queue_depth", "等待处理的队列长度", ("queue",))
+
+_METRICS: List[_Metric] = [BUILDS_STARTED, BUILDS_FINISHED, BUILD_DURATION, PHASE_DURATION,
+                           BYTES_COPIED, CACHE_HITS, CACHE_MISSES, QUEUE_DEPTH]
+_ACCUMULATED = [metric for metric in _METRICS if isinstance(metric, Counter)]
+
+
+def get_state_file() -> str:
+    return get_state_path(STATE_NAME)
+
+
+def _load_store(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class _FileLock:
+    """跨进程的简单锁文件，超时视为获取失败；遗留超过 _LOCK_STALE 秒的锁文件会被清除"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.acquired = False
+
+    def __enter__(self):
+        deadline = time.monotonic() + _LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                self.acquired = True
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > _LOCK_STALE:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    pass
+                if time.monotonic() > deadline:
+                    return self
+                time.sleep(0.02)
+
+    def __exit__(self, *exc_info):
+        if self.acquired:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def flush(path: Optional[str] = None) -> bool:
+    """把本进程的计数增量合并到累计文件，获取不到锁或写入失败时增量保留到下次"""
+    with _lock:
+        pending = [(metric, metric._take()) for metric in _ACCUMULATED]
+    if not any(deltas for _, deltas in pending):
+        return True
+    path = path or get_state_file()
+    with _FileLock(path + ".lock") as file_lock:
+        if file_lock.acquired:
+            store = _load_store(path)
+            for metric, deltas in pending:
+                if deltas:
+                    metric._merge(store, deltas)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(store, f, separators=(",", ":"))
+                os.replace(temp_path, path)
+                return True
+            except OSError:
+                pass
+    # 合并失败：把增量放回
+    with _lock:
+        for metric, deltas in pending:
+            for key, value in deltas.items():
+                if isinstance(metric, Histogram):
+                    current = metric._deltas.get(key) or metric._empty()
+                    metric._deltas[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    metric._deltas[key] = metric._deltas.get(key, 0) + value
+    return False
+
+
+def render(path: Optional[str] = None) -> str:
+    """生成Prometheus文本格式：累计文件中的值加上本进程尚未合并的增量"""
+    stored = _load_store(path or get_state_file())
+    with _lock:
+        lines = []
+        for metric in _METRICS:
+            lines.extend(metric._render(stored))
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(output_path: str):
+    """合并增量后把指标写入文本文件（原子替换，供 node_exporter textfile collector 读取）"""
+    flush()
+    content = render()
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_path, output_path)
+
+
+def start_textfile_writer(output_path: str, interval: float = DEFAULT_TEXTFILE_INTERVAL) -> threading.Thread:
+    """后台定期写入指标文本文件，进程退出时再写一次"""
+    output_path = os.path.abspath(output_path)
+    stop = threading.Event()
+
+    def write():
+        try:
+            write_textfile(output_path)
+        except OSError as e:
+            print(f"警告: 写入指标文件失败: {e}")
+
+    def loop():
+        while not stop.wait(interval):
+            write()
+
+    def at_exit():
+        stop.set()
+        write()
+
+    thread = threading.Thread(target=loop, name="metrics-textfile", daemon=True)
+    thread.start()
+    atexit.register(at_exit)
+    return thread
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = DEFAULT_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程中提供 http://host:port/metrics"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# 编译流程不主动写文件，进程退出时合并本进程的增量
+atexit.register(flush)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="编译指标导出（Prometheus文本格式）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("show", help="输出当前累计的指标")
+
+    serve_parser = subparsers.add_parser("serve", help="在本地HTTP端点持续提供指标")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"端口（默认{DEFAULT_PORT}）")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认127.0.0.1）")
+
+    textfile_parser = subparsers.add_parser("textfile", help="定期把指标写入文本文件")
+    textfile_parser.add_argument("output", help="输出文件，例如 node_exporter 的 textfile 目录下的 loc_compile.prom")
+    textfile_parser.add_argument("--interval", type=float, default=DEFAULT_TEXTFILE_INTERVAL,
+                                 help=f"写入间隔秒数（默认{DEFAULT_TEXTFILE_INTERVAL:.0f}）")
+    textfile_parser.add_argument("--once", action="store_true", help="只写一次后退出")
+
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        print(render(), end="")
+        return 0
+    try:
+        if args.command == "serve":
+            server = start_http_server(args.port, args.host)
+            print(f"指标地址: http://{args.host}:{server.server_address[1]}/metrics（Ctrl+C 退出）")
+            while True:
+                time.sleep(3600)
+        if args.once:
+            write_textfile(args.output)
+            return 0
+        print(f"每 {args.interval:.0f} 秒写入 {args.output}（Ctrl+C 退出）")
+        while True:
+            write_textfile(args.output)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
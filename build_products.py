@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译产物的归属记录和过期清理
+编译成功后记录编译目录中每个目标文件（.o/.obj 及同名的 .d/.lst）由src中的哪个源文件生成。
+之后暂存时源文件不再存在（模块被删除或被忽略规则排除），只按记录删除它的目标文件，并删除输出目录中的
+链接产物使make重新链接，不必为了保险做一次完整的清理编译。
+--clean / --clean-outputs 同样按记录删除，不遍历编译目录。
+"""
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from build_run import BUILD_INFO_NAME, artifact_paths
+from file_sync import scan_tree
+from path_utils import get_state_path
+
+MANIFEST_VERSION = 2
+
+# 生成目标文件的源文件
+SOURCE_SUFFIXES = (".c", ".s", ".asm")
+
+# 由单个源文件生成的文件（目标文件、依赖文件和列表文件）
+OBJECT_SUFFIXES = (".o", ".obj", ".d", ".lst")
+
+
+class PruneResult:
+    """一次清理的统计：过期的源文件、删除的文件数和字节数"""
+
+    def __init__(self):
+        self.sources: List[str] = []
+        self.removed = 0
+        self.removed_bytes = 0
+        self.failed: List[Tuple[str, str]] = []
+
+    @property
+    def success(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        text = f"删除 {self.removed} 个编译产物 ({self.removed_bytes / 1024 / 1024:.1f} MB)"
+        if self.sources:
+            text += f"，来自 {len(self.sources)} 个已删除的源文件"
+        if self.failed:
+            text += f"，失败 {len(self.failed)}"
+        return text
+
+    def remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            self.failed.append((path, str(e)))
+            return
+        self.removed += 1
+        self.removed_bytes += size
+
+
+def _manifest_path(build_dir: str) -> str:
+    kernel = os.path.basename(os.path.dirname(os.path.abspath(build_dir)))
+    return get_state_path(f"build_products_{kernel}.json")
+
+
+def _load_manifest(build_dir: str) -> Optional[dict]:
+    """上次编译成功时的记录: sources 为 {源文件相对路径: [目标文件相对于编译目录的路径]}，
+    unowned 为无法确定归属的目标文件（清理时一并删除）；没有记录时返回None"""
+    try:
+        with open(_manifest_path(build_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != MANIFEST_VERSION or data.get("build_dir") != os.path.abspath(build_dir):
+        return None
+    return data
+
+
+def _save_manifest(build_dir: str, sources: Dict[str, List[str]], unowned: List[str]):
+    path = _manifest_path(build_dir)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "build_dir": os.path.abspath(build_dir), "sources": sources,
+                   "unowned": unowned}, f, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def _keys(rel_path: str) -> Iterator[str]:
+    """去掉扩展名后从完整路径到文件名的各级后缀（小写），例如 app/d0/m.c -> app/d0/m, d0/m, m"""
+    stem = os.path.splitext(rel_path)[0].lower()
+    while True:
+        yield stem
+        _, sep, stem = stem.partition("/")
+        if not sep:
+            return
+
+
+def map_objects(sources: Iterable[str], objects: Iterable[str]) -> Dict[str, List[str]]:
+    """按路径匹配目标文件和源文件：obj/app/d0/m.o 属于 app/d0/m.c，同名源文件不唯一时只按更长的路径匹配"""
+    owners: Dict[str, Optional[str]] = {}
+    for source in sources:
+        for key in _keys(source):
+            owners[key] = source if key not in owners else None
+    products: Dict[str, List[str]] = {}
+    for obj in objects:
+        for key in _keys(obj):
+            if key in owners:
+                owner = owners[key]
+                if owner is not None:
+                    products.setdefault(owner, []).append(obj)
+                break
+    return products
+
+
+def record_build_products(build_dir: str) -> int:
+    """编译成功后记录目标文件的归属，返回记录的文件数"""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(build_dir)), "src")
+    sources = [path for path in scan_tree(src_dir) if path.lower().endswith(SOURCE_SUFFIXES)]
+    objects = [path for path in scan_tree(build_dir)
+               if path.lower().endswith(OBJECT_SUFFIXES) and not path.startswith("out/")]
+    products = map_objects(sources, objects)
+    owned = {obj for paths in products.values() for obj in paths}
+    _save_manifest(build_dir, products, sorted(obj for obj in objects if obj not in owned))
+    return len(objects)
+
+
+def _remove_outputs(build_dir: str, result: PruneResult):
+    out_dir = os.path.join(build_dir, "out")
+    for path in artifact_paths(out_dir) + [os.path.join(out_dir, BUILD_INFO_NAME)]:
+        result.remove(path)
+
+
+def prune_stale_products(build_dir: str) -> PruneResult:
+    """删除src中已不存在的源文件的目标文件；有删除时同时删除链接产物，下次编译重新链接
+
+    只检查记录中的源文件是否存在，不遍历src和编译目录。
+    """
+    result = PruneResult()
+    manifest = _load_manifest(build_dir)
+    if manifest is None:
+        return result
+    products = manifest["sources"]
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(build_dir)), "src")
+    stale = [source for source in products if not os.path.exists(os.path.join(src_dir, *source.split("/")))]
+    if not stale:
+        return result
+    for source in stale:
+        for obj in products.pop(source):
+            result.remove(os.path.join(build_dir, *obj.split("/")))
+        result.sources.append(source)
+    # 链接产物中仍包含已删除模块的代码，而make只按剩余目标文件的时间判断是否需要重新链接
+    _remove_outputs(build_dir, result)
+    try:
+        _save_manifest(build_dir, products, manifest.get("unowned", []))
+    except OSError as e:
+        result.failed.append((_manifest_path(build_dir), str(e)))
+    return result
+
+
+def clean_build_products(build_dir: str, outputs_only: bool = False) -> PruneResult:
+    """删除输出目录中的编译产物，outputs_only 为False时同时删除所有目标文件（下次为完整编译）
+
+    目标文件按记录删除（包括无法确定归属的）；没有记录时（例如还没有成功编译过）按扩展名查找编译目录。
+    """
+    result = PruneResult()
+    if not outputs_only:
+        manifest = _load_manifest(build_dir)
+        if manifest is not None:
+            objects = [obj for paths in manifest["sources"].values() for obj in paths] + manifest.get("unowned", [])
+        else:
+            objects = [path for path in scan_tree(build_dir)
+                       if path.lower().endswith(OBJECT_SUFFIXES) and not path.startswith("out/")]
+        for obj in objects:
+            result.remove(os.path.join(build_dir, *obj.split("/")))
+        try:
+            os.remove(_manifest_path(build_dir))
+        except OSError:
+            pass
+    _remove_outputs(build_dir, result)
+    return result
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译流水线运行记录
+一次编译从源码暂存开始，到MSYS中编译完成后回调的编译后处理结束。界面/命令行进程记录前半段并保存为待完成记录，
+编译后处理进程读取它、补全编译耗时、诊断数量和产物信息后写入编译历史。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import build_metrics
+from file_sync import FileStat, hash_file, scan_tree
+from ignore_rules import IgnoreRules
+from path_utils import get_application_path, get_resource_path, get_state_path
+from pipeline_profiler import PipelineProfiler, maybe_phase
+from task_stamps import TaskStamp, path_state
+from toolchain_fingerprint import get_toolchain_fingerprint, source_hash_cache
+
+TARGET_NAMES = {"m": "MVCU", "s": "SVCU"}
+
+# MSYS编译脚本的输出记录在编译目录中
+BUILD_LOG_NAME = "build.log"
+
+# 从git版本编译时写入输出目录的来源信息
+BUILD_INFO_NAME = "build_info.json"
+
+# 内核目录中不作为编译输入的文件：暂存的源码（按内容哈希计入）、编译生成的文件和编译日志
+KERNEL_IGNORE_RULES = IgnoreRules(["/src/", "/build/out/", "/build/obj/", "*.o", "*.obj", "*.d", "*.lst",
+                                   "*.log", "*.tmp", ".build_status"])
+
+# 产物统计的文件类型
+ARTIFACT_SUFFIXES = (".elf", ".abs", ".map", ".xmap", ".hex", ".s19", ".srec", ".bin")
+
+# 诊断行: GCC 的 "file:line:col: warning:" 和 CodeWarrior 的 "Warning :" 格式
+_WARNING_RE = re.compile(r"(?:^|:\s*)warning\s*:", re.IGNORECASE)
+_ERROR_RE = re.compile(r"(?:^|:\s*)(?:fatal\s+)?error\s*:|^make.*\*\*\*", re.IGNORECASE)
+
+
+def _pending_path(code: str) -> str:
+    return get_state_path(f"pending_run_{code}.json")
+
+
+class BuildRun:
+    """一次编译运行的记录：目标、输入哈希、各阶段耗时、缓存命中、诊断数量、产物和指标"""
+
+    def __init__(self, code: str, source: Optional[str] = None, run_id: Optional[str] = None):
+        """code 为VCU类型代码: "m" 或 "s" """
+        self.run_id = run_id or f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.code = code
+        self.target = TARGET_NAMES.get(code, code)
+        self.source = source
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.status = "running"
+        self.inputs_hash: Optional[str] = None
+        self.toolchain_fingerprint: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.errors = 0
+        self.warnings = 0
+        self.artifacts: Dict[str, dict] = {}
+        self.metrics: Dict[str, float] = {}
+        self.launched_at: Optional[float] = None
+        # 从git版本暂存源码时为提交ID
+        self.revision: Optional[str] = None
+        # 开启性能分析时阶段同时记录到分析器（不跨进程传递）
+        self.profiler: Optional[PipelineProfiler] = None
+        if run_id is None:
+            # 从待完成记录恢复的运行（带run_id）已在启动它的进程中计数
+            build_metrics.BUILDS_STARTED.inc(target=self.target)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一个阶段的耗时，同名阶段累加"""
+        start = time.perf_counter()
+        try:
+            with maybe_phase(self.profiler, name):
+                yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        build_metrics.PHASE_DURATION.observe(seconds, target=self.target, phase=name)
+
+    def record_cache(self, hits: int, misses: int):
+        self.cache_hits += hits
+        self.cache_misses += misses
+        build_metrics.CACHE_HITS.inc(hits, target=self.target)
+        build_metrics.CACHE_MISSES.inc(misses, target=self.target)
+
+    @property
+    def cache_hit_rate(self) -> Optional[float]:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.finished - self.started if self.finished else None
+
+    def add_artifact(self, path: str, sha256: str, size: int):
+        self.artifacts[os.path.basename(path)] = {"sha256": sha256, "size": size}
+
+    def finish(self, status: str = "success"):
+        self.status = status
+        self.finished = time.time()
+        build_metrics.BUILDS_FINISHED.inc(target=self.target, status=status)
+        build_metrics.BUILD_DURATION.observe(self.duration, target=self.target)
+
+    # ---- 跨进程传递 ----
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id, "code": self.code, "target": self.target, "source": self.source,
+            "started": self.started, "finished": self.finished, "status": self.status,
+            "inputs_hash": self.inputs_hash, "toolchain_fingerprint": self.toolchain_fingerprint,
+            "phases": self.phases, "cache_hits": self.cache_hits, "cache_misses": self.cache_misses,
+            "errors": self.errors, "warnings": self.warnings,
+            "artifacts": self.artifacts, "metrics": self.metrics, "launched_at": self.launched_at,
+            "revision": self.revision,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BuildRun":
+        run = cls(data["code"], data.get("source"), data["run_id"])
+        for key, value in data.items():
+            if key != "run_id" and hasattr(run, key):
+                setattr(run, key, value)
+        return run
+
+    def save_pending(self):
+        """MSYS启动编译前保存记录，编译后处理进程继续完成它"""
+        self.launched_at = time.time()
+        path = _pending_path(self.code)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def take_pending(cls, code: str) -> Optional["BuildRun"]:
+        """读取并删除待完成的记录（每条只会被取走一次）"""
+        path = _pending_path(code)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError):
+            return None
+        return cls.from_dict(data)
+
+
+def _input_stats(source_path: str) -> Tuple[str, Dict[str, FileStat]]:
+    """返回 (根目录, {相对路径: (大小, 修改时间ns)})，单个文件时根目录为其所在目录"""
+    if os.path.isfile(source_path):
+        stat = os.stat(source_path)
+        return os.path.dirname(source_path), {os.path.basename(source_path): (stat.st_size, stat.st_mtime_ns)}
+    return source_path, scan_tree(source_path)
+
+
+def compute_inputs_hash(source_path: str, run: Optional[BuildRun] = None) -> str:
+    """计算暂存后源码（目录或单个文件）的内容哈希，文件哈希按大小和修改时间缓存
+
+    源码为目录时同时从缓存中删除其中已不存在的文件。
+    """
+    cache = source_hash_cache()
+    digest = hashlib.sha256()
+    hits = misses = 0
+    changed_bytes = 0
+    root, stats = _input_stats(source_path)
+    full_paths = []
+    for rel_path in sorted(stats):
+        size, mtime_ns = stats[rel_path]
+        full_path = os.path.join(root, *rel_path.split("/"))
+        full_paths.append(full_path)
+        file_digest = cache.get(full_path, size, mtime_ns)
+        if file_digest is None:
+            file_digest = hash_file(full_path)
+            cache.put(full_path, size, mtime_ns, file_digest)
+            misses += 1
+            changed_bytes += size
+        else:
+            hits += 1
+        digest.update(f"{rel_path}|{file_digest}\n".encode("utf-8"))
+    if os.path.isdir(source_path):
+        cache.prune(root, full_paths)
+    cache.save()
+    if run is not None:
+        run.record_cache(hits, misses)
+        # 暂存保留了修改时间，缓存未命中的就是本次新复制或更新的文件
+        build_metrics.BYTES_COPIED.inc(changed_bytes, target=run.target)
+    return digest.hexdigest()
+
+
+def warm_hash_cache(source_path: str, cancel: Optional[threading.Event] = None) -> int:
+    """预先计算文件哈希并写入缓存，之后的 compute_inputs_hash 可全部命中缓存；返回新计算的文件数
+
+    cancel 设置后在下一个文件前停止，已计算的结果仍会保存。
+    """
+    cache = source_hash_cache()
+    root, stats = _input_stats(source_path)
+    hashed = 0
+    try:
+        for rel_path, (size, mtime_ns) in stats.items():
+            if cancel is not None and cancel.is_set():
+                break
+            full_path = os.path.join(root, *rel_path.split("/"))
+            if cache.get(full_path, size, mtime_ns) is not None:
+                continue
+            try:
+                cache.put(full_path, size, mtime_ns, hash_file(full_path))
+            except OSError:
+                continue
+            hashed += 1
+    finally:
+        cache.save()
+    return hashed
+
+
+def record_inputs(run: BuildRun, staged_path: str):
+    """记录暂存后源码的输入哈希和工具链指纹，计入 inputs 阶段"""
+    with run.phase("inputs"):
+        run.inputs_hash = compute_inputs_hash(staged_path, run)
+        run.toolchain_fingerprint = get_toolchain_fingerprint()
+
+
+def count_diagnostics(log_path: str) -> Dict[str, int]:
+    """统计编译日志中的错误和警告行数"""
+    counts = {"errors": 0, "warnings": 0}
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if _ERROR_RE.search(line):
+                    counts["errors"] += 1
+                elif _WARNING_RE.search(line):
+                    counts["warnings"] += 1
+    except OSError:
+        pass
+    return counts
+
+
+def artifact_paths(out_dir: str) -> List[str]:
+    """输出目录中的编译产物"""
+    try:
+        entries = list(os.scandir(out_dir))
+    except OSError:
+        return []
+    return sorted(entry.path for entry in entries
+                  if entry.is_file() and entry.name.lower().endswith(ARTIFACT_SUFFIXES))
+
+
+def collect_artifacts(run: BuildRun, out_dir: str) -> List[str]:
+    """把输出目录中的编译产物（哈希和大小）记录到运行记录中"""
+    collected = artifact_paths(out_dir)
+    for path in collected:
+        run.add_artifact(path, hash_file(path), os.path.getsize(path))
+    return collected
+
+
+def write_build_info(run: BuildRun, out_dir: str) -> str:
+    """在输出目录中写入来源信息（源码、提交ID、运行ID）和产物哈希，产物可据此追溯到编译它的提交"""
+    path = os.path.join(out_dir, BUILD_INFO_NAME)
+    info = {
+        "run_id": run.run_id, "target": run.target, "source": run.source, "revision": run.revision,
+        "inputs_hash": run.inputs_hash, "toolchain_fingerprint": run.toolchain_fingerprint,
+        "built": run.finished or time.time(), "artifacts": run.artifacts,
+    }
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+
+def compile_stamp(run: BuildRun) -> TaskStamp:
+    """编译任务的戳记
+
+    输入为暂存源码的哈希、工具链指纹、内核目录中的其他文件（makefile、编译脚本、链接文件、编译后处理配置等）
+    和MSYS profile，输出为编译产物。
+    启动编译前检查（需要已执行 record_inputs），编译后处理成功后由编译后处理进程记录。
+    """
+    kernel_dir = os.path.join(get_application_path(), "VCU_compile - selftest",
+                              "dev_kernel_mvcu" if run.code == "m" else "dev_kernel_svcu")
+    profile_path = os.path.join(get_resource_path("MSYS-1.0.10-selftest"), "1.0", "etc", "profile")
+    return TaskStamp(f"compile_{run.code}",
+                     inputs={"sources": run.inputs_hash, "toolchain": run.toolchain_fingerprint,
+                             "kernel": lambda: path_state(kernel_dir, KERNEL_IGNORE_RULES)},
+                     input_paths=[profile_path],
+                     outputs=lambda: artifact_paths(os.path.join(kernel_dir, "build", "out")))
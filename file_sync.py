@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基于清单的目录增量同步
+只复制有变化的文件、删除目标中多余的文件，并给出汇总统计，用于发布目录和源码暂存目录的同步
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# 同步清单文件名，保存在目标目录根下，记录上次同步时各源文件的 (大小, 修改时间)
+MANIFEST_NAME = ".sync_manifest.json"
+MANIFEST_VERSION = 1
+
+# 没有清单时按修改时间比较的最大容差（FAT的时间精度为2秒），只用于时间精度不足的目标文件系统
+MTIME_TOLERANCE_NS = 2 * 1000 * 1000 * 1000
+
+# 探测时写入的修改时间：奇数秒加 999999999 ns，截断到任意精度g（100ns、1s、2s等）都会丢失 g-1ns
+_PROBE_MTIME_NS = 1600000001 * 1000 * 1000 * 1000 + 999999999
+
+# 目标目录 -> 修改时间的精度损失（ns）
+_tolerance_cache: Dict[str, int] = {}
+
+# 与 shutil.copytree 相同的忽略函数协议: ignore(directory, names) -> 需要忽略的名称集合
+IgnoreFunction = Callable[[str, List[str]], Iterable[str]]
+
+FileStat = Tuple[int, int]
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class SyncResult:
+    """一次目录同步的统计结果"""
+
+    def __init__(self, src: str, dest: str):
+        self.src = src
+        self.dest = dest
+        self.copied = 0
+        self.copied_bytes = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self.failed: List[Tuple[str, str]] = []
+        self.cancelled = False
+        self.elapsed = 0.0
+
+    @property
+    def success(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        """生成单行汇总信息"""
+        text = (f"同步 {self.src} -> {self.dest}: 复制 {self.copied} 个文件 "
+                f"({self.copied_bytes / 1024 / 1024:.1f} MB)，未变化 {self.unchanged}，"
+                f"删除 {self.removed}，忽略 {self.skipped} ({self.skipped_bytes / 1024 / 1024:.1f} MB)，耗时 {self.elapsed:.2f} s")
+        if self.failed:
+            text += f"，失败 {len(self.failed)}"
+        if self.cancelled:
+            text += "（已取消）"
+        return text
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "src": self.src,
+            "dest": self.dest,
+            "copied": self.copied,
+            "copied_bytes": self.copied_bytes,
+            "unchanged": self.unchanged,
+            "removed": self.removed,
+            "skipped": self.skipped,
+            "skipped_bytes": self.skipped_bytes,
+            "failed": len(self.failed),
+            "elapsed": round(self.elapsed, 4),
+        }
+
+
+def scan_tree(root: str, ignore: Optional[IgnoreFunction] = None,
+              result: Optional[SyncResult] = None, dirs: Optional[Set[str]] = None) -> Dict[str, FileStat]:
+    """扫描目录树，返回 {相对路径: (大小, 修改时间ns)}，相对路径统一使用'/'分隔
+
+    Args:
+        root: 要扫描的根目录
+        ignore: copytree风格的忽略函数
+        result: 若提供，被忽略的条目计入 result.skipped，其大小（目录为其中所有文件）计入 result.skipped_bytes
+        dirs: 若提供，收集扫描到的子目录相对路径
+    """
+    files: Dict[str, FileStat] = {}
+    stack = [("", root)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        try:
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            continue
+
+        ignored: Set[str] = set()
+        if ignore is not None:
+            ignored = set(ignore(abs_dir, [entry.name for entry in entries]))
+            if result is not None:
+                result.skipped += len(ignored)
+                result.skipped_bytes += sum(_entry_size(entry) for entry in entries if entry.name in ignored)
+
+        for entry in entries:
+            if entry.name in ignored:
+                continue
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((rel_path, entry.path))
+                    if dirs is not None:
+                        dirs.add(rel_path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[rel_path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+    return files
+
+
+def _entry_size(entry: os.DirEntry) -> int:
+    try:
+        if entry.is_dir(follow_symlinks=False):
+            return sum(size for size, _ in scan_tree(entry.path).values())
+        return entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        return 0
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(dest: str, manifest_name: str = MANIFEST_NAME) -> Dict[str, FileStat]:
+    """读取目标目录中的同步清单，不存在或损坏时返回空字典"""
+    manifest_path = os.path.join(dest, manifest_name)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return {path: (entry[0], entry[1]) for path, entry in data.get("files", {}).items()}
+
+
+def save_manifest(dest: str, files: Dict[str, FileStat], manifest_name: str = MANIFEST_NAME):
+    """原子地写入同步清单"""
+    manifest_path = os.path.join(dest, manifest_name)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, separators=(",", ":"))
+    os.replace(temp_path, manifest_path)
+
+
+def mtime_tolerance(dest: str) -> int:
+    """目标目录所在文件系统保存修改时间时的精度损失（ns），纳秒精度的文件系统为0
+
+    在目录中写入一个临时文件并设置修改时间后读回，结果按目录缓存。
+    """
+    dest = os.path.abspath(dest)
+    if dest in _tolerance_cache:
+        return _tolerance_cache[dest]
+    probe = os.path.join(dest, f".mtime_probe.{os.getpid()}.tmp")
+    try:
+        with open(probe, "wb"):
+            pass
+        try:
+            os.utime(probe, ns=(_PROBE_MTIME_NS, _PROBE_MTIME_NS))
+            loss = abs(os.stat(probe).st_mtime_ns - _PROBE_MTIME_NS)
+        finally:
+            os.remove(probe)
+    except OSError:
+        # 无法探测时按最粗的精度比较，不缓存
+        return MTIME_TOLERANCE_NS
+    _tolerance_cache[dest] = min(loss, MTIME_TOLERANCE_NS)
+    return _tolerance_cache[dest]
+
+
+def _is_unchanged(src_stat: FileStat, dest_stat: Optional[FileStat], recorded: Optional[FileStat],
+                  tolerance: int = 0) -> bool:
+    """判断目标文件是否无需更新"""
+    if dest_stat is None or dest_stat[0] != src_stat[0]:
+        return False
+    if recorded is not None:
+        return recorded == src_stat
+    # 没有清单记录时，copy2 会保留修改时间，可直接比较；目标文件系统时间精度不足时允许相应的误差，
+    # 否则大小不变的快速修改（例如改一个常量）会被当作未变化
+    return abs(dest_stat[1] - src_stat[1]) <= tolerance
+
+
+def sync_directory(src: str, dest: str, ignore: Optional[IgnoreFunction] = None,
+                   delete: bool = True, manifest_name: Optional[str] = MANIFEST_NAME,
+                   cancel: Optional[threading.Event] = None) -> SyncResult:
+    """把 src 目录增量同步到 dest
+
+    Args:
+        src: 源目录
+        dest: 目标目录，不存在时自动创建
+        ignore: copytree风格的忽略函数，被忽略的源文件不会同步
+        delete: 是否删除目标中源目录已不存在的文件
+        manifest_name: 同步清单文件名，为None时不使用清单，仅按大小和修改时间比较
+        cancel: 若提供，设置后在复制下一个文件前停止（不删除多余文件），result.cancelled 为True
+
+    Returns:
+        SyncResult: 同步统计
+    """
+    start = time.perf_counter()
+    result = SyncResult(src, dest)
+    os.makedirs(dest, exist_ok=True)
+
+    src_dirs: Set[str] = set()
+    src_files = scan_tree(src, ignore, result, src_dirs)
+    dest_files = scan_tree(dest)
+    if manifest_name:
+        dest_files.pop(manifest_name, None)
+        dest_files.pop(manifest_name + ".tmp", None)
+    recorded = load_manifest(dest, manifest_name) if manifest_name else {}
+    tolerance = mtime_tolerance(dest)
+
+    synced: Dict[str, FileStat] = {}
+    created_dirs: Set[str] = set()
+    for rel_path, src_stat in src_files.items():
+        if cancel is not None and cancel.is_set():
+            result.cancelled = True
+            break
+        if _is_unchanged(src_stat, dest_files.get(rel_path), recorded.get(rel_path), tolerance):
+            result.unchanged += 1
+            synced[rel_path] = src_stat
+            continue
+
+        src_file = os.path.join(src, *rel_path.split("/"))
+        dest_file = os.path.join(dest, *rel_path.split("/"))
+        dest_dir = os.path.dirname(dest_file)
+        try:
+            if dest_dir not in created_dirs:
+                os.makedirs(dest_dir, exist_ok=True)
+                created_dirs.add(dest_dir)
+            shutil.copy2(src_file, dest_file)
+        except OSError as e:
+            result.failed.append((rel_path, str(e)))
+            continue
+        result.copied += 1
+        result.copied_bytes += src_stat[0]
+        synced[rel_path] = src_stat
+
+    if result.cancelled:
+        src_dirs = set()
+        delete = False
+
+    # 保留源目录中的空目录（例如MSYS的tmp目录）
+    for rel_dir in src_dirs:
+        dest_dir = os.path.join(dest, *rel_dir.split("/"))
+        if dest_dir not in created_dirs and not os.path.isdir(dest_dir):
+            try:
+                os.makedirs(dest_dir, exist_ok=True)
+            except OSError as e:
+                result.failed.append((rel_dir, str(e)))
+
+    if delete:
+        for rel_path in dest_files:
+            if rel_path in src_files:
+                continue
+            try:
+                os.remove(os.path.join(dest, *rel_path.split("/")))
+                result.removed += 1
+            except OSError as e:
+                result.failed.append((rel_path, str(e)))
+        _remove_empty_dirs(dest, src_dirs)
+
+    if manifest_name:
+        try:
+            save_manifest(dest, synced, manifest_name)
+        except OSError as e:
+            result.failed.append((manifest_name, str(e)))
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _remove_empty_dirs(root: str, keep: Set[str]):
+    """自底向上删除源目录中已不存在的空目录（不删除根目录本身）"""
+    for current, dirs, files in os.walk(root, topdown=False):
+        if current == root or files:
+            continue
+        if os.path.relpath(current, root).replace(os.sep, "/") in keep:
+            continue
+        try:
+            if not os.listdir(current):
+                os.rmdir(current)
+        except OSError:
+            continue
+
+
+def sync_paths(src: str, dest: str, rel_paths: Iterable[str],
+               ignore: Optional[IgnoreFunction] = None) -> SyncResult:
+    """只同步指定的相对路径，用于已知哪些文件发生了变化的增量暂存（例如监视模式）
+
+    源中存在的文件在大小或修改时间与目标不完全相同时复制；目录按 sync_directory 同步其子树，
+    ""表示整个目录；源中已不存在的路径从目标中删除。
+
+    Args:
+        src: 源目录
+        dest: 目标目录
+        rel_paths: 使用'/'分隔的相对路径
+        ignore: 同步子目录时使用的copytree风格忽略函数
+    """
+    start = time.perf_counter()
+    result = SyncResult(src, dest)
+    # 父目录已在列表中时，其下的路径会随目录一起同步
+    paths = sorted(set(rel_paths))
+    dirs: List[str] = []
+    for rel_path in paths:
+        if any(rel_path == d or rel_path.startswith(d + "/") or d == "" for d in dirs):
+            continue
+        src_path = os.path.join(src, *rel_path.split("/")) if rel_path else src
+        dest_path = os.path.join(dest, *rel_path.split("/")) if rel_path else dest
+        try:
+            if os.path.isdir(src_path):
+                dirs.append(rel_path)
+                sub = sync_directory(src_path, dest_path, ignore, manifest_name=None)
+                result.copied += sub.copied
+                result.copied_bytes += sub.copied_bytes
+                result.unchanged += sub.unchanged
+                result.removed += sub.removed
+                result.skipped += sub.skipped
+                result.skipped_bytes += sub.skipped_bytes
+                prefix = f"{rel_path}/" if rel_path else ""
+                result.failed.extend((prefix + path, error) for path, error in sub.failed)
+            elif os.path.isfile(src_path):
+                stat = os.stat(src_path)
+                try:
+                    dest_stat = os.stat(dest_path)
+                except OSError:
+                    dest_stat = None
+                # 调用方已知该文件有变化，只有完全相同时才跳过（不使用修改时间容差）
+                if dest_stat and (dest_stat.st_size, dest_stat.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    result.unchanged += 1
+                    continue
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                shutil.copy2(src_path, dest_path)
+                result.copied += 1
+                result.copied_bytes += stat.st_size
+            elif os.path.isdir(dest_path):
+                shutil.rmtree(dest_path)
+                result.removed += 1
+            elif os.path.lexists(dest_path):
+                os.remove(dest_path)
+                result.removed += 1
+        except OSError as e:
+            result.failed.append((rel_path, str(e)))
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Flash镜像增量
+读取两个输出镜像（Intel HEX / S-record / 纯二进制）为按地址分段的内存镜像，
+按扇区比较找出有变化的扇区，输出只包含这些扇区的增量镜像和扇区列表，烧写时只需擦写变化的扇区。
+"""
+
+import bisect
+import json
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+DEFAULT_SECTOR_SIZE = 0x1000
+DEFAULT_FILL = 0xFF
+
+HEX_SUFFIXES = (".hex", ".ihx", ".ihex")
+SREC_SUFFIXES = (".s19", ".s28", ".s37", ".srec", ".mot", ".sx")
+
+# 粗比较时一次比较的扇区数，整块相同时跳过其中所有扇区
+_COARSE_SECTORS = 64
+
+
+class MemoryImage:
+    """按地址排序的连续数据段集合，每段用一个 bytearray 保存"""
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._segments: List[bytearray] = []
+        self.entry: Optional[int] = None
+
+    def write(self, address: int, data: bytes):
+        """写入数据，与已有段相邻时合并（按地址顺序写入时只追加到最后一段）"""
+        if not data:
+            return
+        starts, segments = self._starts, self._segments
+        if segments:
+            last = len(segments) - 1
+            if starts[last] + len(segments[last]) == address:
+                segments[last] += data
+                return
+        index = bisect.bisect_right(starts, address) - 1
+        if index >= 0 and address <= starts[index] + len(segments[index]):
+            segment = segments[index]
+            offset = address - starts[index]
+            segment[offset:offset + len(data)] = data
+        else:
+            index += 1
+            starts.insert(index, address)
+            segments.insert(index, bytearray(data))
+            segment = segments[index]
+        # 合并被新数据覆盖或相接的后续段
+        segment_end = starts[index] + len(segment)
+        while index + 1 < len(starts) and starts[index + 1] <= segment_end:
+            next_start, next_segment = starts.pop(index + 1), segments.pop(index + 1)
+            overlap = segment_end - next_start
+            if overlap < len(next_segment):
+                segment += next_segment[overlap:]
+            segment_end = starts[index] + len(segment)
+
+    def segments(self) -> Iterator[Tuple[int, bytearray]]:
+        return zip(self._starts, self._segments)
+
+    @property
+    def size(self) -> int:
+        return sum(len(segment) for segment in self._segments)
+
+    @property
+    def bounds(self) -> Tuple[int, int]:
+        if not self._starts:
+            return 0, 0
+        return self._starts[0], self._starts[-1] + len(self._segments[-1])
+
+    def read(self, start: int, end: int, fill: int = DEFAULT_FILL) -> bytearray:
+        """读取 [start, end) 的内容，没有数据的地址用 fill 填充"""
+        result = bytearray([fill]) * (end - start)
+        index = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        while index < len(self._starts) and self._starts[index] < end:
+            seg_start = self._starts[index]
+            segment = self._segments[index]
+            lo = max(start, seg_start)
+            hi = min(end, seg_start + len(segment))
+            if lo < hi:
+                result[lo - start:hi - start] = segment[lo - seg_start:hi - seg_start]
+            index += 1
+        return result
+
+    def view(self, start: int, end: int) -> Optional[memoryview]:
+        """[start, end) 完全位于一个段内时返回该段的只读视图（不复制），否则返回None"""
+        index = bisect.bisect_right(self._starts, start) - 1
+        if index < 0:
+            return None
+        seg_start = self._starts[index]
+        segment = self._segments[index]
+        if end > seg_start + len(segment):
+            return None
+        return memoryview(segment).toreadonly()[start - seg_start:end - seg_start]
+
+    def fill_gaps(self, start: int, end: int, fill: int = DEFAULT_FILL):
+        """把 [start, end) 中没有数据的地址填充为 fill，已有数据不变"""
+        gaps = []
+        cursor = start
+        for seg_start, segment in self.segments():
+            seg_end = seg_start + len(segment)
+            if seg_end <= cursor:
+                continue
+            if seg_start >= end:
+                break
+            if seg_start > cursor:
+                gaps.append((cursor, seg_start))
+            cursor = max(cursor, seg_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        for gap_start, gap_end in gaps:
+            self.write(gap_start, bytes([fill]) * (gap_end - gap_start))
+
+    def sector_indexes(self, sector_size: int) -> List[int]:
+        """返回有数据的扇区编号"""
+        indexes = set()
+        for start, segment in self.segments():
+            indexes.update(range(start // sector_size, (start + len(segment) - 1) // sector_size + 1))
+        return sorted(indexes)
+
+
+# ---------------------------------------------------------------- 读取
+
+
+def _record_bytes(line: str, path: str, line_no: int) -> bytes:
+    try:
+        return bytes.fromhex(line)
+    except ValueError:
+        raise ValueError(f"{path}:{line_no}: 无效的十六进制数据") from None
+
+
+def load_intel_hex(path: str) -> MemoryImage:
+    image = MemoryImage()
+    base = 0
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] != ":":
+                raise ValueError(f"{path}:{line_no}: 不是Intel HEX记录")
+            record = _record_bytes(line[1:], path, line_no)
+            if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+                raise ValueError(f"{path}:{line_no}: 记录长度或校验和错误")
+            record_type = record[3]
+            data = record[4:-1]
+            if record_type == 0x00:
+                image.write(base + ((record[1] << 8) | record[2]), data)
+            elif record_type == 0x01:
+                break
+            elif record_type == 0x02:
+                base = int.from_bytes(data, "big") << 4
+            elif record_type == 0x04:
+                base = int.from_bytes(data, "big") << 16
+            elif record_type in (0x03, 0x05):
+                image.entry = int.from_bytes(data, "big")
+    return image
+
+
+_SREC_ADDRESS_BYTES = {"0": 2, "1": 2, "2": 3, "3": 4, "5": 2, "6": 3, "7": 4, "8": 3, "9": 2}
+
+
+def load_srecord(path: str) -> MemoryImage:
+    image = MemoryImage()
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] != "S" or line[1:2] not in _SREC_ADDRESS_BYTES:
+                raise ValueError(f"{path}:{line_no}: 不是S-record记录")
+            kind = line[1]
+            record = _record_bytes(line[2:], path, line_no)
+            if not record or len(record) != record[0] + 1 or (sum(record) & 0xFF) != 0xFF:
+                raise ValueError(f"{path}:{line_no}: 记录长度或校验和错误")
+            address_bytes = _SREC_ADDRESS_BYTES[kind]
+            address = int.from_bytes(record[1:1 + address_bytes], "big")
+            if kind in "123":
+                image.write(address, record[1 + address_bytes:-1])
+            elif kind in "789":
+                image.entry = address
+    return image
+
+
+def load_binary(path: str, base: int = 0) -> MemoryImage:
+    image = MemoryImage()
+    with open(path, "rb") as f:
+        image.write(base, f.read())
+    return image
+
+
+def image_format(path: str) -> str:
+    """按扩展名判断镜像格式: "hex"、"srec" 或 "bin" """
+    lower = path.lower()
+    if lower.endswith(HEX_SUFFIXES):
+        return "hex"
+    if lower.endswith(SREC_SUFFIXES):
+        return "srec"
+    return "bin"
+
+
+def load_image(path: str, base: int = 0) -> MemoryImage:
+    """按扩展名读取镜像，base 只用于纯二进制文件"""
+    fmt = image_format(path)
+    if fmt == "hex":
+        return load_intel_hex(path)
+    if fmt == "srec":
+        return load_srecord(path)
+    return load_binary(path, base)
+
+
+# ---------------------------------------------------------------- 写出
+
+
+def _chunks(image: MemoryImage, chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+    for start, segment in image.segments():
+        for offset in range(0, len(segment), chunk_size):
+            yield start + offset, bytes(segment[offset:offset + chunk_size])
+
+
+def _hex_record(record_type: int, address: int, data: bytes) -> str:
+    record = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+    return ":" + (record + bytes([(-sum(record)) & 0xFF])).hex().upper()
+
+
+def write_intel_hex(image: MemoryImage, path: str, record_size: int = 32):
+    lines = []
+    upper = None
+    for address, data in _chunks(image, record_size):
+        # 数据记录不能跨越64K边界
+        while data:
+            if address >> 16 != upper:
+                upper = address >> 16
+                lines.append(_hex_record(0x04, 0, upper.to_bytes(2, "big")))
+            take = min(len(data), 0x10000 - (address & 0xFFFF))
+            lines.append(_hex_record(0x00, address & 0xFFFF, data[:take]))
+            address, data = address + take, data[take:]
+    if image.entry is not None:
+        lines.append(_hex_record(0x05, 0, image.entry.to_bytes(4, "big")))
+    lines.append(":00000001FF")
+    with open(path, "w", encoding="ascii", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _srec_record(kind: str, address: int, address_bytes: int, data: bytes) -> str:
+    record = bytes([address_bytes + len(data) + 1]) + address.to_bytes(address_bytes, "big") + data
+    return f"S{kind}" + (record + bytes([(~sum(record)) & 0xFF])).hex().upper()
+
+
+def write_srecord(image: MemoryImage, path: str, record_size: int = 32, header: Optional[str] = None):
+    """写出S-record，header 不为None时写入S0头记录"""
+    lines = [] if header is None else [_srec_record("0", 0, 2, header.encode("ascii", errors="replace"))]
+    count = 0
+    for address, data in _chunks(image, record_size):
+        lines.append(_srec_record("3", address, 4, data))
+        count += 1
+    if count <= 0xFFFF:
+        lines.append(_srec_record("5", count, 2, b""))
+    lines.append(_srec_record("7", image.entry or 0, 4, b""))
+    with open(path, "w", encoding="ascii", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_image(image: MemoryImage, path: str, fmt: Optional[str] = None, fill: int = DEFAULT_FILL,
+                header: Optional[str] = None):
+    """按格式（默认按扩展名）写出镜像
+
+    Args:
+        fill: 二进制格式把各段之间的空白填充为一个连续块时使用的值
+        header: S-record的S0头记录内容，None时不写
+    """
+    fmt = fmt or image_format(path)
+    if fmt == "hex":
+        write_intel_hex(image, path)
+    elif fmt == "srec":
+        write_srecord(image, path, header=header)
+    else:
+        start, end = image.bounds
+        with open(path, "wb") as f:
+            f.write(image.read(start, end, fill))
+
+
+# ---------------------------------------------------------------- 扇区比较
+
+
+def _runs(indexes: List[int]) -> Iterator[Tuple[int, int]]:
+    """把有序的扇区编号分组为连续区间 [first, last]"""
+    if not indexes:
+        return
+    first = previous = indexes[0]
+    for index in indexes[1:]:
+        if index != previous + 1:
+            yield first, previous
+            first = index
+        previous = index
+    yield first, previous
+
+
+def changed_sectors(old: MemoryImage, new: MemoryImage, sector_size: int = DEFAULT_SECTOR_SIZE,
+                    fill: int = DEFAULT_FILL) -> Tuple[List[int], List[int]]:
+    """找出内容有变化的扇区
+
+    按连续区间一次读出两边的内容，先以多个扇区为单位整块比较（C层面的内存比较），
+    只有不同的块才逐扇区比较。
+
+    Returns:
+        (需要重新烧写的扇区起始地址, 只需擦除的扇区起始地址)
+    """
+    new_indexes = set(new.sector_indexes(sector_size))
+    all_indexes = sorted(new_indexes.union(old.sector_indexes(sector_size)))
+    program: List[int] = []
+    erase: List[int] = []
+    coarse = sector_size * _COARSE_SECTORS
+    for first, last in _runs(all_indexes):
+        start = first * sector_size
+        end = (last + 1) * sector_size
+        old_data = old.read(start, end, fill)
+        new_data = new.read(start, end, fill)
+        if old_data == new_data:
+            continue
+        old_view, new_view = memoryview(old_data), memoryview(new_data)
+        for block in range(0, end - start, coarse):
+            block_end = min(block + coarse, end - start)
+            if old_view[block:block_end] == new_view[block:block_end]:
+                continue
+            for offset in range(block, block_end, sector_size):
+                if old_view[offset:offset + sector_size] == new_view[offset:offset + sector_size]:
+                    continue
+                address = start + offset
+                if address // sector_size in new_indexes:
+                    program.append(address)
+                else:
+                    erase.append(address)
+    return program, erase
+
+
+def build_delta(old: MemoryImage, new: MemoryImage, sector_size: int = DEFAULT_SECTOR_SIZE,
+                fill: int = DEFAULT_FILL) -> Tuple[MemoryImage, dict]:
+    """生成只包含变化扇区完整内容的增量镜像和扇区列表
+
+    扇区会被整体擦除，因此增量镜像包含变化扇区的全部内容（空白处用 fill 填充）。
+    """
+    start_time = time.perf_counter()
+    program, erase = changed_sectors(old, new, sector_size, fill)
+    delta = MemoryImage()
+    delta.entry = new.entry
+    for address in program:
+        delta.write(address, new.read(address, address + sector_size, fill))
+
+    total = len(set(new.sector_indexes(sector_size)))
+    sectors = ([{"address": address, "action": "program"} for address in program]
+               + [{"address": address, "action": "erase"} for address in erase])
+    sectors.sort(key=lambda sector: sector["address"])
+    info = {
+        "sector_size": sector_size,
+        "fill": fill,
+        "total_sectors": total,
+        "program_sectors": len(program),
+        "erase_sectors": len(erase),
+        "delta_bytes": delta.size,
+        "image_bytes": new.size,
+        "sectors": sectors,
+        "elapsed": round(time.perf_counter() - start_time, 4),
+    }
+    return delta, info
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="比较两个Flash镜像，生成只包含变化扇区的增量镜像")
+    parser.add_argument("old", help="旧镜像（.hex/.s19/.bin）")
+    parser.add_argument("new", help="新镜像（.hex/.s19/.bin）")
+    parser.add_argument("-o", "--output", required=True, help="增量镜像输出路径（格式按扩展名决定）")
+    parser.add_argument("--sector-size", type=lambda v: int(v, 0), default=DEFAULT_SECTOR_SIZE,
+                        help=f"扇区大小，按目标芯片设置（默认 0x{DEFAULT_SECTOR_SIZE:X}）")
+    parser.add_argument("--fill", type=lambda v: int(v, 0), default=DEFAULT_FILL,
+                        help=f"擦除后的字节值（默认 0x{DEFAULT_FILL:02X}）")
+    parser.add_argument("--base", type=lambda v: int(v, 0), default=0, help="二进制镜像的起始地址")
+    parser.add_argument("--sectors-json", help="扇区列表JSON输出路径（默认为输出文件名加.sectors.json）")
+    args = parser.parse_args(argv)
+
+    if args.sector_size <= 0:
+        parser.error("扇区大小必须大于0")
+    old = load_image(args.old, args.base)
+    new = load_image(args.new, args.base)
+    delta, info = build_delta(old, new, args.sector_size, args.fill)
+    info["old"] = os.path.abspath(args.old)
+    info["new"] = os.path.abspath(args.new)
+
+    write_image(delta, args.output, fill=args.fill, header="delta")
+    sectors_path = args.sectors_json or os.path.splitext(args.output)[0] + ".sectors.json"
+    with open(sectors_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=1)
+
+    print(f"扇区大小 0x{args.sector_size:X}: 共 {info['total_sectors']} 个扇区，"
+          f"需烧写 {info['program_sectors']} 个，只需擦除 {info['erase_sectors']} 个")
+    print(f"增量镜像 {info['delta_bytes']} 字节（完整镜像 {info['image_bytes']} 字节），"
+          f"比较耗时 {info['elapsed'] * 1000:.0f} ms")
+    print(f"增量镜像: {args.output}")
+    print(f"扇区列表: {sectors_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
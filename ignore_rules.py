@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+gitignore风格的忽略规则引擎
+规则只编译一次：精确名称和扩展名走集合查找，其余通配模式合并为一个正则，
+供打包复制和源码暂存共用
+"""
+
+import os
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# 打包和暂存时默认排除的文件和目录（gitignore语法，不含'/'的模式匹配任意层级的名称）
+DEFAULT_IGNORE_PATTERNS = [
+    '.git',                     # Git 仓库
+    '.gitignore',               # Git 忽略文件
+    '__pycache__',              # Python 缓存
+    '*.pyc',                    # Python 编译文件
+    '*.pyo',                    # Python 优化文件
+    '.vs',                      # Visual Studio
+    '.vscode',                  # VS Code
+    'Thumbs.db',                # Windows 缩略图
+    '.DS_Store',                # macOS 文件
+    '*.tmp',                    # 临时文件
+    '*.temp',                   # 临时文件
+    '*.log',                    # 日志文件
+    'dist',                     # 构建输出目录
+    'build',                    # 构建临时目录
+    '.metadata',                # Eclipse 元数据目录
+    '.settings',                # Eclipse 设置目录
+    '.project',                 # Eclipse 项目文件
+    '.cproject',                # Eclipse C/C++ 项目文件
+    '.classpath',               # Eclipse Java 类路径文件
+    '*.launch',                 # Eclipse 启动配置文件
+    '.history',                 # Eclipse 历史目录
+    'RemoteSystemsTempFiles',   # Eclipse 远程系统临时文件
+    '*.d',                      # 依赖文件
+    '*.o',                      # 目标文件
+    '*.obj',                    # 目标文件
+    '*.elf',                    # 可执行文件
+    '*.bin',                    # 二进制文件
+    '*.hex',                    # 十六进制文件
+    '*.map',                    # 映射文件
+    '*.lst',                    # 列表文件
+    'Debug',                    # Debug 目录
+    'Release',                  # Release 目录
+    '*.workspace',              # 工作空间文件
+]
+
+# 源码根目录中的项目忽略规则文件（gitignore语法），在默认规则之后应用，可以用'!'取消默认规则
+SOURCE_IGNORE_FILE = '.loccompileignore'
+
+# 只复制重要文件时保留的文件（源码、脚本、说明和makefile）
+IMPORTANT_FILE_PATTERNS = [
+    '*.c', '*.h', '*.s', '*.asm',
+    '*.txt', '*.md',
+    '*.bat', '*.sh', '*.py',
+    'makefile', 'readme',
+]
+
+# 只复制重要文件时跳过的目录（IDE元数据和构建输出）
+IMPORTANT_SKIP_DIR_PATTERNS = [
+    '.git/', '__pycache__/',
+    '.metadata/', '.settings/', 'RemoteSystemsTempFiles/',
+    'Debug/', 'Release/',
+]
+
+_GLOB_CHARS = frozenset('*?[')
+
+
+def _translate_glob(pattern: str) -> str:
+    """把gitignore通配模式转换为正则（'*'不跨越'/'，'**'可跨越目录）"""
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                if pattern.startswith('**/', i):
+                    result.append('(?:.*/)?')
+                    i += 3
+                else:
+                    result.append('.*')
+                    i += 2
+                continue
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                result.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                result.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+
+def _combine(regexes: List[str]) -> Optional[Callable[[str], object]]:
+    """把多个正则合并为一个 fullmatch 函数"""
+    if not regexes:
+        return None
+    return re.compile('|'.join(f'(?:{r})' for r in regexes), re.DOTALL).fullmatch
+
+
+class _RuleBlock:
+    """同一极性（忽略或取消忽略）的连续规则编译后的匹配器"""
+
+    def __init__(self, negate: bool):
+        self.negate = negate
+        # 索引0: 同时匹配文件和目录；索引1: 只匹配目录
+        self._names: Tuple[Set[str], Set[str]] = (set(), set())
+        self._exts: Tuple[Set[str], Set[str]] = (set(), set())
+        self._name_regexes: Tuple[List[str], List[str]] = ([], [])
+        self._path_regexes: Tuple[List[str], List[str]] = ([], [])
+        self._name_match = (None, None)
+        self._path_match = (None, None)
+
+    def add(self, pattern: str, dir_only: bool, anchored: bool):
+        kind = 1 if dir_only else 0
+        if anchored:
+            self._path_regexes[kind].append(_translate_glob(pattern))
+        elif not _GLOB_CHARS.intersection(pattern):
+            self._names[kind].add(pattern)
+        elif (pattern.startswith('*.') and '.' not in pattern[2:]
+              and not _GLOB_CHARS.intersection(pattern[2:])):
+            self._exts[kind].add(pattern[1:])
+        else:
+            self._name_regexes[kind].append(_translate_glob(pattern))
+
+    def compile(self):
+        self._name_match = tuple(_combine(regexes) for regexes in self._name_regexes)
+        self._path_match = tuple(_combine(regexes) for regexes in self._path_regexes)
+        self.has_dir_only = bool(self._names[1] or self._exts[1] or self._name_regexes[1]
+                                 or self._path_regexes[1])
+        self.has_anchored = bool(self._path_regexes[0] or self._path_regexes[1])
+
+    def match(self, rel_path: str, name: str, ext: str, is_dir: bool) -> bool:
+        for kind in ((0, 1) if is_dir else (0,)):
+            if name in self._names[kind] or (ext and ext in self._exts[kind]):
+                return True
+            name_match = self._name_match[kind]
+            if name_match is not None and name_match(name):
+                return True
+            path_match = self._path_match[kind]
+            if path_match is not None and path_match(rel_path):
+                return True
+        return False
+
+
+class IgnoreRules:
+    """编译后的gitignore风格规则集
+
+    支持的语法: 注释(#)、取消忽略(!)、仅目录(结尾'/')、锚定路径(包含'/')、
+    通配符 * ? [...] 以及跨目录的 **。后出现的规则优先（与gitignore一致）。
+    默认不区分大小写，与Windows文件系统保持一致。
+    """
+
+    def __init__(self, patterns: Iterable[str] = (), case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.patterns: List[str] = []
+        self._blocks: List[_RuleBlock] = []
+        self.extend(patterns)
+
+    @classmethod
+    def from_file(cls, path: str, base: Optional['IgnoreRules'] = None) -> 'IgnoreRules':
+        """从gitignore格式的文件读取规则，可在已有规则之后追加"""
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+        if base is None:
+            return cls(lines)
+        return cls(list(base.patterns) + lines, base.case_sensitive)
+
+    def extend(self, patterns: Iterable[str]):
+        """追加规则并重新编译受影响的规则块"""
+        for raw in patterns:
+            line = raw.rstrip('\r\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            line = line.strip()
+            self.patterns.append(line)
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            if line.startswith('\\'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if not self.case_sensitive:
+                line = line.lower()
+
+            if not self._blocks or self._blocks[-1].negate != negate:
+                self._blocks.append(_RuleBlock(negate))
+            self._blocks[-1].add(line, dir_only, anchored)
+
+        for block in self._blocks:
+            block.compile()
+        self._has_negation = any(block.negate for block in self._blocks)
+        self.has_dir_only = any(block.has_dir_only for block in self._blocks)
+        self.has_anchored = any(block.has_anchored for block in self._blocks)
+
+    def __bool__(self) -> bool:
+        return bool(self._blocks)
+
+    def match(self, rel_path: str, is_dir: bool = False) -> bool:
+        """判断单个条目本身是否被忽略（不检查上级目录）
+
+        Args:
+            rel_path: 相对于规则根目录的路径，使用'/'分隔
+            is_dir: 条目是否为目录
+        """
+        if not self._blocks:
+            return False
+        if not self.case_sensitive:
+            rel_path = rel_path.lower()
+        name = rel_path.rpartition('/')[2]
+        dot = name.rfind('.')
+        ext = name[dot:] if dot > 0 else ''
+
+        if not self._has_negation:
+            block = self._blocks[0]
+            return block.match(rel_path, name, ext, is_dir)
+
+        for block in reversed(self._blocks):
+            if block.match(rel_path, name, ext, is_dir):
+                return not block.negate
+        return False
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False,
+                   _dir_cache: Optional[Dict[str, bool]] = None) -> bool:
+        """判断路径是否被忽略，上级目录被忽略时其下所有内容也视为被忽略
+
+        适用于归档条目等没有目录遍历顺序的场景，可传入字典缓存目录判断结果。
+        """
+        parts = rel_path.strip('/').split('/')
+        prefix = ''
+        for part in parts[:-1]:
+            prefix = f"{prefix}/{part}" if prefix else part
+            if _dir_cache is not None and prefix in _dir_cache:
+                ignored = _dir_cache[prefix]
+            else:
+                ignored = self.match(prefix, True)
+                if _dir_cache is not None:
+                    _dir_cache[prefix] = ignored
+            if ignored:
+                return True
+        return self.match('/'.join(parts), is_dir)
+
+    def copytree_ignore(self, root: str) -> Callable[[str, List[str]], Set[str]]:
+        """生成 shutil.copytree / file_sync 使用的忽略函数，root为规则的根目录"""
+        root = os.path.abspath(root)
+
+        def ignore(directory: str, names: List[str]) -> Set[str]:
+            prefix = ''
+            if self.has_anchored:
+                # 只有锚定模式需要完整的相对路径
+                rel_dir = os.path.relpath(os.path.abspath(directory), root).replace(os.sep, '/')
+                prefix = '' if rel_dir == '.' else rel_dir + '/'
+            ignored = set()
+            for name in names:
+                rel_path = prefix + name
+                if self.match(rel_path, False):
+                    ignored.add(name)
+                elif self.has_dir_only and os.path.isdir(os.path.join(directory, name)):
+                    if self.match(rel_path, True):
+                        ignored.add(name)
+            return ignored
+
+        return ignore
+
+    def walk(self, root: str) -> Iterator[Tuple[str, str, List[str], List[str]]]:
+        """类似 os.walk，被忽略的目录不会进入，被忽略的文件不会返回
+
+        Yields:
+            (绝对目录, 相对目录('.'表示根), 子目录列表, 文件列表)
+        """
+        for current, dirs, files in os.walk(root):
+            rel_dir = os.path.relpath(current, root).replace(os.sep, '/')
+            prefix = '' if rel_dir == '.' else rel_dir + '/'
+            dirs[:] = [d for d in dirs if not self.match(prefix + d, True)]
+            files = [f for f in files if not self.match(prefix + f, False)]
+            yield current, rel_dir, dirs, files
+
+
+def default_ignore_rules() -> IgnoreRules:
+    """返回默认的打包/暂存忽略规则"""
+    return IgnoreRules(DEFAULT_IGNORE_PATTERNS)
+
+
+def source_ignore_rules(lines: Iterable[str] = ()) -> IgnoreRules:
+    """源码暂存的忽略规则：默认规则和规则文件本身，之后是项目规则文件中的行"""
+    return IgnoreRules(DEFAULT_IGNORE_PATTERNS + [SOURCE_IGNORE_FILE] + list(lines))
+
+
+def load_source_ignore_rules(source_root: str) -> IgnoreRules:
+    """读取源码目录中的 .loccompileignore（不存在时只使用默认规则）"""
+    path = os.path.join(source_root, SOURCE_IGNORE_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return source_ignore_rules(f.read().splitlines())
+    except OSError:
+        return source_ignore_rules()
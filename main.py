@@ -4,9 +4,24 @@
 import os
 import sys
 import argparse
-import subprocess
-import shutil
-from path_utils import get_application_path, get_resource_path
+import time
+from path_utils import get_application_path, get_resource_path, resource_available
+from toolchain_fingerprint import quick_check_toolchains, verify_toolchains, get_toolchain_fingerprint
+from memory_usage import report_build_output
+from postbuild import CONFIG_NAME as POSTBUILD_CONFIG_NAME, run_for_build_dir
+from build_run import (BUILD_LOG_NAME, BuildRun, collect_artifacts, compile_stamp, count_diagnostics, record_inputs,
+                       write_build_info)
+from build_history import record_run
+from build_products import clean_build_products, prune_stale_products, record_build_products
+import build_metrics
+from pipeline import PipelineScheduler
+from pipeline_profiler import PipelineProfiler
+from source_archive import archive_stem, detect_vcu_type, is_archive
+from source_git import GitSource
+from source_staging import EXIT_AFTER_BUILD_ENV_VAR, find_c_modules, launch_msys, stage_sources, staged_source_path
+from source_watcher import DEFAULT_DEBOUNCE
+from task_stamps import TaskStamp, configure as configure_task_stamps
+from watch_build import WatchBuilder
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
@@ -15,8 +30,8 @@ from datetime import datetime
 
 # 打开输出目录函数
 def open_output_dir(output_dir):
-    """直接打开输出目录"""
-    if os.path.exists(output_dir):
+    """直接打开输出目录（只在Windows上可用）"""
+    if os.path.exists(output_dir) and hasattr(os, "startfile"):
         os.startfile(output_dir)
         return output_dir
     return None
@@ -59,13 +74,20 @@ def ensure_project_structure():
         missing_dirs = []
         
         for res_dir in resource_dirs:
-            res_path = get_resource_path(res_dir)
-            if not os.path.exists(res_path):
+            # 工具链也可能以压缩包形式提供，此处只检查是否可用，不触发解压
+            if not resource_available(res_dir):
                 missing_dirs.append(res_dir)
         
         if missing_dirs:
             print(f"警告: 缺少以下资源目录: {', '.join(missing_dirs)}")
             print("请确保这些目录与exe文件在同一目录下")
+        
+        # 有随release发布的工具链清单时，按文件大小快速检查工具链是否复制完整。
+        # 每次启动都检查（只读取文件状态，不读取内容）：目录本身的修改时间反映不了其中文件被截断或删除
+        incomplete = quick_check_toolchains()
+        if incomplete:
+            print(f"警告: 工具链不完整: {'; '.join(incomplete)}")
+            print("请重新复制工具链，或使用 --verify-toolchain 查看详细信息")
             
     except Exception as e:
         print(f"创建项目结构时出错: {e}")
@@ -164,9 +186,9 @@ def update_makefiles_with_correct_paths(callback=None):
     if script_dir and len(script_dir) >= 2 and script_dir[1] == ':':
         script_dir = script_dir[0].upper() + script_dir[1:]
     
-    # 获取CW和GCC的绝对路径
-    cw_path = os.path.join(script_dir, "CW", "ColdFire_Tools", "Command_Line_Tools")
-    gcc_path = os.path.join(script_dir, "GCC", "bin")
+    # 获取CW和GCC的绝对路径（工具链以压缩包提供时指向解压缓存）
+    cw_path = os.path.join(get_resource_path("CW"), "ColdFire_Tools", "Command_Line_Tools")
+    gcc_path = os.path.join(get_resource_path("GCC"), "bin")
     
     # 转换为Windows格式的路径 (使用正斜杠，适用于makefile)
     win_cw_path = cw_path.replace(os.sep, "/")
@@ -197,6 +219,17 @@ def update_makefiles_with_correct_paths(callback=None):
     
     results = []  # 用于收集结果报告
     
+    # 编译器路径和makefile都没有变化时不再重新读写
+    stamp = TaskStamp("makefile_paths", inputs={"cw_path": win_cw_path, "gcc_path": win_gcc_path},
+                      outputs=makefile_paths)
+    if stamp.check() is None:
+        for makefile_path in makefile_paths:
+            makefile_type = "MVCU" if "dev_kernel_mvcu" in makefile_path else "SVCU"
+            up_to_date_msg = "{} makefile is up to date: {}".format(makefile_type, makefile_path)
+            show_message(up_to_date_msg)
+            results.append({"type": makefile_type, "success": True, "message": up_to_date_msg, "path": makefile_path})
+        return results
+    
     for makefile_path in makefile_paths:
         # 预先判断makefile类型，确保在文件不存在的情况下也能记录
         makefile_type = "MVCU" if "dev_kernel_mvcu" in makefile_path else "SVCU"
@@ -225,6 +258,7 @@ def update_makefiles_with_correct_paths(callback=None):
                 continue
             
             try:
+                original_content = content
                 # 使用正则表达式进行替换，确保路径使用双引号正确转义
                 # 替换CW路径
                 content = re.sub(r'CW_PATH\s*=\s*[^\n]*', 'CW_PATH = {}'.format(win_cw_path), content)
@@ -237,9 +271,10 @@ def update_makefiles_with_correct_paths(callback=None):
                 content = re.sub(r'@echo\s+"?编译器路径:"?', '@echo "Compiler paths:"', content)
                 content = re.sub(r'@echo\s+"?=============================="?', '@echo "=============================="', content)
                 
-                # 保存修改后的内容，使用相同的编码
-                with open(makefile_path, 'w', encoding=used_encoding) as f:
-                    f.write(content)
+                # 保存修改后的内容，使用相同的编码（内容没有变化时不写入，避免makefile的修改时间触发重新编译）
+                if content != original_content:
+                    with open(makefile_path, 'w', encoding=used_encoding) as f:
+                        f.write(content)
                 
                 success_msg = "Successfully updated {} makefile: {}".format(makefile_type, makefile_path)
                 show_message(success_msg)
@@ -253,9 +288,25 @@ def update_makefiles_with_correct_paths(callback=None):
             show_message(error_msg, is_error=True)
             results.append({"type": makefile_type, "success": False, "message": error_msg})
     
+    if all(item["success"] for item in results):
+        stamp.record()
+    
     # 返回更新结果，可在UI中使用
     return results
 
+def to_msys_path(path):
+    """把Windows路径转换为MSYS路径格式 (C:\\a\\b -> /c/a/b)"""
+    msys_path = path.replace(os.sep, "/")
+    if len(msys_path) >= 2 and msys_path[1] == ':':
+        msys_path = f"/{msys_path[0].lower()}" + msys_path[2:]
+    return msys_path
+
+def get_self_command():
+    """返回重新调用本程序的命令（打包后为exe，开发环境为 python main.py）"""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable]
+    return [sys.executable, os.path.abspath(__file__)]
+
 def update_msys_profile():
     """更新MSYS的profile文件，使用简单的路径指定方式"""
     # 获取资源目录
@@ -273,7 +324,7 @@ def update_msys_profile():
     vcu_dir = os.path.normpath(vcu_dir)
     
     # 构建MSYS profile路径
-    profile_path = os.path.join(script_dir, "MSYS-1.0.10-selftest", "1.0", "etc", "profile")
+    profile_path = os.path.join(get_resource_path("MSYS-1.0.10-selftest"), "1.0", "etc", "profile")
     profile_path = os.path.normpath(profile_path)
     
     if not os.path.exists(profile_path):
@@ -281,22 +332,15 @@ def update_msys_profile():
         return False, None, None
     
     # 将Windows路径转换为MSYS路径格式
-    msys_path_format = script_dir.replace(os.sep, "/")
-    vcu_path_format = vcu_dir.replace(os.sep, "/")
-    
-    # 转换驱动器格式 (C: -> /c)
-    if msys_path_format and len(msys_path_format) >= 2 and msys_path_format[1] == ':':
-        drive_letter = msys_path_format[0].lower()
-        msys_path_format = f"/{drive_letter}" + msys_path_format[2:]
-    
-    if vcu_path_format and len(vcu_path_format) >= 2 and vcu_path_format[1] == ':':
-        drive_letter = vcu_path_format[0].lower()
-        vcu_path_format = f"/{drive_letter}" + vcu_path_format[2:]
+    vcu_path_format = to_msys_path(vcu_dir)
     
     # 构建MSYS脚本内容
     mvcu_path = f"{vcu_path_format}/dev_kernel_mvcu/build"
     svcu_path = f"{vcu_path_format}/dev_kernel_svcu/build"
     
+    # 编译成功后回调本程序执行编译后处理（CRC、填充、格式转换、占用分析）
+    post_build_command = " ".join(f'"{to_msys_path(part)}"' for part in get_self_command())
+    
     # 创建最简单的profile头部
     profile_header = '''# Copyright (C) 2001, 2002  Earnie Boyd  <earnie@users.sf.net>
 # This file is part of the Minimal SYStem.
@@ -382,11 +426,30 @@ if [ -n "$MSYS_FLAG" ]; then
   # 检查脚本是否存在并执行
   if [ -f "$script_name" ]; then
     echo "Executing script: $script_name"
-    sh "$script_name"
+    # 编译输出同时记录到 {BUILD_LOG_NAME}，用于统计错误和警告数量
+    ( sh "$script_name"; echo $? > .build_status ) 2>&1 | tee "{BUILD_LOG_NAME}"
+    build_status=`cat .build_status`
+    rm -f .build_status
+    if [ "$build_status" = "0" ]; then
+      echo "Running post-build steps"
+      {post_build_command} --post-build "$user_input"
+    else
+      echo "Build failed, post-build steps skipped."
+      {post_build_command} --post-build "$user_input" --build-failed
+    fi
+    # 监视模式每次变化都启动一次MSYS，编译结束后关闭窗口
+    if [ -n "${EXIT_AFTER_BUILD_ENV_VAR}" ]; then
+      exit $build_status
+    fi
   else
     echo "Script $script_name not found in current directory."
     echo "Available files:"
     ls -la *.sh 2>/dev/null || echo "No .sh files found."
+    # 同样记为编译失败，等待结果的进程不会一直等下去
+    {post_build_command} --post-build "$user_input" --build-failed
+    if [ -n "${EXIT_AFTER_BUILD_ENV_VAR}" ]; then
+      exit 1
+    fi
   fi
 fi
 '''
@@ -394,37 +457,108 @@ fi
     # 组合完整的profile内容
     profile_content = profile_header + msys_flag_handler
     
+    # 内容和文件都与上次写入时相同则不再写入
+    stamp = TaskStamp("msys_profile", inputs={"content": profile_content}, outputs=[profile_path])
+    if stamp.check() is None:
+        return True, mvcu_path, svcu_path
+    
     # 写入文件
     try:
         with open(profile_path, 'w', encoding='utf-8') as f:
             f.write(profile_content)
+        stamp.record()
         print(f"MSYS profile文件已更新: {profile_path}")
         return True, mvcu_path, svcu_path
     except Exception as e:
         print(f"更新MSYS profile文件失败: {e}")
         return False, None, None
 
-def process_in_console_mode(source_path):
+def record_failed_run(run):
+    """编译未能启动时直接结束运行记录并写入编译历史"""
+    run.finish("failed")
+    record_run(run)
+
+def process_in_console_mode(source_path, profile=False, ref=None):
+    """命令行模式下的处理逻辑
     
-    """命令行模式下的处理逻辑"""
+    参数:
+        profile: 在cProfile/tracemalloc下运行，报告写到对应的编译输出目录
+        ref: 若提供，source_path 为git仓库（或其中的子目录），编译该版本（分支、标签或提交）
+    """
+    if not profile:
+        return run_console_pipeline(source_path, ref=ref)
+    
+    profiler = PipelineProfiler("console")
+    profiler.start()
+    try:
+        return run_console_pipeline(source_path, profiler, ref)
+    finally:
+        profiler.stop()
+        vcu_type = get_vcu_type(source_path)
+        paths = profiler.write(get_output_dir(vcu_type) if vcu_type else None)
+        print(f"性能分析报告: {paths['report']}")
+        print(f"性能分析数据: {paths['pstats']}")
+
+def get_vcu_type(source_path):
+    """按文件名判断VCU类型（源码压缩包名称中没有时再按其中的目录名判断），返回 "m"、"s" 或 None"""
+    if is_archive(source_path):
+        return detect_vcu_type(source_path)
+    source_name = os.path.splitext(os.path.basename(os.path.normpath(source_path)))[0].lower()
+    return "m" if "mvcu" in source_name else "s" if "svcu" in source_name else None
+
+def run_watch_mode(source_path, debounce=DEFAULT_DEBOUNCE):
+    """监视模式：先完整编译一次，之后源码变化时只同步变化的文件并增量编译，编译输出实时显示，Ctrl+C退出"""
+    if not os.path.exists(source_path):
+        print("错误: 源路径不存在。")
+        return False
+    vcu_type = get_vcu_type(source_path)
+    if not vcu_type:
+        print(f"错误: 文件名称 '{os.path.basename(source_path)}' 未包含 mvcu 或 svcu，无法辨认。")
+        return False
+    
+    update_makefiles_with_correct_paths()
+    update_msys_profile()
+    builder = WatchBuilder(source_path, vcu_type)
+    # 先开始监视，第一次编译期间的修改也会在之后触发编译
+    watcher = builder.create_watcher(debounce)
+    try:
+        builder.build()
+        print("等待源码变化，按 Ctrl+C 退出监视")
+        watcher.run()
+    except KeyboardInterrupt:
+        print("\n已退出监视模式")
+    finally:
+        watcher.stop()
+    return True
+
+def run_console_pipeline(source_path, profiler=None, ref=None):
+    """命令行模式的编译流程：暂存源码、更新makefile路径、生成MSYS profile和模块检查并行执行，然后启动MSYS"""
     # 获取当前脚本所在目录
     script_dir = get_application_path()
-    resource_dir = get_resource_path()
     
     # 项目根目录
     vcu_project_dir = os.path.join(script_dir, "VCU_compile - selftest")
     
-    # 首先更新makefiles中的编译器路径配置
-    update_makefiles_with_correct_paths()
-    
     # 检查源路径是否存在
     if not os.path.exists(source_path):
         print("错误: 源路径不存在。")
         input("按任意键继续...")
         return False
     
+    # 从git版本编译时先确认版本存在，提交ID记录到运行记录和输出目录中
+    revision = None
+    if ref is not None:
+        try:
+            revision = GitSource(source_path, ref).commit
+        except ValueError as e:
+            print(f"错误: {e}")
+            input("按任意键继续...")
+            return False
+        print(f"使用git版本: {ref} ({revision})")
+    
     # 获取文件名（不含扩展名）
-    source_name = os.path.splitext(os.path.basename(source_path))[0]
+    archive = is_archive(source_path)
+    source_name = archive_stem(source_path) if archive else os.path.splitext(os.path.basename(source_path))[0]
     print(f"处理源: {source_name}")
     
     # 调试信息
@@ -436,12 +570,15 @@ def process_in_console_mode(source_path):
     
     if "mvcu" in source_name_lower:
         vcu_type = "m"
-        dest_folder = os.path.join(vcu_project_dir, "dev_kernel_mvcu", "src")
         print(f"检测到MVCU类型 (在 '{source_name}' 中找到 'mvcu')")
     elif "svcu" in source_name_lower:
         vcu_type = "s"
-        dest_folder = os.path.join(vcu_project_dir, "dev_kernel_svcu", "src")
         print(f"检测到SVCU类型 (在 '{source_name}' 中找到 'svcu')")
+    elif archive:
+        # 压缩包名称中没有时，按其中的目录名判断
+        vcu_type = detect_vcu_type(source_path)
+        if vcu_type:
+            print(f"按压缩包内容检测到{'MVCU' if vcu_type == 'm' else 'SVCU'}类型")
     
     # 如果没有找到匹配的类型，则退出脚本
     if not vcu_type:
@@ -449,6 +586,12 @@ def process_in_console_mode(source_path):
         input("按任意键继续...")
         return False
     
+    kernel_dir = os.path.join(vcu_project_dir, "dev_kernel_mvcu" if vcu_type == "m" else "dev_kernel_svcu")
+    dest_folder = os.path.join(kernel_dir, "src")
+    makefile_path = os.path.join(kernel_dir, "build", "makefile")
+    staged_path = staged_source_path(source_path, dest_folder)
+    msys_bat_path = os.path.join(get_resource_path("MSYS-1.0.10-selftest"), "1.0", "msys.bat")
+    
     # 检查目标路径是否存在，如果不存在则创建
     if not os.path.exists(dest_folder):
         os.makedirs(dest_folder)
@@ -458,75 +601,94 @@ def process_in_console_mode(source_path):
     os.environ["MSYS_FLAG"] = vcu_type
     print(f"设置MSYS_FLAG={vcu_type}")
     
-    try:
-        # 使用 robocopy 复制文件
-        print("开始复制文件...")
-        
-        # 如果是目录，复制整个目录内容
-        if os.path.isdir(source_path):
-            print(f"复制目录 {source_path} 到 {dest_folder}")
-            # 使用subprocess调用robocopy
-            result = subprocess.run([
-                "robocopy", 
-                source_path, 
-                dest_folder, 
-                "/MIR", 
-                "/NFL", "/NDL", "/NJH", "/NC", "/NJS", "/NP"
-            ], check=False)
-            
-            # robocopy 返回值大于等于8表示错误
-            if result.returncode >= 8:
-                print("错误: 文件复制失败。")
-                input("按任意键继续...")
-                return False
-            else:
-                print("文件复制成功")
-        else:
-            # 如果是单个文件，直接复制
-            try:
-                print(f"复制文件 {source_path} 到 {dest_folder}")
-                shutil.copy2(source_path, dest_folder)
-                print("文件复制成功")
-            except Exception as e:
-                print(f"错误: 文件复制失败。{e}")
-                input("按任意键继续...")
-                return False
-        
-        # 启动MSYS
-        msys_bat_path = os.path.join(resource_dir, "MSYS-1.0.10-selftest", "1.0", "msys.bat")
-        if os.path.exists(msys_bat_path):
-            print(f"启动MSYS: {msys_bat_path}")
-            subprocess.Popen(["cmd", "/c", "start", "", msys_bat_path])
-            print("MSYS已启动")
-            
-            # 编译完成后，归档并打开对应的输出文件夹
-            if vcu_type == "m":
-                output_dir = os.path.join(vcu_project_dir, "dev_kernel_mvcu", "build", "out")
-            elif vcu_type == "s":
-                output_dir = os.path.join(vcu_project_dir, "dev_kernel_svcu", "build", "out")
-            else:
-                output_dir = None
-
-            if output_dir and os.path.exists(output_dir):
-                opened_dir = open_output_dir(output_dir)
-                if opened_dir:
-                    print(f"打开输出文件夹: {opened_dir}")
-                else:
-                    print(f"无法打开输出文件夹: {output_dir}")
-
-            return True
-        else:
-            print(f"错误: 找不到MSYS批处理文件: {msys_bat_path}")
-            input("按任意键继续...")
-            return False
+    # 本次编译的运行记录，启动MSYS前保存，编译后处理时补全并写入编译历史
+    run = BuildRun(vcu_type, source_path if ref is None else f"{source_path}@{ref}")
+    run.revision = revision
+    run.profiler = profiler
+    modules = {}
+    skipped = {}
     
-    except Exception as e:
-        print(f"错误: 处理过程中出现异常: {e}")
+    def stage():
+        # 镜像复制，应用默认忽略规则和源码中的 .loccompileignore，被忽略的文件数和字节数记入运行记录
+        print(f"开始复制文件: {source_path} -> {dest_folder}")
+        staged, detail = stage_sources(source_path, dest_folder, ref=ref, stats=run.metrics)
+        if not staged:
+            raise RuntimeError(f"文件复制失败。{detail}")
+        print(detail)
+    
+    # 压缩包和git版本的内容不能直接遍历（git版本与工作目录的内容也可能不同），模块列表从暂存后的目录得到
+    scan_staged = archive or ref is not None
+    
+    def scan_modules():
+        # 目录按与暂存相同的忽略规则直接从源目录得到模块列表，模块检查不必等待复制完成
+        modules["found"] = find_c_modules(staged_path if scan_staged else source_path)
+    
+    def prune():
+        # 源文件已不在src中的目标文件和包含它们的链接产物不能再被make复用
+        result = prune_stale_products(os.path.join(kernel_dir, "build"))
+        if result.sources or not result.success:
+            print(f"清理过期的编译产物: {result.summary()}")
+    
+    def launch():
+        # 源码、工具链和makefile都没有变化且编译产物完好时不再启动编译
+        stamp = compile_stamp(run)
+        if stamp.check() is None:
+            skipped["compile"] = True
+            return
+        if not os.path.exists(msys_bat_path):
+            raise FileNotFoundError(f"找不到MSYS批处理文件: {msys_bat_path}")
+        print(f"启动MSYS: {msys_bat_path}")
+        stamp.invalidate()
+        run.save_pending()
+        launch_msys(msys_bat_path)
+        print("MSYS已启动")
+    
+    scheduler = PipelineScheduler(run=run)
+    scheduler.add("stage", stage)
+    scheduler.add("patch_makefiles", update_makefiles_with_correct_paths)
+    scheduler.add("render_profile", update_msys_profile)
+    scheduler.add("scan_modules", scan_modules, deps=["stage"] if scan_staged else ())
+    scheduler.add("index_makefile", lambda: load_makefile_index(makefile_path), deps=["patch_makefiles"])
+    scheduler.add("check_modules", lambda: check_modules_in_makefile(vcu_type, modules["found"]),
+                  deps=["scan_modules", "index_makefile"])
+    scheduler.add("inputs", lambda: record_inputs(run, staged_path), deps=["stage"], record=False)
+    scheduler.add("prune", prune, deps=["stage"])
+    scheduler.add("launch", launch, deps=["inputs", "prune", "render_profile", "check_modules"])
+    report = scheduler.run()
+    run.metrics["prepare_overlap_saved"] = round(report.saved_time, 3)
+    print(report.summary())
+    
+    if not report.success:
+        for name, error in report.errors.items():
+            print(f"错误: {name} 失败: {error}")
+        record_failed_run(run)
         input("按任意键继续...")
         return False
+    
+    if skipped.get("compile"):
+        # 与监视模式中没有变化的情况相同，只结束计数，不写入编译历史
+        run.finish("up_to_date")
+        print("编译输出已是最新（源码、工具链和makefile都没有变化），跳过编译；需要重新编译时使用 --force")
+    
+    # 编译完成后，归档并打开对应的输出文件夹
+    output_dir = os.path.join(kernel_dir, "build", "out")
+    if os.path.exists(output_dir):
+        opened_dir = open_output_dir(output_dir)
+        if opened_dir:
+            print(f"打开输出文件夹: {opened_dir}")
+        else:
+            print(f"无法打开输出文件夹: {output_dir}")
+    
+    return True
 
-def start_gui_mode():
-    """启动GUI模式"""
+def start_gui_mode(watchdog_threshold_ms=None, profile=False, watch=False):
+    """启动GUI模式
+    
+    参数:
+        watchdog_threshold_ms: UI卡顿监视阈值（毫秒），None表示按环境变量决定是否开启
+        profile: 界面中“性能分析”选项的初始状态
+        watch: 界面中“监视变化”选项的初始状态
+    """
     try:
         # 首先确保项目目录结构正确
         ensure_project_structure()
@@ -549,8 +711,11 @@ def start_gui_mode():
         
         # 启动GUI，传递路径信息
         root = tk.Tk()
-        app = VcuCompilerUI(root, update_makefiles_with_correct_paths, mvcu_path, svcu_path)
+        app = VcuCompilerUI(root, update_makefiles_with_correct_paths, mvcu_path, svcu_path,
+                            watchdog_threshold_ms=watchdog_threshold_ms, profile=profile, watch=watch)
         root.mainloop()
+        if app.watchdog:
+            app.watchdog.stop()
         return True
     
     except Exception as e:
@@ -563,25 +728,152 @@ def start_gui_mode():
             pass
         return False
 
-def main():
-    """主函数，处理命令行参数并启动相应的模式"""
-    # 确保项目目录结构正确
-    ensure_project_structure()
+def get_output_dir(vcu_type):
+    """获取MVCU(m)或SVCU(s)的编译输出目录"""
+    kernel_dir = "dev_kernel_mvcu" if vcu_type == "m" else "dev_kernel_svcu"
+    return os.path.join(get_application_path(), "VCU_compile - selftest", kernel_dir, "build", "out")
+
+def run_post_build(vcu_type, build_failed=False):
+    """编译后处理：按postbuild.json处理输出镜像，然后生成占用报告，返回进程退出码
+
+    同时补全启动编译时保存的运行记录（编译耗时、诊断数量、产物和占用）并写入编译历史。
+    """
+    output_dir = get_output_dir(vcu_type)
+    build_dir = os.path.dirname(output_dir)
+    run = BuildRun.take_pending(vcu_type) or BuildRun(vcu_type)
+    if run.launched_at:
+        run.add_phase("compile", time.time() - run.launched_at)
+    diagnostics = count_diagnostics(os.path.join(build_dir, BUILD_LOG_NAME))
+    run.errors, run.warnings = diagnostics["errors"], diagnostics["warnings"]
     
-    # 更新MSYS的profile文件
-    success, mvcu_path, svcu_path = update_msys_profile()
+    if build_failed:
+        print(f"编译失败（{run.errors} 个错误），已记录到编译历史")
+        run.finish("failed")
+        record_run(run)
+        return 1
     
+    exit_code = 0
+    with run.phase("postbuild"):
+        try:
+            if run_for_build_dir(build_dir) is None:
+                print(f"未找到 {POSTBUILD_CONFIG_NAME}，跳过镜像处理")
+        except (ValueError, OSError) as e:
+            print(f"错误: 编译后处理失败: {e}")
+            exit_code = 1
+    with run.phase("memory_report"):
+        report = report_build_output(output_dir)
+    if report:
+        run.metrics.update(report["totals"])
+    collect_artifacts(run, output_dir)
+    run.finish("success" if exit_code == 0 else "postbuild_failed")
+    if run.revision:
+        print(f"产物来源: 提交 {run.revision}，见 {write_build_info(run, output_dir)}")
+    record_run(run)
+    # 启动编译时记录了输入（从待完成记录恢复）才写入编译戳记，下次相同输入时跳过编译
+    if exit_code == 0 and run.inputs_hash:
+        compile_stamp(run).record()
+    if exit_code == 0:
+        # 记录目标文件由哪个源文件生成，源文件删除后暂存时据此清理
+        try:
+            record_build_products(build_dir)
+        except OSError as e:
+            print(f"警告: 无法记录编译产物: {e}")
+    return exit_code
+
+def run_toolchain_verification(full=False):
+    """校验工具链完整性并输出结果，返回进程退出码"""
+    print("正在校验工具链...")
+    problems = verify_toolchains(use_cache=not full)
+    if problems:
+        for problem in problems[:50]:
+            print(f"✗ {problem}")
+        if len(problems) > 50:
+            print(f"... 共 {len(problems)} 个问题")
+        return 1
+    print(f"✓ 工具链完整，指纹: {get_toolchain_fingerprint()}")
+    return 0
+
+def main():
+    """主函数，处理命令行参数并启动相应的模式"""
     parser = argparse.ArgumentParser(description="VCU编译器启动器")
     parser.add_argument("--gui", action="store_true", help="启动图形界面模式")
     parser.add_argument("--console", action="store_true", help="启动命令行模式")
     parser.add_argument("--update-paths", action="store_true", help="仅更新makefile中的编译器路径")
-    parser.add_argument("source_path", nargs="?", help="源文件或目录的路径")
+    parser.add_argument("--ui-watchdog", nargs="?", type=int, const=300, default=None, metavar="MS",
+                        help="开启UI卡顿监视，卡顿超过MS毫秒（默认300）时记录主线程调用栈")
+    parser.add_argument("--verify-toolchain", nargs="?", const="quick", choices=["quick", "full"],
+                        help="按随release发布的清单校验工具链哈希后退出（full: 不使用哈希缓存，重新读取所有文件）")
+    parser.add_argument("--memory-report", choices=["m", "s"],
+                        help="分析MVCU(m)或SVCU(s)编译输出中的ELF/map文件，生成Flash/RAM占用报告并与上次比较后退出")
+    parser.add_argument("--clean", choices=["m", "s"],
+                        help="删除MVCU(m)或SVCU(s)的目标文件和输出产物后退出，下次编译为完整编译")
+    parser.add_argument("--clean-outputs", choices=["m", "s"],
+                        help="只删除MVCU(m)或SVCU(s)输出目录中的编译产物后退出，下次编译只重新链接")
+    parser.add_argument("--post-build", choices=["m", "s"],
+                        help="编译完成后执行编译后处理（postbuild.json中的填充/CRC/格式转换）和占用分析后退出，由MSYS编译脚本调用")
+    parser.add_argument("--build-failed", action="store_true",
+                        help="与 --post-build 一起使用：编译失败，只记录编译历史")
+    parser.add_argument("--profile", action="store_true",
+                        help="在cProfile下运行编译流程并记录各阶段内存峰值，.pstats和文本报告写到编译输出目录")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视源路径，文件变化时只同步变化的文件并自动增量编译（界面中为“监视变化”选项的初始状态）")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE, metavar="SECONDS",
+                        help=f"监视模式下一批变化结束后等待的时间（默认{DEFAULT_DEBOUNCE}秒）")
+    parser.add_argument("--ref", metavar="REF",
+                        help="从git版本编译：源路径为仓库（或其中的子目录），REF为分支、标签或提交，不需要检出")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略任务戳记，重新执行所有准备步骤和编译")
+    parser.add_argument("--explain", action="store_true",
+                        help="输出每个任务执行或跳过的原因")
+    parser.add_argument("--metrics-port", nargs="?", type=int, const=build_metrics.DEFAULT_PORT, metavar="PORT",
+                        help=f"运行期间在 http://127.0.0.1:PORT/metrics 提供Prometheus格式的编译指标（默认端口{build_metrics.DEFAULT_PORT}）")
+    parser.add_argument("--metrics-textfile", metavar="PATH",
+                        help="运行期间定期把Prometheus格式的编译指标写入文件（node_exporter textfile）")
+    parser.add_argument("--startup-check", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("source_path", nargs="?", help="源文件、目录或源码压缩包（.zip/.tar.gz）的路径")
     
     # 解析命令行参数
     args = parser.parse_args()
     
-    # 如果只是更新路径
+    # 打包脚本测量启动时间时使用，解析完参数立即退出
+    if args.startup_check:
+        return 0
+    
+    configure_task_stamps(force=args.force, explain=args.explain)
+    
+    # 指标导出在后台线程中进行，编译流程只更新内存中的计数
+    if args.metrics_port:
+        try:
+            build_metrics.start_http_server(args.metrics_port)
+            print(f"编译指标: http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"警告: 无法启动指标端点: {e}")
+    if args.metrics_textfile:
+        build_metrics.start_textfile_writer(args.metrics_textfile)
+    
+    if args.verify_toolchain:
+        return run_toolchain_verification(full=args.verify_toolchain == "full")
+    
+    if args.memory_report:
+        return 0 if report_build_output(get_output_dir(args.memory_report)) else 1
+    
+    if args.post_build:
+        return run_post_build(args.post_build, build_failed=args.build_failed)
+    
+    if args.clean or args.clean_outputs:
+        result = clean_build_products(os.path.dirname(get_output_dir(args.clean or args.clean_outputs)),
+                                      outputs_only=not args.clean)
+        print(result.summary())
+        for path, error in result.failed[:10]:
+            print(f"✗ {path}: {error}")
+        return 0 if result.success else 1
+    
+    # 确保项目目录结构正确
+    ensure_project_structure()
+    
+    # 如果只是更新路径（编译流程中profile与源码暂存并行生成，GUI启动时自行生成）
     if args.update_paths:
+        success, mvcu_path, svcu_path = update_msys_profile()
         update_makefiles_with_correct_paths()
         if success:
             print("编译器路径更新完成。")
@@ -594,7 +886,7 @@ def main():
     # 判断运行模式
     if args.gui:
         # 启动GUI模式
-        start_gui_mode()
+        start_gui_mode(args.ui_watchdog, args.profile, args.watch)
     elif args.console or args.source_path:
         # 命令行模式
         if not args.source_path:
@@ -603,18 +895,23 @@ def main():
             return 1
         
         # 处理文件
-        success = process_in_console_mode(args.source_path)
+        if args.watch:
+            if args.ref:
+                print("错误: 监视模式不支持 --ref，git版本的内容不会变化。")
+                return 1
+            return 0 if run_watch_mode(args.source_path, args.debounce) else 1
+        success = process_in_console_mode(args.source_path, args.profile, args.ref)
         return 0 if success else 1
     else:
         # 没有指定模式或参数，默认启动GUI
         # 但先检查是否有拖放的文件
         if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
             # 有拖放的文件，使用命令行模式处理
-            success = process_in_console_mode(sys.argv[1])
+            success = process_in_console_mode(sys.argv[1], args.profile)
             return 0 if success else 1
         else:
             # 启动GUI模式
-            start_gui_mode()
+            start_gui_mode(args.ui_watchdog, args.profile, args.watch)
     
     return 0
 
@@ -627,11 +924,42 @@ def no_console_main():
         messagebox.showerror("错误", f"程序运行时发生错误: {e}")
         sys.exit(1)
 
-def check_modules_in_makefile(vcu_type):
+# makefile内容及其中的名称集合，按 (大小, 修改时间) 缓存，选择源路径后的预先检查会提前建立
+_makefile_index_cache = {}
+
+def load_makefile_index(makefile_path):
+    """读取makefile，返回 (内容, 其中所有名称的集合)，读取失败返回None"""
+    try:
+        stat = os.stat(makefile_path)
+    except OSError:
+        return None
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _makefile_index_cache.get(makefile_path)
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+    
+    content = None
+    for encoding in ('utf-8', 'latin-1'):
+        try:
+            with open(makefile_path, 'r', encoding=encoding) as f:
+                content = f.read()
+            break
+        except UnicodeDecodeError:
+            continue
+        except OSError:
+            return None
+    if content is None:
+        return None
+    names = set(re.findall(r"\w+", content))
+    _makefile_index_cache[makefile_path] = (key, content, names)
+    return content, names
+
+def check_modules_in_makefile(vcu_type, modules=None):
     """检查模块是否都在makefile中
     
     参数:
         vcu_type: VCU类型，'m' 表示MVCU，'s' 表示SVCU
+        modules: 要检查的模块名列表，None时使用src目录中的所有.c文件
     """
     try:
         # 获取资源路径
@@ -651,7 +979,7 @@ def check_modules_in_makefile(vcu_type):
             return False
         
         # 检查源目录是否存在
-        if not os.path.exists(src_dir):
+        if modules is None and not os.path.exists(src_dir):
             print(f"源目录不存在: {src_dir}")
             return False
         
@@ -660,33 +988,31 @@ def check_modules_in_makefile(vcu_type):
             print(f"Makefile不存在: {makefile_path}")
             return False
         
-        # 获取所有.c文件
-        c_files = []
-        for root, dirs, files in os.walk(src_dir):
-            for file in files:
-                if file.lower().endswith('.c'):
-                    c_files.append(os.path.splitext(file)[0])  # 不带扩展名
+        # 获取所有.c文件（不带扩展名）
+        c_files = find_c_modules(src_dir) if modules is None else list(modules)
         
         if not c_files:
             print("在源目录中未找到.c文件")
             return True
         
+        # 模块列表和makefile都与上次检查通过时相同则跳过
+        stamp = TaskStamp(f"check_modules_{vcu_type}", inputs={"modules": sorted(c_files)},
+                          input_paths=[makefile_path])
+        if stamp.check() is None:
+            print("模块列表和makefile没有变化，沿用上次的检查结果")
+            return True
+        
         # 读取makefile内容
-        try:
-            with open(makefile_path, 'r', encoding='utf-8') as f:
-                makefile_content = f.read()
-        except UnicodeDecodeError:
-            try:
-                with open(makefile_path, 'r', encoding='latin-1') as f:
-                    makefile_content = f.read()
-            except:
-                print("无法读取makefile文件")
-                return False
+        index = load_makefile_index(makefile_path)
+        if index is None:
+            print("无法读取makefile文件")
+            return False
+        makefile_content, makefile_names = index
         
-        # 检查每个模块是否在makefile中
+        # 检查每个模块是否在makefile中（先查名称集合，不在其中时再按子串查找，结果与直接查找内容相同）
         missing_modules = []
         for module in c_files:
-            if module not in makefile_content:
+            if module not in makefile_names and module not in makefile_content:
                 missing_modules.append(module)
         
         if missing_modules:
@@ -694,6 +1020,7 @@ def check_modules_in_makefile(vcu_type):
             print("建议检查makefile配置")
         else:
             print("所有模块都已包含在makefile中")
+            stamp.record()
         
         return len(missing_modules) == 0
         
@@ -0,0 +1,546 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译产物的Flash/RAM占用分析
+ELF通过mmap读取节区表和符号表，链接map文件逐行流式解析（支持GNU ld和CodeWarrior两种格式），
+输出按节区、按模块（目标文件）的占用统计JSON，并可比较两次编译的差异。
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+REPORT_NAME = "memory_usage.json"
+PREVIOUS_REPORT_NAME = "memory_usage.prev.json"
+REPORT_VERSION = 1
+
+ELF_SUFFIXES = (".elf", ".abs", ".out")
+MAP_SUFFIXES = (".map", ".xmap")
+
+# 报告中保留的最大符号数量
+TOP_SYMBOLS = 50
+
+# 模块统计的分类
+CATEGORIES = ("text", "rodata", "data", "bss")
+
+_SHT_NOBITS = 8
+_SHT_SYMTAB = 2
+_SHF_WRITE = 0x1
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+_STT_OBJECT = 1
+_STT_FUNC = 2
+_SHN_LORESERVE = 0xff00
+
+# 不占用目标内存的调试/注释节区（没有ELF时按名称判断）
+_NON_ALLOC_PREFIXES = (".debug", ".comment", ".stab", ".note.gnu", ".gnu.attributes", ".line", ".zdebug")
+
+
+def _category_from_name(name: str) -> Optional[str]:
+    """根据节区名称推断分类，非占用内存的节区返回None"""
+    lower = name.lower()
+    if lower.startswith(_NON_ALLOC_PREFIXES):
+        return None
+    if "bss" in lower or lower == "common" or lower.startswith((".stack", ".heap", ".noinit")):
+        return "bss"
+    if lower.startswith((".data", ".sdata")):
+        return "data"
+    if lower.startswith((".rodata", ".const", ".sconst", ".rdata")):
+        return "rodata"
+    return "text"
+
+
+def _category_from_flags(sh_type: int, sh_flags: int) -> Optional[str]:
+    if not sh_flags & _SHF_ALLOC:
+        return None
+    if sh_flags & _SHF_EXECINSTR:
+        return "text"
+    if sh_type == _SHT_NOBITS:
+        return "bss"
+    if sh_flags & _SHF_WRITE:
+        return "data"
+    return "rodata"
+
+
+def _usage(category: Optional[str], size: int) -> Tuple[int, int]:
+    """返回 (Flash占用, RAM占用)；已初始化的数据同时占用Flash（初值）和RAM"""
+    if category in ("text", "rodata"):
+        return size, 0
+    if category == "data":
+        return size, size
+    if category == "bss":
+        return 0, size
+    return 0, 0
+
+
+# ---------------------------------------------------------------- ELF
+
+
+def _read_cstring(data, offset: int) -> str:
+    end = data.find(b"\0", offset)
+    return data[offset:end].decode("utf-8", "replace")
+
+
+def parse_elf(path: str, top_symbols: int = TOP_SYMBOLS) -> dict:
+    """读取ELF的节区表和符号表
+
+    Returns:
+        {"sections": [...], "symbols": [...]}，符号只保留大小最大的 top_symbols 个
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:4] != b"\x7fELF":
+            raise ValueError(f"不是ELF文件: {path}")
+        is_64 = data[4] == 2
+        endian = "<" if data[5] == 1 else ">"
+        if is_64:
+            header = struct.unpack_from(endian + "HHIQQQIHHHHHH", data, 16)
+            section_format = endian + "IIQQQQIIQQ"
+        else:
+            header = struct.unpack_from(endian + "HHIIIIIHHHHHH", data, 16)
+            section_format = endian + "IIIIIIIIII"
+        shoff, shentsize, shnum, shstrndx = header[5], header[10], header[11], header[12]
+
+        raw_sections = [struct.unpack_from(section_format, data, shoff + i * shentsize)
+                        for i in range(shnum)]
+        strtab_offset = raw_sections[shstrndx][4] if shstrndx < shnum else 0
+
+        sections = []
+        categories: Dict[int, Optional[str]] = {}
+        for index, (name_off, sh_type, flags, addr, offset, size, *_rest) in enumerate(raw_sections):
+            if index == 0:
+                continue
+            name = _read_cstring(data, strtab_offset + name_off)
+            category = _category_from_flags(sh_type, flags)
+            categories[index] = category
+            if category is None or size == 0:
+                continue
+            flash, ram = _usage(category, size)
+            sections.append({"name": name, "addr": addr, "size": size, "category": category,
+                             "flash": flash, "ram": ram})
+
+        symbols = []
+        for sh_type, offset, size, link, entsize in ((s[1], s[4], s[5], s[6], s[9]) for s in raw_sections):
+            if sh_type != _SHT_SYMTAB or not entsize:
+                continue
+            names_offset = raw_sections[link][4]
+            if is_64:
+                symbol_format = endian + "IBBHQQ"
+                unpacked = ((n, v, sz, info, shndx) for n, info, _, shndx, v, sz
+                            in struct.iter_unpack(symbol_format, data[offset:offset + size]))
+            else:
+                symbol_format = endian + "IIIBBH"
+                unpacked = ((n, v, sz, info, shndx) for n, v, sz, info, _, shndx
+                            in struct.iter_unpack(symbol_format, data[offset:offset + size]))
+            for name_off, value, sym_size, info, shndx in unpacked:
+                if not sym_size or shndx == 0 or shndx >= _SHN_LORESERVE:
+                    continue
+                if info & 0xf not in (_STT_OBJECT, _STT_FUNC) or categories.get(shndx) is None:
+                    continue
+                symbols.append((sym_size, name_off + names_offset, value, shndx))
+
+        symbols.sort(reverse=True)
+        top = [{"name": _read_cstring(data, name_pos), "addr": value, "size": sym_size,
+                "section": _read_cstring(data, strtab_offset + raw_sections[shndx][0])}
+               for sym_size, name_pos, value, shndx in symbols[:top_symbols]]
+    return {"sections": sections, "symbols": top}
+
+
+# ---------------------------------------------------------------- map文件
+
+_GNU_OUTPUT_RE = re.compile(r"^(\.?[A-Za-z_][\w.$-]*)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)")
+_GNU_INPUT_RE = re.compile(r"^ (\S+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*)$")
+_GNU_WRAPPED_RE = re.compile(r"^\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+(\S.*))?$")
+_GNU_REGION_RE = re.compile(r"^(\S+)\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+(\S+))?")
+
+_CW_SECTION_RE = re.compile(r"^#\s+(\.\S+)\s*$")
+_CW_ENTRY_RE = re.compile(r"^\s+([0-9A-Fa-f]{8})\s+([0-9A-Fa-f]{8})\s+(?:[0-9A-Fa-f]{8}\s+)?"
+                          r"(\.\S+)\s+(\S+)\s+\((.+)\)\s*$")
+_CW_MEMMAP_RE = re.compile(r"^\s+(\.\S+)\s+([0-9A-Fa-f]{8})\s+([0-9A-Fa-f]{8})")
+
+
+def _module_name(path: str) -> str:
+    """目标文件路径 -> 模块名（库成员保留为 lib.a(member.o) 的形式）"""
+    archive, paren, member = path.strip().replace("\\", "/").partition("(")
+    return archive.rsplit("/", 1)[-1] + paren + member
+
+
+def _iter_lines(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace", buffering=1024 * 1024) as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def _parse_gnu_map(lines: Iterator[str]) -> dict:
+    sections: Dict[str, list] = {}
+    regions = []
+    contributions: Dict[Tuple[str, str], int] = {}
+    output = None
+    pending_input = None
+    pending_output = None
+    in_regions = False
+    in_map = False
+
+    for line in lines:
+        if not in_map:
+            if line.startswith("Memory Configuration"):
+                in_regions = True
+            elif line.startswith("Linker script and memory map"):
+                in_map = True
+                in_regions = False
+            elif in_regions:
+                match = _GNU_REGION_RE.match(line)
+                if match and match.group(1) not in ("Name", "*default*"):
+                    regions.append({"name": match.group(1), "origin": int(match.group(2), 16),
+                                    "length": int(match.group(3), 16), "attributes": match.group(4) or ""})
+            continue
+
+        if not line:
+            continue
+        first = line[0]
+        if first == " ":
+            if pending_input is not None:
+                match = _GNU_WRAPPED_RE.match(line)
+                name, pending_input = pending_input, None
+                if match and match.group(3) and output is not None:
+                    size = int(match.group(2), 16)
+                    if size:
+                        key = (output, _module_name(match.group(3)))
+                        contributions[key] = contributions.get(key, 0) + size
+                    continue
+            if pending_output is not None:
+                match = _GNU_WRAPPED_RE.match(line)
+                if match:
+                    output = pending_output
+                    sections[output] = [int(match.group(1), 16), int(match.group(2), 16)]
+                pending_output = None
+                continue
+            if line[1] == " " or output is None:
+                # 符号行、赋值语句或链接脚本中的匹配模式
+                continue
+            match = _GNU_INPUT_RE.match(line)
+            if match:
+                name = match.group(1)
+                size = int(match.group(3), 16)
+                if size and name != "*fill*" and not name.startswith("*("):
+                    key = (output, _module_name(match.group(4)))
+                    contributions[key] = contributions.get(key, 0) + size
+            elif " " not in line[1:] and line[1] != "*":
+                # 节区名过长时地址和大小换到下一行
+                pending_input = line[1:]
+        elif first == "." or first.isalpha() or first == "_":
+            match = _GNU_OUTPUT_RE.match(line)
+            if match:
+                output = match.group(1)
+                sections[output] = [int(match.group(2), 16), int(match.group(3), 16)]
+            elif first == "." and " " not in line:
+                pending_output = line
+            elif first != ".":
+                # LOAD、OUTPUT 等链接器命令
+                continue
+    return {"sections": sections, "regions": regions, "contributions": contributions}
+
+
+def _parse_cw_map(lines: Iterator[str]) -> dict:
+    sections: Dict[str, list] = {}
+    contributions: Dict[Tuple[str, str], int] = {}
+    symbol_sums: Dict[Tuple[str, str], int] = {}
+    current = None
+    in_memory_map = False
+    for line in lines:
+        if in_memory_map:
+            match = _CW_MEMMAP_RE.match(line)
+            if match:
+                sections[match.group(1)] = [int(match.group(2), 16), int(match.group(3), 16)]
+            continue
+        if line.startswith("#"):
+            match = _CW_SECTION_RE.match(line)
+            if match:
+                current = match.group(1)
+            continue
+        if line.startswith("Memory map:"):
+            in_memory_map = True
+            continue
+        if current is None or not line.startswith(" "):
+            continue
+        match = _CW_ENTRY_RE.match(line)
+        if not match:
+            continue
+        size = int(match.group(2), 16)
+        if not size:
+            continue
+        section, symbol, module = match.group(3), match.group(4), _module_name(match.group(5))
+        key = (section, module)
+        # 符号名与节区名相同的行是整个目标文件的节区，否则是单个符号
+        target = contributions if symbol == section else symbol_sums
+        target[key] = target.get(key, 0) + size
+
+    for key, size in symbol_sums.items():
+        contributions.setdefault(key, size)
+    if not sections:
+        for (section, _), size in contributions.items():
+            sections.setdefault(section, [0, 0])[1] += size
+    return {"sections": sections, "regions": [], "contributions": contributions}
+
+
+def parse_map(path: str) -> dict:
+    """流式解析链接map文件，自动识别GNU ld和CodeWarrior格式
+
+    Returns:
+        {"sections": {输出节区: [地址, 大小]}, "regions": [...], "contributions": {(节区, 模块): 大小}}
+    """
+    lines = _iter_lines(path)
+    head = []
+    for line in lines:
+        head.append(line)
+        if len(head) >= 50:
+            break
+    is_gnu = any(line.startswith(("Archive member included", "Memory Configuration", "Discarded input sections",
+                                  "Allocating common symbols", "Linker script and memory map"))
+                 for line in head)
+
+    def replay():
+        yield from head
+        yield from lines
+
+    return _parse_gnu_map(replay()) if is_gnu else _parse_cw_map(replay())
+
+
+# ---------------------------------------------------------------- 报告
+
+
+def find_artifacts(out_dir: str) -> Tuple[Optional[str], Optional[str]]:
+    """在编译输出目录中查找最新的ELF和map文件"""
+    elf_path = map_path = None
+    elf_mtime = map_mtime = -1.0
+    for entry in os.scandir(out_dir):
+        if not entry.is_file():
+            continue
+        lower = entry.name.lower()
+        mtime = entry.stat().st_mtime
+        if lower.endswith(ELF_SUFFIXES) and mtime > elf_mtime:
+            with open(entry.path, "rb") as f:
+                if f.read(4) == b"\x7fELF":
+                    elf_path, elf_mtime = entry.path, mtime
+        elif lower.endswith(MAP_SUFFIXES) and mtime > map_mtime:
+            map_path, map_mtime = entry.path, mtime
+    return elf_path, map_path
+
+
+def analyze(elf_path: Optional[str] = None, map_path: Optional[str] = None,
+            top_symbols: int = TOP_SYMBOLS) -> dict:
+    """分析ELF和/或map文件，生成占用报告
+
+    ELF中的节区属性决定Flash/RAM归属；没有ELF时按节区名称推断。模块统计来自map文件。
+    """
+    if not elf_path and not map_path:
+        raise ValueError("至少需要ELF或map文件之一")
+    start = time.perf_counter()
+    elf = parse_elf(elf_path, top_symbols) if elf_path else None
+    link_map = parse_map(map_path) if map_path else None
+
+    if elf is not None:
+        sections = elf["sections"]
+    else:
+        sections = []
+        for name, (addr, size) in link_map["sections"].items():
+            category = _category_from_name(name)
+            if category is None or not size:
+                continue
+            flash, ram = _usage(category, size)
+            sections.append({"name": name, "addr": addr, "size": size, "category": category,
+                             "flash": flash, "ram": ram})
+    section_categories = {section["name"]: section["category"] for section in sections}
+
+    modules: Dict[str, Dict[str, int]] = {}
+    regions = []
+    if link_map is not None:
+        for (section, module), size in link_map["contributions"].items():
+            category = section_categories.get(section, _category_from_name(section))
+            if category is None:
+                continue
+            entry = modules.setdefault(module, dict.fromkeys(CATEGORIES, 0))
+            entry[category] += size
+        for entry in modules.values():
+            entry["flash"] = entry["ram"] = 0
+            for category in CATEGORIES:
+                flash, ram = _usage(category, entry[category])
+                entry["flash"] += flash
+                entry["ram"] += ram
+
+        for region in link_map["regions"]:
+            end = region["origin"] + region["length"]
+            used = 0
+            for section in sections:
+                if region["origin"] <= section["addr"] < end:
+                    used += section["size"]
+            regions.append(dict(region, used=used))
+
+    report = {
+        "version": REPORT_VERSION,
+        "elf": elf_path,
+        "map": map_path,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "totals": {
+            "flash": sum(section["flash"] for section in sections),
+            "ram": sum(section["ram"] for section in sections),
+        },
+        "sections": sorted(sections, key=lambda section: section["addr"]),
+        "regions": regions,
+        "modules": dict(sorted(modules.items(), key=lambda item: -(item[1]["flash"] + item[1]["ram"]))),
+        "symbols": elf["symbols"] if elf else [],
+    }
+    report["elapsed"] = round(time.perf_counter() - start, 4)
+    return report
+
+
+def analyze_build(out_dir: str) -> dict:
+    """分析编译输出目录中最新的ELF和map文件"""
+    elf_path, map_path = find_artifacts(out_dir)
+    if not elf_path and not map_path:
+        raise FileNotFoundError(f"输出目录中没有ELF或map文件: {out_dir}")
+    return analyze(elf_path, map_path)
+
+
+def _delta_table(old: Dict[str, int], new: Dict[str, int]) -> List[dict]:
+    rows = []
+    for name in set(old) | set(new):
+        before, after = old.get(name, 0), new.get(name, 0)
+        if before != after:
+            rows.append({"name": name, "old": before, "new": after, "delta": after - before})
+    rows.sort(key=lambda row: (-abs(row["delta"]), row["name"]))
+    return rows
+
+
+def diff_reports(old: dict, new: dict) -> dict:
+    """比较两份占用报告"""
+    def module_sizes(report, key):
+        return {name: entry[key] for name, entry in report.get("modules", {}).items()}
+
+    return {
+        "totals": {key: {"old": old["totals"][key], "new": new["totals"][key],
+                         "delta": new["totals"][key] - old["totals"][key]} for key in ("flash", "ram")},
+        "sections": _delta_table({s["name"]: s["size"] for s in old["sections"]},
+                                 {s["name"]: s["size"] for s in new["sections"]}),
+        "modules_flash": _delta_table(module_sizes(old, "flash"), module_sizes(new, "flash")),
+        "modules_ram": _delta_table(module_sizes(old, "ram"), module_sizes(new, "ram")),
+        "symbols": _delta_table({s["name"]: s["size"] for s in old.get("symbols", [])},
+                                {s["name"]: s["size"] for s in new.get("symbols", [])}),
+    }
+
+
+def format_report(report: dict, limit: int = 10) -> str:
+    lines = [f"Flash: {report['totals']['flash']} 字节，RAM: {report['totals']['ram']} 字节"]
+    for region in report["regions"]:
+        percent = region["used"] * 100.0 / region["length"] if region["length"] else 0.0
+        lines.append(f"  {region['name']:<12} {region['used']:>10} / {region['length']:<10} ({percent:.1f}%)")
+    for section in report["sections"]:
+        lines.append(f"  {section['name']:<20} 0x{section['addr']:08X} {section['size']:>10} {section['category']}")
+    if report["modules"]:
+        lines.append("占用最多的模块:")
+        for name, entry in list(report["modules"].items())[:limit]:
+            lines.append(f"  {name:<40} Flash {entry['flash']:>8}  RAM {entry['ram']:>8}")
+    return "\n".join(lines)
+
+
+def format_diff(diff: dict, limit: int = 10) -> str:
+    lines = []
+    for key, label in (("flash", "Flash"), ("ram", "RAM")):
+        total = diff["totals"][key]
+        lines.append(f"{label}: {total['old']} -> {total['new']} ({total['delta']:+d})")
+    for key, label in (("sections", "节区"), ("modules_flash", "模块Flash"),
+                       ("modules_ram", "模块RAM"), ("symbols", "符号")):
+        rows = diff[key]
+        if not rows:
+            continue
+        lines.append(f"{label}变化:")
+        for row in rows[:limit]:
+            lines.append(f"  {row['name']:<40} {row['old']:>8} -> {row['new']:>8} ({row['delta']:+d})")
+        if len(rows) > limit:
+            lines.append(f"  ... 共 {len(rows)} 项")
+    return "\n".join(lines)
+
+
+def load_report(path: str) -> dict:
+    """读取报告；传入目录时分析其中的编译产物"""
+    if os.path.isdir(path):
+        return analyze_build(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_report(report: dict, path: str):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def report_build_output(out_dir: str) -> Optional[dict]:
+    """编译后调用：分析输出目录，写入报告并与上一次的报告比较
+
+    上一次的报告保留为 memory_usage.prev.json。没有编译产物时返回None。
+    """
+    try:
+        report = analyze_build(out_dir)
+    except FileNotFoundError as e:
+        print(f"跳过占用分析: {e}")
+        return None
+    report_path = os.path.join(out_dir, REPORT_NAME)
+    previous = None
+    if os.path.isfile(report_path):
+        try:
+            previous = load_report(report_path)
+            os.replace(report_path, os.path.join(out_dir, PREVIOUS_REPORT_NAME))
+        except (OSError, ValueError):
+            previous = None
+    write_report(report, report_path)
+
+    print(format_report(report))
+    if previous and previous.get("version") == REPORT_VERSION:
+        print("与上次编译相比:")
+        print(format_diff(diff_reports(previous, report)))
+    print(f"占用报告: {report_path}（分析耗时 {report['elapsed'] * 1000:.0f} ms）")
+    return report
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="编译产物Flash/RAM占用分析")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = subparsers.add_parser("analyze", help="分析ELF/map文件")
+    analyze_parser.add_argument("out_dir", nargs="?", help="编译输出目录（自动查找最新的ELF和map）")
+    analyze_parser.add_argument("--elf", help="ELF文件")
+    analyze_parser.add_argument("--map", dest="map_file", help="map文件")
+    analyze_parser.add_argument("-o", "--output", help="输出JSON报告的路径")
+
+    diff_parser = subparsers.add_parser("diff", help="比较两次编译的占用")
+    diff_parser.add_argument("old", help="旧报告JSON或编译输出目录")
+    diff_parser.add_argument("new", help="新报告JSON或编译输出目录")
+    diff_parser.add_argument("-o", "--output", help="输出JSON差异的路径")
+
+    args = parser.parse_args(argv)
+    if args.command == "analyze":
+        if args.out_dir:
+            report = analyze_build(args.out_dir)
+        else:
+            report = analyze(args.elf, args.map_file)
+        if args.output:
+            write_report(report, args.output)
+        print(format_report(report))
+        print(f"分析耗时 {report['elapsed'] * 1000:.0f} ms")
+    else:
+        diff = diff_reports(load_report(args.old), load_report(args.new))
+        if args.output:
+            write_report(diff, args.output)
+        print(format_diff(diff))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
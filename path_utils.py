@@ -3,16 +3,71 @@ import sys
 
 """封装路径相关的辅助函数，兼容打包和开发两种环境。"""
 
+# 设置后程序目录和资源目录都指向该目录（用于在临时目录中搭建的测试/基准环境）
+ROOT_ENV_VAR = "LOC_COMPILE_ROOT"
+
+# 程序目录中存放状态文件的目录
+STATE_DIR_NAME = ".loc_compile"
+
+
 def get_application_path():
     """获取应用程序运行目录，用于存放输出等可写文件"""
+    override = os.environ.get(ROOT_ENV_VAR)
+    if override:
+        return os.path.abspath(override)
     if getattr(sys, 'frozen', False):
         return os.path.dirname(sys.executable)
     loc_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.dirname(loc_dir)
 
 
+def _get_resource_base():
+    if getattr(sys, 'frozen', False) and not os.environ.get(ROOT_ENV_VAR):
+        return os.path.dirname(sys.executable)
+    return get_application_path()
+
+
+def _split_resource_parts(path_parts):
+    """把路径片段拆分为 (顶层目录名, 工具链内的相对路径)"""
+    joined = "/".join(path_parts).replace("\\", "/")
+    parts = [p for p in joined.split("/") if p and p != "."]
+    if not parts:
+        return None, ""
+    return parts[0], "/".join(parts[1:])
+
+
 def get_resource_path(*path_parts):
-    """获取资源文件所在目录，兼容 PyInstaller"""
-    base = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else get_application_path()
-    return os.path.normpath(os.path.join(base, *path_parts)) if path_parts else os.path.normpath(base)
+    """获取资源文件所在目录，兼容 PyInstaller
+    
+    资源目录不存在但 packs 目录中有对应的压缩工具链包时，按需解压到缓存并返回缓存中的路径
+    """
+    base = _get_resource_base()
+    if not path_parts:
+        return os.path.normpath(base)
+    path = os.path.normpath(os.path.join(base, *path_parts))
+    if not os.path.exists(path):
+        name, rel_path = _split_resource_parts(path_parts)
+        if name:
+            import toolchain_packs
+            if toolchain_packs.has_pack(base, name) and toolchain_packs.pack_contains(base, name, rel_path):
+                return os.path.normpath(toolchain_packs.ensure_extracted(base, name, rel_path))
+    return path
+
 
+def resource_available(*path_parts):
+    """判断资源是否可用（目录存在或可从压缩工具链包中解压），不会触发解压"""
+    base = _get_resource_base()
+    if os.path.exists(os.path.join(base, *path_parts)):
+        return True
+    name, rel_path = _split_resource_parts(path_parts)
+    if not name:
+        return False
+    import toolchain_packs
+    return toolchain_packs.has_pack(base, name) and toolchain_packs.pack_contains(base, name, rel_path)
+
+
+def get_state_path(*path_parts):
+    """获取工具自身状态文件（缓存、报告等）的存放目录，目录不存在时自动创建"""
+    base = os.path.join(get_application_path(), STATE_DIR_NAME)
+    os.makedirs(base, exist_ok=True)
+    return os.path.normpath(os.path.join(base, *path_parts)) if path_parts else os.path.normpath(base)
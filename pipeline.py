@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译准备阶段的依赖调度
+把暂存源码、更新makefile路径、生成MSYS profile、模块检查等阶段描述为依赖图（DAG），
+依赖都已完成的阶段在线程池中并发执行（性能分析时在调用线程中依次执行）。结束后报告每个阶段的耗时，以及与依次执行相比节省的时间。
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from pipeline_profiler import maybe_phase
+
+DEFAULT_WORKERS = 4
+
+
+class PipelineReport:
+    """一次调度的结果：各阶段的返回值、异常、跳过的阶段和时间"""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.skipped: List[str] = []
+        # 阶段 -> (开始, 结束)，相对调度开始的秒数
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self.wall_time = 0.0
+
+    @property
+    def success(self) -> bool:
+        return not self.errors and not self.skipped
+
+    @property
+    def serial_time(self) -> float:
+        """依次执行所有阶段需要的时间"""
+        return sum(end - start for start, end in self.timings.values())
+
+    @property
+    def saved_time(self) -> float:
+        return max(0.0, self.serial_time - self.wall_time)
+
+    def summary(self) -> str:
+        text = (f"准备阶段并行执行: 依次执行需 {self.serial_time:.2f} s，实际 {self.wall_time:.2f} s，"
+                f"节省 {self.saved_time:.2f} s")
+        if self.errors:
+            text += f"，失败: {', '.join(self.errors)}"
+        if self.skipped:
+            text += f"，跳过: {', '.join(self.skipped)}"
+        return text
+
+    def timeline(self) -> List[str]:
+        """按开始时间排列的阶段时间线"""
+        return [f"  {name:<16} {start:>7.3f} s -> {end:>7.3f} s ({end - start:.3f} s)"
+                for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1])]
+
+
+class PipelineScheduler:
+    """按依赖关系并发执行阶段
+
+    阶段函数抛出异常即视为失败，依赖它的阶段（直接或间接）不再执行并记入 skipped。
+    提供运行记录（BuildRun）时，每个阶段的耗时记入其 phases。
+    提供分析器时按依赖顺序在调用线程中依次执行：cProfile只分析启动它的线程，tracemalloc也无法区分并发阶段的内存，
+    每个阶段的耗时和内存峰值记入分析器的阶段列表。
+
+    示例:
+        scheduler = PipelineScheduler(run=run)
+        scheduler.add("stage", stage)
+        scheduler.add("patch_makefiles", patch)
+        scheduler.add("check_modules", check, deps=["patch_makefiles"])
+        scheduler.add("launch", launch, deps=["stage", "check_modules"])
+        report = scheduler.run()
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, run=None, profiler=None):
+        self.max_workers = max_workers
+        self.run_record = run
+        self.profiler = profiler if profiler is not None else getattr(run, "profiler", None)
+        self._tasks: Dict[str, Tuple[Callable[[], Any], Tuple[str, ...], bool]] = {}
+
+    def add(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (), record: bool = True):
+        """添加阶段；阶段函数自己记录耗时（例如 record_inputs）时 record 设为False，避免重复计入"""
+        if name in self._tasks:
+            raise ValueError(f"阶段重复: {name}")
+        self._tasks[name] = (func, tuple(deps), record)
+
+    def _check_graph(self) -> List[str]:
+        """检查依赖是否存在以及是否有环，返回依赖在前的执行顺序"""
+        for name, (_, deps, _) in self._tasks.items():
+            for dep in deps:
+                if dep not in self._tasks:
+                    raise ValueError(f"阶段 {name} 依赖不存在的阶段 {dep}")
+        state: Dict[str, int] = {}
+        order: List[str] = []
+
+        def visit(name: str, path: List[str]):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"阶段依赖存在环: {' -> '.join(path + [name])}")
+            state[name] = 1
+            for dep in self._tasks[name][1]:
+                visit(dep, path + [name])
+            state[name] = 2
+            order.append(name)
+
+        for name in self._tasks:
+            visit(name, [])
+        return order
+
+    def run(self) -> PipelineReport:
+        order = self._check_graph()
+        report = PipelineReport()
+        origin = time.perf_counter()
+        lock = threading.Lock()
+
+        def execute(name: str):
+            func, _, record = self._tasks[name]
+            start = time.perf_counter()
+            try:
+                with maybe_phase(self.profiler if record else None, name):
+                    return func()
+            finally:
+                end = time.perf_counter()
+                with lock:
+                    report.timings[name] = (start - origin, end - origin)
+                if record and self.run_record is not None:
+                    self.run_record.add_phase(name, end - start)
+
+        if self.profiler is not None:
+            self._run_serial(order, execute, report)
+            report.wall_time = time.perf_counter() - origin
+            return report
+
+        pending = dict(self._tasks)
+        done: set = set()
+        failed: set = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline") as executor:
+            while pending or running:
+                for name in list(pending):
+                    deps = pending[name][1]
+                    if any(dep in failed for dep in deps):
+                        del pending[name]
+                        failed.add(name)
+                        report.skipped.append(name)
+                    elif all(dep in done for dep in deps):
+                        del pending[name]
+                        running[executor.submit(execute, name)] = name
+                if not running:
+                    # 剩余阶段都因依赖失败而跳过
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        report.results[name] = future.result()
+                        done.add(name)
+                    else:
+                        report.errors[name] = error
+                        failed.add(name)
+        report.wall_time = time.perf_counter() - origin
+        return report
+
+    def _run_serial(self, order: List[str], execute: Callable[[str], Any], report: PipelineReport):
+        failed: set = set()
+        for name in order:
+            if any(dep in failed for dep in self._tasks[name][1]):
+                failed.add(name)
+                report.skipped.append(name)
+                continue
+            try:
+                report.results[name] = execute(name)
+            except Exception as e:
+                report.errors[name] = e
+                failed.add(name)
+
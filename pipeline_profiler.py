@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译流程性能分析
+在cProfile下运行暂存、makefile路径更新和模块检查等步骤，同时用tracemalloc记录每个阶段的内存峰值。
+结束后写出 .pstats（可用 snakeviz / pstats 查看）和按累计耗时、自身耗时排序的前N个函数的文本报告。
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from path_utils import get_state_path
+
+DEFAULT_TOP_N = 30
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class PipelineProfiler:
+    """编译流程分析器
+
+    cProfile 只分析调用 start() 的线程，因此应在执行编译流程的线程中启动和停止；
+    phase() 记录阶段耗时和该阶段内的内存峰值（tracemalloc统计所有线程的Python内存分配）。
+    """
+
+    def __init__(self, name: str = "pipeline", top_n: int = DEFAULT_TOP_N):
+        self.name = name
+        self.top_n = top_n
+        self.profile = cProfile.Profile()
+        self.phases: List[Tuple[str, float, int]] = []
+        self._started = 0.0
+        self.elapsed = 0.0
+        self.peak_memory = 0
+        self._owns_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self._started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self._started
+        if tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录阶段耗时和内存峰值（相对阶段开始时的增量）"""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # 阶段开始前的峰值计入整体峰值，然后重新统计
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = 0
+            if tracing and tracemalloc.is_tracing():
+                current_peak = tracemalloc.get_traced_memory()[1]
+                self.peak_memory = max(self.peak_memory, current_peak)
+                peak = max(0, current_peak - baseline)
+            self.phases.append((name, seconds, peak))
+
+    def format_report(self) -> str:
+        """阶段汇总和前N个函数（累计耗时、自身耗时）"""
+        lines = [f"性能分析: {self.name}，总耗时 {self.elapsed:.3f} s，Python内存峰值 {_format_bytes(self.peak_memory)}",
+                 "", f"{'阶段':<20} {'耗时(s)':>10} {'内存峰值增量':>14}"]
+        for name, seconds, peak in self.phases:
+            lines.append(f"{name:<20} {seconds:>10.3f} {_format_bytes(peak):>14}")
+        for sort_key, title in (("cumulative", "按累计耗时"), ("tottime", "按自身耗时")):
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.strip_dirs().sort_stats(sort_key).print_stats(self.top_n)
+            lines += ["", f"==== {title}排序的前 {self.top_n} 个函数 ====", stream.getvalue().strip()]
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: Optional[str] = None) -> Dict[str, str]:
+        """写出 .pstats 和文本报告，默认写到状态目录的 profiles 中，返回两个文件的路径"""
+        output_dir = output_dir or get_state_path("profiles")
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, f"profile_{self.name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        paths = {"pstats": base + ".pstats", "report": base + ".txt"}
+        self.profile.dump_stats(paths["pstats"])
+        with open(paths["report"], "w", encoding="utf-8") as f:
+            f.write(self.format_report())
+        return paths
+
+
+@contextmanager
+def maybe_phase(profiler: Optional[PipelineProfiler], name: str) -> Iterator[None]:
+    """分析器为None时什么也不做，方便在流程中无条件地标记阶段"""
+    if profiler is None:
+        yield
+    else:
+        with profiler.phase(name):
+            yield
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译后处理
+按编译目录中的 postbuild.json 对输出镜像做填充、CRC写入和格式转换：镜像只读取一次，
+所有变换在内存中的 bytearray 上原地进行，CRC直接在内存视图上计算，最后一次性写出所有输出文件。
+"""
+
+import binascii
+import glob
+import json
+import os
+import time
+import zlib
+from typing import List, Optional
+
+from flash_image import DEFAULT_FILL, MemoryImage, image_format, load_image, write_image
+
+CONFIG_NAME = "postbuild.json"
+RESULT_NAME = "postbuild_result.json"
+
+# 支持的校验算法: 名称 -> (字节数, 计算函数)
+CHECKSUMS = {
+    "crc32": (4, lambda data: zlib.crc32(data) & 0xFFFFFFFF),
+    "crc16-ccitt": (2, lambda data: binascii.crc_hqx(data, 0xFFFF)),
+    "crc16-xmodem": (2, lambda data: binascii.crc_hqx(data, 0)),
+}
+
+
+def _int(value, name: str) -> int:
+    """配置中的数值可以写成整数或 "0x..." 字符串"""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value), 0)
+    except ValueError:
+        raise ValueError(f"postbuild配置项 {name} 不是有效的数值: {value}") from None
+
+
+def _range(value, name: str) -> Optional[tuple]:
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"postbuild配置项 {name} 应为 [起始地址, 结束地址]")
+    start, end = _int(value[0], name), _int(value[1], name)
+    if end <= start:
+        raise ValueError(f"postbuild配置项 {name} 的结束地址必须大于起始地址")
+    return start, end
+
+
+def load_config(path: str) -> dict:
+    """读取并校验postbuild配置
+
+    配置示例（地址可写为十六进制字符串，路径相对于配置文件所在目录）:
+        {
+          "input": "out/*.s19",
+          "region": ["0x400", "0x7FFFC"],
+          "fill": "0xFF",
+          "align": "0x800",
+          "crc": [{"type": "crc32", "address": "0x7FFFC", "range": ["0x400", "0x7FFFC"], "endian": "big"}],
+          "outputs": ["out/app_final.hex", "out/app_final.s19", "out/app_final.bin"]
+        }
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    if not raw.get("input"):
+        raise ValueError("postbuild配置缺少 input")
+    if not raw.get("outputs"):
+        raise ValueError("postbuild配置缺少 outputs")
+
+    config = {
+        "input": raw["input"],
+        "region": _range(raw.get("region"), "region"),
+        "fill": _int(raw.get("fill", DEFAULT_FILL), "fill") & 0xFF,
+        "align": _int(raw.get("align", 0), "align"),
+        "crc": [],
+        "outputs": list(raw["outputs"]),
+    }
+    for index, item in enumerate(raw.get("crc", [])):
+        name = f"crc[{index}]"
+        kind = str(item.get("type", "crc32")).lower()
+        if kind not in CHECKSUMS:
+            raise ValueError(f"postbuild配置项 {name} 的类型不支持: {kind}（可用: {', '.join(CHECKSUMS)}）")
+        crc_range = _range(item.get("range"), f"{name}.range") or config["region"]
+        if crc_range is None:
+            raise ValueError(f"postbuild配置项 {name} 缺少 range（也没有配置 region）")
+        address = _int(item["address"], f"{name}.address")
+        width = CHECKSUMS[kind][0]
+        if address < crc_range[1] and address + width > crc_range[0]:
+            raise ValueError(f"postbuild配置项 {name} 的写入地址位于校验范围内")
+        endian = item.get("endian", "big")
+        if endian not in ("big", "little"):
+            raise ValueError(f"postbuild配置项 {name}.endian 应为 big 或 little")
+        config["crc"].append({"type": kind, "range": crc_range, "address": address, "endian": endian})
+    return config
+
+
+def _resolve_input(pattern: str, base_dir: str) -> str:
+    pattern = os.path.join(base_dir, pattern)
+    matches = [path for path in glob.glob(pattern) if os.path.isfile(path)]
+    if not matches:
+        raise FileNotFoundError(f"找不到编译输出镜像: {pattern}")
+    return max(matches, key=os.path.getmtime)
+
+
+def _checksum(image: MemoryImage, kind: str, start: int, end: int, fill: int) -> int:
+    compute = CHECKSUMS[kind][1]
+    view = image.view(start, end)
+    if view is None:
+        # 范围跨越多个段（中间有空白），只在这种情况下复制一次
+        return compute(image.read(start, end, fill))
+    try:
+        return compute(view)
+    finally:
+        view.release()
+
+
+def run_postbuild(config_path: str, base_dir: Optional[str] = None) -> dict:
+    """执行编译后处理，返回结果（输入、输出、校验值和各步骤耗时）"""
+    total_start = time.perf_counter()
+    base_dir = base_dir or os.path.dirname(os.path.abspath(config_path))
+    config = load_config(config_path)
+    timings = {}
+
+    step = time.perf_counter()
+    input_path = _resolve_input(config["input"], base_dir)
+    image = load_image(input_path)
+    timings["load"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    fill = config["fill"]
+    if config["region"]:
+        image.fill_gaps(*config["region"], fill)
+    align = config["align"]
+    if align > 0:
+        for start, segment in list(image.segments()):
+            end = start + len(segment)
+            image.fill_gaps(start - start % align, -(-end // align) * align, fill)
+    timings["fill"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    checksums = []
+    for item in config["crc"]:
+        start, end = item["range"]
+        value = _checksum(image, item["type"], start, end, fill)
+        width = CHECKSUMS[item["type"]][0]
+        image.write(item["address"], value.to_bytes(width, item["endian"]))
+        checksums.append({
+            "type": item["type"],
+            "range": [f"0x{start:08X}", f"0x{end:08X}"],
+            "address": f"0x{item['address']:08X}",
+            "value": f"0x{value:0{width * 2}X}",
+        })
+    timings["crc"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    outputs = []
+    for output in config["outputs"]:
+        output_path = os.path.join(base_dir, output)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        write_image(image, output_path, fill=fill, header=os.path.basename(output_path))
+        outputs.append({"path": output_path, "format": image_format(output_path),
+                        "bytes": os.path.getsize(output_path)})
+    timings["write"] = time.perf_counter() - step
+
+    start, end = image.bounds
+    return {
+        "input": input_path,
+        "image": {"start": f"0x{start:08X}", "end": f"0x{end:08X}", "bytes": image.size},
+        "checksums": checksums,
+        "outputs": outputs,
+        "timings": {name: round(value, 4) for name, value in timings.items()},
+        "elapsed": round(time.perf_counter() - total_start, 4),
+    }
+
+
+def format_result(result: dict) -> List[str]:
+    lines = [f"编译后处理: {os.path.basename(result['input'])} "
+             f"({result['image']['start']}-{result['image']['end']}, {result['image']['bytes']} 字节)"]
+    for item in result["checksums"]:
+        lines.append(f"  {item['type']} {item['range'][0]}-{item['range'][1]} = {item['value']}"
+                     f" -> {item['address']}")
+    for output in result["outputs"]:
+        lines.append(f"  输出 {output['format']}: {output['path']} ({output['bytes']} 字节)")
+    timings = "，".join(f"{name} {value * 1000:.0f} ms" for name, value in result["timings"].items())
+    lines.append(f"  耗时 {result['elapsed'] * 1000:.0f} ms（{timings}）")
+    return lines
+
+
+def run_for_build_dir(build_dir: str) -> Optional[dict]:
+    """在编译目录中查找postbuild配置并执行，结果写入 out/postbuild_result.json
+
+    没有配置时返回None；配置或处理出错时抛出 ValueError / OSError。
+    """
+    config_path = os.path.join(build_dir, CONFIG_NAME)
+    if not os.path.isfile(config_path):
+        return None
+    result = run_postbuild(config_path, build_dir)
+    result_dir = os.path.join(build_dir, "out")
+    os.makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, RESULT_NAME), "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=1)
+    for line in format_result(result):
+        print(line)
+    return result
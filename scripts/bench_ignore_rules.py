@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""忽略规则性能对比：旧的逐模式循环实现 vs 编译后的规则引擎"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# 添加父目录到路径以便导入ignore_rules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ignore_rules import DEFAULT_IGNORE_PATTERNS, IgnoreRules
+
+# 生成合成目录树时使用的名称素材
+_EXTENSIONS = ['.c', '.h', '.s', '.o', '.d', '.obj', '.txt', '.mk', '.lst', '.map', '.py', '.pyc', '.dll', '.exe']
+_STEMS = ['main', 'can_driver', 'rebuild_table', 'distance', 'debugger', 'io_ctrl', 'flash', 'eeprom', 'task', 'util']
+_DIRS = ['src', 'inc', 'lib', 'build', 'Debug', 'Release', 'distribution', '.git', '.metadata', 'drivers', 'app']
+
+
+def legacy_ignore(directory, files, ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+    """重构前 copy_directory_safe 中逐模式循环的实现（不含打印），作为对比基线"""
+    ignored = []
+    for f in files:
+        should_ignore = False
+        for pattern in ignore_patterns:
+            if pattern.startswith('.') and not pattern.startswith('*.'):
+                if f == pattern or f == pattern[1:]:
+                    should_ignore = True
+                    break
+            elif pattern.startswith('*.'):
+                if f.lower().endswith(pattern[1:].lower()):
+                    should_ignore = True
+                    break
+            elif pattern in f.lower():
+                should_ignore = True
+                break
+        if should_ignore:
+            ignored.append(f)
+    return ignored
+
+
+def generate_listing(file_count, files_per_dir=50, seed=1):
+    """生成内存中的目录列表 [(目录, [名称...])]"""
+    rng = random.Random(seed)
+    listing = []
+    remaining = file_count
+    index = 0
+    while remaining > 0:
+        count = min(files_per_dir, remaining)
+        names = [f"{rng.choice(_STEMS)}_{index + i}{rng.choice(_EXTENSIONS)}" for i in range(count)]
+        names.extend(rng.sample(_DIRS, 3))
+        listing.append((f"root/{rng.choice(_DIRS)}/d{index}", names))
+        remaining -= count
+        index += count
+    return listing
+
+
+def listing_from_tree(root):
+    """从真实目录读取列表"""
+    return [(current, dirs + files) for current, dirs, files in os.walk(root)]
+
+
+def time_ignore(ignore, listing, repeat):
+    """多次运行取最短时间，返回 (秒, 忽略条目数)"""
+    best = None
+    ignored_count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ignored_count = 0
+        for directory, names in listing:
+            ignored_count += len(ignore(directory, names))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, ignored_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="忽略规则性能对比")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="合成目录树的文件数量")
+    parser.add_argument("--tree", help="使用真实目录代替合成目录树")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最短时间）")
+    args = parser.parse_args()
+
+    compile_start = time.perf_counter()
+    rules = IgnoreRules(DEFAULT_IGNORE_PATTERNS)
+    compile_time = time.perf_counter() - compile_start
+    print(f"规则编译耗时: {compile_time * 1000:.2f} ms ({len(rules.patterns)} 条规则)")
+
+    if args.tree:
+        cases = [(args.tree, listing_from_tree(args.tree))]
+    else:
+        cases = [(f"合成 {count} 个文件", generate_listing(count)) for count in args.files]
+
+    for label, listing in cases:
+        entries = sum(len(names) for _, names in listing)
+        root = listing[0][0] if listing else "."
+        compiled_ignore = rules.copytree_ignore(root)
+        legacy_time, legacy_count = time_ignore(legacy_ignore, listing, args.repeat)
+        compiled_time, compiled_count = time_ignore(compiled_ignore, listing, args.repeat)
+        speedup = legacy_time / compiled_time if compiled_time else float("inf")
+        print(f"{label}: {entries} 个条目")
+        print(f"  旧实现:   {legacy_time * 1000:8.2f} ms，忽略 {legacy_count}")
+        print(f"  规则引擎: {compiled_time * 1000:8.2f} ms，忽略 {compiled_count}，加速 {speedup:.1f}x")
+        if legacy_count != compiled_count:
+            print("  注意: 忽略数量不同，旧实现的子串匹配会误伤如 rebuild_*/distance_* 等名称")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""编译流程热点基准测试
+
+在临时目录中生成不同规模的合成VCU目录树（不需要Windows工具链），测量源码暂存、忽略规则过滤、
+makefile路径更新、模块检查、MSYS profile生成和release复制的耗时，结果写为JSON，
+并可与基线结果比较，超过阈值的项目视为性能退化。
+
+用法:
+    python scripts/bench_pipeline.py run -o bench.json
+    python scripts/bench_pipeline.py run --sizes 100 1000 --baseline bench.json
+    python scripts/bench_pipeline.py compare old.json new.json --threshold 15
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# 添加父目录到路径以便导入项目模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main as loc_main
+from file_sync import scan_tree, sync_directory
+from ignore_rules import default_ignore_rules
+from path_utils import ROOT_ENV_VAR
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_exe
+
+RESULT_VERSION = 1
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 20.0
+# 某个项目在较小规模上已超过该耗时（秒）时，跳过更大的规模
+DEFAULT_BUDGET = 60.0
+
+PROJECT_DIR_NAME = "VCU_compile - selftest"
+
+# 合成源码树的素材：大部分是源码，混入一些会被忽略规则排除的编译产物和IDE目录
+_SOURCE_EXTENSIONS = [".c"] * 6 + [".h"] * 4 + [".s", ".inc"]
+_NOISE_EXTENSIONS = [".o", ".d", ".lst", ".bak", ".tmp"]
+_SUB_DIRS = ["app", "bsw", "drivers", "can", "diag", "nvm", "io", "os", "lib", "cal"]
+_NOISE_DIRS = ["Debug", ".metadata", "__pycache__"]
+_FILES_PER_DIR = 100
+_NOISE_RATIO = 0.1
+_CHANGE_RATIO = 0.01
+
+_MAKEFILE_HEADER = """CW_PATH = C:/old/CW/ColdFire_Tools/Command_Line_Tools
+GCC_PATH = C:/old/GCC/bin
+
+all:
+\t@echo "========== 编译信息 ==========="
+\t@echo "当前路径: $(shell pwd)"
+\t@echo "编译器路径:"
+\t@echo "=============================="
+
+OBJS = \\
+"""
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_workspace(root, file_count, seed=1):
+    """生成合成工作区
+
+    结构:
+        input/app_mvcu/...                     待暂存的源码（含少量应被忽略的文件）
+        VCU_compile - selftest/dev_kernel_mvcu  与真实项目相同的编译目录，makefile列出所有模块
+        MSYS-1.0.10-selftest/1.0/etc/profile    MSYS profile
+    返回待暂存源码目录的路径
+    """
+    rng = random.Random(seed)
+    source_root = os.path.join(root, "input", "app_mvcu")
+    modules = []
+    for index in range(file_count):
+        directory = f"{rng.choice(_SUB_DIRS)}/d{index // _FILES_PER_DIR}"
+        if rng.random() < _NOISE_RATIO:
+            if rng.random() < 0.3:
+                directory = f"{directory}/{rng.choice(_NOISE_DIRS)}"
+            name = f"obj_{index}{rng.choice(_NOISE_EXTENSIONS)}"
+        else:
+            extension = rng.choice(_SOURCE_EXTENSIONS)
+            name = f"module_{index}{extension}"
+            if extension == ".c":
+                modules.append(f"module_{index}")
+        body = f"/* {name} */\nint value_{index} = {index};\n".encode("utf-8")
+        _write(os.path.join(source_root, *directory.split("/"), name), body * rng.randint(4, 16))
+
+    for kernel in ("dev_kernel_mvcu", "dev_kernel_svcu"):
+        kernel_dir = os.path.join(root, PROJECT_DIR_NAME, kernel)
+        os.makedirs(os.path.join(kernel_dir, "src"), exist_ok=True)
+        os.makedirs(os.path.join(kernel_dir, "build", "out"), exist_ok=True)
+        makefile = _MAKEFILE_HEADER + "".join(f"\t$(OBJ_DIR)/{module}.o \\\n" for module in modules) + "\n"
+        _write(os.path.join(kernel_dir, "build", "makefile"), makefile.encode("utf-8"))
+    _write(os.path.join(root, "MSYS-1.0.10-selftest", "1.0", "etc", "profile"), b"# profile\n")
+    return source_root
+
+
+@contextlib.contextmanager
+def project_root(root):
+    """让编译流程函数把合成工作区当作程序目录和资源目录"""
+    saved = os.environ.get(ROOT_ENV_VAR)
+    os.environ[ROOT_ENV_VAR] = root
+    try:
+        yield
+    finally:
+        if saved is None:
+            os.environ.pop(ROOT_ENV_VAR, None)
+        else:
+            os.environ[ROOT_ENV_VAR] = saved
+
+
+def _touch_some(source_root, ratio, seed):
+    """修改一部分源文件（内容和修改时间），模拟一次普通的增量编辑"""
+    rng = random.Random(seed)
+    files = sorted(scan_tree(source_root))
+    for rel_path in rng.sample(files, max(1, int(len(files) * ratio))):
+        path = os.path.join(source_root, *rel_path.split("/"))
+        with open(path, "ab") as f:
+            f.write(b"/* changed */\n")
+
+
+class Benchmark:
+    """一个基准测试项目：setup 不计时，run 计时"""
+
+    def __init__(self, name, run, setup=None, description=""):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.description = description
+
+
+def build_benchmarks(workspace, source_root):
+    staged_dir = os.path.join(workspace, PROJECT_DIR_NAME, "dev_kernel_mvcu", "src")
+    release_dir = os.path.join(workspace, "release", "sources")
+    counter = {"seed": 0}
+
+    def clear(path):
+        return lambda: shutil.rmtree(path, ignore_errors=True)
+
+    def touch():
+        # 先保证目标与源一致，再修改少量文件
+        sync_directory(source_root, staged_dir)
+        counter["seed"] += 1
+        _touch_some(source_root, _CHANGE_RATIO, counter["seed"])
+
+    def touch_release():
+        build_exe.sync_release_directory(source_root, release_dir)
+        counter["seed"] += 1
+        _touch_some(source_root, _CHANGE_RATIO, counter["seed"])
+
+    rules = default_ignore_rules()
+    return [
+        Benchmark("stage_cold", lambda: sync_directory(source_root, staged_dir), clear(staged_dir),
+                  "源码暂存到空的src目录"),
+        Benchmark("stage_incremental", lambda: sync_directory(source_root, staged_dir), touch,
+                  f"修改 {_CHANGE_RATIO:.0%} 的文件后重新暂存"),
+        Benchmark("ignore_filter", lambda: scan_tree(source_root, rules.copytree_ignore(source_root)),
+                  description="按默认忽略规则遍历过滤源码树"),
+        Benchmark("patch_makefiles", loc_main.update_makefiles_with_correct_paths,
+                  description="更新MVCU/SVCU makefile中的编译器路径"),
+        Benchmark("check_modules", lambda: loc_main.check_modules_in_makefile("m"),
+                  description="检查src中的模块是否都在makefile中 (check_modules_in_makefile)"),
+        Benchmark("msys_profile", loc_main.update_msys_profile, description="生成MSYS profile"),
+        Benchmark("release_copy_cold", lambda: build_exe.sync_release_directory(source_root, release_dir),
+                  clear(release_dir), "复制到空的release目录"),
+        Benchmark("release_copy_incremental", lambda: build_exe.sync_release_directory(source_root, release_dir),
+                  touch_release, f"修改 {_CHANGE_RATIO:.0%} 的文件后同步release目录"),
+    ]
+
+
+def time_benchmark(benchmark, repeat):
+    """多次运行取最短时间，程序自身的输出不显示"""
+    runs = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if benchmark.setup:
+                benchmark.setup()
+            start = time.perf_counter()
+            benchmark.run()
+            runs.append(time.perf_counter() - start)
+    return {"seconds": min(runs), "runs": [round(value, 6) for value in runs]}
+
+
+def run_suite(sizes, repeat=DEFAULT_REPEAT, only=None, budget=DEFAULT_BUDGET, keep=False):
+    results = {}
+    over_budget = set()
+    for size in sorted(sizes):
+        workspace = tempfile.mkdtemp(prefix=f"loc_bench_{size}_")
+        try:
+            start = time.perf_counter()
+            source_root = generate_workspace(workspace, size)
+            print(f"== {size} 个文件（生成 {time.perf_counter() - start:.1f} s）: {workspace}")
+            with project_root(workspace):
+                for benchmark in build_benchmarks(workspace, source_root):
+                    if only and benchmark.name not in only:
+                        continue
+                    entry = results.setdefault(benchmark.name, {})
+                    if benchmark.name in over_budget:
+                        entry[str(size)] = {"skipped": f"较小规模已超过 {budget:.0f} s"}
+                        print(f"  {benchmark.name:<26} 跳过")
+                        continue
+                    timing = time_benchmark(benchmark, repeat)
+                    entry[str(size)] = timing
+                    print(f"  {benchmark.name:<26} {timing['seconds'] * 1000:10.2f} ms")
+                    if timing["seconds"] > budget:
+                        over_budget.add(benchmark.name)
+        finally:
+            if keep:
+                print(f"  保留工作区: {workspace}")
+            else:
+                shutil.rmtree(workspace, ignore_errors=True)
+    return {
+        "version": RESULT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """逐项比较两次结果，返回 [(项目, 规模, 基线秒, 当前秒, 变化比例, 是否退化)]"""
+    rows = []
+    for name, sizes in sorted(current["results"].items()):
+        for size, timing in sorted(sizes.items(), key=lambda item: int(item[0])):
+            old = baseline.get("results", {}).get(name, {}).get(size)
+            if not old or "seconds" not in old or "seconds" not in timing:
+                continue
+            change = (timing["seconds"] - old["seconds"]) / old["seconds"] if old["seconds"] else 0.0
+            rows.append((name, int(size), old["seconds"], timing["seconds"], change, change * 100 > threshold))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    regressions = 0
+    for name, size, old, new, change, regressed in rows:
+        mark = "✗" if regressed else " "
+        print(f"{mark} {name:<26} {size:>7} {old * 1000:10.2f} ms -> {new * 1000:10.2f} ms ({change:+.1%})")
+        regressions += regressed
+    if regressions:
+        print(f"{regressions} 项超过阈值 {threshold:.0f}%")
+    else:
+        print(f"没有超过阈值 {threshold:.0f}% 的退化")
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        results = json.load(f)
+    if results.get("version") != RESULT_VERSION:
+        raise ValueError(f"不支持的结果文件版本: {path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编译流程热点基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="生成合成目录树并运行基准测试")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="合成目录树的文件数量")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="重复次数（取最短时间）")
+    run_parser.add_argument("--only", nargs="+", help="只运行指定的项目")
+    run_parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                            help=f"某项目超过该秒数后跳过更大的规模（默认{DEFAULT_BUDGET:.0f}）")
+    run_parser.add_argument("-o", "--output", help="结果JSON路径")
+    run_parser.add_argument("--baseline", help="与该结果JSON比较")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help=f"变慢超过该百分比视为退化（默认{DEFAULT_THRESHOLD:.0f}）")
+    run_parser.add_argument("--keep", action="store_true", help="保留生成的工作区")
+
+    compare_parser = subparsers.add_parser("compare", help="比较两个结果JSON")
+    compare_parser.add_argument("baseline", help="基线结果")
+    compare_parser.add_argument("current", help="当前结果")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help=f"变慢超过该百分比视为退化（默认{DEFAULT_THRESHOLD:.0f}）")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        rows = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+        return 1 if print_comparison(rows, args.threshold) else 0
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    results = run_suite(args.sizes, args.repeat, set(args.only) if args.only else None, args.budget, args.keep)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"结果已写入: {args.output}")
+    if baseline:
+        print(f"与基线比较: {args.baseline}")
+        return 1 if print_comparison(compare_results(baseline, results, args.threshold), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 """打包脚本：将項目打包为單個可執行文件"""
 
+import argparse
+import hashlib
+import json
 import os
 import shutil
 import subprocess
@@ -12,72 +15,64 @@ import time
 # 添加父目录到路径以便导入path_utils
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from path_utils import get_application_path
-
-
-def build_executable():
-    """使用 PyInstaller 打包項目"""
-    # 获取脚本所在目录（scripts目录）
-    scripts_dir = os.path.dirname(os.path.abspath(__file__))
-    # 获取项目根目录（LOC_COMPILE目录）
-    loc_dir = os.path.dirname(scripts_dir)
-    # 统一使用公共路径函数，确保与主程序一致
-    project_root = get_application_path()
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    exe_name = f"LOC_COMPILE_{timestamp}"
-
-    dist_dir = os.path.join(project_root, "dist")
-    build_dir = os.path.join(project_root, "build")
-    release_dir = os.path.join(project_root, "release")
-
-    # 清理舊的輸出
-    for d in (dist_dir, build_dir):
-        if os.path.exists(d):
-            shutil.rmtree(d)
-
-    # 基础 PyInstaller 命令
-    cmd = [
-        sys.executable,
-        "-m",
-        "PyInstaller",
-        "--clean",
-        "--onefile",
-        "--noconsole",
-        "--name",
-        exe_name,
-        # 主入口文件
-        os.path.join(loc_dir, "main.py"),
-    ]
-
-    # 确保包含 vcu_compiler_ui 模块
-    ui_module_path = os.path.join(loc_dir, "vcu_compiler_ui.py")
-    if os.path.exists(ui_module_path):
-        print(f"找到UI模块: {ui_module_path}")
-        cmd.extend(["--hidden-import", "vcu_compiler_ui"])
-        # 也可以直接添加为额外文件
-        cmd.extend(["--add-data", f"{ui_module_path}{os.pathsep}LOC_COMPILE"])
-    else:
-        print(f"警告: UI模块不存在: {ui_module_path}")
-
-    # 添加其他可能需要的Python模块
-    hidden_imports = [
-        "tkinter",
-        "tkinter.ttk", 
-        "tkinter.filedialog",
-        "tkinter.messagebox",
-        "tkinter.scrolledtext",
-        "threading",
-        "subprocess",
-        "shutil",
-        "argparse",
-        "re",
-        "datetime"
-    ]
+from file_sync import hash_file, scan_tree, sync_directory
+from toolchain_packs import PACK_DIR_NAME, build_pack, pack_contains
+from ignore_rules import (DEFAULT_IGNORE_PATTERNS, IMPORTANT_FILE_PATTERNS,
+                          IMPORTANT_SKIP_DIR_PATTERNS, IgnoreRules)
+from toolchain_fingerprint import MANIFEST_NAME as TOOLCHAIN_MANIFEST_NAME
+from toolchain_fingerprint import compute_toolchain_manifest, write_toolchain_manifest
+from release_store import STORE_DIR_NAME, ReleaseStore, prune_stored_executables
+
+
+# PyInstaller 构建缓存文件（保存在release目录，记录上次打包的输入指纹）
+BUILD_CACHE_NAME = ".build_cache.json"
+
+# 打包进exe的LOC_COMPILE源码暂存目录（位于项目根目录），--add-data 和输入指纹都基于其中的文件
+BUNDLE_SOURCE_DIR_NAME = "bundle_src"
+
+# 打包时额外声明的隐藏导入模块
+HIDDEN_IMPORTS = [
+    "tkinter",
+    "tkinter.ttk", 
+    "tkinter.filedialog",
+    "tkinter.messagebox",
+    "tkinter.scrolledtext",
+    "threading",
+    "subprocess",
+    "shutil",
+    "argparse",
+    "re",
+    "datetime"
+]
+
+# 需要与exe放在同一目录的工具链数据目录
+DATA_DIRS = [
+    "CW",
+    "GCC", 
+    "MSYS-1.0.10-selftest",
+]
+
+# 精简模式下必须出现在exe旁边的工具链关键路径
+REQUIRED_TOOLCHAIN_PATHS = [
+    os.path.join("CW", "ColdFire_Tools", "Command_Line_Tools"),
+    os.path.join("GCC", "bin"),
+    os.path.join("MSYS-1.0.10-selftest", "1.0", "msys.bat"),
+    os.path.join("MSYS-1.0.10-selftest", "1.0", "etc", "profile"),
+]
+
+# 打包报告文件（保存在release目录，记录各打包模式的exe大小和启动时间）
+BUILD_REPORT_NAME = ".build_report.json"
+
+# 测量启动时间的运行次数
+STARTUP_PROBE_RUNS = 3
+
+
+def resolve_tkinter_binaries():
+    """查找需要显式打包的tkinter DLL文件
     
-    for module in hidden_imports:
-        cmd.extend(["--hidden-import", module])
-
-    # 添加tkinter DLL文件的显式包含
+    返回:
+        DLL路径列表（按查找顺序去重）；找不到或出错时返回None，表示改用--collect-all tkinter
+    """
     try:
         import tkinter
         python_dir = os.path.dirname(sys.executable)
@@ -97,7 +92,7 @@ def build_executable():
             "_tkinter.pyd",
         ]
         
-        dll_found = False
+        binaries = []
         for dll_dir in dll_dirs:
             if os.path.exists(dll_dir):
                 print(f"检查DLL目录: {dll_dir}")
@@ -105,8 +100,7 @@ def build_executable():
                     dll_path = os.path.join(dll_dir, dll_name)
                     if os.path.exists(dll_path):
                         print(f"找到tkinter DLL: {dll_path}")
-                        cmd.extend(["--add-binary", f"{dll_path}{os.pathsep}."])
-                        dll_found = True
+                        binaries.append(dll_path)
                 
                 # 批量添加tcl/tk相关文件
                 for file in os.listdir(dll_dir):
@@ -114,31 +108,235 @@ def build_executable():
                         file.lower().endswith(('.dll', '.pyd'))):
                         dll_path = os.path.join(dll_dir, file)
                         print(f"添加tcl/tk文件: {dll_path}")
-                        cmd.extend(["--add-binary", f"{dll_path}{os.pathsep}."])
-                        dll_found = True
+                        binaries.append(dll_path)
         
-        if not dll_found:
+        if not binaries:
             print("警告: 未找到tkinter DLL文件，可能会导致运行时错误")
-            print("尝试使用--collect-all tkinter选项")
-            cmd.extend(["--collect-all", "tkinter"])
-        else:
-            print("✓ 已添加tkinter DLL文件")
+            return None
+        print("✓ 已添加tkinter DLL文件")
+        return list(dict.fromkeys(binaries))
             
     except Exception as e:
         print(f"警告: 处理tkinter DLL时出错: {e}")
-        print("尝试使用--collect-all tkinter选项")
-        cmd.extend(["--collect-all", "tkinter"])
+        return None
 
-    # 将整个LOC_COMPILE目录作为数据包含
-    cmd.extend(["--add-data", f"{loc_dir}{os.pathsep}LOC_COMPILE"])
 
-    # 搜索可能需要打包的数据目录
-    data_dirs = [
-        "CW",
-        "GCC", 
-        "MSYS-1.0.10-selftest",
-    ]
+def get_pyinstaller_version():
+    """获取PyInstaller版本，不可用时返回None"""
+    try:
+        result = subprocess.run([sys.executable, "-m", "PyInstaller", "--version"], 
+                              capture_output=True, text=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+
+def stage_bundled_sources(loc_dir, stage_dir):
+    """把LOC_COMPILE目录中需要打包的文件增量同步到暂存目录
+    
+    不使用同步清单，暂存目录中只有要打包的文件
+    """
+    result = sync_directory(loc_dir, stage_dir, ignore=make_ignore_function(loc_dir, verbose=False),
+                            manifest_name=None)
+    print(result.summary())
+    if not result.success:
+        rel_path, error = result.failed[0]
+        raise OSError(f"暂存打包源码失败 {rel_path}: {error}")
+    return stage_dir
+
+
+def compute_build_fingerprint(bundle_dir, hidden_imports, tk_binaries, pyinstaller_version, bundled_data,
+                              toolchain_fingerprint=""):
+    """计算影响exe内容的输入指纹
+    
+    参数:
+        bundle_dir: 通过--add-data打包进exe的源码暂存目录，其中的所有文件参与指纹
+        hidden_imports: 隐藏导入模块列表
+        tk_binaries: 显式打包的tkinter DLL列表（None表示--collect-all）
+        pyinstaller_version: PyInstaller版本
+        bundled_data: 通过--add-data打包进exe的工具链目录名列表
+        toolchain_fingerprint: 打包进exe的工具链内容指纹
+    """
+    digest = hashlib.sha256()
     
+    def feed(label, value):
+        digest.update(f"{label}={value}\n".encode("utf-8"))
+    
+    feed("python", sys.version)
+    feed("pyinstaller", pyinstaller_version)
+    feed("hidden_imports", ",".join(hidden_imports))
+    feed("bundled_data", ",".join(bundled_data))
+    feed("toolchains", toolchain_fingerprint)
+    
+    # DLL按路径、大小和修改时间识别，Python升级或重装后会失效
+    for dll_path in tk_binaries or ["<collect-all>"]:
+        try:
+            stat = os.stat(dll_path)
+            feed("dll", f"{dll_path}|{stat.st_size}|{stat.st_mtime_ns}")
+        except OSError:
+            feed("dll", dll_path)
+    
+    # 打包的文件按内容哈希（与--add-data是同一组文件）
+    for rel_path in sorted(scan_tree(bundle_dir)):
+        full_path = os.path.join(bundle_dir, *rel_path.split("/"))
+        feed("source", f"{rel_path}|{hash_file(full_path)}")
+    
+    return digest.hexdigest()
+
+
+def load_build_cache(release_dir):
+    """读取上次打包的缓存记录"""
+    try:
+        with open(os.path.join(release_dir, BUILD_CACHE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_cache(release_dir, fingerprint, exe_name):
+    """保存本次打包的缓存记录"""
+    os.makedirs(release_dir, exist_ok=True)
+    cache = {
+        "fingerprint": fingerprint,
+        "exe_name": exe_name,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(release_dir, BUILD_CACHE_NAME), "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+
+def verify_release_toolchains(release_dir):
+    """检查工具链关键路径是否存在于exe旁边（目录或压缩包中），返回缺失的路径列表"""
+    missing = []
+    for rel in REQUIRED_TOOLCHAIN_PATHS:
+        if os.path.exists(os.path.join(release_dir, rel)):
+            continue
+        name, _, inner = rel.replace(os.sep, "/").partition("/")
+        if not pack_contains(release_dir, name, inner):
+            missing.append(rel)
+    for rel in missing:
+        print(f"✗ 缺少工具链文件: {os.path.join(release_dir, rel)}")
+    if not missing:
+        print("✓ 工具链已位于exe所在目录")
+    return missing
+
+
+def measure_startup_time(exe_path, runs=STARTUP_PROBE_RUNS):
+    """测量exe从启动到退出的时间（使用--startup-check，不打开界面）
+    
+    返回:
+        (首次启动秒数, 启动时间中位数)，无法测量时返回None
+    """
+    if os.name != 'nt':
+        print("非Windows系统，跳过启动时间测量")
+        return None
+    
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            subprocess.run([exe_path, "--startup-check"], cwd=os.path.dirname(exe_path),
+                           timeout=300, check=False)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"警告: 启动时间测量失败: {e}")
+            return None
+        timings.append(time.perf_counter() - start)
+    return timings[0], sorted(timings)[len(timings) // 2]
+
+
+def report_build_metrics(release_dir, exe_path, mode):
+    """记录并对比exe大小和启动时间
+    
+    参数:
+        mode: 打包模式，"bundled"（工具链打包进exe）或 "slim"（工具链放在exe旁边）
+    """
+    report_path = os.path.join(release_dir, BUILD_REPORT_NAME)
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+    
+    size_mb = os.path.getsize(exe_path) / 1024 / 1024
+    startup = measure_startup_time(exe_path)
+    current = {
+        "exe": os.path.basename(exe_path),
+        "size_mb": round(size_mb, 2),
+        "cold_start_s": round(startup[0], 3) if startup else None,
+        "warm_start_s": round(startup[1], 3) if startup else None,
+        "measured": datetime.now().isoformat(timespec="seconds"),
+    }
+    
+    print(f"exe大小: {size_mb:.1f} MB")
+    if startup:
+        print(f"启动时间: 首次 {startup[0]:.2f} s，中位数 {startup[1]:.2f} s")
+    
+    # 与同模式上次结果及另一种模式的结果对比
+    other_mode = "bundled" if mode == "slim" else "slim"
+    for label, previous in ((f"上次{mode}", report.get(mode)), (other_mode, report.get(other_mode))):
+        if not previous:
+            continue
+        line = f"对比{label}: 大小 {previous['size_mb']:.2f} MB -> {size_mb:.2f} MB"
+        if startup and previous.get("cold_start_s") is not None:
+            line += f"，首次启动 {previous['cold_start_s']:.2f} s -> {startup[0]:.2f} s"
+        print(line)
+    
+    report[mode] = current
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"警告: 写入打包报告失败: {e}")
+    return current
+
+
+def pack_release_toolchains(project_root, release_dir, data_dirs):
+    """把工具链压缩为按内容寻址的包放到 release/packs，并移除release中未压缩的副本"""
+    pack_dir = os.path.join(release_dir, PACK_DIR_NAME)
+    for d in data_dirs:
+        src_path = os.path.join(project_root, d)
+        if not os.path.isdir(src_path):
+            continue
+        start = time.perf_counter()
+        stats = build_pack(src_path, pack_dir, d, ignore=make_ignore_function(src_path, verbose=False))
+        elapsed = time.perf_counter() - start
+        state = "复用" if stats["reused"] else "生成"
+        print(f"{state}工具链包 {d}: {stats['files']} 个文件，"
+              f"{stats['raw_bytes'] / 1024 / 1024:.1f} MB -> {stats['packed_bytes'] / 1024 / 1024:.1f} MB，"
+              f"耗时 {elapsed:.2f} s")
+        
+        # 目录存在时运行时会优先使用目录，因此删除旧的未压缩副本
+        dest_path = os.path.join(release_dir, d)
+        if os.path.isdir(dest_path):
+            shutil.rmtree(dest_path)
+            print(f"删除未压缩的工具链目录: {dest_path}")
+
+
+def build_executable(use_cache=True, slim=False, pack_toolchains=False):
+    """使用 PyInstaller 打包項目
+    
+    参数:
+        use_cache: Python输入未变化时复用上次生成的exe，只同步数据目录
+        slim: 精简模式，不把工具链打包进exe，只放在exe所在目录
+        pack_toolchains: 把工具链压缩为按需解压的包（隐含精简模式）
+    """
+    slim = slim or pack_toolchains
+    # 获取脚本所在目录（scripts目录）
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    # 获取项目根目录（LOC_COMPILE目录）
+    loc_dir = os.path.dirname(scripts_dir)
+    # 统一使用公共路径函数，确保与主程序一致
+    project_root = get_application_path()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    exe_name = f"LOC_COMPILE_{timestamp}"
+
+    dist_dir = os.path.join(project_root, "dist")
+    build_dir = os.path.join(project_root, "build")
+    release_dir = os.path.join(project_root, "release")
+
     # VCU_compile目录需要特殊处理，只包含必要的文件
     vcu_compile_dir = os.path.join(project_root, "VCU_compile - selftest")
     if os.path.exists(vcu_compile_dir):
@@ -147,59 +345,62 @@ def build_executable():
     else:
         print(f"警告: VCU项目目录不存在: {vcu_compile_dir}")
 
+    # 搜索可能需要打包的数据目录
+    data_dirs = DATA_DIRS
+    bundled_data = []
     for d in data_dirs:
-        abs_path = os.path.join(project_root, d)
-        abs_path = os.path.normpath(abs_path)  # 规范化路径
+        abs_path = os.path.normpath(os.path.join(project_root, d))  # 规范化路径
         if os.path.exists(abs_path):
             print(f"找到数据目录: {abs_path}")
-            # PyInstaller 的 --add-data 格式为 '源路径;目标路径' (Windows) 或 '源路径:目标路径' (Linux/Mac)
-            cmd.extend(["--add-data", f"{abs_path}{os.pathsep}{d}"])
+            # 精简模式下工具链只同步到exe旁边，get_resource_path 本就从exe所在目录解析
+            if not slim:
+                bundled_data.append(d)
         else:
             print(f"警告: 数据目录不存在: {abs_path}")
 
-    # 添加图标文件（如果存在）
-    icon_path = os.path.join(loc_dir, "icon.ico")
-    if os.path.exists(icon_path):
-        cmd.extend(["--icon", icon_path])
-
-    print("执行打包命令:", " ".join(cmd))
-    try:
-        subprocess.check_call(cmd)
-    except subprocess.CalledProcessError as e:
-        print(f"打包失败，错误代码: {e.returncode}")
-        raise
-
-    exe_path = os.path.join(dist_dir, f"{exe_name}.exe")
-    if not os.path.exists(exe_path):
-        raise FileNotFoundError(f"生成的exe文件不存在: {exe_path}")
+    # 计算输入指纹，命中缓存时跳过PyInstaller
+    bundle_dir = stage_bundled_sources(loc_dir, os.path.join(project_root, BUNDLE_SOURCE_DIR_NAME))
+    tk_binaries = resolve_tkinter_binaries()
+    # 工具链打包进exe时其内容也影响exe（文件哈希有缓存，工具链未变时几乎不耗时）
+    toolchain_fingerprint = (compute_toolchain_manifest(project_root, bundled_data)["fingerprint"]
+                             if bundled_data else "")
+    fingerprint = compute_build_fingerprint(
+        bundle_dir, HIDDEN_IMPORTS, tk_binaries, get_pyinstaller_version(), bundled_data,
+        toolchain_fingerprint
+    )
+    cache = load_build_cache(release_dir) if use_cache else {}
+    cached_exe = os.path.join(release_dir, f"{cache.get('exe_name', '')}.exe")
     
-    os.makedirs(release_dir, exist_ok=True)
-    final_path = os.path.join(release_dir, f"{exe_name}.exe")
-    shutil.move(exe_path, final_path)
-
-    # 复制数据目录到release目录，确保exe与数据目录在同一目录
-    for d in data_dirs:
-        src_path = os.path.join(project_root, d)
-        if os.path.exists(src_path):
-            dest_path = os.path.join(release_dir, d)
-            if os.path.exists(dest_path):
+    if cache.get("fingerprint") == fingerprint and os.path.isfile(cached_exe):
+        exe_name = cache["exe_name"]
+        final_path = cached_exe
+        print(f"✓ Python输入未变化，复用上次生成的exe: {final_path}")
+    else:
+        if use_cache and cache:
+            print("Python输入已变化，重新打包")
+        final_path = run_pyinstaller(loc_dir, bundle_dir, project_root, exe_name, tk_binaries, bundled_data,
+                                     dist_dir, build_dir, release_dir)
+        save_build_cache(release_dir, fingerprint, exe_name)
+
+    if pack_toolchains:
+        # 工具链压缩为包，运行时按需解压
+        pack_release_toolchains(project_root, release_dir, data_dirs)
+    else:
+        # 增量同步数据目录到release目录，确保exe与数据目录在同一目录
+        for d in data_dirs:
+            src_path = os.path.join(project_root, d)
+            if os.path.exists(src_path):
+                dest_path = os.path.join(release_dir, d)
                 try:
-                    shutil.rmtree(dest_path)
+                    if os.path.isdir(src_path):
+                        # 只复制有变化的文件，删除多余文件，排除不需要的文件
+                        sync_release_directory(src_path, dest_path)
+                    else:
+                        shutil.copy2(src_path, dest_path)
+                        print(f"复制文件: {src_path} -> {dest_path}")
                 except Exception as e:
-                    print(f"警告: 删除现有目录失败 {dest_path}: {e}")
+                    print(f"警告: 同步失败 {src_path}: {e}")
                     continue
-            
-            try:
-                if os.path.isdir(src_path):
-                    # 使用自定义复制函数，排除不需要的文件
-                    copy_directory_safe(src_path, dest_path)
-                    print(f"复制目录: {src_path} -> {dest_path}")
-                else:
-                    shutil.copy2(src_path, dest_path)
-                    print(f"复制文件: {src_path} -> {dest_path}")
-            except Exception as e:
-                print(f"警告: 复制失败 {src_path}: {e}")
-                continue
 
     # 特殊处理VCU_compile目录，只复制必要的文件和目录结构
     vcu_src_path = os.path.join(project_root, "VCU_compile - selftest")
@@ -223,43 +424,28 @@ def build_executable():
                 os.makedirs(full_dir, exist_ok=True)
                 print(f"创建目录: {full_dir}")
             
-            # 只复制重要的文件（makefile等）
-            for root, dirs, files in os.walk(vcu_src_path):
-                # 跳过问题目录
-                dirs[:] = [d for d in dirs if not any(skip in d.lower() for skip in 
-                          ['.metadata', '.settings', 'debug', 'release', 'remotesystemstempfiles'])]
-                
-                rel_path = os.path.relpath(root, vcu_src_path)
-                if rel_path == '.':
-                    continue
-                    
-                dest_dir = os.path.join(vcu_dest_path, rel_path)
-                
-                for file in files:
-                    # 只复制重要文件
-                    if (file.lower() in ['makefile', 'readme.txt', 'readme.md'] or 
-                        file.lower().endswith(('.c', '.h', '.s', '.bat', '.sh', '.py', '.txt'))):
-                        try:
-                            src_file = os.path.join(root, file)
-                            os.makedirs(dest_dir, exist_ok=True)
-                            dest_file = os.path.join(dest_dir, file)
-                            shutil.copy2(src_file, dest_file)
-                            print(f"复制VCU文件: {rel_path}/{file}")
-                        except Exception as e:
-                            print(f"复制VCU文件失败 {file}: {e}")
-                            
+            # 只复制重要的文件（makefile、源码、脚本等）
+            copied = copy_important_files_only(vcu_src_path, vcu_dest_path, verbose=False)
+            print(f"复制VCU文件: {copied} 个")
         except Exception as e:
             print(f"特殊处理VCU目录失败: {e}")
-            # 如果特殊处理失败，尝试使用安全复制
-            try:
-                copy_important_files_only(vcu_src_path, vcu_dest_path)
-                print(f"使用安全复制模式处理VCU目录")
-            except Exception as e2:
-                print(f"安全复制VCU目录也失败: {e2}")
+
+    # 精简模式下exe不含工具链，必须确认它们位于exe旁边
+    missing = verify_release_toolchains(release_dir)
+    if slim and missing:
+        raise FileNotFoundError(f"精简模式下exe所在目录缺少工具链: {', '.join(missing)}")
+
+    # 生成随release发布的工具链清单，供 --verify-toolchain 校验
+    manifest = write_toolchain_manifest(release_dir)
+    print(f"工具链清单: {TOOLCHAIN_MANIFEST_NAME}，"
+          f"{sum(len(t['files']) for t in manifest['toolchains'].values())} 个文件，"
+          f"指纹 {manifest['fingerprint'][:16]}")
 
     # 创建启动脚本（可选）
     create_batch_launcher(release_dir, f"{exe_name}.exe")
 
+    report_build_metrics(release_dir, final_path, "slim" if slim else "bundled")
+
     print(f"打包完成，生成文件: {final_path}")
     print(f"release目录: {release_dir}")
     print("目录结构:")
@@ -274,6 +460,88 @@ def build_executable():
     return final_path
 
 
+def run_pyinstaller(loc_dir, bundle_dir, project_root, exe_name, tk_binaries, bundled_data,
+                    dist_dir, build_dir, release_dir):
+    """执行PyInstaller打包，并把生成的exe移动到release目录
+    
+    返回:
+        release目录中exe的路径
+    """
+    # 清理舊的輸出
+    for d in (dist_dir, build_dir):
+        if os.path.exists(d):
+            shutil.rmtree(d)
+
+    # 基础 PyInstaller 命令
+    cmd = [
+        sys.executable,
+        "-m",
+        "PyInstaller",
+        "--clean",
+        "--onefile",
+        "--noconsole",
+        "--name",
+        exe_name,
+        "--distpath",
+        dist_dir,
+        "--workpath",
+        build_dir,
+        # 主入口文件
+        os.path.join(loc_dir, "main.py"),
+    ]
+
+    # 确保包含 vcu_compiler_ui 模块
+    ui_module_path = os.path.join(bundle_dir, "vcu_compiler_ui.py")
+    if os.path.exists(ui_module_path):
+        print(f"找到UI模块: {ui_module_path}")
+        cmd.extend(["--hidden-import", "vcu_compiler_ui"])
+        # 也可以直接添加为额外文件
+        cmd.extend(["--add-data", f"{ui_module_path}{os.pathsep}LOC_COMPILE"])
+    else:
+        print(f"警告: UI模块不存在: {ui_module_path}")
+
+    # 添加其他可能需要的Python模块
+    for module in HIDDEN_IMPORTS:
+        cmd.extend(["--hidden-import", module])
+
+    # 添加tkinter DLL文件的显式包含
+    if tk_binaries:
+        for dll_path in tk_binaries:
+            cmd.extend(["--add-binary", f"{dll_path}{os.pathsep}."])
+    else:
+        print("尝试使用--collect-all tkinter选项")
+        cmd.extend(["--collect-all", "tkinter"])
+
+    # 将暂存的LOC_COMPILE目录作为数据包含（与输入指纹是同一组文件）
+    cmd.extend(["--add-data", f"{bundle_dir}{os.pathsep}LOC_COMPILE"])
+
+    for d in bundled_data:
+        abs_path = os.path.normpath(os.path.join(project_root, d))
+        # PyInstaller 的 --add-data 格式为 '源路径;目标路径' (Windows) 或 '源路径:目标路径' (Linux/Mac)
+        cmd.extend(["--add-data", f"{abs_path}{os.pathsep}{d}"])
+
+    # 添加图标文件（如果存在）
+    icon_path = os.path.join(loc_dir, "icon.ico")
+    if os.path.exists(icon_path):
+        cmd.extend(["--icon", icon_path])
+
+    print("执行打包命令:", " ".join(cmd))
+    try:
+        subprocess.check_call(cmd)
+    except subprocess.CalledProcessError as e:
+        print(f"打包失败，错误代码: {e.returncode}")
+        raise
+
+    exe_path = os.path.join(dist_dir, f"{exe_name}.exe")
+    if not os.path.exists(exe_path):
+        raise FileNotFoundError(f"生成的exe文件不存在: {exe_path}")
+    
+    os.makedirs(release_dir, exist_ok=True)
+    final_path = os.path.join(release_dir, f"{exe_name}.exe")
+    shutil.move(exe_path, final_path)
+    return final_path
+
+
 def create_batch_launcher(release_dir, exe_name):
     """创建批处理启动脚本"""
     batch_content = f'''@echo off
@@ -305,84 +573,54 @@ if errorlevel 1 (
         print(f"创建启动脚本失败: {e}")
 
 
-def copy_directory_safe(src, dest, ignore_patterns=None):
-    """安全复制目录，排除特定模式的文件和目录"""
-    if ignore_patterns is None:
-        ignore_patterns = [
-            '.git',           # Git 仓库
-            '.gitignore',     # Git 忽略文件
-            '__pycache__',    # Python 缓存
-            '*.pyc',          # Python 编译文件
-            '*.pyo',          # Python 优化文件
-            '.vs',            # Visual Studio
-            '.vscode',        # VS Code
-            'Thumbs.db',      # Windows 缩略图
-            '.DS_Store',      # macOS 文件
-            '*.tmp',          # 临时文件
-            '*.temp',         # 临时文件
-            '*.log',          # 日志文件
-            'dist',           # 构建输出目录
-            'build',          # 构建临时目录
-            '.metadata',      # Eclipse 元数据目录
-            '.settings',      # Eclipse 设置目录
-            '.project',       # Eclipse 项目文件
-            '.cproject',      # Eclipse C/C++ 项目文件
-            '.classpath',     # Eclipse Java 类路径文件
-            '*.launch',       # Eclipse 启动配置文件
-            '.history',       # Eclipse 历史目录
-            'RemoteSystemsTempFiles', # Eclipse 远程系统临时文件
-            '*.d',            # 依赖文件
-            '*.o',            # 目标文件
-            '*.obj',          # 目标文件
-            '*.elf',          # 可执行文件
-            '*.bin',          # 二进制文件
-            '*.hex',          # 十六进制文件
-            '*.map',          # 映射文件
-            '*.lst',          # 列表文件
-            'Debug',          # Debug 目录
-            'Release',        # Release 目录
-            '*.workspace',    # 工作空间文件
-        ]
+# 文件名中可能导致复制失败的字符
+PROBLEMATIC_CHARS = frozenset(':*?"<>|')
+
+# 只复制重要文件时使用的规则
+IMPORTANT_FILE_RULES = IgnoreRules(IMPORTANT_FILE_PATTERNS)
+IMPORTANT_SKIP_DIR_RULES = IgnoreRules(IMPORTANT_SKIP_DIR_PATTERNS)
+
+
+def make_ignore_function(root, ignore_patterns=None, verbose=True):
+    """生成copytree风格的忽略函数
+
+    参数:
+        root: 规则的根目录（锚定模式相对于该目录匹配）
+        ignore_patterns: gitignore风格的忽略模式列表，默认使用DEFAULT_IGNORE_PATTERNS
+        verbose: 是否逐个打印被跳过的文件
+    """
+    rules = IgnoreRules(DEFAULT_IGNORE_PATTERNS if ignore_patterns is None else ignore_patterns)
+    rules_ignore = rules.copytree_ignore(root)
     
     def ignore_function(directory, files):
-        """自定义忽略函数"""
-        ignored = []
+        """规则匹配之外，额外排除过长或包含特殊字符的文件名"""
+        ignored = rules_ignore(directory, files)
         for f in files:
-            # 检查是否匹配忽略模式
-            should_ignore = False
-            for pattern in ignore_patterns:
-                if pattern.startswith('.') and not pattern.startswith('*.'):
-                    # 目录名或文件名精确匹配
-                    if f == pattern or f == pattern[1:]:
-                        should_ignore = True
-                        break
-                elif pattern.startswith('*.'):
-                    # 文件扩展名匹配
-                    if f.lower().endswith(pattern[1:].lower()):
-                        should_ignore = True
-                        break
-                elif pattern in f.lower():
-                    # 包含匹配（不区分大小写）
-                    should_ignore = True
-                    break
-            
-            # 额外检查：排除包含特殊字符或过长的文件名
-            if len(f) > 200:  # 文件名过长
-                should_ignore = True
-            
-            # 检查是否包含可能有问题的字符
-            problematic_chars = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
-            if any(char in f for char in problematic_chars if char not in ['\\', '/']):
-                should_ignore = True
-            
-            if should_ignore:
-                ignored.append(f)
+            if len(f) > 200 or not PROBLEMATIC_CHARS.isdisjoint(f):
+                ignored.add(f)
+        
+        if verbose:
+            for f in sorted(ignored):
                 print(f"跳过: {os.path.join(directory, f)}")
         
         return ignored
     
+    return ignore_function
+
+
+def sync_release_directory(src, dest, ignore_patterns=None):
+    """基于清单增量同步目录到release，只打印汇总信息"""
+    result = sync_directory(src, dest, ignore=make_ignore_function(src, ignore_patterns, verbose=False))
+    print(result.summary())
+    for rel_path, error in result.failed:
+        print(f"警告: 同步失败 {rel_path}: {error}")
+    return result
+
+
+def copy_directory_safe(src, dest, ignore_patterns=None):
+    """安全复制目录，排除特定模式的文件和目录"""
     try:
-        shutil.copytree(src, dest, ignore=ignore_function)
+        shutil.copytree(src, dest, ignore=make_ignore_function(src, ignore_patterns))
     except Exception as e:
         print(f"目录复制失败: {e}")
         # 尝试手动复制重要文件
@@ -394,38 +632,34 @@ def copy_directory_safe(src, dest, ignore_patterns=None):
             raise
 
 
-def copy_important_files_only(src, dest):
-    """仅复制重要文件，避免复制可能有问题的文件"""
-    important_extensions = ['.c', '.h', '.s', '.S', '.asm', '.txt', '.md', '.bat', '.sh', '.py']
-    important_dirs = ['src', 'inc', 'include', 'scripts', 'tools']
+def copy_important_files_only(src, dest, verbose=True):
+    """仅复制重要文件，避免复制可能有问题的文件
     
-    for root, dirs, files in os.walk(src):
-        # 过滤目录
-        dirs[:] = [d for d in dirs if not any(ignore in d.lower() for ignore in 
-                   ['.metadata', '.settings', 'debug', 'release', '.git', '__pycache__'])]
-        
-        # 计算相对路径
-        rel_path = os.path.relpath(root, src)
-        if rel_path == '.':
-            dest_dir = dest
-        else:
-            dest_dir = os.path.join(dest, rel_path)
+    返回:
+        成功复制的文件数
+    """
+    copied = 0
+    for root, rel_dir, dirs, files in IMPORTANT_SKIP_DIR_RULES.walk(src):
+        dest_dir = dest if rel_dir == '.' else os.path.join(dest, rel_dir)
         
         # 创建目标目录
         os.makedirs(dest_dir, exist_ok=True)
         
         # 复制重要文件
         for file in files:
-            file_ext = os.path.splitext(file)[1].lower()
-            if file_ext in important_extensions or file.lower() in ['makefile', 'readme']:
-                try:
-                    src_file = os.path.join(root, file)
-                    dest_file = os.path.join(dest_dir, file)
-                    shutil.copy2(src_file, dest_file)
+            if not IMPORTANT_FILE_RULES.match(file):
+                continue
+            try:
+                src_file = os.path.join(root, file)
+                dest_file = os.path.join(dest_dir, file)
+                shutil.copy2(src_file, dest_file)
+                copied += 1
+                if verbose:
                     print(f"复制: {src_file} -> {dest_file}")
-                except Exception as e:
-                    print(f"复制文件失败 {file}: {e}")
-                    continue
+            except Exception as e:
+                print(f"复制文件失败 {file}: {e}")
+                continue
+    return copied
 
 
 def verify_dependencies():
@@ -433,14 +667,10 @@ def verify_dependencies():
     print("验证打包环境...")
     
     # 检查PyInstaller
-    try:
-        result = subprocess.run([sys.executable, "-m", "PyInstaller", "--version"], 
-                              capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"✓ PyInstaller 版本: {result.stdout.strip()}")
-        else:
-            raise subprocess.CalledProcessError(result.returncode, "PyInstaller")
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    pyinstaller_version = get_pyinstaller_version()
+    if pyinstaller_version:
+        print(f"✓ PyInstaller 版本: {pyinstaller_version}")
+    else:
         print("✗ PyInstaller 未安装或版本过低")
         print("请运行: pip install pyinstaller>=5.0")
         return False
@@ -532,7 +762,47 @@ def open_release_directory(exe_path):
         print(f"请手动访问: {os.path.dirname(exe_path)}")
 
 
+def parse_args(argv=None):
+    """解析打包脚本的命令行参数"""
+    parser = argparse.ArgumentParser(description="VCU编译器打包脚本")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="忽略构建缓存，强制重新执行PyInstaller打包")
+    parser.add_argument("--slim", action="store_true",
+                        help="精简模式：工具链不打包进exe，只放在exe所在目录")
+    parser.add_argument("--pack-toolchains", action="store_true",
+                        help="把工具链压缩为按需解压的包放在exe所在目录的packs中（隐含--slim）")
+    parser.add_argument("--store", nargs="?", const=STORE_DIR_NAME, metavar="DIR",
+                        help=f"打包后把release目录存入发布仓库（默认 {STORE_DIR_NAME}），并清理已入库的旧exe")
+    parser.add_argument("--tag", action="append", default=[],
+                        help="入库版本的标签（可重复），带标签的版本不会被保留策略清理")
+    parser.add_argument("--keep-last", type=int, metavar="N",
+                        help="入库后只保留最新的N个版本（带标签的除外），并回收无引用的内容")
+    return parser.parse_args(argv)
+
+
+def store_release(exe_path, store_dir, tags=(), keep_last=None):
+    """把本次打包的release目录存入发布仓库，并按保留策略清理"""
+    release_dir = os.path.dirname(os.path.abspath(exe_path))
+    exe_name = os.path.splitext(os.path.basename(exe_path))[0]
+    if not os.path.isabs(store_dir):
+        store_dir = os.path.join(get_application_path(), store_dir)
+
+    print(f"\n存入发布仓库: {store_dir}")
+    store = ReleaseStore(store_dir)
+    if store.has_release(exe_name):
+        # 复用缓存的exe时版本名不变，给版本名加上入库时间
+        exe_name = f"{exe_name}@{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # release目录中其他版本的exe不属于本次发布
+    store.ingest(release_dir, exe_name, tags,
+                 extra_ignore=["/LOC_COMPILE_*.exe", f"!/{os.path.basename(exe_path)}"])
+    prune_stored_executables(store, release_dir, exe_path)
+    if keep_last is not None:
+        store.apply_retention(keep_last)
+        store.collect_garbage()
+
+
 def main():
+    args = parse_args()
     try:
         print("=" * 50)
         print("VCU编译器打包脚本")
@@ -546,11 +816,19 @@ def main():
         
         print("\n开始打包...")
         try:
-            exe_path = build_executable()
-        except Exception as e:
+            exe_path = build_executable(use_cache=not args.no_cache, slim=args.slim,
+                                        pack_toolchains=args.pack_toolchains)
+        except subprocess.CalledProcessError as e:
+            # 只有PyInstaller执行失败时才换用备用方法；工具链校验和配置错误直接报告。
+            # 备用方法打包完整的exe且不检查工具链，精简模式下不能代替
+            if args.slim or args.pack_toolchains:
+                raise
             print(f"✗ 标准打包方法失败: {e}")
             print("\n尝试备用打包方法...")
             exe_path = build_executable_alternative()
+
+        if args.store:
+            store_release(exe_path, args.store, args.tag, args.keep_last)
             
         print("\n" + "=" * 50)
         print("✓ 打包成功完成！")
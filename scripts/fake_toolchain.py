@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""假工具链端到端测试环境
+
+在临时目录中搭建完整的程序目录：用桩程序代替 GCC/CW 编译器和链接器（模拟每个文件的编译耗时、
+警告输出，生成目标文件、map文件和S19镜像），生成 `VCU_compile - selftest` 项目和待编译的源码，
+然后像用户一样通过 main.py 命令行模式或界面的编译流程驱动整个流程：暂存、模块检查、MSYS中make编译、
+编译后处理和占用分析。用于在任意Linux机器上可重复地测量暂存、调度、缓存和并行的改进效果。
+
+依赖 bash 和 GNU make；界面模式还需要图形显示（DISPLAY）。
+
+用法:
+    python scripts/fake_toolchain.py run --files 500 --runs 3 --touch 2 --jobs 4 -o e2e.json
+    python scripts/fake_toolchain.py run --mode ui --files 200
+    python scripts/fake_toolchain.py create /tmp/loc_fake --files 1000
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+from path_utils import ROOT_ENV_VAR
+from source_staging import MSYS_COMMAND_ENV_VAR
+
+PROJECT_DIR_NAME = "VCU_compile - selftest"
+GCC_BIN = os.path.join("GCC", "bin")
+CW_BIN = os.path.join("CW", "ColdFire_Tools", "Command_Line_Tools")
+
+# 桩程序的默认耗时（毫秒），可通过同名环境变量覆盖
+DEFAULT_LATENCY = {
+    "LOC_FAKE_COMPILE_MS": 20,     # 每个文件的固定编译耗时
+    "LOC_FAKE_COMPILE_MS_PER_KB": 2,
+    "LOC_FAKE_LINK_MS": 100,
+    "LOC_FAKE_LINK_MS_PER_OBJECT": 0.2,
+}
+
+FLASH_ORIGIN = 0x400
+RAM_ORIGIN = 0x20000000
+
+# 编译器/链接器桩程序：第一个参数为 cc 或 ld，其余参数与真实工具的常用参数一致
+FAKE_TOOL_SOURCE = r'''#!/usr/bin/env python
+"""LOC_COMPILE 假工具链桩程序（由 scripts/fake_toolchain.py 生成）"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULTS = %(defaults)s
+FLASH_ORIGIN = %(flash_origin)d
+RAM_ORIGIN = %(ram_origin)d
+
+
+def setting(name):
+    return float(os.environ.get(name, DEFAULTS[name]))
+
+
+def option(args, flag):
+    return args[args.index(flag) + 1] if flag in args else None
+
+
+def object_sizes(data):
+    """根据源码内容确定各节区大小，保证同样的输入得到同样的产物"""
+    return {"text": 32 + len(data) // 16 * 4, "data": 4 * (data.count(b"=") %% 16), "bss": 8 * (len(data) %% 7)}
+
+
+def compile_file(tool, args):
+    source, output = option(args, "-c"), option(args, "-o")
+    with open(source, "rb") as f:
+        data = f.read()
+    time.sleep((setting("LOC_FAKE_COMPILE_MS") + setting("LOC_FAKE_COMPILE_MS_PER_KB") * len(data) / 1024) / 1000)
+    failed = False
+    for number, line in enumerate(data.decode("utf-8", "replace").splitlines(), 1):
+        if "FAKE_WARNING" in line:
+            if tool == "mwcc":
+                sys.stderr.write(f"Warning : fake warning\n{source} line {number}\n")
+            else:
+                sys.stderr.write(f"{source}:{number}:1: warning: fake warning [-Wfake]\n")
+        elif "FAKE_ERROR" in line:
+            if tool == "mwcc":
+                sys.stderr.write(f"Error   : fake error\n{source} line {number}\n")
+            else:
+                sys.stderr.write(f"{source}:{number}:1: error: fake error\n")
+            failed = True
+    if failed:
+        return 1
+    obj = dict(object_sizes(data), source=source, digest=hashlib.sha256(data).hexdigest())
+    with open(output, "w") as f:
+        json.dump(obj, f)
+    return 0
+
+
+def srec_line(kind, address, payload, address_bytes):
+    body = bytes([len(payload) + address_bytes + 1]) + address.to_bytes(address_bytes, "big") + payload
+    return f"S{kind}{body.hex().upper()}{(~sum(body)) & 0xFF:02X}\n"
+
+
+def link(tool, args):
+    output, map_path = option(args, "-o"), option(args, "-Map")
+    objects = [arg for arg in args if arg.endswith(".o")]
+    time.sleep((setting("LOC_FAKE_LINK_MS") + setting("LOC_FAKE_LINK_MS_PER_OBJECT") * len(objects)) / 1000)
+    entries = []
+    for path in objects:
+        with open(path) as f:
+            entries.append((path, json.load(f)))
+
+    layout = {".text": [], ".data": [], ".bss": []}
+    address = {".text": FLASH_ORIGIN, ".data": RAM_ORIGIN}
+    for path, obj in entries:
+        for section, key in ((".text", "text"), (".data", "data")):
+            layout[section].append((address[section], obj[key], path))
+            address[section] += obj[key]
+    layout[".bss"] = []
+    bss = address[".data"]
+    for path, obj in entries:
+        layout[".bss"].append((bss, obj["bss"], path))
+        bss += obj["bss"]
+    flash_length = int(os.environ.get("LOC_FAKE_FLASH_LENGTH", "0"), 0) or 0x400000
+    if address[".text"] > FLASH_ORIGIN + flash_length:
+        sys.stderr.write("ld: error: region FLASH overflowed\n")
+        return 1
+
+    if map_path:
+        with open(map_path, "w") as f:
+            f.write("Memory Configuration\n\nName             Origin             Length             Attributes\n")
+            f.write(f"FLASH            0x{FLASH_ORIGIN:08x}         0x{flash_length:08x}         xr\n")
+            f.write(f"RAM              0x{RAM_ORIGIN:08x}         0x00100000         xrw\n")
+            f.write("*default*        0x00000000         0xffffffff\n\nLinker script and memory map\n\n")
+            for section, items in layout.items():
+                start = items[0][0] if items else 0
+                total = sum(size for _, size, _ in items)
+                f.write(f"{section:<16}0x{start:08x}     0x{total:x}\n")
+                for item_address, size, path in items:
+                    if size:
+                        f.write(f" {section:<15}0x{item_address:08x}     0x{size:x} {path}\n")
+                f.write("\n")
+
+    image = bytearray()
+    for _, obj in entries:
+        seed = bytes.fromhex(obj["digest"])
+        image += (seed * (obj["text"] // len(seed) + 1))[:obj["text"]]
+    with open(output, "w") as f:
+        f.write(srec_line(0, 0, os.path.basename(output).encode(), 2))
+        for offset in range(0, len(image), 32):
+            f.write(srec_line(3, FLASH_ORIGIN + offset, bytes(image[offset:offset + 32]), 4))
+        f.write(srec_line(7, FLASH_ORIGIN, b"", 4))
+    return 0
+
+
+def main():
+    kind, tool, args = sys.argv[1], sys.argv[2], sys.argv[3:]
+    return compile_file(tool, args) if kind == "cc" else link(tool, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+'''
+
+# 工具名 -> (所在目录, 桩类型, 诊断格式)
+FAKE_TOOLS = {
+    "m68k-elf-gcc": (GCC_BIN, "cc", "gcc"),
+    "m68k-elf-ld": (GCC_BIN, "ld", "gcc"),
+    "mwccmcf": (CW_BIN, "cc", "mwcc"),
+    "mwldmcf": (CW_BIN, "ld", "mwcc"),
+}
+
+# 目标 -> (内核目录, 编译脚本, 编译器路径变量, 编译器, 链接器)
+TARGETS = {
+    "m": ("dev_kernel_mvcu", "make_com.sh", "GCC_PATH", "m68k-elf-gcc", "m68k-elf-ld"),
+    "s": ("dev_kernel_svcu", "make_voob.sh", "CW_PATH", "mwccmcf", "mwldmcf"),
+}
+
+_SUB_DIRS = ["app", "bsw", "drivers", "can", "diag", "nvm", "io", "os"]
+
+
+def _write(path, text, executable=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+    if executable:
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def create_fake_toolchains(root):
+    """生成 GCC/CW 桩工具和MSYS目录（profile由main.py写入）"""
+    tool_path = os.path.join(root, "GCC", "libexec", "loc_fake_tool.py")
+    _write(tool_path, FAKE_TOOL_SOURCE % {"defaults": repr(DEFAULT_LATENCY), "flash_origin": FLASH_ORIGIN,
+                                          "ram_origin": RAM_ORIGIN})
+    for name, (directory, kind, diagnostics) in FAKE_TOOLS.items():
+        wrapper = (f"#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(tool_path)} "
+                   f"{kind} {diagnostics} \"$@\"\n")
+        _write(os.path.join(root, directory, name), wrapper, executable=True)
+    msys_dir = os.path.join(root, "MSYS-1.0.10-selftest", "1.0")
+    _write(os.path.join(msys_dir, "msys.bat"), "@echo off\r\nrem 假MSYS，由 LOC_COMPILE_MSYS_CMD 代替\r\n")
+    _write(os.path.join(msys_dir, "etc", "profile"), "# 由 main.py 生成\n")
+
+
+def _source_text(index, rng, warning_ratio):
+    lines = [f"/* module_{index}.c - 生成的测试源码 */", f'#include "module_{index}.h"', ""]
+    if rng.random() < warning_ratio:
+        lines.append("/* FAKE_WARNING */")
+    for function in range(rng.randint(2, 12)):
+        lines += [f"int module_{index}_func_{function}(int value)", "{",
+                  f"    int result = value * {rng.randint(2, 99)} + {function};", "    return result;", "}", ""]
+    return "\n".join(lines)
+
+
+def generate_sources(source_root, file_count, seed=1, warning_ratio=0.02):
+    """生成源码树，返回 .c 文件的相对路径列表（每个 .c 配一个 .h）"""
+    rng = random.Random(seed)
+    sources = []
+    for index in range(file_count):
+        directory = f"{_SUB_DIRS[index % len(_SUB_DIRS)]}/d{index // 100}"
+        rel_path = f"{directory}/module_{index}.c"
+        _write(os.path.join(source_root, *rel_path.split("/")), _source_text(index, rng, warning_ratio))
+        _write(os.path.join(source_root, *directory.split("/"), f"module_{index}.h"),
+               f"int module_{index}_func_0(int value);\n")
+        sources.append(rel_path)
+    return sources
+
+
+def _makefile(target, sources):
+    _, _, path_var, compiler, linker = TARGETS[target]
+    listing = " \\\n".join(f"\t{rel_path}" for rel_path in sources)
+    return f"""# 假工具链测试项目（由 scripts/fake_toolchain.py 生成）
+CW_PATH = CW_PATH_PLACEHOLDER
+GCC_PATH = GCC_PATH_PLACEHOLDER
+
+CC = $({path_var})/{compiler}
+LD = $({path_var})/{linker}
+SRC_DIR = ../src
+OBJ_DIR = obj
+OUT_DIR = out
+TARGET = $(OUT_DIR)/app
+
+SRCS = \\
+{listing}
+
+OBJS = $(patsubst %.c,$(OBJ_DIR)/%.o,$(SRCS))
+
+all: $(TARGET).s19
+
+$(TARGET).s19: $(OBJS)
+\t@mkdir -p $(OUT_DIR)
+\t$(LD) -o $@ -Map $(TARGET).map $(OBJS)
+
+$(OBJ_DIR)/%.o: $(SRC_DIR)/%.c
+\t@mkdir -p $(dir $@)
+\t$(CC) -c $< -o $@
+
+clean:
+\trm -rf $(OBJ_DIR) $(OUT_DIR)/app.*
+"""
+
+
+def create_project(root, file_count, seed=1, warning_ratio=0.02):
+    """生成假工具链、两个内核的编译目录和待编译的源码，返回 {目标: 源码目录}"""
+    create_fake_toolchains(root)
+    inputs = {}
+    max_flash_length = 0
+    for target, (kernel, script, _, _, _) in TARGETS.items():
+        source_root = os.path.join(root, "input", f"app_{kernel.rsplit('_', 1)[-1]}")
+        sources = generate_sources(source_root, file_count, seed, warning_ratio)
+        build_dir = os.path.join(root, PROJECT_DIR_NAME, kernel, "build")
+        os.makedirs(os.path.join(root, PROJECT_DIR_NAME, kernel, "src"), exist_ok=True)
+        os.makedirs(os.path.join(build_dir, "out"), exist_ok=True)
+        _write(os.path.join(build_dir, "makefile"), _makefile(target, sources))
+        _write(os.path.join(build_dir, script), "#!/bin/sh\nmake -j${LOC_FAKE_JOBS:-1} all\n", executable=True)
+
+        # Flash大小取能容纳镜像的2的幂，CRC写在末尾
+        source_bytes = sum(os.path.getsize(os.path.join(source_root, *rel.split("/"))) for rel in sources)
+        flash_length = 0x40000
+        while flash_length < (source_bytes // 4 + 64 * file_count) * 2:
+            flash_length *= 2
+        end = FLASH_ORIGIN + flash_length
+        config = {
+            "input": "out/app.s19",
+            "region": [hex(FLASH_ORIGIN), hex(end)],
+            "fill": "0xFF",
+            "crc": [{"type": "crc32", "address": hex(end - 4), "range": [hex(FLASH_ORIGIN), hex(end - 4)]}],
+            "outputs": ["out/app_final.s19", "out/app_final.bin"],
+        }
+        _write(os.path.join(build_dir, "postbuild.json"), json.dumps(config, indent=1))
+        inputs[target] = source_root
+        max_flash_length = max(max_flash_length, flash_length)
+    with open(os.path.join(root, "fake_project.json"), "w", encoding="utf-8") as f:
+        json.dump({"files": file_count, "inputs": inputs, "flash_length": max_flash_length}, f, indent=1)
+    return inputs
+
+
+def touch_sources(source_root, percent, seed):
+    """修改一部分 .c 文件，模拟两次编译之间的编辑"""
+    rng = random.Random(seed)
+    sources = sorted(os.path.join(current, name) for current, _, files in os.walk(source_root)
+                     for name in files if name.endswith(".c"))
+    changed = rng.sample(sources, max(1, int(len(sources) * percent / 100))) if sources else []
+    for path in changed:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"\nint touched_{seed} = {seed};\n")
+    return len(changed)
+
+
+def harness_environment(root, marker, jobs, flash_length=None):
+    """子进程使用的环境变量：程序目录指向测试目录，MSYS用bash执行profile，结束后写入标记文件"""
+    env = dict(os.environ)
+    env[ROOT_ENV_VAR] = root
+    env[MSYS_COMMAND_ENV_VAR] = (f"bash --noprofile --norc -c '. \"$0\"; echo $? > \"$1\"' "
+                                 f"{{profile}} {shlex.quote(marker)}")
+    env["LOC_FAKE_JOBS"] = str(jobs)
+    if flash_length:
+        env["LOC_FAKE_FLASH_LENGTH"] = hex(flash_length)
+    return env
+
+
+def wait_for_marker(marker, timeout, poll=None):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(marker):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"等待编译结束超时（{timeout:.0f} s）")
+        if poll:
+            poll()
+        time.sleep(0.05)
+    return time.perf_counter()
+
+
+def run_console(root, source_root, marker, env, timeout, log):
+    """通过 main.py 命令行模式执行一次编译，返回 (启动耗时, 总耗时)"""
+    start = time.perf_counter()
+    # 输出直接写入日志文件：用管道时MSYS子进程继承管道，会一直等到编译结束
+    log.flush()
+    result = subprocess.run([sys.executable, os.path.join(PACKAGE_DIR, "main.py"), "--console", source_root],
+                            env=env, input="\n" * 5, stdout=log, stderr=subprocess.STDOUT, text=True,
+                            timeout=timeout)
+    launched = time.perf_counter()
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py 返回 {result.returncode}，日志: {log.name}")
+    finished = wait_for_marker(marker, timeout)
+    return launched - start, finished - start
+
+
+def run_ui(root, source_root, marker, env, timeout, log):
+    """在本进程中创建界面并执行编译流程，返回 (启动耗时, 总耗时)"""
+    os.environ.update(env)
+    import tkinter as tk
+    import main as loc_main
+    from vcu_compiler_ui import VcuCompilerUI
+
+    loc_main.ensure_project_structure()
+    _, mvcu_path, svcu_path = loc_main.update_msys_profile()
+    loc_main.update_makefiles_with_correct_paths()
+    tk_root = tk.Tk()
+    tk_root.withdraw()
+    try:
+        ui = VcuCompilerUI(tk_root, None, mvcu_path, svcu_path)
+        ui.path_var.set(source_root)
+        start = time.perf_counter()
+        ui._start_compile()
+        # 编译按钮恢复可用表示暂存、模块检查和启动MSYS已完成
+        while str(ui.compile_btn["state"]) == tk.DISABLED:
+            tk_root.update()
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError("界面编译流程超时")
+            time.sleep(0.01)
+        launched = time.perf_counter()
+        finished = wait_for_marker(marker, timeout, tk_root.update)
+        log.write(ui.log_text.get("1.0", tk.END))
+    finally:
+        tk_root.destroy()
+    return launched - start, finished - start
+
+
+def latest_run(root, target):
+    """从测试目录的编译历史中读取最近一次运行"""
+    from build_history import HistoryDB
+    db = HistoryDB(os.path.join(root, ".loc_compile", "build_history.sqlite3"))
+    try:
+        runs = db.trend(target, limit=1)
+        return db.get_run(runs[-1]["run_id"]) if runs else None
+    finally:
+        db.close()
+
+
+def run_harness(args):
+    root = os.path.abspath(args.dir) if args.dir else tempfile.mkdtemp(prefix="loc_fake_")
+    created = not os.path.isfile(os.path.join(root, "fake_project.json"))
+    if created:
+        start = time.perf_counter()
+        create_project(root, args.files, warning_ratio=args.warning_ratio)
+        print(f"生成测试目录（{args.files} 个源文件/目标）: {root}，耗时 {time.perf_counter() - start:.1f} s")
+    with open(os.path.join(root, "fake_project.json"), encoding="utf-8") as f:
+        project = json.load(f)
+
+    results = []
+    try:
+        for index in range(args.runs):
+            if index and args.touch:
+                changed = touch_sources(project["inputs"][args.target], args.touch, index)
+                print(f"修改了 {changed} 个源文件")
+            marker = os.path.join(root, f".fake_msys_done_{index}")
+            env = harness_environment(root, marker, args.jobs, project.get("flash_length"))
+            log_path = os.path.join(root, f"harness_run_{index}.log")
+            with open(log_path, "w", encoding="utf-8") as log:
+                runner = run_ui if args.mode == "ui" else run_console
+                launch_seconds, total_seconds = runner(root, project["inputs"][args.target], marker, env,
+                                                       args.timeout, log)
+            with open(marker, encoding="utf-8") as f:
+                exit_status = f.read().strip()
+            run = latest_run(root, args.target)
+            entry = {"index": index, "launch_seconds": round(launch_seconds, 4),
+                     "total_seconds": round(total_seconds, 4), "msys_exit": exit_status,
+                     "run": run}
+            results.append(entry)
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in (run or {}).get("phases", {}).items())
+            print(f"第 {index + 1} 次: 启动 {launch_seconds:.2f} s，总计 {total_seconds:.2f} s，"
+                  f"状态 {(run or {}).get('status', '未记录')}（{phases}）")
+    finally:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"root": root, "mode": args.mode, "target": args.target, "files": project["files"],
+                           "jobs": args.jobs, "touch": args.touch, "runs": results}, f, ensure_ascii=False, indent=1)
+            print(f"结果已写入: {args.output}")
+        if args.keep or args.dir:
+            print(f"测试目录保留在: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    return 0 if all(entry["run"] and entry["run"]["status"] == "success" for entry in results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="假工具链端到端测试环境")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="只生成测试目录")
+    create_parser.add_argument("dir", help="测试目录")
+    create_parser.add_argument("--files", type=int, default=200, help="每个目标的源文件数量（默认200）")
+    create_parser.add_argument("--warning-ratio", type=float, default=0.02, help="带编译警告的文件比例")
+
+    run_parser = subparsers.add_parser("run", help="生成测试目录并端到端执行编译")
+    run_parser.add_argument("--dir", help="使用（或生成到）指定目录，默认使用临时目录并在结束后删除")
+    run_parser.add_argument("--files", type=int, default=200, help="每个目标的源文件数量（默认200）")
+    run_parser.add_argument("--warning-ratio", type=float, default=0.02, help="带编译警告的文件比例")
+    run_parser.add_argument("--target", choices=sorted(TARGETS), default="m", help="编译MVCU(m)或SVCU(s)")
+    run_parser.add_argument("--mode", choices=["console", "ui"], default="console",
+                            help="通过命令行模式或界面的编译流程驱动")
+    run_parser.add_argument("--runs", type=int, default=1, help="连续编译次数（第二次起测量增量编译）")
+    run_parser.add_argument("--touch", type=float, default=0, help="每次编译前修改的源文件百分比")
+    run_parser.add_argument("--jobs", type=int, default=1, help="make 的并行任务数")
+    run_parser.add_argument("--timeout", type=float, default=600, help="单次编译的超时秒数")
+    run_parser.add_argument("-o", "--output", help="结果JSON路径")
+    run_parser.add_argument("--keep", action="store_true", help="保留临时测试目录")
+
+    args = parser.parse_args()
+    if args.command == "create":
+        root = os.path.abspath(args.dir)
+        create_project(root, args.files, warning_ratio=args.warning_ratio)
+        print(f"测试目录已生成: {root}")
+        print(f"使用方法: {ROOT_ENV_VAR}=\"{root}\" {MSYS_COMMAND_ENV_VAR}=... python main.py --console <源码目录>")
+        return 0
+    return run_harness(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
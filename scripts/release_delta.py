@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""发布增量包工具：比较两个release目录生成增量包，并在目标机器上应用和按哈希校验"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import time
+import zipfile
+
+# 添加父目录到路径以便导入公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_sync import MANIFEST_NAME, hash_file, scan_tree
+from ignore_rules import IgnoreRules
+from path_utils import STATE_DIR_NAME
+from toolchain_fingerprint import GENERATED_PATTERNS
+
+DELTA_VERSION = 1
+DELTA_MANIFEST = "delta.json"
+
+# 超过该大小且内容有变化的文件尝试块级差分
+DELTA_MIN_SIZE = 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+
+# 差分中新数据超过文件大小的该比例时直接存整个文件
+MAX_LITERAL_RATIO = 0.8
+
+# 与机器相关的状态文件不参与比较
+STATE_RULES = IgnoreRules([
+    MANIFEST_NAME,
+    "/.build_cache.json",
+    "/.build_report.json",
+    f"/{STATE_DIR_NAME}/",
+])
+
+# 增量包同时排除程序按安装路径改写的文件：使用过的旧版本中它们总与发布时不同，也不需要更新
+EXCLUDE_RULES = IgnoreRules(STATE_RULES.patterns + GENERATED_PATTERNS)
+
+# 差分指令: 'C' + (源偏移, 长度) 表示从旧文件复制；'L' + 长度 + 数据 表示新数据
+_COPY = b"C"
+_LITERAL = b"L"
+_COPY_STRUCT = struct.Struct(">QI")
+_LEN_STRUCT = struct.Struct(">I")
+
+
+def build_manifest(root):
+    """计算目录中所有文件的 {相对路径: [sha256, 大小, 权限]}"""
+    manifest = {}
+    for rel_path, (size, _) in scan_tree(root, EXCLUDE_RULES.copytree_ignore(root)).items():
+        full_path = os.path.join(root, *rel_path.split("/"))
+        manifest[rel_path] = [hash_file(full_path), size, os.stat(full_path).st_mode & 0o777]
+    return manifest
+
+
+def _block_digest(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def compute_block_delta(old_path, new_path, block_size=BLOCK_SIZE):
+    """按固定大小的块比较两个文件，生成差分指令流
+
+    旧文件中任意位置对齐的相同块都会被引用（支持块的移动和重复），不同的块作为新数据保存。
+
+    返回:
+        (差分字节串, 新数据字节数)
+    """
+    old_blocks = {}
+    with open(old_path, "rb") as f:
+        offset = 0
+        for block in iter(lambda: f.read(block_size), b""):
+            old_blocks.setdefault(_block_digest(block), (offset, len(block)))
+            offset += len(block)
+
+    ops = bytearray()
+    literal_bytes = 0
+    pending_copy = None
+    with open(new_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            match = old_blocks.get(_block_digest(block))
+            if match is not None and match[1] == len(block):
+                # 合并连续的复制指令
+                if pending_copy and pending_copy[0] + pending_copy[1] == match[0]:
+                    pending_copy[1] += match[1]
+                else:
+                    if pending_copy:
+                        ops += _COPY + _COPY_STRUCT.pack(*pending_copy)
+                    pending_copy = [match[0], match[1]]
+                continue
+            if pending_copy:
+                ops += _COPY + _COPY_STRUCT.pack(*pending_copy)
+                pending_copy = None
+            ops += _LITERAL + _LEN_STRUCT.pack(len(block)) + block
+            literal_bytes += len(block)
+    if pending_copy:
+        ops += _COPY + _COPY_STRUCT.pack(*pending_copy)
+    return bytes(ops), literal_bytes
+
+
+def apply_block_delta(old_path, delta, out_file):
+    """根据差分指令流和旧文件重建新文件"""
+    view = memoryview(delta)
+    pos = 0
+    with open(old_path, "rb") as old:
+        while pos < len(view):
+            op = bytes(view[pos:pos + 1])
+            pos += 1
+            if op == _COPY:
+                offset, length = _COPY_STRUCT.unpack_from(view, pos)
+                pos += _COPY_STRUCT.size
+                old.seek(offset)
+                out_file.write(old.read(length))
+            elif op == _LITERAL:
+                (length,) = _LEN_STRUCT.unpack_from(view, pos)
+                pos += _LEN_STRUCT.size
+                out_file.write(view[pos:pos + length])
+                pos += length
+            else:
+                raise ValueError(f"无效的差分指令: {op!r}")
+
+
+def create_delta(old_dir, new_dir, output_path):
+    """比较两个release目录，生成增量包
+
+    返回:
+        统计信息字典
+    """
+    start = time.perf_counter()
+    print(f"计算旧版本清单: {old_dir}")
+    old_manifest = build_manifest(old_dir)
+    print(f"计算新版本清单: {new_dir}")
+    new_manifest = build_manifest(new_dir)
+
+    # 按内容查找旧文件，用于识别改名/移动的文件
+    old_by_hash = {}
+    for rel_path, (digest, _, _) in old_manifest.items():
+        old_by_hash.setdefault(digest, rel_path)
+
+    entries = {}
+    base = {}
+    stats = {"keep": 0, "copy": 0, "add": 0, "delta": 0, "removed": 0, "payload_bytes": 0}
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for rel_path in sorted(new_manifest):
+            digest, size, mode = new_manifest[rel_path]
+            entry = {"sha256": digest, "size": size, "mode": mode}
+            old_entry = old_manifest.get(rel_path)
+
+            if old_entry and old_entry[0] == digest:
+                entry["op"] = "keep"
+            elif digest in old_by_hash:
+                entry["op"] = "copy"
+                entry["source"] = old_by_hash[digest]
+                base[entry["source"]] = digest
+            else:
+                new_file = os.path.join(new_dir, *rel_path.split("/"))
+                delta = None
+                if old_entry and size >= DELTA_MIN_SIZE:
+                    old_file = os.path.join(old_dir, *rel_path.split("/"))
+                    delta, literal_bytes = compute_block_delta(old_file, new_file)
+                    if literal_bytes > size * MAX_LITERAL_RATIO:
+                        delta = None
+                if delta is not None:
+                    entry["op"] = "delta"
+                    base[rel_path] = old_entry[0]
+                    archive.writestr(f"delta/{rel_path}", delta)
+                    stats["payload_bytes"] += len(delta)
+                else:
+                    entry["op"] = "add"
+                    archive.write(new_file, f"add/{rel_path}")
+                    stats["payload_bytes"] += size
+            stats[entry["op"]] += 1
+            entries[rel_path] = entry
+
+        removed = sorted(set(old_manifest) - set(new_manifest))
+        stats["removed"] = len(removed)
+        manifest = {
+            "version": DELTA_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "from": os.path.basename(os.path.normpath(old_dir)),
+            "to": os.path.basename(os.path.normpath(new_dir)),
+            "base": base,
+            "files": entries,
+            "removed": removed,
+        }
+        archive.writestr(DELTA_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    stats["package_bytes"] = os.path.getsize(output_path)
+    stats["elapsed"] = time.perf_counter() - start
+    print(f"增量包已生成: {output_path}")
+    print(f"  未变化 {stats['keep']}，移动 {stats['copy']}，新增/整体替换 {stats['add']}，"
+          f"块差分 {stats['delta']}，删除 {stats['removed']}")
+    print(f"  增量包大小 {stats['package_bytes'] / 1024 / 1024:.2f} MB，耗时 {stats['elapsed']:.1f} s")
+    return stats
+
+
+def apply_delta(delta_path, target_dir):
+    """把增量包应用到旧版本release目录（原地更新），并按哈希校验结果
+
+    返回:
+        是否成功
+    """
+    with zipfile.ZipFile(delta_path, "r") as archive:
+        manifest = json.loads(archive.read(DELTA_MANIFEST).decode("utf-8"))
+        if manifest.get("version") != DELTA_VERSION:
+            print(f"✗ 不支持的增量包版本: {manifest.get('version')}")
+            return False
+
+        # 先确认复制和块差分要读取的旧文件与生成增量包时相同（未变化的文件最后统一校验）
+        print(f"校验基础版本: {target_dir}")
+        sources = {entry["source"] for entry in manifest["files"].values() if entry["op"] == "copy"}
+        sources.update(rel for rel, entry in manifest["files"].items() if entry["op"] == "delta")
+        for rel_path in sorted(sources):
+            digest = manifest["base"][rel_path]
+            full_path = os.path.join(target_dir, *rel_path.split("/"))
+            if not os.path.isfile(full_path) or hash_file(full_path) != digest:
+                print(f"✗ 目标目录与增量包的基础版本不一致: {rel_path}")
+                return False
+
+        # 新文件先写到临时文件，全部生成后再替换，避免依赖的旧文件被提前覆盖
+        staged = []
+        try:
+            for rel_path, entry in manifest["files"].items():
+                op = entry["op"]
+                if op == "keep":
+                    continue
+                dest = os.path.join(target_dir, *rel_path.split("/"))
+                temp_path = dest + ".delta-tmp"
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if op == "copy":
+                    shutil.copyfile(os.path.join(target_dir, *entry["source"].split("/")), temp_path)
+                elif op == "add":
+                    with archive.open(f"add/{rel_path}") as src, open(temp_path, "wb") as out:
+                        shutil.copyfileobj(src, out, 1024 * 1024)
+                elif op == "delta":
+                    with open(temp_path, "wb") as out:
+                        apply_block_delta(dest, archive.read(f"delta/{rel_path}"), out)
+                else:
+                    raise ValueError(f"未知的操作: {op}")
+                if hash_file(temp_path) != entry["sha256"]:
+                    raise IOError(f"重建的文件哈希不一致: {rel_path}")
+                staged.append((temp_path, dest, entry.get("mode")))
+        except Exception as e:
+            print(f"✗ 应用增量包失败: {e}")
+            for temp_path, _, _ in staged:
+                os.remove(temp_path)
+            return False
+
+    for temp_path, dest, mode in staged:
+        os.replace(temp_path, dest)
+        if mode:
+            os.chmod(dest, mode)
+    for rel_path in manifest["removed"]:
+        full_path = os.path.join(target_dir, *rel_path.split("/"))
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+    # 最终按哈希校验全部文件
+    print("校验更新结果...")
+    result = build_manifest(target_dir)
+    expected = {rel: entry["sha256"] for rel, entry in manifest["files"].items()}
+    mismatched = [rel for rel, digest in expected.items() if result.get(rel, [None])[0] != digest]
+    extra = sorted(set(result) - set(expected))
+    for rel in mismatched:
+        print(f"✗ 校验失败: {rel}")
+    for rel in extra:
+        print(f"⚠ 多余的文件: {rel}")
+    if mismatched:
+        return False
+    print(f"✓ 已更新到 {manifest['to']}，{len(staged)} 个文件更新，{len(manifest['removed'])} 个文件删除")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="发布增量包工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = subparsers.add_parser("diff", help="比较两个release目录生成增量包")
+    diff_parser.add_argument("old_dir", help="旧版本release目录")
+    diff_parser.add_argument("new_dir", help="新版本release目录")
+    diff_parser.add_argument("-o", "--output", required=True, help="输出的增量包(.zip)")
+
+    apply_parser = subparsers.add_parser("apply", help="把增量包应用到旧版本release目录")
+    apply_parser.add_argument("delta", help="增量包(.zip)")
+    apply_parser.add_argument("target_dir", help="要更新的旧版本release目录")
+
+    args = parser.parse_args()
+    if args.command == "diff":
+        create_delta(args.old_dir, args.new_dir, args.output)
+        return 0
+    return 0 if apply_delta(args.delta, args.target_dir) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
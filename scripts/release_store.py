@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+发布仓库：按内容寻址保存各版本的release目录
+每个版本只是一份清单，文件内容以SHA-256为名存放在blobs中，不同版本间相同的文件（尤其是工具链）只存一份。
+支持打标签、按保留策略清理旧版本、回收无引用的内容，以及用硬链接快速还原任意版本。
+仓库中的内容都是只读的：硬链接与仓库共享内容，程序运行时会改写的文件（MSYS profile、makefile）还原时复制。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+
+# 添加父目录到路径以便导入公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_sync import hash_file, scan_tree
+from ignore_rules import IgnoreRules
+from path_utils import get_application_path
+from release_delta import STATE_RULES
+
+STORE_DIR_NAME = "release_store"
+STORE_VERSION = 1
+HASH_CACHE_NAME = "hash_cache.json"
+
+# 程序每次启动时原地改写的文件（update_msys_profile / update_makefiles_with_correct_paths），
+# 还原时总是复制，不与仓库内容共享
+REWRITTEN_RULES = IgnoreRules([
+    "/MSYS-*/1.0/etc/profile",
+    "/VCU_compile - selftest/**/makefile",
+])
+
+
+def _write_json_atomic(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def _format_size(size):
+    return f"{size / 1024 / 1024:.2f} MB"
+
+
+def _blob_mode(mode):
+    """仓库内容的权限：只读，清单中有可执行权限时保留"""
+    return 0o555 if mode & 0o111 else 0o444
+
+
+def _remove_file(path):
+    """删除文件，只读文件（Windows上不能直接删除）先去掉只读属性"""
+    try:
+        os.remove(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        os.remove(path)
+
+
+class ReleaseStore:
+    """按内容寻址的发布仓库
+
+    目录结构:
+        blobs/<sha前两位>/<sha>   文件内容
+        releases/<版本>.json      版本清单（文件 -> [sha, 大小, 权限]、目录、标签）
+        hash_cache.json           源文件 (大小, 修改时间) -> sha，重复入库时免去重新哈希
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.release_dir = os.path.join(self.root, "releases")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.release_dir, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _manifest_path(self, release_id):
+        return os.path.join(self.release_dir, f"{release_id}.json")
+
+    def _load_hash_cache(self):
+        try:
+            with open(os.path.join(self.root, HASH_CACHE_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # ---- 版本清单 ----
+
+    def has_release(self, release_id):
+        return os.path.isfile(self._manifest_path(release_id))
+
+    def load_release(self, release_id):
+        path = self._manifest_path(release_id)
+        if not os.path.isfile(path):
+            raise KeyError(f"发布仓库中没有版本: {release_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_releases(self):
+        """返回所有版本清单，按入库时间从旧到新排序"""
+        releases = []
+        for name in os.listdir(self.release_dir):
+            if name.endswith(".json"):
+                releases.append(self.load_release(name[:-len(".json")]))
+        releases.sort(key=lambda release: (release["created"], release["id"]))
+        return releases
+
+    def set_tag(self, release_id, tag, remove=False):
+        """给版本添加或移除标签，带标签的版本不会被保留策略清理"""
+        release = self.load_release(release_id)
+        tags = set(release.get("tags", []))
+        if remove:
+            tags.discard(tag)
+        else:
+            tags.add(tag)
+        release["tags"] = sorted(tags)
+        _write_json_atomic(self._manifest_path(release_id), release)
+        return release
+
+    # ---- 入库 ----
+
+    def ingest(self, src_dir, release_id=None, tags=(), extra_ignore=()):
+        """把release目录存为一个版本，只复制仓库中还没有的内容
+
+        参数:
+            extra_ignore: 额外排除的gitignore风格规则（如同一目录中其他版本的exe）
+
+        返回:
+            版本清单
+        """
+        start = time.perf_counter()
+        src_dir = os.path.abspath(src_dir)
+        if release_id is None:
+            release_id = time.strftime("%Y%m%d_%H%M%S")
+        if self.has_release(release_id):
+            raise ValueError(f"版本已存在: {release_id}")
+
+        rules = IgnoreRules(STATE_RULES.patterns + list(extra_ignore)) if extra_ignore else STATE_RULES
+        hash_cache = self._load_hash_cache()
+        dirs = set()
+        files = {}
+        new_blobs = 0
+        new_bytes = 0
+        total_bytes = 0
+        for rel_path, (size, mtime_ns) in scan_tree(src_dir, rules.copytree_ignore(src_dir), dirs=dirs).items():
+            full_path = os.path.join(src_dir, *rel_path.split("/"))
+            cached = hash_cache.get(full_path)
+            if cached and cached[0] == size and cached[1] == mtime_ns:
+                digest = cached[2]
+            else:
+                digest = hash_file(full_path)
+                hash_cache[full_path] = [size, mtime_ns, digest]
+            mode = os.stat(full_path).st_mode & 0o777
+            files[rel_path] = [digest, size, mode]
+            total_bytes += size
+
+            blob = self.blob_path(digest)
+            if not os.path.isfile(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                temp_blob = f"{blob}.{os.getpid()}.tmp"
+                shutil.copyfile(full_path, temp_blob)
+                # 内容只读，通过硬链接还原出的文件不能被原地修改
+                os.chmod(temp_blob, _blob_mode(mode))
+                os.replace(temp_blob, blob)
+                new_blobs += 1
+                new_bytes += size
+
+        release = {
+            "version": STORE_VERSION,
+            "id": release_id,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": src_dir,
+            "tags": sorted(set(tags)),
+            "files": files,
+            "dirs": sorted(dirs),
+            "total_bytes": total_bytes,
+        }
+        _write_json_atomic(self._manifest_path(release_id), release)
+        _write_json_atomic(os.path.join(self.root, HASH_CACHE_NAME), hash_cache)
+
+        elapsed = time.perf_counter() - start
+        print(f"✓ 已入库版本 {release_id}: {len(files)} 个文件 ({_format_size(total_bytes)})，"
+              f"新增内容 {new_blobs} 个 ({_format_size(new_bytes)})，耗时 {elapsed:.1f} s")
+        return release
+
+    # ---- 还原 ----
+
+    def materialize(self, release_id, dest_dir, use_links=True):
+        """把版本还原到目录，默认用硬链接指向仓库内容
+
+        目标目录中已经链接到正确内容的文件不会重新处理，清单之外的文件会被删除。
+        硬链接与仓库共享只读的内容，链接出的文件只有读和执行权限；程序会改写的文件（REWRITTEN_RULES）
+        总是复制并按清单设置权限。无法创建硬链接（如跨磁盘）时自动改为复制。
+
+        返回:
+            (链接数, 复制数, 未变化数, 删除数)
+        """
+        start = time.perf_counter()
+        release = self.load_release(release_id)
+        dest_dir = os.path.abspath(dest_dir)
+        os.makedirs(dest_dir, exist_ok=True)
+        for rel_dir in release["dirs"]:
+            os.makedirs(os.path.join(dest_dir, *rel_dir.split("/")), exist_ok=True)
+
+        linked = copied = unchanged = 0
+        for rel_path, (digest, size, mode) in release["files"].items():
+            blob = self.blob_path(digest)
+            dest = os.path.join(dest_dir, *rel_path.split("/"))
+            link = use_links and not REWRITTEN_RULES.match(rel_path)
+            if os.path.isfile(dest):
+                if link and os.path.samefile(blob, dest):
+                    unchanged += 1
+                    continue
+                if (not link and not os.path.samefile(blob, dest)
+                        and os.path.getsize(dest) == size and hash_file(dest) == digest):
+                    unchanged += 1
+                    continue
+                _remove_file(dest)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if link:
+                # 之前的版本入库的内容可能还不是只读的
+                os.chmod(blob, _blob_mode(mode))
+                try:
+                    os.link(blob, dest)
+                    linked += 1
+                    continue
+                except OSError:
+                    use_links = False
+                    print("⚠ 无法创建硬链接，改为复制文件")
+            shutil.copyfile(blob, dest)
+            os.chmod(dest, mode or 0o644)
+            copied += 1
+
+        # 删除清单之外的文件（不含本机状态文件）
+        removed = 0
+        existing = scan_tree(dest_dir, STATE_RULES.copytree_ignore(dest_dir))
+        for rel_path in set(existing) - set(release["files"]):
+            _remove_file(os.path.join(dest_dir, *rel_path.split("/")))
+            removed += 1
+
+        elapsed = time.perf_counter() - start
+        print(f"✓ 已还原版本 {release_id} 到 {dest_dir}: 链接 {linked}，复制 {copied}，"
+              f"未变化 {unchanged}，删除 {removed}，耗时 {elapsed:.1f} s")
+        return linked, copied, unchanged, removed
+
+    # ---- 保留策略和回收 ----
+
+    def apply_retention(self, keep_last, keep_tagged=True):
+        """只保留最新的 keep_last 个版本（以及带标签的版本），删除其余版本清单
+
+        返回:
+            被删除的版本列表
+        """
+        releases = self.list_releases()
+        keep = {release["id"] for release in releases[-keep_last:]} if keep_last > 0 else set()
+        if keep_tagged:
+            keep.update(release["id"] for release in releases if release.get("tags"))
+        dropped = [release["id"] for release in releases if release["id"] not in keep]
+        for release_id in dropped:
+            os.remove(self._manifest_path(release_id))
+            print(f"删除版本: {release_id}")
+        return dropped
+
+    def referenced_blobs(self):
+        referenced = set()
+        for release in self.list_releases():
+            referenced.update(entry[0] for entry in release["files"].values())
+        return referenced
+
+    def collect_garbage(self):
+        """删除不再被任何版本引用的内容
+
+        返回:
+            (删除数, 释放字节数)
+        """
+        referenced = self.referenced_blobs()
+        removed = 0
+        freed = 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name in referenced:
+                    continue
+                path = os.path.join(prefix_dir, name)
+                freed += os.path.getsize(path)
+                _remove_file(path)
+                removed += 1
+            if not os.listdir(prefix_dir):
+                os.rmdir(prefix_dir)
+        print(f"✓ 回收 {removed} 个无引用内容，释放 {_format_size(freed)}")
+        return removed, freed
+
+    def verify(self):
+        """重新计算所有被引用内容的哈希，返回缺失或损坏的内容列表"""
+        bad = []
+        for digest in sorted(self.referenced_blobs()):
+            blob = self.blob_path(digest)
+            if not os.path.isfile(blob) or hash_file(blob) != digest:
+                bad.append(digest)
+                print(f"✗ 内容缺失或损坏: {digest}")
+        return bad
+
+    def disk_usage(self):
+        """返回 (仓库实际占用字节数, 各版本文件总字节数)"""
+        stored = sum(size for size, _ in scan_tree(self.blob_dir).values())
+        logical = sum(release.get("total_bytes", 0) for release in self.list_releases())
+        return stored, logical
+
+
+def prune_stored_executables(store, release_dir, current_exe):
+    """删除release目录中已入库的旧exe，仓库中没有的exe保留不动
+
+    返回:
+        删除的文件名列表
+    """
+    stored = store.referenced_blobs()
+    removed = []
+    for name in os.listdir(release_dir):
+        path = os.path.join(release_dir, name)
+        if (not name.lower().endswith(".exe") or not name.startswith("LOC_COMPILE_")
+                or os.path.abspath(path) == os.path.abspath(current_exe) or not os.path.isfile(path)):
+            continue
+        if hash_file(path) in stored:
+            os.remove(path)
+            removed.append(name)
+    if removed:
+        print(f"清理release目录中已入库的旧exe: {len(removed)} 个")
+    return removed
+
+
+def main():
+    # 与 build_exe.py --store 相同，位于项目根目录（不在LOC_COMPILE中，不会被打包）
+    default_store = os.path.join(get_application_path(), STORE_DIR_NAME)
+    parser = argparse.ArgumentParser(description="发布仓库：按内容寻址保存各版本release目录")
+    parser.add_argument("--store", default=default_store, help=f"仓库目录（默认 {default_store}）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="把release目录存为一个版本")
+    ingest_parser.add_argument("src_dir", help="release目录")
+    ingest_parser.add_argument("--id", dest="release_id", help="版本名（默认使用当前时间）")
+    ingest_parser.add_argument("--tag", action="append", default=[], help="版本标签，可重复")
+
+    subparsers.add_parser("list", help="列出所有版本")
+
+    tag_parser = subparsers.add_parser("tag", help="给版本添加标签")
+    tag_parser.add_argument("release_id")
+    tag_parser.add_argument("tag")
+    tag_parser.add_argument("--remove", action="store_true", help="移除标签")
+
+    materialize_parser = subparsers.add_parser("materialize", help="把版本还原到目录")
+    materialize_parser.add_argument("release_id")
+    materialize_parser.add_argument("dest_dir")
+    materialize_parser.add_argument("--copy", action="store_true", help="复制文件而不是创建硬链接")
+
+    prune_parser = subparsers.add_parser("prune", help="按保留策略删除旧版本并回收内容")
+    prune_parser.add_argument("--keep-last", type=int, required=True, help="保留最新的版本数量")
+    prune_parser.add_argument("--include-tagged", action="store_true", help="带标签的版本也参与清理")
+
+    subparsers.add_parser("gc", help="回收无引用的内容")
+    subparsers.add_parser("verify", help="校验仓库内容的哈希")
+
+    args = parser.parse_args()
+    store = ReleaseStore(args.store)
+    try:
+        if args.command == "ingest":
+            store.ingest(args.src_dir, args.release_id, args.tag)
+        elif args.command == "list":
+            for release in store.list_releases():
+                tags = f" [{', '.join(release['tags'])}]" if release.get("tags") else ""
+                print(f"{release['id']}  {release['created']}  {len(release['files'])} 个文件  "
+                      f"{_format_size(release.get('total_bytes', 0))}{tags}")
+            stored, logical = store.disk_usage()
+            print(f"实际占用 {_format_size(stored)}，各版本合计 {_format_size(logical)}")
+        elif args.command == "tag":
+            store.set_tag(args.release_id, args.tag, remove=args.remove)
+        elif args.command == "materialize":
+            store.materialize(args.release_id, args.dest_dir, use_links=not args.copy)
+        elif args.command == "prune":
+            store.apply_retention(args.keep_last, keep_tagged=not args.include_tagged)
+            store.collect_garbage()
+        elif args.command == "gc":
+            store.collect_garbage()
+        elif args.command == "verify":
+            if store.verify():
+                return 1
+            print("✓ 仓库内容完整")
+    except (KeyError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+源码压缩包的直接暂存
+供应商以 .zip / .tar.gz 等压缩包提供的源码不再手工解压后再复制一次：条目直接流式写入编译目录的src，
+应用默认忽略规则和压缩包中的 .loccompileignore，写入时同时计算文件哈希并存入哈希缓存（之后计算输入哈希不再读取文件）。
+与目录镜像一样，大小和修改时间未变的文件不重写，压缩包中已没有的文件从src中删除。
+"""
+
+import hashlib
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from file_sync import SyncResult, _remove_empty_dirs, scan_tree
+from ignore_rules import SOURCE_IGNORE_FILE, IgnoreRules, source_ignore_rules
+from toolchain_fingerprint import FileHashCache, source_hash_cache
+
+ARCHIVE_SUFFIXES = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar", ".zip")
+
+_CHUNK_SIZE = 1024 * 1024
+
+# (相对路径, 是否目录, 大小, 修改时间ns, 打开条目内容的函数)
+_Entry = Tuple[str, bool, int, int, Callable[[], BinaryIO]]
+
+
+class _LayoutChanged(Exception):
+    """按顺序读取条目时发现它们并不都在同一个顶层目录下，需要不去掉顶层目录重新暂存"""
+
+
+def is_archive(path: str) -> bool:
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def archive_stem(path: str) -> str:
+    """去掉压缩包扩展名的文件名（例如 app_mvcu.tar.gz -> app_mvcu）"""
+    name = os.path.basename(path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def _normalize(name: str) -> Optional[str]:
+    """条目名称转换为'/'分隔的相对路径，绝对路径或包含'..'的不安全路径返回None"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        return None
+    return "/".join(parts)
+
+
+def _iter_zip(path: str) -> Iterator[_Entry]:
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 1000 * 1000 * 1000
+            yield (info.filename, info.is_dir(), info.file_size, mtime_ns,
+                   lambda info=info: archive.open(info))
+
+
+def _iter_tar(path: str) -> Iterator[_Entry]:
+    # 流模式按顺序读取，.tar.gz 只解压一遍
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not (member.isfile() or member.isdir()):
+                # 链接和设备文件不暂存
+                continue
+            yield (member.name, member.isdir(), member.size, int(member.mtime) * 1000 * 1000 * 1000,
+                   lambda member=member: archive.extractfile(member))
+
+
+def iter_entries(path: str) -> Iterator[_Entry]:
+    """按压缩包中的顺序返回条目"""
+    return _iter_zip(path) if path.lower().endswith(".zip") else _iter_tar(path)
+
+
+def detect_vcu_type(path: str) -> Optional[str]:
+    """按压缩包名称判断VCU类型，名称中没有时按其中的目录和文件名判断；返回 "m"、"s" 或 None"""
+    def match(name: str) -> Optional[str]:
+        name = name.lower()
+        return "m" if "mvcu" in name else "s" if "svcu" in name else None
+
+    code = match(archive_stem(path))
+    if code:
+        return code
+    try:
+        for name, _, _, _, _ in iter_entries(path):
+            rel_path = _normalize(name)
+            code = match(rel_path) if rel_path else None
+            if code:
+                return code
+    except (OSError, zipfile.BadZipFile, tarfile.TarError):
+        return None
+    return None
+
+
+def load_archive_ignore_rules(path: str) -> IgnoreRules:
+    """源码暂存的忽略规则，压缩包根目录（或唯一的顶层目录）中有 .loccompileignore 时加上其中的规则"""
+    try:
+        for name, is_dir, _, _, open_entry in iter_entries(path):
+            rel_path = _normalize(name)
+            if is_dir or rel_path is None or rel_path.rpartition("/")[2] != SOURCE_IGNORE_FILE:
+                continue
+            if rel_path.count("/") <= 1:
+                with open_entry() as f:
+                    return source_ignore_rules(f.read().decode("utf-8", errors="replace").splitlines())
+    except (OSError, zipfile.BadZipFile, tarfile.TarError):
+        # 压缩包损坏时暂存会报告错误
+        pass
+    return source_ignore_rules()
+
+
+def ingest_archive(archive_path: str, dest: str, rules: Optional[IgnoreRules] = None,
+                   cancel: Optional[threading.Event] = None) -> SyncResult:
+    """把压缩包中的源码直接暂存到 dest（镜像）
+
+    所有条目都在同一个顶层目录下时（常见的 app_mvcu/... 布局）去掉该目录，与选择解压后的目录效果相同。
+
+    Args:
+        rules: 忽略规则，默认使用 load_archive_ignore_rules()
+        cancel: 若提供，设置后在下一个条目前停止（不删除多余文件），result.cancelled 为True
+    """
+    rules = load_archive_ignore_rules(archive_path) if rules is None else rules
+    if archive_path.lower().endswith(".zip"):
+        # zip的目录在文件末尾，可以先确定布局
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                prefix = _top_directory(archive.namelist())
+        except (OSError, zipfile.BadZipFile):
+            prefix = None
+        return _ingest(archive_path, dest, rules, cancel, strip_top=prefix is not None, prefix=prefix)
+    # tar只能按顺序读取，先假设只有一个顶层目录，遇到例外时重新暂存
+    try:
+        return _ingest(archive_path, dest, rules, cancel, strip_top=True)
+    except _LayoutChanged:
+        return _ingest(archive_path, dest, rules, cancel, strip_top=False)
+
+
+def _top_directory(names: List[str]) -> Optional[str]:
+    """所有条目都在同一个顶层目录下时返回 "目录/"，否则返回None"""
+    tops = set()
+    for name in names:
+        rel_path = _normalize(name)
+        if rel_path is None:
+            continue
+        top, sep, _ = rel_path.partition("/")
+        if not sep and not name.endswith("/"):
+            return None
+        tops.add(top)
+    return f"{tops.pop()}/" if len(tops) == 1 else None
+
+
+def _ingest(archive_path: str, dest: str, rules: IgnoreRules, cancel: Optional[threading.Event],
+            strip_top: bool, prefix: Optional[str] = None) -> SyncResult:
+    start = time.perf_counter()
+    result = SyncResult(archive_path, dest)
+    os.makedirs(dest, exist_ok=True)
+    dest_files = scan_tree(dest)
+    cache = source_hash_cache()
+    staged: Set[str] = set()
+    staged_dirs: Set[str] = set()
+    dir_cache: Dict[str, bool] = {}
+
+    try:
+        for name, is_dir, size, mtime_ns, open_entry in iter_entries(archive_path):
+            if cancel is not None and cancel.is_set():
+                result.cancelled = True
+                break
+            rel_path = _normalize(name)
+            if rel_path is None:
+                result.failed.append((name, "不安全的路径"))
+                continue
+            if strip_top:
+                if prefix is None:
+                    top, sep, _ = rel_path.partition("/")
+                    if not (sep or is_dir):
+                        # 第一个条目就是根下的文件，没有顶层目录可去掉
+                        strip_top = False
+                    prefix = top + "/"
+                if strip_top:
+                    if rel_path + "/" == prefix:
+                        continue
+                    if not rel_path.startswith(prefix):
+                        raise _LayoutChanged()
+                    rel_path = rel_path[len(prefix):]
+            if rules.is_ignored(rel_path, is_dir, dir_cache):
+                result.skipped += 1
+                result.skipped_bytes += size
+                continue
+            dest_path = os.path.join(dest, *rel_path.split("/"))
+            if is_dir:
+                staged_dirs.add(rel_path)
+                os.makedirs(dest_path, exist_ok=True)
+                continue
+            staged.add(rel_path)
+            if dest_files.get(rel_path) == (size, mtime_ns):
+                result.unchanged += 1
+                continue
+            try:
+                _extract_file(open_entry, dest_path, mtime_ns, cache)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                result.failed.append((rel_path, str(e)))
+                continue
+            result.copied += 1
+            result.copied_bytes += size
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        # 压缩包损坏或读取中断，已写入的文件保留，不删除多余文件
+        result.failed.append((os.path.basename(archive_path), str(e)))
+    finally:
+        cache.save()
+
+    if not result.cancelled and result.success:
+        for rel_path in dest_files:
+            if rel_path in staged:
+                continue
+            try:
+                os.remove(os.path.join(dest, *rel_path.split("/")))
+                result.removed += 1
+            except OSError as e:
+                result.failed.append((rel_path, str(e)))
+        keep = set(staged_dirs)
+        for rel_path in staged:
+            parent = rel_path.rpartition("/")[0]
+            while parent and parent not in keep:
+                keep.add(parent)
+                parent = parent.rpartition("/")[0]
+        _remove_empty_dirs(dest, keep)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _extract_file(open_entry: Callable[[], BinaryIO], dest_path: str, mtime_ns: int, cache: FileHashCache):
+    """写入一个条目，同时计算哈希；修改时间设为条目中记录的时间，哈希按写入后的大小和修改时间存入缓存"""
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    digest = hashlib.sha256()
+    temp_path = dest_path + ".ingest.tmp"
+    with open_entry() as source, open(temp_path, "wb") as target:
+        for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            target.write(chunk)
+    os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+    os.replace(temp_path, dest_path)
+    stat = os.stat(dest_path)
+    cache.put(dest_path, stat.st_size, stat.st_mtime_ns, digest.hexdigest())
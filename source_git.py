@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+从git版本直接暂存源码
+发布编译不再先检出标签到工作目录：按仓库路径和版本（分支、标签或提交）列出该版本的文件树，
+只通过 git cat-file --batch 读取有变化的对象并直接写入编译目录的src。
+忽略规则为默认规则加上该版本中的 .loccompileignore（而不是工作目录中的）。
+上次暂存的文件按对象ID（blob ID）记录，ID相同且暂存的文件未被改动时不再读取和写入。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from file_sync import SyncResult, _remove_empty_dirs, scan_tree
+from ignore_rules import SOURCE_IGNORE_FILE, IgnoreRules, source_ignore_rules
+from path_utils import get_state_path
+from toolchain_fingerprint import FileHashCache, source_hash_cache
+
+MANIFEST_VERSION = 1
+
+_CHUNK_SIZE = 1024 * 1024
+
+# ls-tree 中普通文件的模式（符号链接 120000 和子模块 160000 不暂存）
+_FILE_MODES = ("100644", "100755")
+
+
+class GitSource:
+    """仓库中某个版本的源码目录
+
+    Args:
+        path: 仓库根目录或其中的子目录（只暂存该子目录在此版本中的内容）
+        ref: 分支、标签或提交ID
+    """
+
+    def __init__(self, path: str, ref: str):
+        self.path = os.path.abspath(path)
+        self.ref = ref
+        if shutil.which("git") is None:
+            raise ValueError("找不到git命令，无法从git版本暂存源码")
+        self.root = self._git("rev-parse", "--show-toplevel", cwd=self.path).strip()
+        self.prefix = self._git("rev-parse", "--show-prefix", cwd=self.path).strip()
+        self.commit = self._git("rev-parse", "--verify", f"{ref}^{{commit}}").strip()
+
+    def _git(self, *args: str, cwd: Optional[str] = None) -> str:
+        process = subprocess.run(["git", *args], cwd=cwd or self.root, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+        if process.returncode != 0:
+            detail = process.stderr.strip() or f"git {args[0]} 返回 {process.returncode}"
+            raise ValueError(f"{self.path} @ {self.ref}: {detail}")
+        return process.stdout
+
+    @property
+    def description(self) -> str:
+        return f"{self.path}@{self.ref} ({self.commit[:12]})"
+
+    def list_files(self) -> Tuple[Dict[str, Tuple[str, str, int]], int]:
+        """该版本中的文件 {相对路径: (模式, blob ID, 大小)}，以及跳过的链接和子模块数量"""
+        output = self._git("ls-tree", "-r", "-z", "--long", f"{self.commit}:{self.prefix}")
+        files: Dict[str, Tuple[str, str, int]] = {}
+        skipped = 0
+        for record in output.split("\0"):
+            if not record:
+                continue
+            info, _, rel_path = record.partition("\t")
+            mode, kind, blob, size = info.split()
+            if kind != "blob" or mode not in _FILE_MODES:
+                skipped += 1
+                continue
+            files[rel_path] = (mode, blob, int(size))
+        return files, skipped
+
+    def stage(self, dest: str, rules: Optional[IgnoreRules] = None,
+              cancel: Optional[threading.Event] = None) -> SyncResult:
+        """把该版本的文件树镜像到 dest
+
+        写入时同时计算SHA-256存入哈希缓存，之后计算输入哈希不再读取文件。
+
+        Args:
+            rules: 忽略规则，默认使用默认规则和该版本中的 .loccompileignore
+            cancel: 若提供，设置后在下一个文件前停止（不删除多余文件），result.cancelled 为True
+        """
+        start = time.perf_counter()
+        result = SyncResult(self.description, dest)
+        os.makedirs(dest, exist_ok=True)
+
+        files, result.skipped = self.list_files()
+        if rules is None:
+            ignore_file = files.get(SOURCE_IGNORE_FILE)
+            lines = self._git("cat-file", "blob", ignore_file[1]).splitlines() if ignore_file else ()
+            rules = source_ignore_rules(lines)
+        dir_cache: Dict[str, bool] = {}
+        for rel_path in [path for path in files if rules.is_ignored(path, False, dir_cache)]:
+            result.skipped += 1
+            result.skipped_bytes += files.pop(rel_path)[2]
+
+        manifest_path = _manifest_path(dest)
+        recorded = _load_manifest(manifest_path, dest)
+        dest_files = scan_tree(dest)
+        staged: Dict[str, list] = {}
+        pending: List[str] = []
+        for rel_path, (_, blob, _) in files.items():
+            entry = recorded.get(rel_path)
+            if entry and entry[0] == blob and dest_files.get(rel_path) == (entry[1], entry[2]):
+                staged[rel_path] = entry
+                result.unchanged += 1
+            else:
+                pending.append(rel_path)
+
+        if pending:
+            self._write_blobs(files, pending, dest, staged, result, cancel)
+
+        if not result.cancelled and result.success:
+            for rel_path in dest_files:
+                if rel_path in files:
+                    continue
+                try:
+                    os.remove(os.path.join(dest, *rel_path.split("/")))
+                    result.removed += 1
+                except OSError as e:
+                    result.failed.append((rel_path, str(e)))
+            keep = set()
+            for rel_path in files:
+                parent = rel_path.rpartition("/")[0]
+                while parent and parent not in keep:
+                    keep.add(parent)
+                    parent = parent.rpartition("/")[0]
+            _remove_empty_dirs(dest, keep)
+
+        try:
+            _save_manifest(manifest_path, dest, staged)
+        except OSError as e:
+            result.failed.append((os.path.basename(manifest_path), str(e)))
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _write_blobs(self, files: Dict[str, Tuple[str, str, int]], pending: List[str], dest: str,
+                     staged: Dict[str, list], result: SyncResult, cancel: Optional[threading.Event]):
+        """用一个 git cat-file --batch 进程按顺序读取对象并写入文件"""
+        process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.root,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def feed():
+            try:
+                for rel_path in pending:
+                    process.stdin.write(f"{files[rel_path][1]}\n".encode("ascii"))
+                process.stdin.close()
+            except OSError:
+                # 取消时进程已结束
+                pass
+
+        threading.Thread(target=feed, name="git-cat-file-feed", daemon=True).start()
+        cache = source_hash_cache()
+        try:
+            for rel_path in pending:
+                if cancel is not None and cancel.is_set():
+                    result.cancelled = True
+                    break
+                header = process.stdout.readline().split()
+                if len(header) != 3:
+                    raise ValueError(f"{rel_path}: 读取对象失败 ({b' '.join(header).decode(errors='replace')})")
+                mode, blob, size = files[rel_path]
+                dest_path = os.path.join(dest, *rel_path.split("/"))
+                try:
+                    staged[rel_path] = _write_object(process.stdout, int(header[2]), dest_path, blob, mode, cache)
+                except OSError as e:
+                    result.failed.append((rel_path, str(e)))
+                    continue
+                finally:
+                    # 每个对象的内容之后有一个换行
+                    process.stdout.read(1)
+                result.copied += 1
+                result.copied_bytes += size
+        except ValueError as e:
+            result.failed.append((self.description, str(e)))
+        finally:
+            cache.save()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+
+def _write_object(stream, size: int, dest_path: str, blob: str, mode: str, cache: FileHashCache) -> list:
+    """从 cat-file 输出中读取 size 字节写入文件，返回清单记录 [blob ID, 大小, 修改时间ns]
+
+    写入失败时仍读完对象内容再抛出 OSError，后面的对象才能对齐。
+    """
+    temp_path = dest_path + ".git.tmp"
+    target = None
+    error: Optional[OSError] = None
+    try:
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        target = open(temp_path, "wb")
+    except OSError as e:
+        error = e
+    digest = hashlib.sha256()
+    remaining = size
+    while remaining:
+        chunk = stream.read(min(_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("git cat-file 输出提前结束")
+        remaining -= len(chunk)
+        if error is None:
+            try:
+                target.write(chunk)
+            except OSError as e:
+                error = e
+            digest.update(chunk)
+    if target is not None:
+        target.close()
+    if error is not None:
+        if target is not None:
+            os.remove(temp_path)
+        raise error
+    if mode == "100755" and os.name != "nt":
+        os.chmod(temp_path, 0o755)
+    # 修改时间保持为写入时间，make会重新编译内容变化的文件
+    os.replace(temp_path, dest_path)
+    stat = os.stat(dest_path)
+    cache.put(dest_path, stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return [blob, stat.st_size, stat.st_mtime_ns]
+
+
+def _manifest_path(dest: str) -> str:
+    kernel = os.path.basename(os.path.dirname(os.path.abspath(dest)))
+    return get_state_path(f"git_stage_{kernel}.json")
+
+
+def _load_manifest(path: str, dest: str) -> Dict[str, list]:
+    """上次从git暂存到 dest 的文件 {相对路径: [blob ID, 大小, 修改时间ns]}"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION or data.get("dest") != os.path.abspath(dest):
+        return {}
+    return data.get("files", {})
+
+
+def _save_manifest(path: str, dest: str, files: Dict[str, list]):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "dest": os.path.abspath(dest), "files": files}, f,
+                  separators=(",", ":"))
+    os.replace(temp_path, path)
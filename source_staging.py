@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+源码暂存和MSYS启动
+把用户选择的源码镜像到编译目录的src中：使用 file_sync 的增量同步，应用默认忽略规则和源码根目录中的
+.loccompileignore（.git、IDE元数据、Debug/Release输出和目标文件等不会进入src），
+被忽略的文件数和字节数记入编译记录。
+源码压缩包（.zip / .tar.gz 等）由 source_archive 直接流式暂存，不需要先解压；
+指定git版本时由 source_git 从仓库对象直接暂存，不需要先检出。
+MSYS默认通过 cmd /c start 打开新窗口，也可以用环境变量替换为其他命令（用于自动化环境）。
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from file_sync import SyncResult, sync_directory
+from ignore_rules import IgnoreRules, load_source_ignore_rules
+from source_archive import ingest_archive, is_archive
+from source_git import GitSource
+from task_stamps import TaskStamp, path_state
+
+# 启动MSYS的命令行，{msys_bat}、{profile}、{msys_root} 会替换为实际路径，例如:
+#   LOC_COMPILE_MSYS_CMD='bash --noprofile --norc -c ". \"$0\"" {profile}'
+MSYS_COMMAND_ENV_VAR = "LOC_COMPILE_MSYS_CMD"
+
+# 设置后MSYS profile在编译和编译后处理结束时退出（监视模式使用）
+EXIT_AFTER_BUILD_ENV_VAR = "MSYS_EXIT_AFTER_BUILD"
+
+
+def stage_sources(source_path: str, dest_folder: str, cancel: Optional[threading.Event] = None,
+                  ref: Optional[str] = None, stats: Optional[Dict[str, float]] = None) -> Tuple[bool, str]:
+    """把源码目录镜像（或单个文件复制）到 dest_folder
+
+    源码和暂存结果都与上次复制时相同时直接返回成功，不再启动复制。
+
+    Args:
+        cancel: 若提供，设置后在下一个文件前停止复制并返回失败
+        ref: 若提供，source_path 为git仓库（或其中的子目录），暂存该版本的内容
+        stats: 若提供，填入被忽略的文件数和字节数（skipped_files / skipped_bytes），
+            跳过复制时为上次暂存的统计，可以直接传入运行记录的 metrics
+
+    Returns:
+        (是否成功, 说明)
+    """
+    os.makedirs(dest_folder, exist_ok=True)
+    source_path = os.path.abspath(source_path)
+    if ref is not None:
+        return _stage_git(source_path, ref, dest_folder, cancel, stats)
+    # 源码目录的状态包含其中的 .loccompileignore，规则变化时重新暂存
+    stamp = TaskStamp(f"stage_{os.path.basename(os.path.dirname(os.path.abspath(dest_folder)))}",
+                      inputs={"source": source_path, "tree": lambda: path_state(source_path)},
+                      outputs=[staged_source_path(source_path, dest_folder)])
+    if stamp.check() is None:
+        _report_skipped(stats, stamp.details)
+        return True, "源码没有变化，跳过复制"
+    staged, detail, result = _copy_sources(source_path, dest_folder, cancel)
+    if staged:
+        details = _skipped_details(result)
+        stamp.record(details)
+        _report_skipped(stats, details)
+    return staged, detail
+
+
+def _skipped_details(result: Optional[SyncResult]) -> Dict[str, float]:
+    if result is None:
+        return {}
+    return {"skipped_files": result.skipped, "skipped_bytes": result.skipped_bytes}
+
+
+def _report_skipped(stats: Optional[Dict[str, float]], details: Dict[str, float]):
+    if stats is not None:
+        stats.update(details)
+
+
+def _stage_git(source_path: str, ref: str, dest_folder: str, cancel: Optional[threading.Event],
+               stats: Optional[Dict[str, float]]) -> Tuple[bool, str]:
+    try:
+        source = GitSource(source_path, ref)
+    except ValueError as e:
+        return False, str(e)
+    # 同一提交暂存过且src未被改动时不再比较文件树
+    stamp = TaskStamp(f"stage_{os.path.basename(os.path.dirname(os.path.abspath(dest_folder)))}",
+                      inputs={"source": source_path, "commit": source.commit}, outputs=[dest_folder])
+    if stamp.check() is None:
+        _report_skipped(stats, stamp.details)
+        return True, f"{source.description} 已暂存，跳过复制"
+    result = source.stage(dest_folder, cancel=cancel)
+    staged, detail = _sync_outcome(result, "git版本暂存成功")
+    if staged:
+        stamp.record(_skipped_details(result))
+        _report_skipped(stats, _skipped_details(result))
+    return staged, detail
+
+
+def _sync_outcome(result: SyncResult, success_text: str) -> Tuple[bool, str]:
+    if result.cancelled:
+        return False, "暂存已取消"
+    if not result.success:
+        rel_path, error = result.failed[0]
+        return False, f"{rel_path}: {error}（共 {len(result.failed)} 个文件失败）"
+    return True, f"{success_text}: {result.summary()}"
+
+
+def staged_source_path(source_path: str, dest_folder: str) -> str:
+    """源码暂存后的位置：目录和源码压缩包为整个 dest_folder，单个文件为其中的同名文件"""
+    if os.path.isdir(source_path) or is_archive(source_path):
+        return dest_folder
+    return os.path.join(dest_folder, os.path.basename(source_path))
+
+
+def _copy_sources(source_path: str, dest_folder: str,
+                  cancel: Optional[threading.Event]) -> Tuple[bool, str, Optional[SyncResult]]:
+    """返回 (是否成功, 说明, 同步统计)，单个文件没有同步统计"""
+    if is_archive(source_path):
+        result = ingest_archive(source_path, dest_folder, cancel=cancel)
+        return _sync_outcome(result, "压缩包暂存成功") + (result,)
+    if not os.path.isdir(source_path):
+        try:
+            shutil.copy2(source_path, os.path.join(dest_folder, os.path.basename(source_path)))
+        except OSError as e:
+            return False, str(e), None
+        return True, "文件复制成功", None
+
+    # 不使用 robocopy /MIR：它不能报告被排除的字节数，而且不会删除src中之前已复制的被排除文件
+    rules = load_source_ignore_rules(source_path)
+    result = sync_directory(source_path, dest_folder, rules.copytree_ignore(source_path),
+                            manifest_name=None, cancel=cancel)
+    return _sync_outcome(result, "目录同步成功") + (result,)
+
+
+def find_c_modules(source_path: str, rules: Optional[IgnoreRules] = None) -> List[str]:
+    """源码中所有.c文件的模块名（不带扩展名），与暂存后的src相同
+
+    Args:
+        rules: 忽略规则，目录默认使用与暂存相同的规则（默认规则和其中的 .loccompileignore）
+    """
+    if not os.path.isdir(source_path):
+        name, ext = os.path.splitext(os.path.basename(source_path))
+        return [name] if ext.lower() == ".c" else []
+    rules = load_source_ignore_rules(source_path) if rules is None else rules
+    modules = []
+    for _, _, _, files in rules.walk(source_path):
+        modules.extend(os.path.splitext(name)[0] for name in files if name.lower().endswith(".c"))
+    return modules
+
+
+def get_msys_command(msys_bat_path: str, wait: bool = False) -> List[str]:
+    """启动MSYS的命令：默认打开新的MSYS窗口，设置了 LOC_COMPILE_MSYS_CMD 时使用其中的命令
+
+    wait 为True时 cmd 等到MSYS窗口关闭才退出，调用方可以通过进程判断MSYS是否还在运行。
+    """
+    override = os.environ.get(MSYS_COMMAND_ENV_VAR, "").strip()
+    if not override:
+        return ["cmd", "/c", "start", "", "/wait", msys_bat_path] if wait else ["cmd", "/c", "start", "", msys_bat_path]
+    msys_dir = os.path.dirname(msys_bat_path)
+    paths = {
+        "msys_bat": msys_bat_path,
+        "profile": os.path.join(msys_dir, "etc", "profile"),
+        "msys_root": os.path.dirname(msys_dir),
+    }
+    # 先拆分再替换，路径中的空格不会破坏参数
+    return [part.format(**paths) for part in shlex.split(override, posix=os.name != "nt")]
+
+
+def launch_msys(msys_bat_path: str, env: Optional[Dict[str, str]] = None, wait: bool = False) -> subprocess.Popen:
+    """启动MSYS（不等待编译结束），env 为None时继承当前进程的环境变量
+
+    wait 为True时返回的进程在MSYS退出时才结束（见 get_msys_command）。
+    """
+    return subprocess.Popen(get_msys_command(msys_bat_path, wait), env=env)
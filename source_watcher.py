@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+源码目录监视
+Linux上使用inotify（通过ctypes调用libc，不需要额外依赖），其他平台或inotify不可用时定时扫描目录树比较
+大小和修改时间。一批变化在 debounce 秒内没有新的变化后才回调，编辑器保存、批量替换等连续写入只触发一次。
+回调参数是变化的相对路径集合（'/'分隔），目录表示其整个子树有变化，""表示需要重新同步整个目录。
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+from file_sync import FileStat, scan_tree
+from ignore_rules import IgnoreRules, default_ignore_rules
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 1.0
+
+# 读取事件的最长等待时间，保证 stop() 能及时生效
+_WAIT_SLICE = 0.5
+
+# <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE
+               | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    """支持inotify时返回libc，否则返回None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _PollingBackend:
+    """定时扫描目录树，与上次的快照比较"""
+
+    name = "polling"
+
+    def __init__(self, root: str, rules: IgnoreRules, interval: float = DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._ignore = rules.copytree_ignore(root)
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, FileStat]:
+        return scan_tree(self.root, self._ignore)
+
+    def read(self, timeout: float) -> Set[str]:
+        remaining = self._next_scan - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(timeout, remaining))
+            if time.monotonic() < self._next_scan:
+                return set()
+        snapshot = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        changed = {path for path, stat in snapshot.items() if self._snapshot.get(path) != stat}
+        changed.update(path for path in self._snapshot if path not in snapshot)
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class _InotifyBackend:
+    """inotify监视：每个未被忽略的目录一个watch，新建的目录自动加入"""
+
+    name = "inotify"
+
+    def __init__(self, root: str, rules: IgnoreRules, libc):
+        self.root = root
+        self.rules = rules
+        self._libc = libc
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self._watches: Dict[int, str] = {}
+        try:
+            self._add_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, rel_dir: str):
+        path = os.path.join(self.root, *rel_dir.split("/")) if rel_dir else self.root
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # 目录在加入前已被删除时忽略，watch数量超过上限等其他错误由调用方改用轮询
+            if error in (errno.ENOENT, errno.ENOTDIR) and rel_dir:
+                return
+            raise OSError(error, f"无法监视目录 {path}: {os.strerror(error)}")
+        self._watches[wd] = rel_dir
+
+    def _add_tree(self, rel_dir: str):
+        """监视目录及其所有未被忽略的子目录"""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            self._add_watch(current)
+            path = os.path.join(self.root, *current.split("/")) if current else self.root
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                rel_path = f"{current}/{entry.name}" if current else entry.name
+                if entry.is_dir(follow_symlinks=False) and not self.rules.match(rel_path, True):
+                    stack.append(rel_path)
+
+    def read(self, timeout: float) -> Set[str]:
+        changed: Set[str] = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding(), "surrogateescape")
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                # 内核事件队列溢出，变化可能丢失，重新同步整个目录
+                changed.add("")
+                continue
+            rel_dir = self._watches.get(wd)
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if rel_dir is None:
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if not rel_dir:
+                    changed.add("")
+                continue
+            if not name:
+                continue
+
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            is_dir = bool(mask & _IN_ISDIR)
+            if self.rules.is_ignored(rel_path, is_dir):
+                continue
+            if is_dir and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # 新目录中可能已有文件（在watch加入之前写入），整个子树视为变化
+                try:
+                    self._add_tree(rel_path)
+                except OSError:
+                    changed.add("")
+            changed.add(rel_path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class SourceWatcher:
+    """监视源码目录（或单个文件），去抖后回调变化的路径
+
+    创建时即开始记录变化；run() 在当前线程中循环直到 stop()，start() 在后台线程中运行。
+    回调在监视线程中执行，回调执行期间发生的变化会在回调返回后作为下一批报告。
+    """
+
+    def __init__(self, path: str, on_change: Callable[[Set[str]], None],
+                 debounce: float = DEFAULT_DEBOUNCE, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 rules: Optional[IgnoreRules] = None, use_inotify: bool = True):
+        path = os.path.abspath(path)
+        # 单个文件时监视其所在目录，只报告该文件
+        self.single_file = None if os.path.isdir(path) else os.path.basename(path)
+        self.root = os.path.dirname(path) if self.single_file else path
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.rules = rules if rules is not None else default_ignore_rules()
+        self.use_inotify = use_inotify
+        self.backend = self._create_backend()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _create_backend(self):
+        libc = _load_libc() if self.use_inotify else None
+        if libc is not None:
+            try:
+                return _InotifyBackend(self.root, self.rules, libc)
+            except OSError as e:
+                print(f"警告: inotify不可用，改为轮询: {e}")
+        return _PollingBackend(self.root, self.rules, self.poll_interval)
+
+    def _filter(self, changed: Set[str]) -> Set[str]:
+        if self.single_file is None:
+            return changed
+        return {self.single_file} if changed & {self.single_file, ""} else set()
+
+    def run(self):
+        """监视循环，直到 stop() 被调用"""
+        pending: Set[str] = set()
+        deadline = 0.0
+        try:
+            while not self._stopped.is_set():
+                timeout = _WAIT_SLICE if not pending else max(0.0, min(_WAIT_SLICE, deadline - time.monotonic()))
+                changed = self._filter(self.backend.read(timeout))
+                if changed:
+                    pending |= changed
+                    deadline = time.monotonic() + self.debounce
+                if pending and time.monotonic() >= deadline and not self._stopped.is_set():
+                    batch, pending = pending, set()
+                    self.on_change(batch)
+        finally:
+            self.backend.close()
+
+    def start(self):
+        """在后台线程中监视"""
+        self._thread = threading.Thread(target=self.run, name="source-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译准备的预先执行
+界面中选择源路径后，在用户点击“开始编译”之前就在后台暂存源码、计算暂存文件的哈希（写入哈希缓存）
+并执行模块检查（建立makefile名称索引）。选择改变时取消；开始编译时等待它完成，
+编译流程中相同的步骤随后基本不再需要复制和计算。
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from build_run import warm_hash_cache
+from source_staging import stage_sources, staged_source_path
+
+
+class StagingPrefetch:
+    """在后台线程中预先完成一个源路径的编译准备
+
+    Args:
+        source_path: 选择的源目录或源文件
+        vcu_code: "m" 或 "s"
+        dest_folder: 暂存目标（编译目录中的src）
+        check_modules: 模块检查函数，参数为VCU类型代码
+        log: 进度信息的输出函数
+    """
+
+    def __init__(self, source_path: str, vcu_code: str, dest_folder: str,
+                 check_modules: Optional[Callable[[str], object]] = None,
+                 log: Callable[[str], None] = print):
+        self.source_path = os.path.abspath(source_path)
+        self.vcu_code = vcu_code
+        self.dest_folder = dest_folder
+        self.check_modules = check_modules
+        self.log = log
+        self.timings: Dict[str, float] = {}
+        self.completed = False
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="staging-prefetch", daemon=True)
+
+    def matches(self, source_path: str) -> bool:
+        return os.path.normcase(os.path.abspath(source_path)) == os.path.normcase(self.source_path)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """请求取消，不等待后台线程结束"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def running(self) -> bool:
+        """后台线程是否仍在执行（取消后也要等它结束才能再写入同一个src目录）"""
+        return self._thread.is_alive()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待结束，返回是否完整完成"""
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        return self.completed
+
+    def _step(self, name: str, action: Callable[[], object]):
+        start = time.perf_counter()
+        try:
+            return action()
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def _run(self):
+        try:
+            staged, detail = self._step("stage", lambda: stage_sources(
+                self.source_path, self.dest_folder, cancel=self._cancel))
+            if not staged:
+                if not self.cancelled:
+                    self.log(f"预先暂存失败，将在编译时重试: {detail}")
+                return
+            staged_path = staged_source_path(self.source_path, self.dest_folder)
+            hashed = self._step("hash", lambda: warm_hash_cache(staged_path, self._cancel))
+            if self.cancelled:
+                return
+            if self.check_modules is not None:
+                self._step("check_modules", lambda: self.check_modules(self.vcu_code))
+            if self.cancelled:
+                return
+            self.completed = True
+            self.log(f"预先准备完成: 暂存 {self.timings['stage']:.2f} s，哈希 {hashed} 个文件 "
+                     f"{self.timings['hash']:.2f} s，模块检查 {self.timings.get('check_modules', 0):.2f} s")
+        except Exception as e:
+            # 预先准备只是优化，失败时编译流程会重新执行这些步骤
+            self.log(f"预先准备出错，将在编译时重试: {e}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+编译流程任务的最新检查
+每个任务声明自己的输入（值、文件或目录）和输出（文件或目录）。任务成功后把输入的摘要和输出的状态写入
+戳记文件（.loc_compile/stamps/<任务>.json）；下次执行前输入摘要相同、输出与记录一致时跳过任务，
+与make按依赖判断目标是否需要重建相同。--force 忽略所有戳记，--explain 输出每个任务执行或跳过的原因。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from file_sync import scan_tree
+from ignore_rules import IgnoreRules
+from path_utils import get_state_path
+
+STAMP_VERSION = 1
+
+# 命令行的 --force / --explain，对本进程中所有任务生效
+_settings = {"force": False, "explain": False}
+_print_lock = threading.Lock()
+
+# 任务的输出：路径列表，或在记录时才返回路径列表的函数（例如编译产物）
+Outputs = Union[Iterable[str], Callable[[], Iterable[str]]]
+
+
+def configure(force: Optional[bool] = None, explain: Optional[bool] = None):
+    """设置是否忽略戳记以及是否输出执行原因"""
+    if force is not None:
+        _settings["force"] = force
+    if explain is not None:
+        _settings["explain"] = explain
+
+
+def is_forced() -> bool:
+    return _settings["force"]
+
+
+def explain(message: str):
+    """开启 --explain 时输出一行说明"""
+    if _settings["explain"]:
+        with _print_lock:
+            print(f"[explain] {message}")
+
+
+def path_state(path: str, rules: Optional[IgnoreRules] = None) -> Optional[str]:
+    """文件为 "大小:修改时间ns"，目录为其中所有文件状态的摘要（不含 rules 忽略的文件），不存在时为None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isdir(path):
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256()
+    for rel_path, (size, mtime_ns) in sorted(scan_tree(path, rules.copytree_ignore(path) if rules else None).items()):
+        digest.update(f"{rel_path}|{size}|{mtime_ns}\n".encode("utf-8"))
+    return f"tree:{digest.hexdigest()}"
+
+
+def _digest(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TaskStamp:
+    """一个任务的输入、输出声明和戳记
+
+    Args:
+        name: 任务名称，同时决定戳记文件名
+        inputs: {名称: 值}，值可以是无参数函数，在检查时才计算
+        input_paths: 状态作为输入的文件或目录（任务不会修改它们）
+        outputs: 任务生成或修改的文件或目录
+
+    示例:
+        stamp = TaskStamp("msys_profile", inputs={"content": content}, outputs=[profile_path])
+        if stamp.check() is not None:
+            write_profile()
+            stamp.record()
+    """
+
+    def __init__(self, name: str, inputs: Optional[Dict[str, Any]] = None,
+                 input_paths: Iterable[str] = (), outputs: Outputs = ()):
+        self.name = name
+        self.inputs = dict(inputs or {})
+        for path in input_paths:
+            self.inputs[path] = (lambda p=path: path_state(p))
+        self.outputs = outputs
+        self.path = get_state_path("stamps", re.sub(r"[^\w.-]", "_", name) + ".json")
+        self._current: Optional[Dict[str, str]] = None
+        self._recorded: Optional[dict] = None
+
+    def current_inputs(self) -> Dict[str, str]:
+        """输入的摘要，第一次调用时计算，之后记录戳记时使用同一份结果"""
+        if self._current is None:
+            self._current = {label: _digest(value() if callable(value) else value)
+                             for label, value in self.inputs.items()}
+        return self._current
+
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == STAMP_VERSION else None
+
+    def reason(self) -> Optional[str]:
+        """需要执行的原因，已是最新时返回None"""
+        if is_forced():
+            return "强制执行（--force）"
+        stamp = self._recorded = self._load()
+        if stamp is None:
+            return "没有戳记记录"
+        current = self.current_inputs()
+        recorded = stamp.get("inputs", {})
+        for label in sorted(set(current) | set(recorded)):
+            if current.get(label) != recorded.get(label):
+                return f"输入变化: {label}"
+        for path, state in stamp.get("outputs", {}).items():
+            now = path_state(path)
+            if now is None:
+                return f"输出缺失: {path}"
+            if now != state:
+                return f"输出已被修改: {path}"
+        return None
+
+    def check(self) -> Optional[str]:
+        """检查并按 --explain 输出结果，返回需要执行的原因，None表示可以跳过"""
+        reason = self.reason()
+        explain(f"{self.name}: {'执行，' + reason if reason else '已是最新，跳过'}")
+        return reason
+
+    @property
+    def details(self) -> Dict[str, Any]:
+        """检查时读到的戳记中任务记录的附加结果（例如统计），跳过任务时可以据此报告上次的结果"""
+        return dict((self._recorded or {}).get("details", {}))
+
+    def record(self, details: Optional[Dict[str, Any]] = None):
+        """任务成功后写入戳记：检查时的输入摘要、现在的输出状态和附加结果"""
+        outputs = self.outputs() if callable(self.outputs) else self.outputs
+        data = {
+            "version": STAMP_VERSION,
+            "name": self.name,
+            "time": time.time(),
+            "inputs": self.current_inputs(),
+            "outputs": {path: path_state(path) for path in outputs},
+            "details": details or {},
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def invalidate(self):
+        """删除戳记，下次一定执行（例如开始一次可能覆盖输出的编译之前）"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置：模块导入路径和独立的程序目录"""
+
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(REPO_ROOT, "scripts")
+for path in (REPO_ROOT, SCRIPTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(autouse=True)
+def app_root(tmp_path, monkeypatch):
+    """每个测试使用独立的程序目录，状态文件（.loc_compile）写入临时目录"""
+    root = tmp_path / "app"
+    root.mkdir()
+    monkeypatch.setenv("LOC_COMPILE_ROOT", str(root))
+    return root
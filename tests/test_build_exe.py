@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""打包输入指纹"""
+
+import os
+
+from build_exe import HIDDEN_IMPORTS, compute_build_fingerprint, stage_bundled_sources
+
+
+def _write(root, rel_path, data="x"):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    return path
+
+
+def _fingerprint(loc_dir, stage_dir):
+    bundle_dir = stage_bundled_sources(str(loc_dir), str(stage_dir))
+    return compute_build_fingerprint(bundle_dir, HIDDEN_IMPORTS, ["tk86t.dll"], "6.0", ["GCC"])
+
+
+def test_fingerprint_covers_bundled_files(tmp_path):
+    loc_dir = tmp_path / "LOC_COMPILE"
+    stage_dir = tmp_path / "bundle_src"
+    _write(loc_dir, "main.py", "import vcu_compiler_ui")
+    _write(loc_dir, "doc/usage.md", "v1")
+    fingerprint = _fingerprint(loc_dir, stage_dir)
+    assert _fingerprint(loc_dir, stage_dir) == fingerprint
+
+    # 随exe打包的非Python文件变化同样需要重新打包
+    _write(loc_dir, "doc/usage.md", "v2")
+    changed = _fingerprint(loc_dir, stage_dir)
+    assert changed != fingerprint
+
+    # 不打包的文件既不进入暂存目录，也不影响指纹
+    _write(loc_dir, "__pycache__/main.cpython-311.pyc")
+    _write(loc_dir, "run.log")
+    assert _fingerprint(loc_dir, stage_dir) == changed
+    assert sorted(os.listdir(str(stage_dir))) == ["doc", "main.py"]
+
+    os.remove(str(loc_dir / "doc" / "usage.md"))
+    assert _fingerprint(loc_dir, stage_dir) != changed
+    assert not os.path.exists(str(stage_dir / "doc" / "usage.md"))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""目标文件归属的匹配和按记录清理"""
+
+import os
+
+import pytest
+
+from build_products import clean_build_products, map_objects, prune_stale_products, record_build_products
+
+
+def test_map_objects_by_path_suffix():
+    sources = ["app/d0/m.c", "bsw/can.c", "startup.s"]
+    objects = ["obj/app/d0/m.o", "obj/app/d0/m.d", "obj/can.o", "obj/startup.o", "obj/unknown.o"]
+    assert map_objects(sources, objects) == {
+        "app/d0/m.c": ["obj/app/d0/m.o", "obj/app/d0/m.d"],
+        "bsw/can.c": ["obj/can.o"],
+        "startup.s": ["obj/startup.o"],
+    }
+
+
+def test_map_objects_ambiguous_names():
+    sources = ["app/a/util.c", "app/b/util.c"]
+    # 只有文件名时无法确定归属，带目录时按更长的路径匹配
+    assert map_objects(sources, ["obj/util.o", "obj/a/util.o", "obj/app/b/util.o"]) == {
+        "app/a/util.c": ["obj/a/util.o"],
+        "app/b/util.c": ["obj/app/b/util.o"],
+    }
+
+
+def test_map_objects_case_insensitive():
+    assert map_objects(["App/Main.C"], ["OBJ/app/main.obj"]) == {"App/Main.C": ["OBJ/app/main.obj"]}
+
+
+def _touch(root, rel_path):
+    path = os.path.join(root, *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(rel_path)
+    return path
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    kernel = tmp_path / "kernel_m"
+    for rel_path in ("src/app/m.c", "src/app/n.c"):
+        _touch(str(kernel), rel_path)
+    build = str(kernel / "build")
+    for rel_path in ("obj/app/m.o", "obj/app/m.d", "obj/app/n.o", "obj/orphan.o", "out/app.elf", "out/app.map"):
+        _touch(build, rel_path)
+    assert record_build_products(build) == 4
+    return build
+
+
+def _exists(build_dir, rel_path):
+    return os.path.exists(os.path.join(build_dir, *rel_path.split("/")))
+
+
+def test_prune_removes_objects_of_deleted_sources(build_dir):
+    assert prune_stale_products(build_dir).removed == 0
+    os.remove(os.path.join(os.path.dirname(build_dir), "src", "app", "m.c"))
+    result = prune_stale_products(build_dir)
+    assert result.success
+    assert result.sources == ["app/m.c"]
+    assert not _exists(build_dir, "obj/app/m.o") and not _exists(build_dir, "obj/app/m.d")
+    # 链接产物被删除，下次编译重新链接
+    assert not _exists(build_dir, "out/app.elf")
+    assert _exists(build_dir, "obj/app/n.o") and _exists(build_dir, "obj/orphan.o")
+    # 记录已更新，再次检查没有需要删除的文件
+    assert prune_stale_products(build_dir).removed == 0
+
+
+def test_clean_removes_recorded_and_unowned_objects(build_dir):
+    result = clean_build_products(build_dir)
+    assert result.success
+    for rel_path in ("obj/app/m.o", "obj/app/m.d", "obj/app/n.o", "obj/orphan.o", "out/app.elf", "out/app.map"):
+        assert not _exists(build_dir, rel_path)
+
+
+def test_clean_outputs_only(build_dir):
+    clean_build_products(build_dir, outputs_only=True)
+    assert not _exists(build_dir, "out/app.elf")
+    assert _exists(build_dir, "obj/app/m.o") and _exists(build_dir, "obj/orphan.o")
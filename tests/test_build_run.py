@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""编译任务戳记的输入"""
+
+import os
+
+import pytest
+
+from build_run import BUILD_LOG_NAME, BuildRun, compile_stamp
+
+
+def _write(root, rel_path, data="x"):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    return path
+
+
+@pytest.fixture
+def kernel(app_root):
+    kernel = os.path.join(str(app_root), "VCU_compile - selftest", "dev_kernel_mvcu")
+    for rel_path in ("src/app/main.c", "build/makefile", "build/make_com.sh", "build/postbuild.json",
+                     "prm/app.lcf", "build/out/app.s19"):
+        _write(kernel, rel_path)
+    return kernel
+
+
+def _stamp():
+    run = BuildRun("m")
+    run.inputs_hash = "sources"
+    run.toolchain_fingerprint = "toolchain"
+    return compile_stamp(run)
+
+
+def test_up_to_date_after_record(kernel):
+    _stamp().record()
+    assert _stamp().reason() is None
+
+
+@pytest.mark.parametrize("rel_path", ["prm/app.lcf", "build/make_com.sh", "build/makefile", "build/postbuild.json",
+                                      "build/new_script.sh"])
+def test_kernel_file_changed(kernel, rel_path):
+    _stamp().record()
+    _write(kernel, rel_path, "changed")
+    assert _stamp().reason() == "输入变化: kernel"
+
+
+def test_generated_files_ignored(kernel):
+    _stamp().record()
+    # 源码按暂存后的哈希计入，编译生成的文件和日志不影响戳记
+    _write(kernel, "src/app/main.c", "changed")
+    _write(kernel, "build/obj/app/main.o")
+    _write(kernel, "build/main.d")
+    _write(kernel, f"build/{BUILD_LOG_NAME}")
+    assert _stamp().reason() is None
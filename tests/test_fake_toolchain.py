@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""用假工具链端到端执行命令行模式的编译（暂存、MSYS中make编译、编译后处理和编译历史）"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SCRIPTS_DIR
+
+pytestmark = pytest.mark.skipif(shutil.which("bash") is None or shutil.which("make") is None,
+                                reason="需要bash和GNU make")
+
+
+def test_console_build_and_incremental_rebuild(tmp_path):
+    output = str(tmp_path / "e2e.json")
+    process = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, "fake_toolchain.py"), "run", "--dir", str(tmp_path / "fake"),
+         "--files", "5", "--runs", "2", "--touch", "40", "--jobs", "2", "--timeout", "120", "-o", output],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace", timeout=300)
+    assert process.returncode == 0, process.stdout
+
+    with open(output, encoding="utf-8") as f:
+        runs = json.load(f)["runs"]
+    assert len(runs) == 2
+    for entry in runs:
+        assert entry["msys_exit"] == "0"
+        run = entry["run"]
+        assert run["status"] == "success"
+        assert {"stage", "compile", "postbuild"} <= set(run["phases"])
+        assert run["artifacts"]
+    # 第二次只修改了部分源文件，输入哈希不同
+    assert runs[0]["run"]["inputs_hash"] != runs[1]["run"]["inputs_hash"]
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""目录增量同步（源码暂存的核心）"""
+
+import os
+import threading
+
+import pytest
+
+import file_sync
+from file_sync import MANIFEST_NAME, MTIME_TOLERANCE_NS, _is_unchanged, scan_tree, sync_directory, sync_paths
+from ignore_rules import IgnoreRules
+
+SECOND_NS = 1000 * 1000 * 1000
+
+
+def _write(root, rel_path, data, mtime_ns=None):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def _read(root, rel_path):
+    with open(os.path.join(str(root), *rel_path.split("/")), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / "src"
+    _write(root, "app/main.c", "int main;")
+    _write(root, "app/util.h", "#define A 1")
+    _write(root, "bsw/can.c", "void can;")
+    os.makedirs(str(root / "tmp"))
+    return str(root)
+
+
+@pytest.fixture
+def dest(tmp_path):
+    return str(tmp_path / "staged")
+
+
+def test_copy_unchanged_removed(src, dest):
+    result = sync_directory(src, dest)
+    assert (result.copied, result.unchanged, result.removed) == (3, 0, 0)
+    assert sorted(scan_tree(dest)) == [MANIFEST_NAME, "app/main.c", "app/util.h", "bsw/can.c"]
+    # 源目录中的空目录同样保留
+    assert os.path.isdir(os.path.join(dest, "tmp"))
+
+    result = sync_directory(src, dest)
+    assert (result.copied, result.unchanged, result.removed) == (0, 3, 0)
+
+    _write(src, "app/main.c", "int main(void);")
+    _write(src, "app/new.c", "int n;")
+    os.remove(os.path.join(src, "bsw", "can.c"))
+    os.rmdir(os.path.join(src, "bsw"))
+    os.rmdir(os.path.join(src, "tmp"))
+    result = sync_directory(src, dest)
+    assert result.success
+    assert (result.copied, result.unchanged, result.removed) == (2, 1, 1)
+    assert _read(dest, "app/main.c") == "int main(void);"
+    # 源目录中已不存在的空目录被删除
+    assert not os.path.exists(os.path.join(dest, "bsw"))
+    assert not os.path.exists(os.path.join(dest, "tmp"))
+
+
+def test_keep_extra_files_without_delete(src, dest):
+    sync_directory(src, dest)
+    _write(dest, "extra.txt", "keep")
+    result = sync_directory(src, dest, delete=False)
+    assert result.removed == 0
+    assert _read(dest, "extra.txt") == "keep"
+
+
+def test_ignored_paths(src, dest):
+    _write(src, "app/main.o", "obj")
+    _write(src, "Debug/app.elf", "elf")
+    ignore = IgnoreRules(["*.o", "Debug/"]).copytree_ignore(src)
+    result = sync_directory(src, dest, ignore)
+    assert result.skipped == 2
+    assert sorted(scan_tree(dest)) == [MANIFEST_NAME, "app/main.c", "app/util.h", "bsw/can.c"]
+
+    # 之前已暂存的文件被忽略后从目标中删除
+    sync_directory(src, dest)
+    assert os.path.exists(os.path.join(dest, "app", "main.o"))
+    result = sync_directory(src, dest, ignore)
+    assert result.removed == 2
+    assert not os.path.exists(os.path.join(dest, "app", "main.o"))
+    assert not os.path.exists(os.path.join(dest, "Debug"))
+
+
+def test_cancel_keeps_existing_files(src, dest):
+    sync_directory(src, dest)
+    _write(dest, "extra.txt", "keep")
+    _write(src, "app/main.c", "changed!!")
+    cancel = threading.Event()
+    cancel.set()
+    result = sync_directory(src, dest, cancel=cancel)
+    assert result.cancelled
+    assert (result.copied, result.removed) == (0, 0)
+    assert _read(dest, "extra.txt") == "keep"
+    assert _read(dest, "app/main.c") == "int main;"
+    # 取消后下次同步补上未复制的文件
+    result = sync_directory(src, dest)
+    assert (result.copied, result.removed) == (1, 1)
+    assert _read(dest, "app/main.c") == "changed!!"
+
+
+@pytest.mark.parametrize("manifest_name", [MANIFEST_NAME, None])
+def test_same_size_edit_detected(src, dest, manifest_name):
+    mtime_ns = 1700000000 * SECOND_NS
+    _write(src, "app/main.c", "int a = 1;", mtime_ns)
+    sync_directory(src, dest, manifest_name=manifest_name)
+    # 大小不变、修改时间只差几毫秒的快速修改
+    _write(src, "app/main.c", "int a = 2;", mtime_ns + 5 * 1000 * 1000)
+    result = sync_directory(src, dest, manifest_name=manifest_name)
+    assert result.copied == 1
+    assert _read(dest, "app/main.c") == "int a = 2;"
+
+
+def test_coarse_destination_tolerance(src, dest, monkeypatch):
+    mtime_ns = 1700000000 * SECOND_NS
+    _write(src, "app/main.c", "int a = 1;", mtime_ns)
+    sync_directory(src, dest, manifest_name=None)
+    # 模拟FAT等2秒精度的文件系统: 目标的修改时间被截断，不应因此重复复制
+    _write(dest, "app/main.c", "int a = 1;", mtime_ns - SECOND_NS)
+    monkeypatch.setattr(file_sync, "mtime_tolerance", lambda path: MTIME_TOLERANCE_NS)
+    result = sync_directory(src, dest, manifest_name=None)
+    assert (result.copied, result.unchanged) == (0, 3)
+    # 超出精度的修改仍会被复制
+    _write(src, "app/main.c", "int a = 2;", mtime_ns + 3 * SECOND_NS)
+    assert sync_directory(src, dest, manifest_name=None).copied == 1
+
+
+def test_is_unchanged():
+    stat = (10, 1700000000 * SECOND_NS)
+    assert _is_unchanged(stat, stat, None)
+    assert not _is_unchanged(stat, (10, stat[1] + 1), None)
+    assert _is_unchanged(stat, (10, stat[1] - SECOND_NS), None, tolerance=MTIME_TOLERANCE_NS)
+    assert not _is_unchanged(stat, (11, stat[1]), None, tolerance=MTIME_TOLERANCE_NS)
+    # 有清单记录时按记录的源文件状态比较
+    assert not _is_unchanged(stat, stat, (10, stat[1] - 1))
+    assert not _is_unchanged(stat, None, stat)
+
+
+def test_mtime_tolerance_probe(dest):
+    os.makedirs(dest)
+    tolerance = file_sync.mtime_tolerance(dest)
+    assert 0 <= tolerance <= MTIME_TOLERANCE_NS
+    assert os.listdir(dest) == []
+
+
+def test_sync_paths(src, dest):
+    sync_directory(src, dest)
+    _write(src, "app/main.c", "int main(void);")
+    _write(src, "lib/new/x.c", "int x;")
+    _write(src, "lib/new/y.c", "int y;")
+    os.remove(os.path.join(src, "bsw", "can.c"))
+    result = sync_paths(src, dest, ["app/main.c", "app/util.h", "lib", "lib/new/x.c", "bsw/can.c"])
+    assert result.success
+    assert (result.copied, result.unchanged, result.removed) == (3, 1, 1)
+    assert _read(dest, "app/main.c") == "int main(void);"
+    assert _read(dest, "lib/new/y.c") == "int y;"
+    assert not os.path.exists(os.path.join(dest, "bsw", "can.c"))
+
+    # 删除的目录整个从目标中删除
+    for name in ("x.c", "y.c"):
+        os.remove(os.path.join(src, "lib", "new", name))
+    os.rmdir(os.path.join(src, "lib", "new"))
+    os.rmdir(os.path.join(src, "lib"))
+    assert sync_paths(src, dest, ["lib"]).removed == 1
+    assert not os.path.exists(os.path.join(dest, "lib"))
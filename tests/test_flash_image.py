@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""MemoryImage 的写入合并和扇区比较"""
+
+import pytest
+
+from flash_image import MemoryImage, build_delta, changed_sectors, load_image, write_image
+
+
+def _image(*writes):
+    image = MemoryImage()
+    for address, data in writes:
+        image.write(address, data)
+    return image
+
+
+def _segments(image):
+    return [(start, bytes(segment)) for start, segment in image.segments()]
+
+
+def test_write_appends_adjacent_data():
+    image = _image((0x100, b"ab"), (0x102, b"cd"))
+    assert _segments(image) == [(0x100, b"abcd")]
+
+
+def test_write_out_of_order_keeps_segments_sorted():
+    image = _image((0x200, b"zz"), (0x100, b"aa"), (0x150, b"mm"))
+    assert _segments(image) == [(0x100, b"aa"), (0x150, b"mm"), (0x200, b"zz")]
+    assert image.bounds == (0x100, 0x202)
+    assert image.size == 6
+
+
+def test_write_overlapping_merges_following_segments():
+    image = _image((0x10, b"aaaa"), (0x18, b"cccc"), (0x20, b"dd"))
+    image.write(0x12, b"BBBBBBBB")
+    assert _segments(image) == [(0x10, b"aaBBBBBBBBcc"), (0x20, b"dd")]
+    # 与后一段相接时同样合并
+    image.write(0x1c, b"EEEE")
+    assert _segments(image) == [(0x10, b"aaBBBBBBBBccEEEEdd")]
+    image.write(0x21, b"FFF")
+    assert _segments(image) == [(0x10, b"aaBBBBBBBBccEEEEdFFF")]
+
+
+def test_read_fills_gaps():
+    image = _image((2, b"ab"), (6, b"cd"))
+    assert image.read(0, 10, 0xFF) == b"\xff\xffab\xff\xffcd\xff\xff"
+    assert image.view(2, 4) == b"ab"
+    assert image.view(2, 7) is None
+
+
+def test_changed_sectors():
+    old = _image((0, b"\x01" * 64), (0x100, b"\x02" * 16))
+    new = _image((0, b"\x01" * 32 + b"\x09" * 32), (0x80, b"\x03" * 4))
+    program, erase = changed_sectors(old, new, sector_size=32)
+    # 0x20 内容变化，0x80 是新扇区，0x100 只在旧镜像中有数据
+    assert program == [0x20, 0x80]
+    assert erase == [0x100]
+
+
+def test_changed_sectors_ignores_fill_only_differences():
+    old = _image((0, b"\x01" * 16))
+    new = _image((0, b"\x01" * 16 + b"\xff" * 16))
+    assert changed_sectors(old, new, sector_size=32) == ([], [])
+
+
+def test_changed_sectors_across_coarse_blocks():
+    data = bytearray(range(256)) * 64
+    old = _image((0x1000, bytes(data)))
+    data[5000] ^= 0xFF
+    new = _image((0x1000, bytes(data)))
+    assert changed_sectors(old, new, sector_size=16) == ([0x1000 + 5000 // 16 * 16], [])
+
+
+def test_build_delta_contains_whole_sectors():
+    old = _image((0, b"\x00" * 64))
+    new = _image((0, b"\x00" * 40 + b"\x07" * 4))
+    delta, info = build_delta(old, new, sector_size=32)
+    assert _segments(delta) == [(32, b"\x00" * 8 + b"\x07" * 4 + b"\xff" * 20)]
+    assert (info["program_sectors"], info["erase_sectors"]) == (1, 0)
+
+
+@pytest.mark.parametrize("name", ["image.hex", "image.s19", "image.bin"])
+def test_write_and_load_round_trip(tmp_path, name):
+    image = _image((0x20, b"hello"), (0x40, b"world"))
+    path = str(tmp_path / name)
+    write_image(image, path, fill=0x00)
+    loaded = load_image(path, base=0x20)
+    assert loaded.read(0x20, 0x45, 0x00) == image.read(0x20, 0x45, 0x00)
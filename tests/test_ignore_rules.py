@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""ignore_rules 的规则匹配"""
+
+import pytest
+
+from ignore_rules import IgnoreRules, load_source_ignore_rules
+
+
+@pytest.mark.parametrize("pattern, path, is_dir, expected", [
+    # 名称、扩展名和名称通配在任意层级匹配
+    ("build.log", "a/b/build.log", False, True),
+    ("*.o", "obj/app/m.o", False, True),
+    ("*.o", "obj/app/m.obj", False, False),
+    ("tmp_*", "src/tmp_1.c", False, True),
+    ("file?.c", "file12.c", False, False),
+    ("[ab].c", "x/b.c", False, True),
+    # 锚定模式只匹配完整路径
+    ("/out", "out", True, True),
+    ("/out", "src/out", True, False),
+    ("src/*.c", "src/m.c", False, True),
+    ("src/*.c", "src/d/m.c", False, False),
+    # ** 跨越任意层目录
+    ("src/**/gen.c", "src/gen.c", False, True),
+    ("src/**/gen.c", "src/a/b/gen.c", False, True),
+    ("**/Debug", "a/b/Debug", True, True),
+    # 仅目录规则不匹配文件
+    ("Debug/", "Debug", True, True),
+    ("Debug/", "Debug", False, False),
+    # 默认不区分大小写
+    ("*.O", "M.o", False, True),
+])
+def test_match(pattern, path, is_dir, expected):
+    assert IgnoreRules([pattern]).match(path, is_dir) is expected
+
+
+def test_comments_blank_lines_and_escape():
+    rules = IgnoreRules(["# 注释", "", "   ", r"\#keep"])
+    assert rules.patterns == [r"\#keep"]
+    assert rules.match("#keep")
+    assert not rules.match("# 注释")
+
+
+def test_later_negation_wins():
+    rules = IgnoreRules(["*.log", "!keep.log"])
+    assert rules.match("a/build.log")
+    assert not rules.match("a/keep.log")
+    rules = IgnoreRules(["!keep.log", "*.log"])
+    assert rules.match("a/keep.log")
+
+
+def test_case_sensitive():
+    rules = IgnoreRules(["*.O"], case_sensitive=True)
+    assert rules.match("m.O")
+    assert not rules.match("m.o")
+
+
+def test_is_ignored_checks_parent_directories():
+    rules = IgnoreRules(["Debug/"])
+    cache = {}
+    assert rules.is_ignored("app/Debug/m.o", False, cache)
+    assert cache == {"app": False, "app/Debug": True}
+    assert not rules.is_ignored("app/m.o")
+    # 只有条目本身时不检查上级目录
+    assert not rules.match("app/Debug/m.o")
+
+
+def test_walk_and_copytree_ignore(tmp_path):
+    for rel_path in ("src/m.c", "src/m.o", "src/Debug/x.c", "out/a.elf", "docs/out/readme.txt"):
+        path = tmp_path.joinpath(*rel_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+    rules = IgnoreRules(["*.o", "Debug/", "/out"])
+    found = sorted(f"{rel_dir}/{name}" for _, rel_dir, _, files in rules.walk(str(tmp_path)) for name in files)
+    assert found == ["docs/out/readme.txt", "src/m.c"]
+    assert rules.copytree_ignore(str(tmp_path))(str(tmp_path / "src"), ["m.c", "m.o", "Debug"]) == {"m.o", "Debug"}
+
+
+def test_load_source_ignore_rules(tmp_path):
+    assert not load_source_ignore_rules(str(tmp_path)).match("m.c")
+    (tmp_path / ".loccompileignore").write_text("generated/\n*.bak\n", encoding="utf-8")
+    rules = load_source_ignore_rules(str(tmp_path))
+    assert rules.match("generated", True)
+    assert rules.match("a/m.bak")
+    # 规则文件本身不暂存
+    assert rules.match(".loccompileignore")
+    assert not rules.match("m.c")
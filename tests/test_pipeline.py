@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""PipelineScheduler 的依赖调度、失败传播和依赖检查"""
+
+import threading
+
+import pytest
+
+from build_run import BuildRun
+from pipeline import PipelineScheduler
+from pipeline_profiler import PipelineProfiler
+
+
+def _fail():
+    raise RuntimeError("失败")
+
+
+def test_dependencies_run_first():
+    order = []
+    lock = threading.Lock()
+
+    def task(name):
+        def run():
+            with lock:
+                order.append(name)
+            return name.upper()
+        return run
+
+    scheduler = PipelineScheduler()
+    scheduler.add("launch", task("launch"), deps=["stage", "check"])
+    scheduler.add("check", task("check"), deps=["patch"])
+    scheduler.add("patch", task("patch"))
+    scheduler.add("stage", task("stage"))
+    report = scheduler.run()
+
+    assert report.success
+    assert report.results == {"launch": "LAUNCH", "check": "CHECK", "patch": "PATCH", "stage": "STAGE"}
+    assert order.index("patch") < order.index("check") < order.index("launch")
+    assert order.index("stage") < order.index("launch")
+    assert set(report.timings) == set(report.results)
+
+
+@pytest.mark.parametrize("profiled", [False, True])
+def test_failure_skips_dependents(profiled):
+    ran = []
+    scheduler = PipelineScheduler(profiler=PipelineProfiler() if profiled else None)
+    scheduler.add("stage", _fail)
+    scheduler.add("patch", lambda: ran.append("patch"))
+    scheduler.add("check", lambda: ran.append("check"), deps=["stage"])
+    scheduler.add("launch", lambda: ran.append("launch"), deps=["check", "patch"])
+    report = scheduler.run()
+
+    assert not report.success
+    assert list(report.errors) == ["stage"]
+    assert isinstance(report.errors["stage"], RuntimeError)
+    # 间接依赖失败阶段的阶段同样跳过，无关的阶段照常执行
+    assert sorted(report.skipped) == ["check", "launch"]
+    assert ran == ["patch"]
+
+
+def test_cycle_detected():
+    scheduler = PipelineScheduler()
+    scheduler.add("a", lambda: None, deps=["c"])
+    scheduler.add("b", lambda: None, deps=["a"])
+    scheduler.add("c", lambda: None, deps=["b"])
+    with pytest.raises(ValueError, match="环"):
+        scheduler.run()
+
+
+def test_invalid_graph():
+    scheduler = PipelineScheduler()
+    scheduler.add("a", lambda: None, deps=["missing"])
+    with pytest.raises(ValueError, match="missing"):
+        scheduler.run()
+    with pytest.raises(ValueError):
+        scheduler.add("a", lambda: None)
+
+
+def test_profiler_runs_serially_in_calling_thread():
+    threads = []
+    profiler = PipelineProfiler()
+    run = BuildRun("m")
+    scheduler = PipelineScheduler(run=run, profiler=profiler)
+    scheduler.add("stage", lambda: threads.append(threading.get_ident()))
+    scheduler.add("inputs", lambda: threads.append(threading.get_ident()), deps=["stage"], record=False)
+    report = scheduler.run()
+
+    assert report.success
+    assert threads == [threading.get_ident()] * 2
+    # record 为False的阶段自己记录耗时，不重复计入
+    assert [phase[0] for phase in profiler.phases] == ["stage"]
+    assert list(run.phases) == ["stage"]
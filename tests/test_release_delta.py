@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""release_delta 增量包的生成和应用"""
+
+import os
+import random
+import shutil
+
+import pytest
+
+from release_delta import BLOCK_SIZE, DELTA_MIN_SIZE, apply_delta, build_manifest, create_delta
+
+
+def _write(root, rel_path, data):
+    path = os.path.join(root, *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def releases(tmp_path):
+    rng = random.Random(0)
+    big = bytes(rng.getrandbits(8) for _ in range(DELTA_MIN_SIZE + 4 * BLOCK_SIZE))
+    moved = bytes(rng.getrandbits(8) for _ in range(4096))
+    old_dir, new_dir = str(tmp_path / "v1"), str(tmp_path / "v2")
+
+    _write(old_dir, "keep.txt", b"same")
+    _write(old_dir, "lib/old_name.bin", moved)
+    _write(old_dir, "big.bin", big)
+    _write(old_dir, "removed.txt", b"gone")
+    _write(old_dir, "GCC/.sync_manifest.json", b"{}")
+
+    _write(new_dir, "keep.txt", b"same")
+    _write(new_dir, "lib/new_name.bin", moved)
+    # 中间一个块被修改，其余内容可以从旧文件复制
+    changed = bytearray(big)
+    changed[2 * BLOCK_SIZE:2 * BLOCK_SIZE + 100] = b"\0" * 100
+    _write(new_dir, "big.bin", bytes(changed))
+    _write(new_dir, "added/new.txt", b"new")
+    _write(new_dir, "GCC/.sync_manifest.json", b'{"other": 1}')
+    return old_dir, new_dir
+
+
+def test_round_trip(releases, tmp_path):
+    old_dir, new_dir = releases
+    delta_path = str(tmp_path / "v1_v2.zip")
+    stats = create_delta(old_dir, new_dir, delta_path)
+    assert (stats["keep"], stats["copy"], stats["delta"], stats["add"], stats["removed"]) == (1, 1, 1, 1, 2)
+    # 块差分只包含修改过的块
+    assert stats["payload_bytes"] < 2 * BLOCK_SIZE
+
+    target = str(tmp_path / "target")
+    shutil.copytree(old_dir, target)
+    assert apply_delta(delta_path, target)
+    assert build_manifest(target) == build_manifest(new_dir)
+    assert not os.path.exists(os.path.join(target, "removed.txt"))
+    # 同步清单与机器相关，不参与比较也不会被更新
+    with open(os.path.join(target, "GCC", ".sync_manifest.json"), "rb") as f:
+        assert f.read() == b"{}"
+
+
+def test_apply_rejects_other_base(releases, tmp_path):
+    old_dir, new_dir = releases
+    delta_path = str(tmp_path / "v1_v2.zip")
+    create_delta(old_dir, new_dir, delta_path)
+    target = str(tmp_path / "target")
+    shutil.copytree(old_dir, target)
+    _write(target, "big.bin", b"modified locally")
+    assert not apply_delta(delta_path, target)
+    with open(os.path.join(target, "keep.txt"), "rb") as f:
+        assert f.read() == b"same"
+    assert os.path.exists(os.path.join(target, "removed.txt"))
+
+
+def test_apply_to_used_release(releases, tmp_path):
+    old_dir, new_dir = releases
+    profile = ("MSYS-1.0.10-selftest", "1.0", "etc", "profile")
+    _write(old_dir, "/".join(profile), b"# template\n")
+    _write(new_dir, "/".join(profile), b"# template v2\n")
+    delta_path = str(tmp_path / "v1_v2.zip")
+    create_delta(old_dir, new_dir, delta_path)
+
+    # 使用过的旧版本: profile 按安装路径改写过，状态目录中有缓存和编译历史
+    target = str(tmp_path / "installed")
+    shutil.copytree(old_dir, target)
+    _write(target, "/".join(profile), b"cd '/c/Users/someone/loc'\n")
+    _write(target, ".loc_compile/stamps/compile_m.json", b"{}")
+    _write(target, ".loc_compile/build_history.sqlite3", b"db")
+
+    assert apply_delta(delta_path, target)
+    assert build_manifest(target) == build_manifest(new_dir)
+    with open(os.path.join(target, *profile), "rb") as f:
+        assert f.read() == b"cd '/c/Users/someone/loc'\n"
+    assert os.path.exists(os.path.join(target, ".loc_compile", "build_history.sqlite3"))
+
+
+def test_unchanged_files_checked_after_apply(releases, tmp_path):
+    old_dir, new_dir = releases
+    delta_path = str(tmp_path / "v1_v2.zip")
+    create_delta(old_dir, new_dir, delta_path)
+    target = str(tmp_path / "target")
+    shutil.copytree(old_dir, target)
+    # 未变化的文件不被读取，不阻止应用，但最终校验会发现它
+    _write(target, "keep.txt", b"edited")
+    assert not apply_delta(delta_path, target)
+    with open(os.path.join(target, "added", "new.txt"), "rb") as f:
+        assert f.read() == b"new"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""发布仓库的入库、还原、保留策略和回收"""
+
+import os
+import stat
+
+import pytest
+
+from file_sync import scan_tree
+from release_store import ReleaseStore
+
+PROFILE = "MSYS-1.0.10-selftest/1.0/etc/profile"
+
+
+def _write(root, rel_path, data):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _read_tree(root, ignore_state=True):
+    result = {}
+    for rel_path in scan_tree(str(root)):
+        if ignore_state and rel_path.startswith(".loc_compile/"):
+            continue
+        with open(os.path.join(str(root), *rel_path.split("/")), "rb") as f:
+            result[rel_path] = f.read()
+    return result
+
+
+def _release(root, files):
+    for rel_path, data in files.items():
+        _write(root, rel_path, data)
+    return str(root)
+
+
+V1 = {
+    "LOC_compile.exe": b"exe v1",
+    "GCC/bin/gcc.exe": b"gcc" * 1000,
+    PROFILE: b"# profile template\n",
+    "VCU_compile - selftest/dev_kernel_mvcu/build/makefile": b"all:\n",
+}
+V2 = dict(V1, **{"LOC_compile.exe": b"exe v2", "GCC/lib/new.a": b"new lib"})
+V3 = dict(V2, **{"LOC_compile.exe": b"exe v3"})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReleaseStore(str(tmp_path / "store"))
+    store.ingest(_release(tmp_path / "v1", V1), "v1")
+    store.ingest(_release(tmp_path / "v2", V2), "v2")
+    return store
+
+
+def test_ingest_shares_content(store, tmp_path):
+    blobs = scan_tree(store.blob_dir)
+    # v2 只新增了两个内容
+    assert len(blobs) == len(set(V1.values()) | set(V2.values())) == 6
+    for rel_path in blobs:
+        mode = os.stat(os.path.join(store.blob_dir, *rel_path.split("/"))).st_mode
+        assert not mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    release = store.ingest(_release(tmp_path / "v3", V3), "v3", tags=["stable"])
+    assert release["tags"] == ["stable"]
+    assert len(scan_tree(store.blob_dir)) == 7
+    with pytest.raises(ValueError):
+        store.ingest(str(tmp_path / "v3"), "v3")
+
+
+@pytest.mark.parametrize("use_links", [True, False])
+def test_materialize_round_trip(store, tmp_path, use_links):
+    for release_id, files in (("v1", V1), ("v2", V2)):
+        dest = tmp_path / f"out_{release_id}"
+        store.materialize(release_id, str(dest), use_links=use_links)
+        assert _read_tree(dest) == files
+        gcc = os.path.join(str(dest), "GCC", "bin", "gcc.exe")
+        blob = store.blob_path(store.load_release(release_id)["files"]["GCC/bin/gcc.exe"][0])
+        assert os.path.samefile(gcc, blob) is use_links
+        # 程序会改写的文件总是复制，修改它不会影响仓库中的内容
+        profile = os.path.join(str(dest), *PROFILE.split("/"))
+        assert not os.path.samefile(profile, store.blob_path(store.load_release(release_id)["files"][PROFILE][0]))
+        with open(profile, "wb") as f:
+            f.write(b"cd /c/somewhere\n")
+    assert store.verify() == []
+
+
+def test_materialize_over_other_version(store, tmp_path):
+    dest = tmp_path / "install"
+    store.materialize("v2", str(dest))
+    _write(dest, PROFILE, b"rewritten")
+    _write(dest, ".loc_compile/build_history.sqlite3", b"db")
+    linked, copied, unchanged, removed = store.materialize("v1", str(dest))
+    assert _read_tree(dest) == V1
+    assert removed == 1
+    # 本机状态不属于版本内容，不被删除
+    assert os.path.exists(os.path.join(str(dest), ".loc_compile", "build_history.sqlite3"))
+    # 再次还原时已链接的文件不再处理
+    assert store.materialize("v1", str(dest)) == (0, 0, len(V1), 0)
+
+
+def test_retention_and_gc(store, tmp_path):
+    store.ingest(_release(tmp_path / "v3", V3), "v3")
+    store.set_tag("v1", "stable")
+    assert store.apply_retention(keep_last=1) == ["v2"]
+    assert [release["id"] for release in store.list_releases()] == ["v1", "v3"]
+
+    removed, freed = store.collect_garbage()
+    # 只有v2独有的exe被回收，与v3共享的 GCC/lib/new.a 保留
+    assert (removed, freed) == (1, len(V2["LOC_compile.exe"]))
+    assert store.verify() == []
+    for release_id, files in (("v1", V1), ("v3", V3)):
+        dest = tmp_path / f"out_{release_id}"
+        store.materialize(release_id, str(dest))
+        assert _read_tree(dest) == files
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""从压缩包直接暂存源码（镜像）"""
+
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from file_sync import scan_tree
+from source_archive import detect_vcu_type, ingest_archive
+from toolchain_fingerprint import source_hash_cache
+
+FILES = {
+    "app/main.c": b"int main(void) { return 0; }\n",
+    "app/util.h": b"#define UTIL 1\n",
+    "app/Debug/main.o": b"\x7fELF",
+    "bsw/can.c": b"void can(void) {}\n",
+    "notes.bak": b"old",
+    ".loccompileignore": b"*.bak\n",
+}
+
+
+def _read_tree(root):
+    result = {}
+    for rel_path in scan_tree(root):
+        with open(os.path.join(root, *rel_path.split("/")), "rb") as f:
+            result[rel_path] = f.read()
+    return result
+
+
+def _write_zip(path, files, top="app_mvcu/"):
+    with zipfile.ZipFile(path, "w") as archive:
+        for rel_path, data in files.items():
+            archive.writestr(top + rel_path, data)
+
+
+def _write_tar(path, files, top="app_mvcu/"):
+    with tarfile.open(path, "w:gz" if path.endswith(".gz") else "w") as archive:
+        for rel_path, data in files.items():
+            info = tarfile.TarInfo(top + rel_path)
+            info.size = len(data)
+            info.mtime = 1600000000
+            archive.addfile(info, io.BytesIO(data))
+
+
+EXPECTED = {"app/main.c": FILES["app/main.c"], "app/util.h": FILES["app/util.h"], "bsw/can.c": FILES["bsw/can.c"]}
+
+
+@pytest.mark.parametrize("name, writer", [("src_mvcu.zip", _write_zip), ("src.tar.gz", _write_tar)])
+def test_archive_mirror(tmp_path, name, writer):
+    archive_path = str(tmp_path / name)
+    dest = str(tmp_path / "kernel" / "src")
+    writer(archive_path, FILES)
+    assert detect_vcu_type(archive_path) == "m"
+
+    result = ingest_archive(archive_path, dest)
+    assert result.success
+    # 去掉唯一的顶层目录，忽略默认规则（Debug/）和压缩包中 .loccompileignore 的规则
+    assert _read_tree(dest) == EXPECTED
+    assert result.copied == 3
+    with open(source_hash_cache().path, encoding="utf-8") as f:
+        cached = json.load(f)
+    assert sorted(cached) == sorted(os.path.join(dest, *rel.split("/")) for rel in EXPECTED)
+
+    # 再次暂存时未变化的文件不再写入，多余的文件被删除
+    os.makedirs(os.path.join(dest, "stale"))
+    with open(os.path.join(dest, "stale", "old.c"), "w") as f:
+        f.write("stale")
+    result = ingest_archive(archive_path, dest)
+    assert (result.copied, result.unchanged, result.removed) == (0, 3, 1)
+    assert _read_tree(dest) == EXPECTED
+    assert not os.path.exists(os.path.join(dest, "stale"))
+
+
+def test_tar_without_single_top_directory(tmp_path):
+    archive_path = str(tmp_path / "src.tar")
+    dest = str(tmp_path / "kernel" / "src")
+    # 先假设有顶层目录，读到根下的文件时重新暂存
+    files = {"app_mvcu/" + rel: data for rel, data in FILES.items()}
+    files["README.txt"] = b"hi"
+    _write_tar(archive_path, files, top="")
+    result = ingest_archive(archive_path, dest)
+    assert result.success
+    staged = _read_tree(dest)
+    assert staged["README.txt"] == b"hi"
+    assert staged["app_mvcu/app/main.c"] == FILES["app/main.c"]
+
+
+def test_archive_rejects_unsafe_paths(tmp_path):
+    archive_path = str(tmp_path / "src.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("m.c", b"ok")
+        archive.writestr("../escape.c", b"bad")
+    dest = str(tmp_path / "kernel" / "src")
+    result = ingest_archive(archive_path, dest)
+    assert [name for name, _ in result.failed] == ["../escape.c"]
+    assert not os.path.exists(str(tmp_path / "kernel" / "escape.c"))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""从git版本暂存源码（镜像）"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from file_sync import scan_tree
+from source_git import GitSource
+
+FILES = {
+    "app/main.c": b"int main(void) { return 0; }\n",
+    "app/util.h": b"#define UTIL 1\n",
+    "app/Debug/main.o": b"\x7fELF",
+    "bsw/can.c": b"void can(void) {}\n",
+    "notes.bak": b"old",
+    ".loccompileignore": b"*.bak\n",
+}
+
+EXPECTED = {"app/main.c": FILES["app/main.c"], "app/util.h": FILES["app/util.h"], "bsw/can.c": FILES["bsw/can.c"]}
+
+
+def _read_tree(root):
+    result = {}
+    for rel_path in scan_tree(root):
+        with open(os.path.join(root, *rel_path.split("/")), "rb") as f:
+            result[rel_path] = f.read()
+    return result
+
+
+def _git(repo, *args):
+    subprocess.run(["git", *args], cwd=repo, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("需要git")
+    repo = str(tmp_path / "repo")
+    os.makedirs(repo)
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "test@example.com")
+    _git(repo, "config", "user.name", "test")
+    for rel_path, data in FILES.items():
+        path = os.path.join(repo, "app_mvcu", *rel_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "v1")
+    _git(repo, "tag", "v1")
+    os.remove(os.path.join(repo, "app_mvcu", "bsw", "can.c"))
+    with open(os.path.join(repo, "app_mvcu", "app", "main.c"), "wb") as f:
+        f.write(b"int main(void) { return 1; }\n")
+    _git(repo, "commit", "-q", "-am", "v2")
+    return repo
+
+
+def test_git_mirror(git_repo, tmp_path):
+    dest = str(tmp_path / "kernel" / "src")
+    source = GitSource(os.path.join(git_repo, "app_mvcu"), "v1")
+    result = source.stage(dest)
+    assert result.success
+    assert _read_tree(dest) == EXPECTED
+    assert result.copied == 3
+
+    # 同一版本再次暂存时不读取对象
+    result = source.stage(dest)
+    assert (result.copied, result.unchanged) == (0, 3)
+
+    # 切换到新版本只写入变化的文件，删除的文件从暂存目录中删除
+    result = GitSource(os.path.join(git_repo, "app_mvcu"), "HEAD").stage(dest)
+    assert (result.copied, result.unchanged, result.removed) == (1, 1, 1)
+    assert _read_tree(dest) == {"app/main.c": b"int main(void) { return 1; }\n", "app/util.h": FILES["app/util.h"]}
+    # 工作区的修改不影响暂存的版本
+    with open(os.path.join(git_repo, "app_mvcu", "app", "util.h"), "wb") as f:
+        f.write(b"dirty")
+    GitSource(git_repo, "v1").stage(str(tmp_path / "kernel2" / "src"))
+    assert _read_tree(str(tmp_path / "kernel2" / "src"))["app_mvcu/app/util.h"] == FILES["app/util.h"]
+
+
+def test_git_unknown_ref(git_repo):
+    with pytest.raises(ValueError):
+        GitSource(git_repo, "no-such-branch")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""源码目录监视：轮询后端、去抖合并和inotify不可用时的回退"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import source_watcher
+from ignore_rules import IgnoreRules
+from source_watcher import SourceWatcher, _PollingBackend
+
+POLL_INTERVAL = 0.05
+DEBOUNCE = 0.5
+
+
+def _write(root, rel_path, data="x"):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    return path
+
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / "src"
+    _write(root, "app/main.c", "int main;")
+    _write(root, "app/util.h", "#define A 1")
+    return str(root)
+
+
+class _Batches:
+    """收集回调的各批变化"""
+
+    def __init__(self):
+        self.batches = []
+        self._event = threading.Event()
+
+    def __call__(self, changes):
+        self.batches.append(set(changes))
+        self._event.set()
+
+    def wait(self, timeout=5.0):
+        assert self._event.wait(timeout), "没有收到变化回调"
+        self._event.clear()
+
+
+def _watch(path, on_change, **kwargs):
+    watcher = SourceWatcher(path, on_change, debounce=DEBOUNCE, poll_interval=POLL_INTERVAL,
+                            use_inotify=False, **kwargs)
+    assert watcher.backend.name == "polling"
+    watcher.start()
+    return watcher
+
+
+def test_polling_backend(src):
+    backend = _PollingBackend(src, IgnoreRules(["*.o"]), interval=0)
+    assert backend.read(0) == set()
+    _write(src, "app/main.c", "int main(void);")
+    _write(src, "app/main.o", "obj")
+    _write(src, "lib/new.c", "int n;")
+    os.remove(os.path.join(src, "app", "util.h"))
+    assert backend.read(0) == {"app/main.c", "app/util.h", "lib/new.c"}
+    assert backend.read(0) == set()
+
+
+def test_debounce_coalesces_changes(src):
+    batches = _Batches()
+    watcher = _watch(src, batches)
+    try:
+        # 连续写入的间隔小于去抖时间，合并为一次回调
+        for rel_path in ("app/main.c", "app/new.c", "lib/a.c"):
+            _write(src, rel_path, "changed")
+            time.sleep(DEBOUNCE / 4)
+        batches.wait()
+        assert batches.batches == [{"app/main.c", "app/new.c", "lib/a.c"}]
+
+        # 回调之后的变化作为下一批报告
+        _write(src, "app/util.h", "#define A 2")
+        batches.wait()
+        assert batches.batches[1] == {"app/util.h"}
+    finally:
+        watcher.stop(5)
+
+
+def test_single_file(src):
+    batches = _Batches()
+    watcher = _watch(os.path.join(src, "app", "main.c"), batches)
+    try:
+        _write(src, "app/util.h", "#define A 2")
+        _write(src, "app/main.c", "int main(void);")
+        batches.wait()
+        assert batches.batches == [{"main.c"}]
+    finally:
+        watcher.stop(5)
+
+
+def test_fallback_to_polling(src, monkeypatch):
+    def unavailable(*args):
+        raise OSError(28, "inotify watch limit reached")
+
+    monkeypatch.setattr(source_watcher, "_load_libc", lambda: object())
+    monkeypatch.setattr(source_watcher, "_InotifyBackend", unavailable)
+    assert SourceWatcher(src, lambda changes: None).backend.name == "polling"
+
+    monkeypatch.setattr(source_watcher, "_load_libc", lambda: None)
+    assert SourceWatcher(src, lambda changes: None).backend.name == "polling"
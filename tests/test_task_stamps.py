@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""TaskStamp 判断任务是否需要执行的原因"""
+
+import os
+
+import pytest
+
+import task_stamps
+from task_stamps import TaskStamp
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("v1")
+    return str(path)
+
+
+def test_up_to_date_after_record(output):
+    assert TaskStamp("task", inputs={"a": 1}, outputs=[output]).reason() == "没有戳记记录"
+    TaskStamp("task", inputs={"a": 1}, outputs=[output]).record({"count": 3})
+    stamp = TaskStamp("task", inputs={"a": 1}, outputs=[output])
+    assert stamp.reason() is None
+    assert stamp.details == {"count": 3}
+
+
+def test_input_changed(output):
+    TaskStamp("task", inputs={"a": 1, "b": 2}, outputs=[output]).record()
+    assert TaskStamp("task", inputs={"a": 1, "b": 3}, outputs=[output]).reason() == "输入变化: b"
+    # 新增或减少的输入同样视为变化
+    assert TaskStamp("task", inputs={"a": 1}, outputs=[output]).reason() == "输入变化: b"
+
+
+def test_callable_input_evaluated_once(output):
+    calls = []
+
+    def value():
+        calls.append(1)
+        return "v"
+
+    stamp = TaskStamp("task", inputs={"value": value}, outputs=[output])
+    stamp.reason()
+    stamp.record()
+    assert len(calls) == 1
+    assert TaskStamp("task", inputs={"value": "v"}, outputs=[output]).reason() is None
+
+
+def test_input_path_changed(tmp_path, output):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "m.c").write_text("int a;")
+    TaskStamp("task", input_paths=[str(source)], outputs=[output]).record()
+    assert TaskStamp("task", input_paths=[str(source)], outputs=[output]).reason() is None
+    (source / "n.c").write_text("int b;")
+    assert TaskStamp("task", input_paths=[str(source)], outputs=[output]).reason() == f"输入变化: {source}"
+
+
+def test_output_missing_or_modified(output):
+    TaskStamp("task", outputs=[output]).record()
+    stat = os.stat(output)
+    with open(output, "w") as f:
+        f.write("changed")
+    os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert TaskStamp("task", outputs=[output]).reason() == f"输出已被修改: {output}"
+    os.remove(output)
+    assert TaskStamp("task", outputs=[output]).reason() == f"输出缺失: {output}"
+
+
+def test_outputs_resolved_when_recording(tmp_path):
+    outputs = []
+    stamp = TaskStamp("task", outputs=lambda: outputs)
+    path = tmp_path / "late.bin"
+    path.write_bytes(b"x")
+    outputs.append(str(path))
+    stamp.record()
+    path.unlink()
+    assert TaskStamp("task", outputs=lambda: outputs).reason() == f"输出缺失: {path}"
+
+
+def test_force_and_invalidate(output, monkeypatch):
+    TaskStamp("task", outputs=[output]).record()
+    monkeypatch.setitem(task_stamps._settings, "force", True)
+    assert TaskStamp("task", outputs=[output]).reason() == "强制执行（--force）"
+    monkeypatch.setitem(task_stamps._settings, "force", False)
+    TaskStamp("task", outputs=[output]).invalidate()
+    assert TaskStamp("task", outputs=[output]).reason() == "没有戳记记录"
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""工具链清单、指纹和完整性检查"""
+
+import os
+import shutil
+
+import pytest
+
+from toolchain_fingerprint import (compute_toolchain_manifest, quick_check_toolchains, verify_toolchains,
+                                   write_toolchain_manifest)
+
+PROFILE = ("MSYS-1.0.10-selftest", "1.0", "etc", "profile")
+
+
+def _write(root, *parts, data=b"x"):
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+@pytest.fixture
+def packaged(tmp_path):
+    base = str(tmp_path / "build" / "release")
+    _write(base, "GCC", "bin", "gcc.exe", data=b"gcc" * 100)
+    _write(base, "CW", "lib", "runtime.a", data=b"cw")
+    _write(base, "MSYS-1.0.10-selftest", "1.0", "bin", "sh.exe", data=b"sh")
+    _write(base, *PROFILE, data=b"# profile template\n")
+    write_toolchain_manifest(base)
+    return base
+
+
+def _install(packaged, tmp_path):
+    """复制到另一个目录，并像程序启动时一样按新路径改写profile"""
+    target = str(tmp_path / "users" / "someone" / "loc")
+    shutil.copytree(packaged, target)
+    _write(target, *PROFILE, data=f"cd '{target}/VCU_compile - selftest'\n".encode("utf-8"))
+    return target
+
+
+def test_verify_at_another_path(packaged, tmp_path):
+    target = _install(packaged, tmp_path)
+    assert quick_check_toolchains(target) == []
+    assert verify_toolchains(target) == []
+    # 指纹与安装位置无关，基于它的缓存不会因为换了目录而失效
+    assert compute_toolchain_manifest(target)["fingerprint"] == compute_toolchain_manifest(packaged)["fingerprint"]
+
+
+def test_profile_not_in_manifest(packaged):
+    files = compute_toolchain_manifest(packaged)["toolchains"]["MSYS-1.0.10-selftest"]["files"]
+    assert sorted(files) == ["1.0/bin/sh.exe"]
+
+
+def test_damaged_toolchain_detected(packaged, tmp_path):
+    target = _install(packaged, tmp_path)
+    _write(target, "GCC", "bin", "gcc.exe", data=b"gcc")
+    os.remove(os.path.join(target, "CW", "lib", "runtime.a"))
+    assert sorted(quick_check_toolchains(target)) == ["CW: 缺少 1 个文件，大小不符 0 个文件",
+                                                      "GCC: 缺少 0 个文件，大小不符 1 个文件"]
+    assert sorted(verify_toolchains(target)) == ["CW/lib/runtime.a: 文件缺失", "GCC/bin/gcc.exe: 内容不一致"]
+    assert compute_toolchain_manifest(target)["fingerprint"] != compute_toolchain_manifest(packaged)["fingerprint"]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""工具链包的打包、索引读取和按需解压"""
+
+import os
+
+import pytest
+
+import toolchain_packs
+from toolchain_packs import (PACK_DIR_NAME, build_pack, ensure_extracted, has_pack, load_index,
+                             pack_contains)
+
+NAME = "GCC"
+
+
+def _write(root, rel_path, data):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _read(root, rel_path):
+    with open(os.path.join(str(root), *rel_path.split("/")), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setenv(toolchain_packs.CACHE_ENV_VAR, str(cache))
+    # 进程内的检查记录按包内容区分，不同用例之间不能共用
+    monkeypatch.setattr(toolchain_packs, "_ensured", set())
+    monkeypatch.setattr(toolchain_packs, "_index_cache", {})
+    return str(cache / NAME)
+
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / "src"
+    _write(root, "bin/gcc.exe", b"gcc" * 1000)
+    _write(root, "bin/cc1.exe", b"gcc" * 1000)
+    _write(root, "lib/old/libold.a", b"old lib")
+    _write(root, "include/stdio.h", b"int printf();")
+    os.makedirs(str(root / "share" / "empty"))
+    return str(root)
+
+
+@pytest.fixture
+def base(tmp_path):
+    return str(tmp_path / "release")
+
+
+def _pack(src, base):
+    return build_pack(src, os.path.join(base, PACK_DIR_NAME), NAME)
+
+
+def test_build_and_reuse(src, base, cache):
+    stats = _pack(src, base)
+    # 相同内容的文件只存储一份
+    assert (stats["files"], stats["blobs"], stats["reused"]) == (4, 3, False)
+    assert has_pack(base, NAME)
+    assert _pack(src, base)["reused"]
+
+    index = load_index(base, NAME)
+    assert sorted(index["files"]) == ["bin/cc1.exe", "bin/gcc.exe", "include/stdio.h", "lib/old/libold.a"]
+    assert pack_contains(base, NAME, "bin/gcc.exe")
+    assert pack_contains(base, NAME, "share/empty")
+    assert not pack_contains(base, NAME, "bin/ld.exe")
+    assert not has_pack(base, "CW")
+
+
+def test_lazy_extract(src, base, cache):
+    _pack(src, base)
+    target = ensure_extracted(base, NAME, "bin/gcc.exe")
+    assert target == os.path.join(cache, "bin", "gcc.exe")
+    assert _read(cache, "bin/gcc.exe") == b"gcc" * 1000
+    # 只解压请求的文件
+    assert not os.path.exists(os.path.join(cache, "include"))
+
+    assert ensure_extracted(base, NAME, "include") == os.path.join(cache, "include")
+    assert _read(cache, "include/stdio.h") == b"int printf();"
+    ensure_extracted(base, NAME)
+    assert os.path.isdir(os.path.join(cache, "share", "empty"))
+    assert _read(cache, "lib/old/libold.a") == b"old lib"
+    with pytest.raises(FileNotFoundError):
+        ensure_extracted(base, "CW")
+
+
+def test_repack_updates_cache(src, base, cache, monkeypatch):
+    _pack(src, base)
+    ensure_extracted(base, NAME)
+
+    # 新版本修改、新增并删除了部分文件
+    _write(src, "include/stdio.h", b"int printf(const char *);")
+    _write(src, "lib/libnew.a", b"new lib")
+    os.remove(os.path.join(src, "lib", "old", "libold.a"))
+    os.rmdir(os.path.join(src, "lib", "old"))
+    assert not _pack(src, base)["reused"]
+
+    # 新进程启动时按新索引检查缓存
+    monkeypatch.setattr(toolchain_packs, "_ensured", set())
+    ensure_extracted(base, NAME, "bin")
+    # 只在旧包中存在的文件和目录被删除，即使本次只请求了其他子目录
+    assert not os.path.exists(os.path.join(cache, "lib", "old"))
+    assert os.path.isdir(os.path.join(cache, "share", "empty"))
+
+    ensure_extracted(base, NAME)
+    assert _read(cache, "include/stdio.h") == b"int printf(const char *);"
+    assert _read(cache, "lib/libnew.a") == b"new lib"
+    state = toolchain_packs._load_extracted_state(cache)
+    assert sorted(state) == sorted(load_index(base, NAME)["files"])
+
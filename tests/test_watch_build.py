@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""监视模式：监视器报告的变化交给增量同步"""
+
+import os
+import threading
+
+import pytest
+
+import source_watcher
+from watch_build import WatchBuilder
+
+
+def _write(root, rel_path, data="x"):
+    path = os.path.join(str(root), *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    return path
+
+
+def _read(root, rel_path):
+    with open(os.path.join(str(root), *rel_path.split("/")), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def builder(tmp_path, app_root, monkeypatch):
+    src = tmp_path / "mvcu_src"
+    _write(src, "app/main.c", "int main;")
+    _write(src, "app/util.h", "#define A 1")
+    _write(src, ".loccompileignore", "Debug/\n")
+    # 不依赖inotify，使用轮询后端
+    monkeypatch.setattr(source_watcher, "_load_libc", lambda: None)
+    builder = WatchBuilder(str(src), "m", log=lambda message: None)
+    stats = {}
+    assert builder._stage(None, stats)[:2] == (True, True)
+    return builder
+
+
+def test_stage_changed_paths(builder):
+    src, dest = builder.source_path, builder.dest_folder
+    assert _read(dest, "app/main.c") == "int main;"
+
+    _write(src, "app/main.c", "int main(void);")
+    _write(src, "lib/new.c", "int n;")
+    _write(src, "lib/Debug/lib.elf", "elf")
+    os.remove(os.path.join(src, "app", "util.h"))
+    stats = {}
+    staged, modified, _ = builder._stage({"app/main.c", "app/util.h", "lib"}, stats)
+    assert (staged, modified) == (True, True)
+    assert _read(dest, "app/main.c") == "int main(void);"
+    assert _read(dest, "lib/new.c") == "int n;"
+    assert not os.path.exists(os.path.join(dest, "app", "util.h"))
+    # 同步变化的子目录时 .loccompileignore 中的规则同样适用
+    assert not os.path.exists(os.path.join(dest, "lib", "Debug"))
+    assert stats["skipped_files"] == 1
+
+    # 报告的文件内容没有变化时不需要编译
+    assert builder._stage({"app/main.c"}, {})[:2] == (True, False)
+
+
+def test_watcher_hands_changes_to_sync(builder, monkeypatch):
+    batches = []
+    received = threading.Event()
+
+    def build(changes=None):
+        batches.append(set(changes))
+        builder._stage(changes, {})
+        received.set()
+
+    monkeypatch.setattr(builder, "build", build)
+    watcher = builder.create_watcher(debounce=0.3, poll_interval=0.05)
+    assert watcher.backend.name == "polling"
+    watcher.start()
+    try:
+        _write(builder.source_path, "app/main.c", "int main(void);")
+        _write(builder.source_path, "lib/new.c", "int n;")
+        _write(builder.source_path, "Debug/app.elf", "elf")
+        assert received.wait(5), "没有收到变化回调"
+    finally:
+        builder.stop()
+        watcher.stop(5)
+
+    # 被忽略的文件不报告，增量同步后暂存目录与源码一致
+    assert batches == [{"app/main.c", "lib/new.c"}]
+    assert _read(builder.dest_folder, "app/main.c") == "int main(void);"
+    assert _read(builder.dest_folder, "lib/new.c") == "int n;"
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+工具链指纹和完整性校验
+并行计算工具链目录中各文件的SHA-256，按 (大小, 修改时间) 缓存到状态目录，重复计算几乎不需要读文件。
+得到的指纹作为工具链的稳定标识供各类缓存使用；打包时生成的清单随release发布，用于校验工具链是否完整。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from file_sync import hash_file, scan_tree
+from ignore_rules import IgnoreRules, default_ignore_rules
+from path_utils import get_resource_path, get_state_path
+
+TOOLCHAIN_NAMES = ("GCC", "CW", "MSYS-1.0.10-selftest")
+
+# 随release发布的工具链清单，放在exe所在目录
+MANIFEST_NAME = "toolchain_manifest.json"
+MANIFEST_VERSION = 1
+
+# 程序按安装路径生成的文件（update_msys_profile 改写的MSYS profile），相对于资源目录。
+# 它们的内容随安装位置变化，不计入清单和指纹，也不参与完整性检查
+GENERATED_PATTERNS = ["/MSYS-*/1.0/etc/profile"]
+GENERATED_RULES = IgnoreRules(GENERATED_PATTERNS)
+
+# 状态目录中的文件哈希缓存
+HASH_CACHE_NAME = "toolchain_hashes.json"
+# 暂存源码的文件哈希缓存，与工具链分开，源码删除的文件不会使工具链缓存无限增长
+SOURCE_HASH_CACHE_NAME = "source_hashes.json"
+
+_fingerprint_lock = threading.Lock()
+_fingerprint_cache: Dict[str, str] = {}
+
+
+def _default_workers() -> int:
+    return min(16, (os.cpu_count() or 4) * 2)
+
+
+class FileHashCache:
+    """按绝对路径记录 [大小, 修改时间ns, sha256] 的哈希缓存"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_state_path(HASH_CACHE_NAME)
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries: Dict[str, list] = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, full_path: str, size: int, mtime_ns: int) -> Optional[str]:
+        entry = self._entries.get(full_path)
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, full_path: str, size: int, mtime_ns: int, digest: str):
+        self._entries[full_path] = [size, mtime_ns, digest]
+        self._dirty = True
+
+    def prune(self, root: str, keep: Iterable[str]) -> int:
+        """删除 root 目录下不在 keep（绝对路径）中的记录，返回删除的数量"""
+        prefix = os.path.join(root, "")
+        keep = set(keep)
+        stale = [path for path in self._entries if path.startswith(prefix) and path not in keep]
+        for path in stale:
+            del self._entries[path]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def save(self):
+        if not self._dirty:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"警告: 保存文件哈希缓存失败: {e}")
+
+
+def source_hash_cache() -> FileHashCache:
+    """暂存源码使用的哈希缓存"""
+    return FileHashCache(get_state_path(SOURCE_HASH_CACHE_NAME))
+
+
+def _digest_files(files: Dict[str, list]) -> str:
+    digest = hashlib.sha256()
+    for rel_path in sorted(files):
+        digest.update(f"{rel_path}|{files[rel_path][0]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_generated(name: str, rel_path: str) -> bool:
+    return GENERATED_RULES.match(f"{name}/{rel_path}")
+
+
+def hash_toolchain(base_dir: str, name: str, cache: Optional[FileHashCache] = None,
+                   workers: Optional[int] = None) -> Optional[Dict[str, list]]:
+    """计算一个工具链中所有文件的 {相对路径: [sha256, 大小]}
+
+    工具链目录不存在但以压缩包形式提供时直接使用包索引中记录的哈希；都不存在时返回None。
+    与打包一致，默认忽略规则排除的文件（日志、临时文件等）不参与计算，程序生成的文件（GENERATED_RULES）也不参与。
+    """
+    root = os.path.join(base_dir, name)
+    if not os.path.isdir(root):
+        import toolchain_packs
+        index = toolchain_packs.load_index(base_dir, name)
+        if index is None:
+            return None
+        blobs = index["blobs"]
+        return {rel: [digest, blobs[digest][2]] for rel, (digest, _) in index["files"].items()
+                if not _is_generated(name, rel)}
+
+    stats = scan_tree(root, default_ignore_rules().copytree_ignore(root))
+    result: Dict[str, list] = {}
+    pending = []
+    for rel_path, (size, mtime_ns) in stats.items():
+        if _is_generated(name, rel_path):
+            continue
+        full_path = os.path.join(root, *rel_path.split('/'))
+        digest = cache.get(full_path, size, mtime_ns) if cache else None
+        if digest is None:
+            pending.append((rel_path, full_path, size, mtime_ns))
+        else:
+            result[rel_path] = [digest, size]
+
+    if pending:
+        # 文件读取和hashlib都会释放GIL，线程池即可并行
+        with ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+            digests = executor.map(lambda item: hash_file(item[1]), pending)
+            for (rel_path, full_path, size, mtime_ns), digest in zip(pending, digests):
+                result[rel_path] = [digest, size]
+                if cache:
+                    cache.put(full_path, size, mtime_ns, digest)
+    return result
+
+
+def compute_toolchain_manifest(base_dir: Optional[str] = None, names: Iterable[str] = TOOLCHAIN_NAMES,
+                               use_cache: bool = True, workers: Optional[int] = None) -> dict:
+    """计算各工具链的文件清单、摘要和总指纹
+
+    Returns:
+        {"version", "fingerprint", "toolchains": {名称: {"digest", "files"}}}，缺失的工具链不出现在结果中
+    """
+    base_dir = base_dir or get_resource_path()
+    cache = FileHashCache() if use_cache else None
+    toolchains = {}
+    for name in names:
+        files = hash_toolchain(base_dir, name, cache, workers)
+        if files is not None:
+            toolchains[name] = {"digest": _digest_files(files), "files": files}
+    if cache:
+        cache.save()
+
+    fingerprint = hashlib.sha256()
+    for name in sorted(toolchains):
+        fingerprint.update(f"{name}={toolchains[name]['digest']}\n".encode('utf-8'))
+    return {
+        "version": MANIFEST_VERSION,
+        "fingerprint": fingerprint.hexdigest(),
+        "toolchains": toolchains,
+    }
+
+
+def get_toolchain_fingerprint(base_dir: Optional[str] = None) -> str:
+    """获取工具链指纹，同一进程内只计算一次，用作编译缓存和结果缓存键的一部分"""
+    base_dir = base_dir or get_resource_path()
+    with _fingerprint_lock:
+        fingerprint = _fingerprint_cache.get(base_dir)
+        if fingerprint is None:
+            fingerprint = compute_toolchain_manifest(base_dir)["fingerprint"]
+            _fingerprint_cache[base_dir] = fingerprint
+    return fingerprint
+
+
+def write_toolchain_manifest(base_dir: str, names: Iterable[str] = TOOLCHAIN_NAMES) -> dict:
+    """为目录中的工具链生成清单文件（打包时调用）"""
+    manifest = compute_toolchain_manifest(base_dir, names)
+    manifest_path = os.path.join(base_dir, MANIFEST_NAME)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(",", ":"), sort_keys=True)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+def load_toolchain_manifest(base_dir: Optional[str] = None) -> Optional[dict]:
+    """读取随release发布的工具链清单，不存在时返回None"""
+    manifest_path = os.path.join(base_dir or get_resource_path(), MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def quick_check_toolchains(base_dir: Optional[str] = None) -> List[str]:
+    """只比较文件是否存在和大小，快速发现复制不完整的工具链（不读取文件内容）
+
+    Returns:
+        问题描述列表，没有清单时返回空列表
+    """
+    base_dir = base_dir or get_resource_path()
+    manifest = load_toolchain_manifest(base_dir)
+    if manifest is None:
+        return []
+    problems = []
+    for name, toolchain in manifest["toolchains"].items():
+        root = os.path.join(base_dir, name)
+        if not os.path.isdir(root):
+            # 压缩包形式的工具链解压时会逐文件校验哈希
+            continue
+        missing = 0
+        truncated = 0
+        for rel_path, (_, size) in toolchain["files"].items():
+            if _is_generated(name, rel_path):
+                # 旧版本生成的清单中包含这些文件
+                continue
+            try:
+                if os.path.getsize(os.path.join(root, *rel_path.split('/'))) != size:
+                    truncated += 1
+            except OSError:
+                missing += 1
+        if missing or truncated:
+            problems.append(f"{name}: 缺少 {missing} 个文件，大小不符 {truncated} 个文件")
+    return problems
+
+
+def verify_toolchains(base_dir: Optional[str] = None, use_cache: bool = True) -> List[str]:
+    """按随release发布的清单校验工具链文件的哈希
+
+    Args:
+        use_cache: 大小和修改时间未变的文件使用缓存的哈希；False时重新读取所有文件
+
+    Returns:
+        问题描述列表，为空表示校验通过
+    """
+    base_dir = base_dir or get_resource_path()
+    manifest = load_toolchain_manifest(base_dir)
+    if manifest is None:
+        return [f"找不到工具链清单: {os.path.join(base_dir, MANIFEST_NAME)}"]
+
+    actual = compute_toolchain_manifest(base_dir, manifest["toolchains"], use_cache=use_cache)
+    problems = []
+    for name, expected in manifest["toolchains"].items():
+        current = actual["toolchains"].get(name)
+        if current is None:
+            problems.append(f"{name}: 工具链不存在")
+            continue
+        if current["digest"] == expected["digest"]:
+            continue
+        files = current["files"]
+        for rel_path, (digest, _) in sorted(expected["files"].items()):
+            if _is_generated(name, rel_path):
+                continue
+            if rel_path not in files:
+                problems.append(f"{name}/{rel_path}: 文件缺失")
+            elif files[rel_path][0] != digest:
+                problems.append(f"{name}/{rel_path}: 内容不一致")
+        for rel_path in sorted(set(files) - set(expected["files"])):
+            problems.append(f"{name}/{rel_path}: 清单之外的文件")
+    return problems
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+压缩的工具链包
+打包时把工具链目录压缩为按内容寻址的包文件和逐文件索引；运行时按需把用到的子目录/文件
+解压到持久缓存，之后的启动直接复用缓存
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+# 包文件放在exe所在目录的子目录中
+PACK_DIR_NAME = "packs"
+PACK_SUFFIX = ".lcpack"
+INDEX_SUFFIX = ".lcidx.json"
+INDEX_VERSION = 1
+
+# 缓存目录中记录已解压文件哈希的状态文件
+EXTRACTED_STATE_NAME = ".extracted.json"
+
+# 通过环境变量指定解压缓存目录
+CACHE_ENV_VAR = "LOC_COMPILE_PACK_CACHE"
+
+_lock = threading.Lock()
+_index_cache: Dict[str, dict] = {}
+_ensured: Set[tuple] = set()
+
+
+def pack_paths(base_dir: str, name: str):
+    """返回 (包文件路径, 索引文件路径)"""
+    pack_dir = os.path.join(base_dir, PACK_DIR_NAME)
+    return os.path.join(pack_dir, name + PACK_SUFFIX), os.path.join(pack_dir, name + INDEX_SUFFIX)
+
+
+def has_pack(base_dir: str, name: str) -> bool:
+    """判断工具链是否以压缩包形式提供"""
+    pack_path, index_path = pack_paths(base_dir, name)
+    return os.path.isfile(index_path) and os.path.isfile(pack_path)
+
+
+def get_cache_root() -> str:
+    """解压缓存的根目录"""
+    override = os.environ.get(CACHE_ENV_VAR)
+    if override:
+        return override
+    local_appdata = os.environ.get("LOCALAPPDATA")
+    if local_appdata:
+        return os.path.join(local_appdata, "LOC_COMPILE", "toolchains")
+    return os.path.join(os.path.expanduser("~"), ".cache", "loc_compile", "toolchains")
+
+
+def load_index(base_dir: str, name: str) -> Optional[dict]:
+    """读取并缓存包索引"""
+    _, index_path = pack_paths(base_dir, name)
+    try:
+        mtime = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return None
+    key = f"{index_path}|{mtime}"
+    index = _index_cache.get(key)
+    if index is None:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            return None
+        _index_cache[key] = index
+    return index
+
+
+def build_pack(src_dir: str, out_dir: str, name: str,
+               ignore: Optional[Callable[[str, List[str]], Iterable[str]]] = None,
+               level: int = 6) -> dict:
+    """把工具链目录压缩为按内容寻址的包
+
+    相同内容的文件只存储一份。源目录的 (大小, 修改时间) 与上次打包一致时直接复用已有的包。
+
+    Args:
+        src_dir: 工具链源目录
+        out_dir: 输出目录（通常为 release/packs）
+        name: 工具链名称，如 "GCC"
+        ignore: copytree风格的忽略函数
+        level: zlib压缩级别
+
+    Returns:
+        统计信息: files, blobs, raw_bytes, packed_bytes, reused
+    """
+    # 延迟导入，运行时解压路径不依赖同步模块
+    from file_sync import scan_tree
+
+    os.makedirs(out_dir, exist_ok=True)
+    pack_path = os.path.join(out_dir, name + PACK_SUFFIX)
+    index_path = os.path.join(out_dir, name + INDEX_SUFFIX)
+
+    dirs: Set[str] = set()
+    source_stats = scan_tree(src_dir, ignore, dirs=dirs)
+    source_record = {rel: list(stat) for rel, stat in source_stats.items()}
+
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if (previous.get("version") == INDEX_VERSION and previous.get("source") == source_record
+                and os.path.isfile(pack_path)):
+            return dict(previous["stats"], reused=True)
+    except (OSError, ValueError):
+        pass
+
+    blobs: Dict[str, list] = {}
+    files: Dict[str, list] = {}
+    raw_bytes = 0
+    temp_pack = pack_path + ".tmp"
+    with open(temp_pack, 'wb') as out:
+        for rel_path in sorted(source_stats):
+            full_path = os.path.join(src_dir, *rel_path.split('/'))
+            with open(full_path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            mode = os.stat(full_path).st_mode & 0o777
+            files[rel_path] = [digest, mode]
+            raw_bytes += len(data)
+            if digest in blobs:
+                continue
+            compressed = zlib.compress(data, level)
+            blobs[digest] = [out.tell(), len(compressed), len(data)]
+            out.write(compressed)
+        packed_bytes = out.tell()
+
+    stats = {
+        "files": len(files),
+        "blobs": len(blobs),
+        "raw_bytes": raw_bytes,
+        "packed_bytes": packed_bytes,
+    }
+    index = {
+        "version": INDEX_VERSION,
+        "name": name,
+        "files": files,
+        "dirs": sorted(dirs),
+        "blobs": blobs,
+        "source": source_record,
+        "stats": stats,
+    }
+    index_blob = json.dumps(index, separators=(",", ":"), sort_keys=True)
+    index["pack_id"] = hashlib.sha256(index_blob.encode("utf-8")).hexdigest()[:16]
+
+    os.replace(temp_pack, pack_path)
+    temp_index = index_path + ".tmp"
+    with open(temp_index, 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(temp_index, index_path)
+    return dict(stats, reused=False)
+
+
+def pack_contains(base_dir: str, name: str, rel_path: str = "") -> bool:
+    """判断包中是否存在指定的文件或目录（不解压）"""
+    index = load_index(base_dir, name)
+    if index is None:
+        return False
+    rel_path = rel_path.strip('/')
+    if not rel_path or rel_path in index["files"] or rel_path in index["dirs"]:
+        return True
+    return False
+
+
+def _load_extracted_state(target_root: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(target_root, EXTRACTED_STATE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_extracted_state(target_root: str, state: Dict[str, str]):
+    state_path = os.path.join(target_root, EXTRACTED_STATE_NAME)
+    temp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(temp_path, state_path)
+
+
+def _remove_stale(target_root: str, state: Dict[str, str], files: Dict[str, list], dirs: Set[str]) -> bool:
+    """删除缓存中由旧包解压、当前包中已不存在的文件，返回是否有删除"""
+    stale = [path for path in state if path not in files]
+    for path in stale:
+        try:
+            os.remove(os.path.join(target_root, *path.split('/')))
+        except FileNotFoundError:
+            pass
+        del state[path]
+        # 向上清理变空且当前包中也不存在的目录
+        parent = path.rpartition('/')[0]
+        while parent and parent not in dirs:
+            try:
+                os.rmdir(os.path.join(target_root, *parent.split('/')))
+            except OSError:
+                break
+            parent = parent.rpartition('/')[0]
+    return bool(stale)
+
+
+def ensure_extracted(base_dir: str, name: str, rel_path: str = "") -> str:
+    """确保包中的某个文件或子目录已解压到缓存，返回其在缓存中的路径
+
+    只解压缓存中缺失或内容已变化（哈希不同）的文件，同一进程内对同一路径只检查一次。
+    包更新后，由旧包解压而当前包中已不存在的文件会从缓存中删除。
+
+    Args:
+        base_dir: 包所在的基础目录（exe所在目录）
+        name: 工具链名称
+        rel_path: 工具链内的相对路径，空字符串表示整个工具链
+    """
+    index = load_index(base_dir, name)
+    if index is None:
+        raise FileNotFoundError(f"工具链包不存在: {name}")
+
+    rel_path = rel_path.replace('\\', '/').strip('/')
+    target_root = os.path.join(get_cache_root(), name)
+    target = os.path.normpath(os.path.join(target_root, *rel_path.split('/'))) if rel_path else target_root
+
+    key = (index["pack_id"], name, rel_path)
+    if key in _ensured:
+        return target
+
+    with _lock:
+        if key in _ensured:
+            return target
+        os.makedirs(target_root, exist_ok=True)
+        state = _load_extracted_state(target_root)
+
+        files = index["files"]
+        if _remove_stale(target_root, state, files, set(index["dirs"])):
+            _save_extracted_state(target_root, state)
+
+        if rel_path in files:
+            wanted = [rel_path]
+        else:
+            prefix = rel_path + '/' if rel_path else ''
+            wanted = [path for path in files if path.startswith(prefix)]
+            for rel_dir in index["dirs"]:
+                if rel_dir == rel_path or rel_dir.startswith(prefix):
+                    os.makedirs(os.path.join(target_root, *rel_dir.split('/')), exist_ok=True)
+
+        pending = [path for path in wanted
+                   if state.get(path) != files[path][0]
+                   or not os.path.isfile(os.path.join(target_root, *path.split('/')))]
+        if pending:
+            pack_path, _ = pack_paths(base_dir, name)
+            blobs = index["blobs"]
+            with open(pack_path, 'rb') as pack:
+                for path in sorted(pending, key=lambda p: blobs[files[p][0]][0]):
+                    digest, mode = files[path]
+                    offset, length, size = blobs[digest]
+                    pack.seek(offset)
+                    data = zlib.decompress(pack.read(length))
+                    if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+                        raise IOError(f"工具链包已损坏: {name}/{path}")
+
+                    dest = os.path.join(target_root, *path.split('/'))
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    temp_dest = f"{dest}.{os.getpid()}.tmp"
+                    with open(temp_dest, 'wb') as f:
+                        f.write(data)
+                    os.chmod(temp_dest, mode or 0o644)
+                    os.replace(temp_dest, dest)
+                    state[path] = digest
+            _save_extracted_state(target_root, state)
+
+        _ensured.add(key)
+    return target
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tk主循环延迟监视器
+通过周期性的 after 心跳测量事件循环延迟，卡顿超过阈值时采样主线程调用栈并写入卡顿报告
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 通过环境变量开启监视器，值为卡顿阈值（毫秒），例如 LOC_COMPILE_UI_WATCHDOG=300
+WATCHDOG_ENV_VAR = "LOC_COMPILE_UI_WATCHDOG"
+
+DEFAULT_THRESHOLD_MS = 300
+DEFAULT_HEARTBEAT_MS = 100
+DEFAULT_SAMPLE_MS = 50
+
+# 报告中每次卡顿最多输出的不同调用栈数量
+MAX_STACKS_PER_STALL = 5
+
+
+def threshold_from_environment() -> Optional[int]:
+    """从环境变量读取卡顿阈值，未设置或非法时返回None（即不开启）"""
+    value = os.environ.get(WATCHDOG_ENV_VAR, "").strip()
+    if not value:
+        return None
+    if value.lower() in ("1", "on", "true", "yes"):
+        return DEFAULT_THRESHOLD_MS
+    try:
+        threshold = int(value)
+    except ValueError:
+        logger.warning(f"无效的{WATCHDOG_ENV_VAR}值: {value}")
+        return None
+    return threshold if threshold > 0 else None
+
+
+class TkLatencyWatchdog:
+    """Tk事件循环延迟监视器
+
+    主线程只执行一个极轻的 after 心跳回调；后台线程检查心跳是否超时，
+    超时期间按固定间隔采样主线程调用栈，卡顿结束后把采样结果汇总写入报告。
+    """
+
+    def __init__(self, root, report_path: str, threshold_ms: int = DEFAULT_THRESHOLD_MS,
+                 heartbeat_ms: int = DEFAULT_HEARTBEAT_MS, sample_ms: int = DEFAULT_SAMPLE_MS):
+        """
+        Args:
+            root: Tk根窗口实例
+            report_path: 卡顿报告文件路径（追加写入）
+            threshold_ms: 判定为卡顿的额外延迟阈值
+            heartbeat_ms: 心跳间隔
+            sample_ms: 卡顿期间的调用栈采样间隔
+        """
+        self.root = root
+        self.report_path = report_path
+        self.threshold = threshold_ms / 1000.0
+        self.heartbeat_ms = heartbeat_ms
+        self.sample_interval = sample_ms / 1000.0
+
+        self.stall_count = 0
+        self.max_latency = 0.0
+
+        self._last_beat = 0.0
+        self._after_id = None
+        self._main_ident = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动监视器，必须在运行Tk主循环的线程中调用"""
+        if self.running:
+            return
+        self._main_ident = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop_event.clear()
+        self._after_id = self.root.after(self.heartbeat_ms, self._beat)
+        self._thread = threading.Thread(target=self._monitor, name="TkLatencyWatchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"UI卡顿监视器已启动，阈值 {int(self.threshold * 1000)} ms，报告: {self.report_path}")
+
+    def stop(self):
+        """停止监视器"""
+        self._stop_event.set()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _beat(self):
+        """心跳回调：只记录时间戳并重新调度"""
+        self._last_beat = time.perf_counter()
+        if not self._stop_event.is_set():
+            self._after_id = self.root.after(self.heartbeat_ms, self._beat)
+
+    def _monitor(self):
+        """后台线程：检测心跳延迟并在卡顿期间采样主线程调用栈"""
+        interval = self.heartbeat_ms / 1000.0
+        stall_beat = None
+        stall_started_at = None
+        samples: Counter = Counter()
+        sample_count = 0
+
+        while not self._stop_event.wait(self.sample_interval):
+            last_beat = self._last_beat
+            lag = time.perf_counter() - last_beat - interval
+
+            if stall_beat is not None and last_beat != stall_beat:
+                # 心跳已恢复，结束本次卡顿
+                duration = last_beat - stall_beat - interval
+                self._record_stall(stall_started_at, duration, samples, sample_count)
+                stall_beat = None
+                samples = Counter()
+                sample_count = 0
+                continue
+
+            if lag < self.threshold:
+                continue
+
+            if stall_beat is None:
+                stall_beat = last_beat
+                stall_started_at = datetime.now()
+
+            stack = self._sample_main_stack()
+            if stack:
+                samples[stack] += 1
+                sample_count += 1
+
+    def _sample_main_stack(self) -> Optional[Tuple[str, ...]]:
+        """采样主线程当前调用栈"""
+        frame = sys._current_frames().get(self._main_ident)
+        if frame is None:
+            return None
+        return tuple(
+            f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}"
+            for entry in traceback.extract_stack(frame)
+        )
+
+    def _record_stall(self, started_at: datetime, duration: float, samples: Counter, sample_count: int):
+        """把一次卡顿的汇总信息写入报告"""
+        self.stall_count += 1
+        self.max_latency = max(self.max_latency, duration)
+        logger.warning(f"检测到UI卡顿: {duration * 1000:.0f} ms")
+
+        lines = [
+            f"=== UI卡顿 #{self.stall_count} 开始于 {started_at.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} "
+            f"持续 {duration * 1000:.0f} ms，采样 {sample_count} 次 ==="
+        ]
+        for stack, count in samples.most_common(MAX_STACKS_PER_STALL):
+            lines.append(f"--- {count}/{sample_count} 次采样 ---")
+            lines.extend(f"    {entry}" for entry in stack)
+        lines.append("")
+
+        try:
+            os.makedirs(os.path.dirname(self.report_path) or ".", exist_ok=True)
+            with open(self.report_path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.error(f"写入UI卡顿报告失败: {e}")
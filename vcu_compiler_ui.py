@@ -7,8 +7,6 @@ VCU编译器图形界面
 
 import os
 import sys
-import subprocess
-import shutil
 import tkinter as tk
 from pathlib import Path
 from tkinter import filedialog, messagebox, ttk, scrolledtext
@@ -23,14 +21,54 @@ logger = logging.getLogger(__name__)
 
 # 导入工具模块
 try:
-    from path_utils import get_application_path, get_resource_path
+    from path_utils import get_application_path, get_resource_path, get_state_path
 except ImportError:
     logger.warning("path_utils模块导入失败，使用默认实现")
     def get_application_path():
         return os.path.dirname(os.path.abspath(__file__))
     
-    def get_resource_path():
-        return get_application_path()
+    def get_resource_path(*path_parts):
+        return os.path.join(get_application_path(), *path_parts)
+    
+    def get_state_path(*path_parts):
+        return os.path.join(get_application_path(), *path_parts)
+
+try:
+    from ui_watchdog import TkLatencyWatchdog, threshold_from_environment
+except ImportError:
+    TkLatencyWatchdog = None
+    threshold_from_environment = lambda: None
+
+from pipeline import PipelineScheduler
+from source_archive import archive_stem, detect_vcu_type, is_archive
+from source_staging import find_c_modules, launch_msys, stage_sources, staged_source_path
+
+try:
+    from pipeline_profiler import PipelineProfiler
+except ImportError:
+    PipelineProfiler = None
+
+try:
+    from staging_prefetch import StagingPrefetch
+except ImportError:
+    StagingPrefetch = None
+
+try:
+    from watch_build import WatchBuilder
+except ImportError:
+    WatchBuilder = None
+
+try:
+    from build_run import BuildRun, compile_stamp, record_inputs
+    from build_history import record_run
+except ImportError:
+    logger.warning("编译历史模块导入失败，本次运行不记录编译历史")
+    BuildRun = None
+
+try:
+    from build_products import prune_stale_products
+except ImportError:
+    prune_stale_products = None
 
 
 class ModuleImporter:
@@ -118,7 +156,7 @@ class ModuleImporter:
     
     def _use_backup_functions(self):
         """使用备用函数实现"""
-        def check_modules_in_makefile(vcu_type):
+        def check_modules_in_makefile(vcu_type, modules=None):
             logger.info(f"执行基本的模块检查 (VCU类型: {vcu_type})")
             return True
         
@@ -143,6 +181,10 @@ class VcuCompilerUI:
     WINDOW_TITLE = "VCU编译器 v2.0"
     WINDOW_SIZE = "800x600"
     MIN_WINDOW_SIZE = (600, 500)
+    # 源路径输入停顿多久后开始预先准备（毫秒）
+    PREFETCH_DELAY_MS = 400
+    # 等待被取消的预先准备结束时的检查间隔
+    PREFETCH_POLL_MS = 100
     
     # VCU类型映射
     VCU_TYPES = {
@@ -159,7 +201,8 @@ class VcuCompilerUI:
     }
     
     def __init__(self, root: tk.Tk, update_path_function: Optional[Callable] = None, 
-                 mvcu_path: Optional[str] = None, svcu_path: Optional[str] = None):
+                 mvcu_path: Optional[str] = None, svcu_path: Optional[str] = None,
+                 watchdog_threshold_ms: Optional[int] = None, profile: bool = False, watch: bool = False):
         """
         初始化VCU编译器界面
         
@@ -168,12 +211,23 @@ class VcuCompilerUI:
             update_path_function: 更新makefile路径的回调函数
             mvcu_path: MSYS环境下MVCU的编译路径
             svcu_path: MSYS环境下SVCU的编译路径
+            watchdog_threshold_ms: UI卡顿监视阈值（毫秒），为None时读取环境变量，默认不开启
+            profile: “性能分析”选项的初始状态
+            watch: “监视变化”选项的初始状态
         """
         self.root = root
         self.update_path_function = update_path_function
         self.mvcu_path = mvcu_path
         self.svcu_path = svcu_path
         self.current_vcu_type = None
+        self.profile_var = tk.BooleanVar(value=profile and PipelineProfiler is not None)
+        self.watch_var = tk.BooleanVar(value=watch and WatchBuilder is not None)
+        self.watch_builder = None
+        # 选择源路径后在后台预先暂存、计算哈希和检查模块
+        self.prefetch = None
+        self._prefetch_job = None
+        # 已取消但后台线程尚未结束的预先准备，结束前不开始新的预先准备
+        self._cancelled_prefetch = None
         
         # 导入必要的函数
         self.importer = ModuleImporter()
@@ -183,11 +237,25 @@ class VcuCompilerUI:
         self._setup_styles()
         self._create_widgets()
         self._initialize_logging()
+        self._start_watchdog(watchdog_threshold_ms)
         
         # 自动更新路径
         if self.update_path_function:
             self.root.after(500, self.update_compiler_paths)
     
+    def _start_watchdog(self, threshold_ms: Optional[int]):
+        """按需启动UI卡顿监视器"""
+        self.watchdog = None
+        if threshold_ms is None:
+            threshold_ms = threshold_from_environment()
+        if not threshold_ms or TkLatencyWatchdog is None:
+            return
+        
+        report_path = get_state_path("ui_stalls.log")
+        self.watchdog = TkLatencyWatchdog(self.root, report_path, threshold_ms=threshold_ms)
+        self.watchdog.start()
+        self._log(f"UI卡顿监视已开启 (阈值 {threshold_ms} ms)，报告: {report_path}", "debug")
+    
     def _setup_window(self):
         """配置主窗口"""
         self.root.title(self.WINDOW_TITLE)
@@ -247,6 +315,7 @@ class VcuCompilerUI:
         ttk.Label(path_frame, text="源路径:").grid(row=0, column=0, padx=5, sticky="w")
         
         self.path_var = tk.StringVar()
+        self.path_var.trace_add("write", self._on_path_changed)
         path_entry = ttk.Entry(path_frame, textvariable=self.path_var)
         path_entry.grid(row=0, column=1, padx=5, sticky="ew")
         
@@ -357,6 +426,19 @@ class VcuCompilerUI:
         exit_btn = ttk.Button(btn_frame, text="退出", command=self.root.destroy)
         exit_btn.grid(row=0, column=0, padx=5)
         
+        # 性能分析选项：编译流程在cProfile下运行，报告写到编译输出目录
+        profile_check = ttk.Checkbutton(btn_frame, text="性能分析", variable=self.profile_var)
+        if PipelineProfiler is None:
+            profile_check.state(["disabled"])
+        profile_check.grid(row=0, column=2, padx=5)
+        
+        # 监视变化选项：编译后继续监视源路径，文件变化时只同步变化的文件并自动增量编译
+        watch_check = ttk.Checkbutton(btn_frame, text="监视变化", variable=self.watch_var,
+                                      command=self._toggle_watch)
+        if WatchBuilder is None:
+            watch_check.state(["disabled"])
+        watch_check.grid(row=0, column=3, padx=5)
+        
         # 编译按钮
         self.compile_btn = ttk.Button(
             btn_frame, 
@@ -427,7 +509,8 @@ class VcuCompilerUI:
         if not path:
             path = filedialog.askopenfilename(
                 title="选择源文件",
-                filetypes=[("所有文件", "*.*"), ("C文件", "*.c"), ("头文件", "*.h")]
+                filetypes=[("所有文件", "*.*"), ("源码压缩包", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz"),
+                           ("C文件", "*.c"), ("头文件", "*.h")]
             )
         
         if path:
@@ -437,18 +520,72 @@ class VcuCompilerUI:
             # 自动检测VCU类型
             self._detect_vcu_type(path)
     
+    def _on_path_changed(self, *_):
+        """源路径改变：取消正在进行的预先准备，输入停顿后为新路径重新开始"""
+        if self.prefetch is not None:
+            self.prefetch.cancel()
+            self._cancelled_prefetch = self.prefetch
+            self.prefetch = None
+        if self._prefetch_job is not None:
+            self.root.after_cancel(self._prefetch_job)
+        self._prefetch_job = self.root.after(self.PREFETCH_DELAY_MS, self._start_prefetch)
+    
+    def _start_prefetch(self):
+        """在后台预先完成编译准备（编译或监视进行中时不启动，以免同时写入src目录）"""
+        self._prefetch_job = None
+        source_path = self.path_var.get().strip()
+        if StagingPrefetch is None or not source_path or not Path(source_path).exists():
+            return
+        if str(self.compile_btn["state"]) == tk.DISABLED:
+            return
+        vcu_code = self._get_vcu_code(source_path)
+        if not vcu_code:
+            return
+        previous = self._cancelled_prefetch
+        if previous is not None:
+            if previous.running:
+                # 被取消的线程可能仍在写入src目录，不在界面线程中等待，稍后再检查
+                self._prefetch_job = self.root.after(self.PREFETCH_POLL_MS, self._start_prefetch)
+                return
+            self._cancelled_prefetch = None
+        
+        folder_name = "dev_kernel_mvcu" if vcu_code == "m" else "dev_kernel_svcu"
+        dest_folder = Path(get_application_path()) / "VCU_compile - selftest" / folder_name / "src"
+        self.prefetch = StagingPrefetch(source_path, vcu_code, str(dest_folder),
+                                        check_modules=self.importer.check_modules_in_makefile,
+                                        log=lambda message: self._log(message, "debug"))
+        self.prefetch.start()
+        self._log("后台预先暂存源码并检查模块...", "debug")
+    
+    def _wait_for_prefetch(self, source_path: str):
+        """编译开始前（在编译线程中调用）：同一路径的预先准备等待其完成，其他路径的取消"""
+        cancelled, self._cancelled_prefetch = self._cancelled_prefetch, None
+        if cancelled is not None:
+            cancelled.wait()
+        prefetch, self.prefetch = self.prefetch, None
+        if prefetch is None:
+            return
+        if not prefetch.matches(source_path):
+            prefetch.cancel()
+        prefetch.wait()
+    
+    def _match_vcu_type(self, source_path: str) -> Optional[Dict[str, str]]:
+        """按名称匹配VCU类型，源码压缩包名称中没有时再按其中的目录名匹配"""
+        if is_archive(source_path):
+            code = detect_vcu_type(source_path)
+            return next((info for info in self.VCU_TYPES.values() if info['code'] == code), None)
+        source_name = Path(source_path).stem.lower()
+        for vcu_key, vcu_info in self.VCU_TYPES.items():
+            if vcu_key in source_name:
+                return vcu_info
+        return None
+    
     def _detect_vcu_type(self, path: str):
         """检测VCU类型"""
-        filename = Path(path).stem.lower()
-        detected_type = None
-        
-        for vcu_key in self.VCU_TYPES:
-            if vcu_key in filename:
-                detected_type = self.VCU_TYPES[vcu_key]['name']
-                break
+        vcu_info = self._match_vcu_type(path)
         
-        if detected_type:
-            self._log(f"检测到{detected_type}项目", "success")
+        if vcu_info:
+            self._log(f"检测到{vcu_info['name']}项目", "success")
         else:
             self._log("未能自动检测VCU类型，请确认文件名包含mvcu或svcu", "warning")
     
@@ -467,18 +604,29 @@ class VcuCompilerUI:
         self._log("开始更新makefile中编译器路径...")
         
         # 在新线程中执行更新
+        profile = self.profile_var.get()
+        
         def update_thread():
+            profiler = self._start_profiler("patch_makefiles", profile)
             try:
-                results = self.update_path_function(self._log)
-                self._process_path_update_results(results)
+                # makefile路径更新和MSYS profile生成互不依赖，同时进行
+                scheduler = PipelineScheduler(profiler=profiler)
+                scheduler.add("patch_makefiles", lambda: self.update_path_function(self._log))
+                scheduler.add("render_profile", self._update_msys_profile)
+                report = scheduler.run()
+                if "patch_makefiles" in report.errors:
+                    raise report.errors["patch_makefiles"]
+                self._process_path_update_results(report.results["patch_makefiles"], update_profile=False)
             except Exception as e:
                 self._log(f"更新路径过程中出错: {e}", "error")
                 self.root.after(0, lambda: self._update_ui_after_path_update(False))
+            finally:
+                self._finish_profiler(profiler)
         
         threading.Thread(target=update_thread, daemon=True).start()
     
-    def _process_path_update_results(self, results: List[Dict[str, Any]]):
-        """处理路径更新结果"""
+    def _process_path_update_results(self, results: List[Dict[str, Any]], update_profile: bool = True):
+        """处理路径更新结果，update_profile 为False时MSYS profile已另行生成"""
         if not results:
             self.root.after(0, lambda: self._update_ui_after_path_update(False))
             return
@@ -494,7 +642,8 @@ class VcuCompilerUI:
                     self.svcu_makefile_var.set(item["path"])
         
         # 更新MSYS profile
-        self._update_msys_profile()
+        if update_profile:
+            self._update_msys_profile()
         
         # 更新UI
         self.root.after(0, lambda: self._update_ui_after_path_update(success))
@@ -555,56 +704,227 @@ class VcuCompilerUI:
         # 清空日志
         self.log_text.delete(1.0, tk.END)
         
+        if self.watch_var.get():
+            threading.Thread(target=self._watch_process, args=(source_path,), daemon=True).start()
+            return
+        
         # 在新线程中执行编译
         threading.Thread(
             target=self._compile_process, 
-            args=(source_path,), 
+            args=(source_path, self.profile_var.get()), 
             daemon=True
         ).start()
     
-    def _compile_process(self, source_path: str):
-        """编译处理过程"""
+    def _toggle_watch(self):
+        """取消“监视变化”时停止正在进行的监视"""
+        if not self.watch_var.get() and self.watch_builder is not None:
+            self._log("正在停止监视（当前编译结束后生效）...")
+            self.watch_builder.stop()
+    
+    def _watch_process(self, source_path: str):
+        """监视模式：完整编译一次并等待结果，之后源码变化时增量编译，直到取消“监视变化”"""
+        self._wait_for_prefetch(source_path)
+        vcu_info = self._get_vcu_info(source_path)
+        if not vcu_info:
+            return
+        
+        builder = WatchBuilder(source_path, vcu_info['code'], log=self._log,
+                               build_output=lambda line: self._log(line, "debug"))
+        self.watch_builder = builder
+        try:
+            # 先开始监视，第一次编译期间的修改也会在之后触发编译
+            watcher = builder.create_watcher()
+            builder.build()
+            if not builder.stopped:
+                self.root.after(0, lambda: self.status_var.set("监视中，源码变化时自动编译"))
+                watcher.run()
+        except Exception as e:
+            self._log(f"监视模式出现异常: {e}", "error")
+        finally:
+            self.watch_builder = None
+            self.current_vcu_type = vcu_info['code']
+            self.root.after(0, self._update_ui_after_watch)
+    
+    def _update_ui_after_watch(self):
+        self.compile_btn.config(state=tk.NORMAL)
+        self.status_var.set("监视已停止")
+        self._log("已停止监视")
+    
+    def _compile_process(self, source_path: str, profile: bool = False):
+        """编译处理过程，开启性能分析时在cProfile下运行"""
+        self._wait_for_prefetch(source_path)
+        profiler = self._start_profiler("compile", profile)
+        try:
+            self._run_compile_pipeline(source_path, profiler)
+        finally:
+            self._finish_profiler(profiler, self._get_vcu_code(source_path))
+    
+    def _run_compile_pipeline(self, source_path: str, profiler=None):
+        """暂存源码的同时更新makefile路径、生成MSYS profile并检查模块，全部完成后启动MSYS"""
+        run = None
         try:
             # 检测VCU类型
             vcu_info = self._get_vcu_info(source_path)
             if not vcu_info:
                 return
             
-            # 准备编译环境
-            if not self._prepare_compile_environment(source_path, vcu_info):
-                return
+            # 本次编译的运行记录，启动MSYS前保存，编译后处理时补全并写入编译历史
+            if BuildRun is not None:
+                run = BuildRun(vcu_info['code'], source_path)
+                run.profiler = profiler
+            
+            modules = {}
+            skipped = {}
+            
+            def stage():
+                if not self._prepare_compile_environment(source_path, vcu_info,
+                                                         run.metrics if run is not None else None):
+                    raise RuntimeError("源码暂存失败")
+            
+            archive = is_archive(source_path)
+            
+            def scan_modules():
+                # 目录按与暂存相同的忽略规则直接从源目录得到模块列表，模块检查不必等待复制完成；
+                # 压缩包的内容不能直接遍历，从暂存后的目录得到
+                modules['found'] = find_c_modules(
+                    self._staged_path(source_path, vcu_info) if archive else source_path)
+            
+            def prune():
+                # 源文件已不在src中的目标文件和包含它们的链接产物不能再被make复用
+                build_dir = Path(get_application_path()) / "VCU_compile - selftest" / vcu_info['folder'] / "build"
+                result = prune_stale_products(str(build_dir))
+                if result.sources or not result.success:
+                    self._log(f"清理过期的编译产物: {result.summary()}",
+                              "success" if result.success else "warning")
             
-            # 检查模块
-            self._check_modules(vcu_info['code'])
+            def launch():
+                stamp = None
+                if run is not None:
+                    # 源码、工具链和makefile都没有变化且编译产物完好时不再启动编译
+                    stamp = compile_stamp(run)
+                    if stamp.check() is None:
+                        skipped['compile'] = True
+                        return
+                # 找不到MSYS时在改动戳记和待完成记录之前失败，本次编译记为失败
+                msys_bat_path = self._find_msys_bat()
+                if run is not None:
+                    stamp.invalidate()
+                    run.save_pending()
+                try:
+                    self._launch_msys(msys_bat_path, vcu_info)
+                except Exception:
+                    # 没有启动编译，编译后处理不会取走待完成记录，由编译历史记为失败
+                    if run is not None:
+                        BuildRun.take_pending(run.code)
+                    raise
             
-            # 启动MSYS
-            self._launch_msys(vcu_info)
+            scheduler = PipelineScheduler(run=run, profiler=profiler)
+            scheduler.add("stage", stage)
+            scheduler.add("scan_modules", scan_modules, deps=["stage"] if archive else ())
+            check_deps = ["scan_modules"]
+            if self.update_path_function:
+                scheduler.add("patch_makefiles", self.update_path_function)
+                check_deps.append("patch_makefiles")
+            scheduler.add("render_profile", self._update_msys_profile)
+            scheduler.add("check_modules", lambda: self._check_modules(vcu_info['code'], modules['found']),
+                          deps=check_deps)
+            launch_deps = ["stage", "render_profile", "check_modules"]
+            if prune_stale_products is not None:
+                scheduler.add("prune", prune, deps=["stage"])
+                launch_deps.append("prune")
+            if run is not None:
+                scheduler.add("inputs", lambda: record_inputs(run, self._staged_path(source_path, vcu_info)),
+                              deps=["stage"], record=False)
+                launch_deps.append("inputs")
+            scheduler.add("launch", launch, deps=launch_deps)
+            report = scheduler.run()
+            if run is not None:
+                run.metrics["prepare_overlap_saved"] = round(report.saved_time, 3)
+            self._log(report.summary(), "debug")
+            
+            if "patch_makefiles" in report.results:
+                self._process_path_update_results(report.results["patch_makefiles"], update_profile=False)
+            if not report.success:
+                for name, error in report.errors.items():
+                    self._log(f"{name} 失败: {error}", "error")
+                self._record_failed_run(run)
+                if "launch" in report.errors:
+                    messagebox.showerror("错误", f"启动MSYS失败: {report.errors['launch']}")
+                self._compile_done(False)
+                return
+            
+            if skipped.get('compile'):
+                run.finish("up_to_date")
+                self._log("编译输出已是最新（源码、工具链和makefile都没有变化），跳过编译；"
+                          "需要重新编译时以 --force 启动程序", "success")
             
             # 编译完成
             self._compile_done(True, vcu_info['code'])
             
         except Exception as e:
             self._log(f"编译过程中出现异常: {e}", "error")
+            self._record_failed_run(run)
             messagebox.showerror("错误", f"编译过程中出现异常: {e}")
             self._compile_done(False)
     
+    @staticmethod
+    def _start_profiler(name: str, enabled: bool):
+        """勾选了性能分析时创建并启动分析器（必须在执行流程的线程中调用）"""
+        if not enabled or PipelineProfiler is None:
+            return None
+        profiler = PipelineProfiler(name)
+        profiler.start()
+        return profiler
+    
+    def _finish_profiler(self, profiler, vcu_code: Optional[str] = None):
+        """停止分析器并写出报告：已知VCU类型时写到编译输出目录，否则写到状态目录"""
+        if profiler is None:
+            return
+        profiler.stop()
+        output_dir = None
+        if vcu_code:
+            folder_name = "dev_kernel_mvcu" if vcu_code == "m" else "dev_kernel_svcu"
+            output_dir = str(Path(get_application_path()) / "VCU_compile - selftest" / folder_name / "build" / "out")
+        try:
+            paths = profiler.write(output_dir)
+            self._log(f"性能分析报告: {paths['report']}", "success")
+            self._log(f"性能分析数据: {paths['pstats']}")
+        except OSError as e:
+            self._log(f"写入性能分析报告失败: {e}", "error")
+    
+    def _get_vcu_code(self, source_path: str) -> Optional[str]:
+        vcu_info = self._match_vcu_type(source_path)
+        return vcu_info['code'] if vcu_info else None
+    
+    @staticmethod
+    def _record_failed_run(run):
+        if run is not None and run.finished is None:
+            run.finish("failed")
+            record_run(run)
+    
+    @staticmethod
+    def _staged_path(source_path: str, vcu_info: Dict[str, str]) -> str:
+        """源码暂存后的位置：目录和源码压缩包为整个src目录，单个文件为src中的同名文件"""
+        dest_folder = Path(get_application_path()) / "VCU_compile - selftest" / vcu_info['folder'] / "src"
+        return staged_source_path(source_path, str(dest_folder))
+    
     def _get_vcu_info(self, source_path: str) -> Optional[Dict[str, str]]:
         """获取VCU信息"""
-        source_name = Path(source_path).stem.lower()
-        self._log(f"处理源: {Path(source_path).stem}")
+        self._log(f"处理源: {archive_stem(source_path) if is_archive(source_path) else Path(source_path).stem}")
         
-        for vcu_key, vcu_info in self.VCU_TYPES.items():
-            if vcu_key in source_name:
-                self._log(f"检测到{vcu_info['name']}类型", "success")
-                return vcu_info
+        vcu_info = self._match_vcu_type(source_path)
+        if vcu_info:
+            self._log(f"检测到{vcu_info['name']}类型", "success")
+            return vcu_info
         
         self._log(f"错误: 文件名称未包含mvcu或svcu，无法识别", "error")
         messagebox.showerror("错误", f"文件名称未包含mvcu或svcu，无法识别")
         self._compile_done(False)
         return None
     
-    def _prepare_compile_environment(self, source_path: str, vcu_info: Dict[str, str]) -> bool:
-        """准备编译环境"""
+    def _prepare_compile_environment(self, source_path: str, vcu_info: Dict[str, str],
+                                     stats: Optional[Dict[str, float]] = None) -> bool:
+        """准备编译环境，stats 若提供则填入暂存时被忽略的文件数和字节数"""
         try:
             # 创建目标文件夹
             script_dir = get_application_path()
@@ -618,39 +938,24 @@ class VcuCompilerUI:
             self._log(f"设置MSYS_FLAG={vcu_info['code']}")
             
             # 复制文件
-            return self._copy_source_files(source_path, dest_folder)
+            return self._copy_source_files(source_path, dest_folder, stats)
             
         except Exception as e:
             self._log(f"准备编译环境失败: {e}", "error")
             return False
     
-    def _copy_source_files(self, source_path: str, dest_folder: Path) -> bool:
+    def _copy_source_files(self, source_path: str, dest_folder: Path,
+                           stats: Optional[Dict[str, float]] = None) -> bool:
         """复制源文件"""
         self._log("开始复制文件...")
         
         try:
-            source_path_obj = Path(source_path)
-            
-            if source_path_obj.is_dir():
-                # 复制目录
-                self._log(f"复制目录 {source_path} 到 {dest_folder}")
-                result = subprocess.run([
-                    "robocopy", str(source_path_obj), str(dest_folder),
-                    "/MIR", "/NFL", "/NDL", "/NJH", "/NC", "/NJS", "/NP"
-                ], capture_output=True, text=True)
-                
-                # robocopy返回值大于等于8表示错误
-                if result.returncode >= 8:
-                    self._log(f"文件复制失败: {result.stderr}", "error")
-                    return False
-                else:
-                    self._log("目录复制成功", "success")
-            else:
-                # 复制单个文件
-                self._log(f"复制文件 {source_path} 到 {dest_folder}")
-                shutil.copy2(source_path_obj, dest_folder / source_path_obj.name)
-                self._log("文件复制成功", "success")
-            
+            self._log(f"复制 {source_path} 到 {dest_folder}")
+            success, detail = stage_sources(source_path, str(dest_folder), stats=stats)
+            if not success:
+                self._log(f"文件复制失败: {detail}", "error")
+                return False
+            self._log(detail, "success")
             return True
             
         except Exception as e:
@@ -658,41 +963,38 @@ class VcuCompilerUI:
             messagebox.showerror("错误", f"文件复制失败: {e}")
             return False
     
-    def _check_modules(self, vcu_code: str):
-        """检查模块"""
+    def _check_modules(self, vcu_code: str, modules: Optional[List[str]] = None):
+        """检查模块，modules 为None时检查src目录中的所有.c文件"""
         if not self.importer.check_modules_in_makefile:
             self._log("无法进行模块检查，需要重新运行程序", "warning")
             return
         
         try:
             self._log("检查模块是否都包含在makefile中...")
-            self.importer.check_modules_in_makefile(vcu_code)
+            self.importer.check_modules_in_makefile(vcu_code, modules)
             self._log("完成模块检查", "success")
         except Exception as e:
             self._log(f"模块检查过程中出错: {e}", "error")
     
-    def _launch_msys(self, vcu_info: Dict[str, str]):
-        """启动MSYS"""
-        resource_dir = get_resource_path()
-        msys_bat_path = Path(resource_dir) / "MSYS-1.0.10-selftest" / "1.0" / "msys.bat"
-        
-        if msys_bat_path.exists():
-            self._log(f"启动MSYS: {msys_bat_path}")
-            try:
-                subprocess.Popen(["cmd", "/c", "start", "", str(msys_bat_path)])
-                self._log("MSYS已启动", "success")
-                
-                # 显示将要使用的路径
-                if vcu_info['code'] == "m" and self.mvcu_path:
-                    self._log(f"MSYS将使用MVCU路径: {self.mvcu_path}")
-                elif vcu_info['code'] == "s" and self.svcu_path:
-                    self._log(f"MSYS将使用SVCU路径: {self.svcu_path}")
-                    
-            except Exception as e:
-                self._log(f"启动MSYS失败: {e}", "error")
-        else:
-            self._log(f"找不到MSYS批处理文件: {msys_bat_path}", "error")
-            messagebox.showwarning("警告", f"找不到MSYS批处理文件: {msys_bat_path}")
+    @staticmethod
+    def _find_msys_bat() -> Path:
+        """MSYS批处理文件的路径，不存在时抛出 FileNotFoundError"""
+        msys_bat_path = Path(get_resource_path("MSYS-1.0.10-selftest")) / "1.0" / "msys.bat"
+        if not msys_bat_path.exists():
+            raise FileNotFoundError(f"找不到MSYS批处理文件: {msys_bat_path}")
+        return msys_bat_path
+    
+    def _launch_msys(self, msys_bat_path: Path, vcu_info: Dict[str, str]):
+        """启动MSYS，失败时抛出异常由编译流程记为失败"""
+        self._log(f"启动MSYS: {msys_bat_path}")
+        launch_msys(str(msys_bat_path))
+        self._log("MSYS已启动", "success")
+        
+        # 显示将要使用的路径
+        if vcu_info['code'] == "m" and self.mvcu_path:
+            self._log(f"MSYS将使用MVCU路径: {self.mvcu_path}")
+        elif vcu_info['code'] == "s" and self.svcu_path:
+            self._log(f"MSYS将使用SVCU路径: {self.svcu_path}")
     
     def _compile_done(self, success: bool, vcu_code: Optional[str] = None):
         """编译完成后的处理"""
@@ -790,6 +1092,8 @@ class VcuCompilerApp:
         """应用程序关闭事件处理"""
         try:
             # 可以在这里添加保存设置等逻辑
+            if self.ui and self.ui.watchdog:
+                self.ui.watchdog.stop()
             self.root.destroy()
         except Exception as e:
             logger.error(f"应用程序关闭时出错: {e}")
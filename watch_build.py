@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+监视模式的增量编译
+第一次完整暂存源码并编译，之后源码目录每出现一批变化，只把变化的文件同步到编译目录的src中，
+再启动一次MSYS编译（make按修改时间只重新编译受影响的模块），并等待编译后处理写入编译历史，
+期间把编译日志实时输出到命令行或界面日志中。
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from build_history import record_run, wait_for_run
+from build_products import prune_stale_products
+from build_run import BUILD_LOG_NAME, TARGET_NAMES, BuildRun, compile_stamp, record_inputs
+from file_sync import sync_paths
+from ignore_rules import load_source_ignore_rules
+from path_utils import get_application_path, get_resource_path
+from source_staging import EXIT_AFTER_BUILD_ENV_VAR, launch_msys, stage_sources, staged_source_path
+from source_watcher import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, SourceWatcher
+
+# 等待一次编译（含编译后处理）结束的最长时间（秒）
+DEFAULT_BUILD_TIMEOUT = 30 * 60
+
+_KERNEL_FOLDERS = {"m": "dev_kernel_mvcu", "s": "dev_kernel_svcu"}
+
+
+def format_run_result(run: dict) -> str:
+    """一次编译结果的单行汇总"""
+    text = (f"{TARGET_NAMES.get(run['target'], run['target'])} 编译{'成功' if run['status'] == 'success' else '失败'}"
+            f"（{run['status']}），耗时 {run['duration'] or 0:.1f} s，错误 {run['errors']}，警告 {run['warnings']}")
+    if run.get("revision"):
+        text += f"，提交 {run['revision'][:12]}"
+    metrics = run.get("metrics", {})
+    if "flash" in metrics and "ram" in metrics:
+        text += f"，Flash {metrics['flash']:.0f} 字节，RAM {metrics['ram']:.0f} 字节"
+    return text
+
+
+class WatchBuilder:
+    """监视模式下的编译：build() 执行一次编译并等待结果，create_watcher() 创建的监视器在源码变化时增量编译
+
+    Args:
+        source_path: 源码目录或单个源文件
+        vcu_type: "m" 或 "s"
+        log: 状态信息的输出函数
+        build_output: 编译日志每一行的输出函数，默认与 log 相同
+    """
+
+    def __init__(self, source_path: str, vcu_type: str, log: Callable[[str], None] = print,
+                 build_output: Optional[Callable[[str], None]] = None, timeout: float = DEFAULT_BUILD_TIMEOUT):
+        self.source_path = os.path.abspath(source_path)
+        self.vcu_type = vcu_type
+        self.log = log
+        self.build_output = build_output or log
+        self.timeout = timeout
+        self.watcher: Optional[SourceWatcher] = None
+        self.stopped = False
+        self._lock = threading.Lock()
+        kernel_dir = os.path.join(get_application_path(), "VCU_compile - selftest", _KERNEL_FOLDERS[vcu_type])
+        self.dest_folder = os.path.join(kernel_dir, "src")
+        self.build_dir = os.path.join(kernel_dir, "build")
+        self.log_path = os.path.join(self.build_dir, BUILD_LOG_NAME)
+        # 与暂存相同的忽略规则（.loccompileignore 在开始监视时读取）
+        self.rules = load_source_ignore_rules(self.source_path)
+
+    def _staged_path(self) -> str:
+        return staged_source_path(self.source_path, self.dest_folder)
+
+    def _stage(self, changes: Optional[Iterable[str]], stats: Dict[str, float]):
+        """返回 (是否成功, 是否有文件变化, 说明)，被忽略的文件数和字节数填入 stats"""
+        if changes is None or not os.path.isdir(self.source_path):
+            staged, detail = stage_sources(self.source_path, self.dest_folder, stats=stats)
+            return staged, True, detail
+        # 监视器已按相同的规则过滤变化，同步变化的子目录时也应用规则
+        result = sync_paths(self.source_path, self.dest_folder, changes,
+                            self.rules.copytree_ignore(self.source_path))
+        stats.update(skipped_files=result.skipped, skipped_bytes=result.skipped_bytes)
+        if not result.success:
+            rel_path, error = result.failed[0]
+            return False, True, f"{rel_path}: {error}（共 {len(result.failed)} 个文件失败）"
+        return True, bool(result.copied or result.removed), result.summary()
+
+    def build(self, changes: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """同步源码并编译一次，返回编译历史中的运行记录；未能启动编译、没有变化或等待超时时返回None
+
+        Args:
+            changes: 变化的相对路径，None表示完整暂存
+        """
+        with self._lock:
+            run = BuildRun(self.vcu_type, self.source_path)
+            with run.phase("stage"):
+                staged, modified, detail = self._stage(changes, run.metrics)
+            if not staged:
+                self.log(f"错误: 文件同步失败: {detail}")
+                run.finish("failed")
+                record_run(run)
+                return None
+            self.log(detail)
+            if not modified:
+                self.log("暂存的源码没有变化，跳过编译")
+                # 只结束计数，不写入编译历史
+                run.finish("unchanged")
+                return None
+            with run.phase("prune"):
+                pruned = prune_stale_products(self.build_dir)
+            if pruned.sources or not pruned.success:
+                self.log(f"清理过期的编译产物: {pruned.summary()}")
+            record_inputs(run, self._staged_path())
+
+            msys_bat_path = os.path.join(get_resource_path("MSYS-1.0.10-selftest"), "1.0", "msys.bat")
+            if not os.path.exists(msys_bat_path):
+                self.log(f"错误: 找不到MSYS批处理文件: {msys_bat_path}")
+                run.finish("failed")
+                record_run(run)
+                return None
+
+            # 删除上次的编译日志，等待时只输出本次编译的内容
+            try:
+                os.remove(self.log_path)
+            except OSError:
+                pass
+            env = dict(os.environ, MSYS_FLAG=self.vcu_type, **{EXIT_AFTER_BUILD_ENV_VAR: "1"})
+            # 编译成功后编译后处理会按本次输入重新写入编译戳记
+            compile_stamp(run).invalidate()
+            run.save_pending()
+            process = launch_msys(msys_bat_path, env, wait=True)
+            self.log(f"已启动MSYS编译: {run.run_id}")
+
+            result = wait_for_run(run.run_id, self.timeout, self.log_path, self.build_output, process=process)
+            if result is None:
+                if process.poll() is None:
+                    self.log(f"警告: {self.timeout / 60:.0f} 分钟内未收到编译结果")
+                    return None
+                self.log(f"错误: MSYS已退出（返回码 {process.returncode}），没有执行编译后处理")
+                # 编译后处理没有取走的记录由这里结束，编译历史中记为失败
+                pending = BuildRun.take_pending(self.vcu_type)
+                if pending is not None and pending.run_id == run.run_id:
+                    pending.finish("failed")
+                    record_run(pending)
+                return None
+            self.log(f"{format_run_result(result)}，总耗时 {time.time() - run.started:.1f} s")
+            return result
+
+    def on_change(self, changes):
+        names = [path or "(整个目录)" for path in sorted(changes)]
+        self.log(f"检测到 {len(names)} 处变化: {', '.join(names[:5])}{' ...' if len(names) > 5 else ''}")
+        try:
+            self.build(changes)
+        except Exception as e:
+            # 监视不因一次编译的异常而停止
+            self.log(f"错误: 增量编译时出现异常: {e}")
+
+    def create_watcher(self, debounce: float = DEFAULT_DEBOUNCE,
+                       poll_interval: float = DEFAULT_POLL_INTERVAL) -> SourceWatcher:
+        self.watcher = SourceWatcher(self.source_path, self.on_change, debounce, poll_interval, self.rules)
+        self.log(f"监视 {self.source_path}（{self.watcher.backend.name}，去抖 {debounce:.1f} s）")
+        return self.watcher
+
+    def stop(self):
+        """停止监视，正在进行的编译结束后监视循环退出"""
+        self.stopped = True
+        if self.watcher is not None:
+            self.watcher.stop()